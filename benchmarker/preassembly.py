@@ -0,0 +1,536 @@
+"""Benchmark the preassembly of synthetic raw statement corpora.
+
+A corpus of raw statements is generated from a vocabulary of protein families
+and their member genes, with a configurable mix of statement types, density of
+refinements (statements that are more specific versions of others), and rate
+of duplicates (the same statement extracted from several papers). The corpus
+is loaded into the test database in two parts: the first is preassembled with
+`create_corpus` and the second is then added with `supplement_corpus`.
+
+Each stage of preassembly is timed, and the results include the rate at which
+statements were processed and support links found, the time spent executing
+SQL and copying data, and the peak memory used, so that the performance of
+preassembly can be compared across commits.
+"""
+
+__all__ = ['generate_corpus', 'load_corpus', 'StageTimer', 'SqlTimer',
+           'benchmark_preassembly', 'format_results']
+
+import json
+import random
+import logging
+import resource
+import subprocess
+from os import path
+from uuid import UUID
+from time import perf_counter
+from copy import deepcopy
+from functools import wraps
+from datetime import datetime
+from collections import defaultdict
+from inspect import isgeneratorfunction
+
+from sqlalchemy import event
+
+logger = logging.getLogger('benchmark_tools')
+
+DEFAULT_TYPE_MIX = {'Phosphorylation': 0.4, 'Activation': 0.3,
+                    'IncreaseAmount': 0.2, 'Complex': 0.1}
+
+# The methods of the preassembler timed as stages. Stages may be nested, for
+# example `_dump_links` is called within `_run_support_queue`, and the time of
+# each stage includes that of any stages within it. The batch comparisons are
+# only seen when they are run in this process, i.e. with a single worker.
+PREASSEMBLER_STAGES = ['_distill_stmt_ids', '_raw_sid_stmt_iter',
+                       '_clean_statements', '_condense_statements',
+                       '_get_new_stmt_ids', '_run_support_queue',
+                       '_cache_batch', '_compare_batches', '_dump_links']
+KEY_INDEX_STAGES = ['block_batches', 'find_related']
+
+COPY_METHODS = ['copy', 'copy_lazy', 'copy_push', 'copy_report_lazy',
+                'copy_report_push']
+
+RESIDUES = ['S', 'T', 'Y']
+
+
+def _get_vocabulary(ontology, n_agents, rng):
+    """Choose families and member genes, up to n_agents genes in total.
+
+    Returns a list of (family, members) tuples, where the family is an
+    (ns, id) pair and the members are a list of (ns, id) pairs.
+    """
+    ontology.initialize()
+    families = []
+    for node in sorted(ontology.nodes):
+        if not node.startswith('FPLX:'):
+            continue
+        ns, db_id = ontology.get_ns_id(node)
+        members = [child for child in ontology.get_children(ns, db_id)
+                   if child[0] == 'HGNC']
+        if members:
+            families.append(((ns, db_id), sorted(members)))
+    rng.shuffle(families)
+
+    vocabulary = []
+    n_genes = 0
+    for family, members in families:
+        if n_genes >= n_agents:
+            break
+        members = members[:n_agents - n_genes]
+        vocabulary.append((family, members))
+        n_genes += len(members)
+    if n_genes < n_agents:
+        logger.warning(f"Only {n_genes} genes are available, fewer than the "
+                       f"{n_agents} requested.")
+    return vocabulary
+
+
+def _make_agent(ontology, ns, db_id):
+    from indra.statements import Agent
+    return Agent(ontology.get_name(ns, db_id), db_refs={ns: db_id})
+
+
+class _StatementFactory(object):
+    """Make statements, and refinements of them, from a vocabulary."""
+    def __init__(self, ontology, vocabulary, type_mix, rng):
+        self.ontology = ontology
+        self.rng = rng
+        self.types, self.weights = zip(*sorted(type_mix.items()))
+
+        # Index the family of each gene, and the members of each family.
+        self.families = {}
+        self.family_of = {}
+        for family, members in vocabulary:
+            self.families[family] = members
+            for member in members:
+                self.family_of[member] = family
+        self.genes = sorted(self.family_of)
+
+    def _choose_entity(self):
+        # Use the family of a gene about a quarter of the time, so that some
+        # statements can be refined by their members.
+        gene = self.rng.choice(self.genes)
+        if self.rng.random() < 0.25:
+            return self.family_of[gene]
+        return gene
+
+    def make_statement(self):
+        from indra.statements import get_statement_by_name
+        stmt_type = self.rng.choices(self.types, self.weights)[0]
+        stmt_cls = get_statement_by_name(stmt_type)
+        ent_a = self._choose_entity()
+        ent_b = self._choose_entity()
+        while ent_b == ent_a:
+            ent_b = self._choose_entity()
+        agents = [_make_agent(self.ontology, *ent) for ent in (ent_a, ent_b)]
+        if stmt_type == 'Complex':
+            return stmt_cls(agents)
+        return stmt_cls(*agents)
+
+    def refine(self, stmt):
+        """Get a more specific version of a statement, if there is one.
+
+        A family is replaced with one of its members, or else a residue, and
+        then a position, is added to a modification.
+        """
+        from indra.statements import Modification
+        refined = deepcopy(stmt)
+        agents = [ag for ag in refined.agent_list() if ag is not None]
+        self.rng.shuffle(agents)
+        for ag in agents:
+            ent = ('FPLX', ag.db_refs.get('FPLX'))
+            if ent in self.families:
+                ns, db_id = self.rng.choice(self.families[ent])
+                ag.name = self.ontology.get_name(ns, db_id)
+                ag.db_refs = {ns: db_id}
+                return refined
+        if isinstance(refined, Modification):
+            if refined.residue is None:
+                refined.residue = self.rng.choice(RESIDUES)
+                return refined
+            if refined.position is None:
+                refined.position = str(self.rng.randint(1, 1000))
+                return refined
+        return None
+
+
+def generate_corpus(n_stmts, n_agents=500, type_mix=None,
+                    refinement_density=0.2, duplicate_rate=0.2,
+                    stmts_per_paper=20, seed=0, ontology=None):
+    """Generate a synthetic corpus of raw statements, grouped into papers.
+
+    Parameters
+    ----------
+    n_stmts : int
+        The total number of raw statements to generate.
+    n_agents : int
+        The number of genes in the agent vocabulary. The families of the genes
+        are also used as agents.
+    type_mix : dict
+        The relative frequency of each statement type, keyed by type name. By
+        default Phosphorylation, Activation, IncreaseAmount and Complex are
+        used.
+    refinement_density : float
+        The fraction of statements that are generated as more specific
+        versions of earlier statements, where possible.
+    duplicate_rate : float
+        The fraction of statements that repeat the content of an earlier
+        statement from another paper.
+    stmts_per_paper : int
+        The number of statements extracted from each paper.
+    seed : int
+        The seed of the random number generator, so that the same corpus can
+        be generated on different commits.
+    ontology : indra.ontology.IndraOntology
+        The ontology from which to draw the vocabulary. By default the INDRA
+        bio ontology is used.
+
+    Returns
+    -------
+    papers : list[list[indra.statements.Statement]]
+        The raw statements of each paper, each with evidence citing the
+        paper's (synthetic) pmid.
+    """
+    from indra.statements import Evidence
+    if ontology is None:
+        from indra.ontology.bio import bio_ontology
+        ontology = bio_ontology
+    if type_mix is None:
+        type_mix = DEFAULT_TYPE_MIX
+
+    rng = random.Random(seed)
+    vocabulary = _get_vocabulary(ontology, n_agents, rng)
+    factory = _StatementFactory(ontology, vocabulary, type_mix, rng)
+
+    templates = []
+    papers = []
+    for i in range(n_stmts):
+        if i % stmts_per_paper == 0:
+            papers.append([])
+            in_paper = set()
+        pmid = str(len(papers))
+
+        # Duplicates come from other papers: a repeat within a paper would be
+        # an exact duplicate, and discarded.
+        roll = rng.random()
+        template = None
+        if templates and roll < duplicate_rate:
+            template = rng.choice(templates)
+            if id(template) in in_paper:
+                template = None
+        elif templates and roll < duplicate_rate + refinement_density:
+            template = factory.refine(rng.choice(templates))
+            if template is not None:
+                templates.append(template)
+        if template is None:
+            template = factory.make_statement()
+            templates.append(template)
+        in_paper.add(id(template))
+
+        # Make each raw statement a distinct copy, with a reproducible uuid.
+        stmt = deepcopy(template)
+        stmt.uuid = str(UUID(int=rng.getrandbits(128), version=4))
+        stmt.evidence = [Evidence(source_api='reach', pmid=pmid,
+                                  text=f'Sentence {i} of paper {pmid}.')]
+        papers[-1].append(stmt)
+    return papers
+
+
+def load_corpus(db, papers, first_id=1):
+    """Load papers of raw statements into the database.
+
+    Each paper gets a text ref, an abstract, and a REACH reading, with ids
+    counting up from `first_id`, so separate parts of a corpus should be
+    loaded with distinct ranges of ids.
+    """
+    from indra_db.databases import reader_versions
+    from indra_db.tests.util import simple_insert_stmts
+
+    ids = range(first_id, first_id + len(papers))
+    pmids = [papers[i][0].evidence[0].pmid for i in range(len(papers))]
+    db.copy('text_ref', [(trid, pmid, int(pmid))
+                         for trid, pmid in zip(ids, pmids)],
+            ('id', 'pmid', 'pmid_num'))
+    db.copy('text_content', [(tcid, tcid, 'pubmed', 'txt', 'abstract')
+                             for tcid in ids],
+            ('id', 'text_ref_id', 'source', 'format', 'text_type'))
+    db.copy('reading', [(rid, rid, 'REACH', reader_versions['reach'][-1], 1,
+                         'json') for rid in ids],
+            ('id', 'text_content_id', 'reader', 'reader_version', 'batch_id',
+             'format'))
+    simple_insert_stmts(db, {'reading': dict(zip(ids, papers))})
+    return
+
+
+class StageTimer(object):
+    """Time the calls to methods of classes, while in context.
+
+    The total time and number of calls are recorded for each method. For
+    generator methods the time spent producing each item is recorded, rather
+    than the time spent by the caller consuming them.
+    """
+    def __init__(self, targets):
+        self.targets = targets
+        self.stages = defaultdict(lambda: {'calls': 0, 'time': 0.0})
+        self._originals = []
+
+    def _wrap(self, name, func):
+        record = self.stages[name]
+
+        if isgeneratorfunction(func):
+            @wraps(func)
+            def timed(*args, **kwargs):
+                record['calls'] += 1
+                gen = func(*args, **kwargs)
+                while True:
+                    start = perf_counter()
+                    try:
+                        item = next(gen)
+                    except StopIteration:
+                        return
+                    finally:
+                        record['time'] += perf_counter() - start
+                    yield item
+        else:
+            @wraps(func)
+            def timed(*args, **kwargs):
+                record['calls'] += 1
+                start = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    record['time'] += perf_counter() - start
+        return timed
+
+    def __enter__(self):
+        for cls, method_names in self.targets:
+            for name in method_names:
+                original = cls.__dict__[name]
+                self._originals.append((cls, name, original))
+                setattr(cls, name, self._wrap(name, original))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        for cls, name, original in reversed(self._originals):
+            setattr(cls, name, original)
+        self._originals.clear()
+
+    def get_results(self):
+        return {name: dict(record) for name, record in self.stages.items()}
+
+
+class SqlTimer(object):
+    """Time the SQL executed, and the data copied, by a database manager.
+
+    The copy methods use a raw connection, and so are not seen by the engine's
+    events: they are wrapped instead.
+    """
+    def __init__(self, db):
+        self.db = db
+        self.n_queries = 0
+        self.query_time = 0.0
+        self.n_copies = 0
+        self.copy_time = 0.0
+        self._starts = []
+        self._copy_depth = 0
+
+    def _before_execute(self, *args):
+        self._starts.append(perf_counter())
+
+    def _after_execute(self, *args):
+        self.n_queries += 1
+        self.query_time += perf_counter() - self._starts.pop()
+
+    def _wrap_copy(self, func):
+        @wraps(func)
+        def timed(*args, **kwargs):
+            # Some copy methods call others, which should not be counted
+            # twice.
+            self._copy_depth += 1
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._copy_depth -= 1
+                if not self._copy_depth:
+                    self.n_copies += 1
+                    self.copy_time += perf_counter() - start
+        return timed
+
+    def __enter__(self):
+        event.listen(self.db.engine, 'before_cursor_execute',
+                     self._before_execute)
+        event.listen(self.db.engine, 'after_cursor_execute',
+                     self._after_execute)
+        for name in COPY_METHODS:
+            setattr(self.db, name, self._wrap_copy(getattr(self.db, name)))
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        event.remove(self.db.engine, 'before_cursor_execute',
+                     self._before_execute)
+        event.remove(self.db.engine, 'after_cursor_execute',
+                     self._after_execute)
+        for name in COPY_METHODS:
+            delattr(self.db, name)
+
+    def get_results(self):
+        return {'queries': self.n_queries, 'query_time': self.query_time,
+                'copies': self.n_copies, 'copy_time': self.copy_time,
+                'sql_time': self.query_time + self.copy_time}
+
+
+def _get_peak_rss():
+    """Get the peak resident memory, in MB, of this process and its children.
+
+    Note that this is the peak over the life of each process, not just the
+    current stage.
+    """
+    # On Linux the maximum RSS is given in kilobytes.
+    return {
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024,
+        'peak_child_rss_mb':
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss/1024
+    }
+
+
+def _get_git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=path.dirname(path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _run_stage(db, n_raw, func, *args, **kwargs):
+    """Run a preassembly task, timing it and each of its stages."""
+    from indra_db.preassembly.blocking import AgentKeyIndex
+    from indra_db.preassembly.preassemble_db import DbPreassembler
+
+    n_links_before = db.count(db.PASupportLinks)
+    targets = [(DbPreassembler, PREASSEMBLER_STAGES),
+               (AgentKeyIndex, KEY_INDEX_STAGES)]
+    with StageTimer(targets) as stage_timer, SqlTimer(db) as sql_timer:
+        start = perf_counter()
+        func(*args, **kwargs)
+        duration = perf_counter() - start
+    n_links = db.count(db.PASupportLinks) - n_links_before
+
+    results = {'duration': duration, 'raw_statements': n_raw,
+               'pa_statements': db.count(db.PAStatements),
+               'support_links': n_links,
+               'statements_per_sec': n_raw/duration,
+               'links_per_sec': n_links/duration,
+               'stages': stage_timer.get_results()}
+    results.update(sql_timer.get_results())
+    results.update(_get_peak_rss())
+    return results
+
+
+def benchmark_preassembly(n_stmts, update_fraction=0.2, batch_size=10000,
+                          n_workers=1, stmt_type=None, db=None, **corpus_args):
+    """Time the preassembly of a synthetic corpus in the test database.
+
+    Parameters
+    ----------
+    n_stmts : int
+        The total number of raw statements in the corpus.
+    update_fraction : float
+        The fraction of papers held back from `create_corpus` to be added by
+        `supplement_corpus`. If 0, only `create_corpus` is run.
+    batch_size : int
+        The batch size used by the preassembler.
+    n_workers : int
+        The number of worker processes used by the preassembler.
+    stmt_type : str
+        Optionally preassemble only statements of this type.
+    db : PrincipalDatabaseManager
+        The database to use. By default the test database is used. In either
+        case IT IS CLEARED.
+
+    Any further keyword arguments are passed to `generate_corpus`.
+
+    Returns
+    -------
+    results : dict
+        The parameters of the benchmark, the revision of the code, and the
+        timings of corpus generation and loading, and of each preassembly
+        task.
+    """
+    from indra_db.preassembly.preassemble_db import DbPreassembler
+    if db is None:
+        from indra_db.tests.util import get_temp_db
+        db = get_temp_db(clear=True)
+    else:
+        db._clear(force=True)
+
+    results = {'revision': _get_git_revision(),
+               'date': datetime.utcnow().isoformat(),
+               'params': dict(n_stmts=n_stmts,
+                              update_fraction=update_fraction,
+                              batch_size=batch_size, n_workers=n_workers,
+                              stmt_type=stmt_type, **corpus_args)}
+
+    start = perf_counter()
+    papers = generate_corpus(n_stmts, **corpus_args)
+    results['generate_time'] = perf_counter() - start
+    n_initial = len(papers) - int(len(papers)*update_fraction)
+    initial, update = papers[:n_initial], papers[n_initial:]
+
+    def count_stmts(some_papers):
+        return sum(len(paper) for paper in some_papers)
+
+    start = perf_counter()
+    load_corpus(db, initial)
+    results['load_time'] = perf_counter() - start
+
+    dbp = DbPreassembler(batch_size=batch_size, stmt_type=stmt_type,
+                         yes_all=True, n_workers=n_workers)
+    logger.info(f"Creating the corpus from {count_stmts(initial)} raw "
+                f"statements.")
+    results['create'] = _run_stage(db, count_stmts(initial),
+                                   dbp.create_corpus, db)
+
+    if update:
+        start = perf_counter()
+        load_corpus(db, update, first_id=n_initial + 1)
+        results['load_time'] += perf_counter() - start
+        logger.info(f"Supplementing the corpus with {count_stmts(update)} "
+                    f"raw statements.")
+        results['supplement'] = _run_stage(db, count_stmts(update),
+                                           dbp.supplement_corpus, db)
+    return results
+
+
+def format_results(results):
+    """Format the results of a benchmark as a table for display."""
+    lines = [f"Revision: {results['revision']}",
+             f"Parameters: {json.dumps(results['params'])}",
+             f"Generated corpus in {results['generate_time']:.2f} s, loaded "
+             f"in {results['load_time']:.2f} s."]
+    for task in ['create', 'supplement']:
+        if task not in results:
+            continue
+        res = results[task]
+        lines += [
+            '',
+            f"{task}: {res['duration']:.2f} s",
+            '-'*(len(task) + 2),
+            f"{res['raw_statements']} raw statements "
+            f"({res['statements_per_sec']:.1f}/s), {res['pa_statements']} pa "
+            f"statements, {res['support_links']} support links "
+            f"({res['links_per_sec']:.1f}/s)",
+            f"SQL: {res['sql_time']:.2f} s ({res['queries']} queries in "
+            f"{res['query_time']:.2f} s, {res['copies']} copies in "
+            f"{res['copy_time']:.2f} s)",
+            f"Peak RSS: {res['peak_rss_mb']:.0f} MB (workers: "
+            f"{res['peak_child_rss_mb']:.0f} MB)",
+        ]
+        for name, stage in sorted(res['stages'].items(),
+                                  key=lambda t: -t[1]['time']):
+            lines.append(f"  {name:<24} {stage['time']:>9.2f} s "
+                         f"{stage['calls']:>7} calls")
+    return '\n'.join(lines)
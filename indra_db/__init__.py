@@ -1,2 +1,17 @@
-from .util import get_primary_db, get_db, get_ro
-from .databases import texttypes, formats, sql_expressions
+__all__ = ['get_primary_db', 'get_db', 'get_ro', 'texttypes', 'formats',
+           'sql_expressions']
+
+# These are only imported when first used, so that importing any part of the
+# package (e.g. indra_db.config) does not load the database machinery.
+_lazy_attrs = {'get_primary_db': 'util', 'get_db': 'util', 'get_ro': 'util',
+               'texttypes': 'databases', 'formats': 'databases',
+               'sql_expressions': 'databases'}
+
+
+def __getattr__(name):
+    if name not in _lazy_attrs:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    from importlib import import_module
+    value = getattr(import_module(f'.{_lazy_attrs[name]}', __name__), name)
+    globals()[name] = value
+    return value
@@ -8,15 +8,22 @@ corpus to be processed locally in RAM, in very little time.
 import pickle
 import logging
 import argparse
+from io import StringIO
+from time import perf_counter
 from datetime import datetime
+from concurrent.futures import wait, FIRST_COMPLETED
+
+import numpy as np
+from sqlalchemy import func
 
 from indra_db import util as dbu
-from indra_db.util import S3Path
+from indra_db.util import S3Path, IntSet, get_process_pool
 from indra_db.util.dump_sif import upload_pickle_to_s3, S3_SUBDIR
 
 logger = logging.getLogger('db_belief')
 
 from indra.belief import BeliefEngine, SimpleScorer
+from indra.statements import Evidence
 
 
 class LoadError(Exception):
@@ -47,12 +54,16 @@ class MockStatement(object):
     def matches_key(self):
         return self.__mk_hash
 
-    def get_hash(self):
+    def get_hash(self, matches_fun=None, refresh=False):
         return self.__mk_hash
 
 
-class MockEvidence(object):
-    """A class to imitate real INDRA Evidence for calculating belief."""
+class MockEvidence(Evidence):
+    """A class to imitate real INDRA Evidence for calculating belief.
+
+    This subclasses Evidence only so that it passes the belief engine's type
+    checks: none of the attributes of real Evidence are set.
+    """
     def __init__(self, source_api, **annotations):
         self.source_api = source_api
 
@@ -92,19 +103,24 @@ def populate_support(stmts, links):
     return
 
 
+def _add_mock_evidence(stmts_dict, src_api, mk_hash, sid, db_name=None):
+    """Add a piece of evidence to a dict of mock statements keyed by hash."""
+    # Add a new mock statement if applicable.
+    if mk_hash not in stmts_dict.keys():
+        stmts_dict[mk_hash] = MockStatement(mk_hash)
+
+    # Add the new evidence.
+    mev = MockEvidence(src_api.lower(), raw_sid=sid, source_sub_id=db_name)
+    stmts_dict[mk_hash].evidence.append(mev)
+
+
 def load_mock_statements(db, hashes=None, sup_links=None):
     """Generate a list of mock statements from the pa statement table."""
     # Initialize a dictionary of evidence keyed by hash.
     stmts_dict = {}
 
     def add_evidence(src_api, mk_hash, sid, db_name=None):
-        # Add a new mock statement if applicable.
-        if mk_hash not in stmts_dict.keys():
-            stmts_dict[mk_hash] = MockStatement(mk_hash)
-
-        # Add the new evidence.
-        mev = MockEvidence(src_api.lower(), raw_sid=sid, source_sub_id=db_name)
-        stmts_dict[mk_hash].evidence.append(mev)
+        _add_mock_evidence(stmts_dict, src_api, mk_hash, sid, db_name)
 
     # Handle the evidence from reading.
     q_rdg = db.filter_query([db.Reading.reader,
@@ -150,42 +166,604 @@ def load_mock_statements(db, hashes=None, sup_links=None):
     return list(stmts_dict.values())
 
 
-def calculate_belief(stmts):
-    scorer = SimpleScorer(subtype_probs={
+def _get_scorer():
+    return SimpleScorer(subtype_probs={
         'biopax': {'pc11': 0.2, 'phosphosite': 0.01},
     })
+
+
+def calculate_belief(stmts):
+    scorer = _get_scorer()
     be = BeliefEngine(scorer=scorer)
     be.set_prior_probs(stmts)
     be.set_hierarchy_probs(stmts)
     return {str(s.get_hash()): s.belief for s in stmts}
 
 
-def get_belief(db=None, partition=True):
+def _get_evidence_class(source_api, db_name=None):
+    """Get the (source, subtype) by which the belief scorer treats evidence.
+
+    As in `indra.belief.tag_evidence_subtype`, only biopax evidence has a
+    subtype (the name of its database) that can be known from the metadata.
+    """
+    source_api = source_api.lower()
+    if source_api == 'biopax':
+        return source_api, db_name
+    return source_api, None
+
+
+def _group_reduce(keys, values, ufunc):
+    """Reduce values with a ufunc over each group of equal keys.
+
+    Returns the sorted unique keys, and the reduced value of each.
+    """
+    if not len(keys):
+        return keys, values
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    return keys[starts], ufunc.reduceat(values[order], starts)
+
+
+def _expand_ranges(starts, stops):
+    """Get the positions within the given ranges, and the range of each."""
+    counts = stops - starts
+    rows = np.repeat(np.arange(len(starts)), counts)
+    offsets = np.cumsum(counts) - counts
+    return np.repeat(starts - offsets, counts) + np.arange(counts.sum()), rows
+
+
+def _make_csr(rows, n_rows):
+    """Get the order that sorts entries by row, and the CSR index pointer."""
+    order = np.argsort(rows, kind='stable')
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return order, indptr
+
+
+class BeliefArrays(object):
+    """The evidence and support of pa statements, held as arrays.
+
+    Rather than one object per statement and per piece of evidence, the
+    evidence is held as counts per statement and evidence class (source and
+    subtype), and the support links as a CSR adjacency over statement indices,
+    so the beliefs of a whole corpus can be scored with a few numpy operations.
+
+    Parameters
+    ----------
+    hashes : numpy.ndarray
+        The sorted unique mk_hashes of the statements.
+    classes : list[tuple]
+        The (source_api, subtype) of each evidence class.
+    ev_stmt, ev_class, ev_count : numpy.ndarray
+        The index of the statement, index of the class, and number of pieces
+        of evidence in each evidence count.
+    sup_ptr, sup_idx : numpy.ndarray
+        The CSR adjacency of the support links: the statements supported by
+        statement `i` are those indexed by `sup_idx[sup_ptr[i]:sup_ptr[i+1]]`.
+    """
+    def __init__(self, hashes, classes, ev_stmt, ev_class, ev_count, sup_ptr,
+                 sup_idx):
+        self.hashes = hashes
+        self.classes = classes
+        self.ev_stmt = ev_stmt
+        self.ev_class = ev_class
+        self.ev_count = ev_count
+        self.sup_ptr = sup_ptr
+        self.sup_idx = sup_idx
+
+    @classmethod
+    def from_counts(cls, ev_counts, links):
+        """Build the arrays from evidence counts and support links.
+
+        Parameters
+        ----------
+        ev_counts : iterable[tuple]
+            Tuples of (mk_hash, source_api, db_name, count). The db_name may
+            be None.
+        links : iterable[tuple]
+            Pairs of hashes, where the first supports the second. As in
+            `populate_support`, links involving statements without evidence
+            are skipped.
+        """
+        class_idx = {}
+        ev_hashes = []
+        ev_classes = []
+        ev_count = []
+        for mk_hash, source_api, db_name, count in ev_counts:
+            ev_class = _get_evidence_class(source_api, db_name)
+            ev_hashes.append(mk_hash)
+            ev_classes.append(class_idx.setdefault(ev_class, len(class_idx)))
+            ev_count.append(count)
+        ev_hashes = np.array(ev_hashes, dtype=np.int64)
+        hashes, ev_stmt = np.unique(ev_hashes, return_inverse=True)
+
+        # Merge any repeated counts of a class for a statement.
+        n_classes = len(class_idx)
+        keys, ev_count = _group_reduce(
+            ev_stmt.astype(np.int64)*n_classes
+            + np.array(ev_classes, dtype=np.int64),
+            np.array(ev_count, dtype=np.int64), np.add
+        )
+        ev_stmt, ev_class = np.divmod(keys, max(n_classes, 1))
+
+        if not isinstance(links, np.ndarray):
+            links = list(links)
+        link_arr = np.asarray(links, dtype=np.int64).reshape(-1, 2)
+        supporting = np.searchsorted(hashes, link_arr[:, 0])
+        supported = np.searchsorted(hashes, link_arr[:, 1])
+        valid = np.ones(len(link_arr), dtype=bool)
+        for idx, col in [(supporting, 0), (supported, 1)]:
+            in_range = idx < len(hashes)
+            valid &= in_range
+            valid[in_range] &= hashes[idx[in_range]] == link_arr[in_range, col]
+        if not valid.all():
+            logger.warning(f"Skipping {(~valid).sum()} support links between "
+                           f"statements without evidence.")
+        supporting = supporting[valid]
+        supported = supported[valid]
+
+        order, sup_ptr = _make_csr(supporting, len(hashes))
+        classes = sorted(class_idx, key=class_idx.get)
+        return cls(hashes, classes, ev_stmt, ev_class, ev_count, sup_ptr,
+                   supported[order])
+
+    @classmethod
+    def from_mock_statements(cls, stmts):
+        """Build the arrays from a list of MockStatements."""
+        ev_counts = ((s.get_hash(), ev.source_api,
+                      ev.annotations.get('source_sub_id'), 1)
+                     for s in stmts for ev in s.evidence)
+        links = ((supping.get_hash(), s.get_hash())
+                 for s in stmts for supping in s.supported_by)
+        return cls.from_counts(ev_counts, links)
+
+    @classmethod
+    def from_db(cls, db, hashes=None, links=None):
+        """Load the arrays from the database.
+
+        The evidence is counted by the database, so only one row per
+        statement and source is loaded.
+
+        Parameters
+        ----------
+        db : PrincipalDatabaseManager
+            The database from which to load the statements.
+        hashes : iterable[int]
+            Optionally only load these statements, and the links between them.
+            By default the whole corpus is loaded.
+        links : iterable[tuple]
+            Optionally give the (supporting, supported) hash pairs, if they
+            have already been loaded. By default they are loaded from the
+            database.
+        """
+        db.grab_session()
+        count = func.count(db.RawUniqueLinks.raw_stmt_id)
+        mk_hash = db.RawUniqueLinks.pa_stmt_mk_hash
+        q_rdg = (db.session.query(mk_hash, db.Reading.reader, count)
+                 .filter(*db.link(db.Reading, db.RawUniqueLinks))
+                 .group_by(mk_hash, db.Reading.reader))
+        q_dbs = (db.session.query(mk_hash, db.DBInfo.source_api,
+                                  db.DBInfo.db_name, count)
+                 .filter(*db.link(db.DBInfo, db.RawUniqueLinks))
+                 .group_by(mk_hash, db.DBInfo.source_api, db.DBInfo.db_name))
+
+        if links is None:
+            links = db.session.query(db.PASupportLinks.supporting_mk_hash,
+                                     db.PASupportLinks.supported_mk_hash)
+            links = links.yield_per(100000)
+        if hashes is None:
+            hash_chunks = [None]
+        else:
+            hashes = IntSet(hashes)
+            hash_list = hashes.tolist()
+            hash_chunks = [hash_list[i:i + 10000]
+                           for i in range(0, len(hash_list), 10000)]
+
+            # Only keep the links among the chosen statements.
+            links = np.asarray(list(links), dtype=np.int64).reshape(-1, 2)
+            links = links[hashes.contains(links[:, 0])
+                          & hashes.contains(links[:, 1])]
+
+        def iter_counts():
+            for hash_chunk in hash_chunks:
+                clauses = []
+                if hash_chunk is not None:
+                    clauses.append(mk_hash.in_(hash_chunk))
+                for h, reader, n in q_rdg.filter(*clauses).yield_per(100000):
+                    yield h, reader, None, n
+                yield from q_dbs.filter(*clauses).yield_per(100000)
+
+        return cls.from_counts(iter_counts(), links)
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def get_support_closure(self):
+        """Get all the (supporting, supported) index pairs, transitively.
+
+        This is equivalent to the descendants of each statement in INDRA's
+        refinements graph. A ValueError is raised if the links form a cycle.
+        """
+        n = len(self.hashes)
+        src = np.repeat(np.arange(n, dtype=np.int64), np.diff(self.sup_ptr))
+        pairs = np.unique(src*n + self.sup_idx)
+        frontier = pairs
+        while len(frontier):
+            # Extend the newest paths by one more link.
+            ends = frontier % n
+            pos, rows = _expand_ranges(self.sup_ptr[ends],
+                                       self.sup_ptr[ends + 1])
+            extended = np.unique((frontier // n)[rows]*n + self.sup_idx[pos])
+            frontier = np.setdiff1d(extended, pairs, assume_unique=True)
+            pairs = np.union1d(pairs, frontier)
+        supporting, supported = np.divmod(pairs, max(n, 1))
+        cycle = supporting == supported
+        if cycle.any():
+            raise ValueError(f"Cycle found in the support links, involving "
+                             f"{self.hashes[supporting[cycle]].tolist()}.")
+        return supporting, supported
+
+    def score(self, scorer=None):
+        """Get the belief of each statement, in the order of the hashes.
+
+        The beliefs are those set by a BeliefEngine's `set_hierarchy_probs`,
+        using a SimpleScorer, and each statement is credited with its own
+        evidence and that of all the statements it (transitively) supports.
+        """
+        if scorer is None:
+            scorer = _get_scorer()
+
+        # Look up the probabilities of each class of evidence.
+        sources = sorted({source for source, _ in self.classes})
+        for err_type in ('rand', 'syst'):
+            missing = set(sources) - set(scorer.prior_probs[err_type])
+            if missing:
+                raise ValueError(f"Missing {err_type} probability parameters "
+                                 f"for sources: {sorted(missing)}.")
+        subtype_probs = scorer.subtype_probs or {}
+        rand = np.array([subtype_probs.get(source, {}).get(
+                             subtype, scorer.prior_probs['rand'][source])
+                         for source, subtype in self.classes])
+        syst = np.array([scorer.prior_probs['syst'][source]
+                         for source in sources])
+        class_source = np.array([sources.index(source)
+                                 for source, _ in self.classes],
+                                dtype=np.int64)
+
+        # Credit each statement with the evidence of those it supports.
+        n = len(self.hashes)
+        supporting, supported = self.get_support_closure()
+        order, ev_ptr = _make_csr(self.ev_stmt, n)
+        pos, rows = _expand_ranges(ev_ptr[supported], ev_ptr[supported + 1])
+        pos = order[pos]
+        stmt = np.concatenate([self.ev_stmt, supporting[rows]])
+        ev_class = np.concatenate([self.ev_class, self.ev_class[pos]])
+        count = np.concatenate([self.ev_count, self.ev_count[pos]])
+
+        # Total the evidence of each class, and get the probability that all
+        # of it is randomly wrong.
+        n_classes = len(self.classes)
+        keys, count = _group_reduce(stmt*n_classes + ev_class, count, np.add)
+        stmt, ev_class = np.divmod(keys, max(n_classes, 1))
+        rand_prob = np.power(rand[ev_class], count)
+
+        # Combine the random and systematic errors of each source.
+        n_sources = len(sources)
+        keys, rand_prob = _group_reduce(
+            stmt*n_sources + class_source[ev_class], rand_prob, np.multiply
+        )
+        stmt, source = np.divmod(keys, max(n_sources, 1))
+        stmt, neg_prob = _group_reduce(stmt, syst[source] + rand_prob,
+                                       np.multiply)
+        beliefs = np.zeros(n)
+        beliefs[stmt] = 1 - neg_prob
+        return beliefs
+
+    def get_belief_dict(self, scorer=None):
+        """Get a dict of beliefs keyed by (string) hash, as calculate_belief.
+        """
+        return dict(zip(map(str, self.hashes.tolist()),
+                        self.score(scorer).tolist()))
+
+
+def _get_connected(seeds, links):
+    """Get the hashes connected to any of the seeds by support links.
+
+    Parameters
+    ----------
+    seeds : IntSet
+        The hashes from which to search.
+    links : numpy.ndarray
+        An array of (supporting, supported) hash pairs.
+    """
+    # Make an index of the links in both directions.
+    src = np.concatenate([links[:, 0], links[:, 1]])
+    dst = np.concatenate([links[:, 1], links[:, 0]])
+    order = np.argsort(src, kind='stable')
+    src = src[order]
+    dst = dst[order]
+
+    connected = IntSet(seeds)
+    frontier = connected.to_array()
+    while len(frontier):
+        pos, _ = _expand_ranges(np.searchsorted(src, frontier, 'left'),
+                                np.searchsorted(src, frontier, 'right'))
+        frontier = (IntSet(dst[pos]) - connected).to_array()
+        connected |= frontier
+    return connected
+
+
+def get_last_link_id(db):
+    """Get the id of the latest raw_unique_links row, or 0 if there are none.
+
+    Links are only ever added, with increasing ids, so the evidence linked to
+    pa statements after a belief calculation has ids above the last id taken
+    before it.
+    """
+    db.grab_session()
+    last_id = db.session.query(func.max(db.RawUniqueLinks.id)).scalar()
+    return last_id or 0
+
+
+def get_belief_update(db, prev_beliefs, last_link_id):
+    """Update the beliefs of an earlier dump with the changes since then.
+
+    The belief of a statement depends only on the evidence of the statements
+    it supports, so only the beliefs in the support components (connected by
+    support links) that have changed since the earlier beliefs are
+    recalculated. A component has changed if it contains a statement missing
+    from `prev_beliefs` (which includes all new pa statements), or a statement
+    with evidence linked to it after `last_link_id`. The links are used rather
+    than the creation time of the raw statements, as raw statements may be
+    linked to pa statements long after they were created. New support links
+    always involve a new pa statement, as `supplement_corpus` only compares
+    new statements with each other and with old statements.
+
+    Note that if statements were removed from the corpus, they are removed
+    from the beliefs, but the statements that had been linked to them are not
+    recalculated. A full calculation should be done in that case.
+
+    Parameters
+    ----------
+    db : PrincipalDatabaseManager
+        The database from which to load the statements.
+    prev_beliefs : dict
+        The earlier beliefs, keyed by (string) hash, as from `get_belief`.
+    last_link_id : int
+        The last id of raw_unique_links included in the earlier beliefs, as
+        from `get_last_link_id` before they were calculated.
+
+    Returns
+    -------
+    beliefs : dict
+        The updated beliefs of all the statements, keyed by (string) hash.
+    delta : dict
+        The changes for the readonly belief table: 'changed' is a dict of the
+        new or changed beliefs keyed by hash, and 'removed' a list of the
+        hashes that no longer have a belief.
+    """
+    db.grab_session()
+    pa_hashes = IntSet(h for h, in db.session.query(db.PAStatements.mk_hash)
+                       .yield_per(100000))
+    prev_hashes = IntSet(int(h) for h in prev_beliefs)
+
+    # Find the statements that have changed.
+    new_ev = (db.session.query(db.RawUniqueLinks.pa_stmt_mk_hash.distinct())
+              .filter(db.RawUniqueLinks.id > last_link_id))
+    touched = IntSet(h for h, in new_ev.yield_per(100000))
+    touched |= pa_hashes - prev_hashes
+
+    # Recalculate the beliefs in the components of those statements.
+    links = np.array(db.select_all([db.PASupportLinks.supporting_mk_hash,
+                                    db.PASupportLinks.supported_mk_hash]),
+                     dtype=np.int64).reshape(-1, 2)
+    affected = _get_connected(touched, links)
+    logger.info(f"Recalculating the beliefs of {len(affected)} statements "
+                f"connected to {len(touched)} new or changed statements.")
+    new_beliefs = BeliefArrays.from_db(db, affected, links).get_belief_dict()
+
+    # Replace the stale beliefs.
+    beliefs = dict(prev_beliefs)
+    stale = (prev_hashes - pa_hashes) | (affected & prev_hashes)
+    for h in stale:
+        del beliefs[str(h)]
+    beliefs.update(new_beliefs)
+
+    delta = {'changed': {h: b for h, b in new_beliefs.items()
+                         if prev_beliefs.get(h) != b},
+             'removed': [str(h) for h in stale if str(h) not in beliefs]}
+    logger.info(f"{len(delta['changed'])} beliefs changed, and "
+                f"{len(delta['removed'])} were removed.")
+    return beliefs, delta
+
+
+def _get_components(n_nodes, src, dst):
+    """Label the connected components of a graph using array union-find.
+
+    The nodes are given by index, and the edges by arrays of the indices of
+    their ends. Each node is labelled with the smallest index in its
+    component.
+    """
+    labels = np.arange(n_nodes)
+    while True:
+        # Hook the root of each end of an edge to the smaller of the two.
+        root_src = labels[src]
+        root_dst = labels[dst]
+        low = np.minimum(root_src, root_dst)
+        np.minimum.at(labels, root_src, low)
+        np.minimum.at(labels, root_dst, low)
+
+        # Point every node directly at its root.
+        while True:
+            jumped = labels[labels]
+            if (jumped == labels).all():
+                break
+            labels = jumped
+
+        if (labels[src] == labels[dst]).all():
+            return labels
+
+
+def _score_group(ev_rows, links):
+    """Calculate the beliefs of a group of statements with the BeliefEngine.
+
+    The evidence rows are tuples of (mk_hash, source_api, db_name, raw_sid).
+    """
+    stmts_dict = {}
+    for mk_hash, src_api, db_name, sid in ev_rows:
+        _add_mock_evidence(stmts_dict, src_api, mk_hash, sid, db_name)
+    populate_support(stmts_dict, links)
+    return calculate_belief(list(stmts_dict.values()))
+
+
+# Evidence with the group of its statement, sorted by group. The group of each
+# statement is loaded into a temporary table.
+GROUP_EVIDENCE_QUERY = """
+SELECT grp.group_id, link.pa_stmt_mk_hash, reading.reader, NULL,
+       link.raw_stmt_id
+FROM raw_unique_links AS link
+  JOIN belief_group AS grp ON grp.mk_hash = link.pa_stmt_mk_hash
+  JOIN raw_statements AS raw ON raw.id = link.raw_stmt_id
+  JOIN reading ON reading.id = raw.reading_id
+UNION ALL
+SELECT grp.group_id, link.pa_stmt_mk_hash, db_info.source_api,
+       db_info.db_name, link.raw_stmt_id
+FROM raw_unique_links AS link
+  JOIN belief_group AS grp ON grp.mk_hash = link.pa_stmt_mk_hash
+  JOIN raw_statements AS raw ON raw.id = link.raw_stmt_id
+  JOIN db_info ON db_info.id = raw.db_info_id
+ORDER BY 1
+"""
+
+
+def _get_partitioned_belief(db, n_workers=1, group_size=10000):
+    """Calculate beliefs group by group, with the BeliefEngine.
+
+    The statements are partitioned into their support components, and the
+    components gathered into groups of about `group_size` statements. The
+    evidence of all the groups is then streamed, sorted by group, from a
+    single query, and the groups are scored as they arrive, in parallel if
+    `n_workers` is more than 1.
+    """
+    timings = {}
+    start = perf_counter()
+    db.grab_session()
+    hashes = IntSet(h for h, in db.session.query(db.PAStatements.mk_hash)
+                    .yield_per(100000)).to_array()
+    links = np.array(db.select_all([db.PASupportLinks.supporting_mk_hash,
+                                    db.PASupportLinks.supported_mk_hash]),
+                     dtype=np.int64).reshape(-1, 2)
+    timings['load hashes and links'] = perf_counter() - start
+
+    # Partition the statements into groups of whole components.
+    start = perf_counter()
+    src = np.searchsorted(hashes, links[:, 0])
+    dst = np.searchsorted(hashes, links[:, 1])
+    labels = _get_components(len(hashes), src, dst)
+    comp_labels, comp_idx, comp_sizes = \
+        np.unique(labels, return_inverse=True, return_counts=True)
+    comp_groups = (np.cumsum(comp_sizes) - comp_sizes) // group_size
+    groups = comp_groups[comp_idx]
+    link_order = np.argsort(groups[src], kind='stable')
+    links = links[link_order]
+    link_groups = groups[src][link_order]
+    timings['partition'] = perf_counter() - start
+    logger.info(f"Partitioned {len(hashes)} statements into "
+                f"{len(comp_labels)} components, in "
+                f"{comp_groups[-1] + 1 if len(comp_groups) else 0} groups.")
+
+    def get_group_links(group_id):
+        lo, hi = np.searchsorted(link_groups, [group_id, group_id + 1])
+        return [(int(supped), int(supping))
+                for supping, supped in links[lo:hi].tolist()]
+
+    executor = get_process_pool(n_workers)
+    if executor is not None:
+        # The workers are only forked with the first job, so start them now,
+        # before the connection and cursor below are opened. With fork, the
+        # first job starts all of them.
+        executor.submit(int).result()
+
+    beliefs = {}
+    jobs = set()
+    conn = db.engine.raw_connection()
+    try:
+        start = perf_counter()
+        cursor = conn.cursor()
+        cursor.execute("CREATE TEMP TABLE belief_group "
+                       "(mk_hash bigint PRIMARY KEY, group_id integer);")
+        for i in range(0, len(hashes), 1000000):
+            group_data = '\n'.join(
+                f'{h}\t{g}' for h, g
+                in zip(hashes[i:i+1000000].tolist(),
+                       groups[i:i+1000000].tolist())
+            )
+            cursor.copy_expert("COPY belief_group FROM STDIN;",
+                               StringIO(group_data))
+        cursor.execute("ANALYZE belief_group;")
+        timings['upload groups'] = perf_counter() - start
+
+        def score(group_id, ev_rows):
+            group_links = get_group_links(group_id)
+            if executor is None:
+                beliefs.update(_score_group(ev_rows, group_links))
+                return
+
+            # Keep only a few groups waiting at a time.
+            while len(jobs) >= 2*n_workers:
+                finished, _ = wait(jobs, return_when=FIRST_COMPLETED)
+                for job in finished:
+                    jobs.remove(job)
+                    beliefs.update(job.result())
+            jobs.add(executor.submit(_score_group, ev_rows, group_links))
+
+        start = perf_counter()
+        ev_cursor = conn.cursor(name='belief_evidence')
+        ev_cursor.itersize = 100000
+        ev_cursor.execute(GROUP_EVIDENCE_QUERY)
+        group_id = None
+        ev_rows = []
+        for row_group, mk_hash, src_api, db_name, sid in ev_cursor:
+            if row_group != group_id:
+                if ev_rows:
+                    score(group_id, ev_rows)
+                group_id = row_group
+                ev_rows = []
+            ev_rows.append((mk_hash, src_api, db_name, sid))
+        if ev_rows:
+            score(group_id, ev_rows)
+        for job in jobs:
+            beliefs.update(job.result())
+        ev_cursor.close()
+        timings['load evidence and score'] = perf_counter() - start
+    finally:
+        conn.rollback()
+        conn.close()
+        if executor is not None:
+            executor.shutdown()
+
+    report = '\n'.join(f'{stage:<25} {secs:10.1f}s'
+                       for stage, secs in timings.items())
+    logger.info(f"Time spent calculating {len(beliefs)} beliefs:\n{report}")
+    return beliefs
+
+
+def get_belief(db=None, partition=True, vectorized=False, n_workers=1):
+    """Get the beliefs of all the pa statements, keyed by (string) hash.
+
+    If `vectorized`, the whole corpus is scored at once using BeliefArrays,
+    and `partition` has no effect. Otherwise, if `partition`, the corpus is
+    scored in groups of support components, using `n_workers` processes (see
+    `_get_partitioned_belief`).
+    """
     if db is None:
         db = dbu.get_db('primary')
 
-    if partition:
-        import networkx as nx
-        hashes = {h for h, in db.select_all(db.PAStatements.mk_hash)}
-        link_pair = [db.PASupportLinks.supporting_mk_hash,
-                     db.PASupportLinks.supported_mk_hash]
-        links = {tuple(link) for link in db.select_all(link_pair)}
-        g = nx.Graph()
-        g.add_nodes_from(hashes)
-        g.add_edges_from(links)
-
-        group = set()
-        beliefs = {}
-        for c in nx.connected_components(g):
-            group |= c
-
-            if len(group) >= 10000:
-                sg = g.subgraph(group)
-                stmts = load_mock_statements(db, hashes=group,
-                                             sup_links=list(sg.edges))
-                beliefs.update(calculate_belief(stmts))
-                group = set()
-        return beliefs
+    if vectorized:
+        return BeliefArrays.from_db(db).get_belief_dict()
+    elif partition:
+        return _get_partitioned_belief(db, n_workers)
     else:
         stmts = load_mock_statements(db)
         return calculate_belief(stmts)
@@ -203,8 +781,18 @@ if __name__ == '__main__':
                         default=False,
                         help='Upload belief dict to the bigmech s3 bucket '
                              'instead of saving it locally')
+    parser.add_argument('--vectorized',
+                        action='store_true',
+                        help='Score the whole corpus at once with numpy, '
+                             'instead of with the INDRA belief engine.')
+    parser.add_argument('-w', '--workers',
+                        type=int,
+                        default=1,
+                        help='The number of processes with which to score '
+                             'groups of statements in parallel.')
     args = parser.parse_args()
-    belief_dict = get_belief()
+    belief_dict = get_belief(vectorized=args.vectorized,
+                             n_workers=args.workers)
     if args.s3:
         key = '/'.join([datetime.utcnow().strftime('%Y-%m-%d'), args.fname])
         s3_path = S3Path(S3_SUBDIR, key)
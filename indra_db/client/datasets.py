@@ -5,7 +5,6 @@ import logging
 from itertools import permutations
 from sqlalchemy import or_
 
-from indra.databases import hgnc_client
 from indra_db.util import get_db, get_statement_object
 
 logger = logging.getLogger(__name__)
@@ -119,6 +118,8 @@ def get_relation_dict(db, groundings=None, with_evidence_count=False,
 
         # Handle the case that this is or isn't HGNC
         if ag_dbname == 'HGNC':
+            # Loading the HGNC tables is slow, so only do it when needed.
+            from indra.databases import hgnc_client
             ag_tpl = (ag_id, ag_role, ag_dbname, ag_dbid,
                       hgnc_client.get_hgnc_name(ag_dbid))
         else:
@@ -127,7 +127,7 @@ def get_content_by_refs(db, pmid_list=None, trid_list=None, sources=None,
                                      db.TextContent.text_ref_id.in_(trid_list),
                                      *clauses)
     if unzip:
-        content_dict = {id_val: unpack(content)
+        content_dict = {id_val: unpack(content, db=db)
                         for id_val, content in content_list}
     else:
         content_dict = {id_val: content for id_val, content in content_list}
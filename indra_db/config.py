@@ -4,8 +4,6 @@ from functools import wraps
 from os import path, mkdir, environ
 from shutil import copyfile
 
-from indra_db.util.s3_path import S3Path
-
 if sys.version_info[0] == 3:
     from configparser import ConfigParser
 else:
@@ -165,6 +163,8 @@ def get_s3_dump(force_update=False, include_config=True):
     if 's3_dump' not in CONFIG:
         return None
 
+    # Imported here to avoid a circular import with indra_db.util.
+    from indra_db.util.s3_path import S3Path
     return S3Path(CONFIG['s3_dump']['bucket'], CONFIG['s3_dump'].get('prefix'))
 
 
@@ -1,15 +1,341 @@
-__all__ = ['CopyManager', 'LazyCopyManager', 'PushCopyManager']
+__all__ = ['CopyManager', 'LazyCopyManager', 'PushCopyManager',
+           'TypedCopyManager', 'BinaryCopyEncoder']
 
+import json
 import logging
 import tempfile
+from io import BytesIO
+from copy import copy
+from struct import Struct, error as StructError
+from datetime import datetime, date, timezone, timedelta
 
 from pgcopy import CopyManager
 
+from indra_db.exceptions import IndraDbException
+
 
 logger = logging.getLogger(__name__)
 
 
-class LazyCopyManager(CopyManager):
+BINCOPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + b'\x00' * 8
+BINCOPY_TRAILER = b'\xff\xff'
+_NULL = b'\xff\xff\xff\xff'
+_LEN = Struct('>i')
+
+_PG_EPOCH = datetime(2000, 1, 1)
+_PG_EPOCH_DATE = date(2000, 1, 1)
+_ONE_US = timedelta(microseconds=1)
+
+# The struct codes of types with a fixed width binary representation.
+_FIXED_CODES = {'smallint': 'h', 'integer': 'i', 'bigint': 'q', 'real': 'f',
+                'double precision': 'd', 'boolean': '?',
+                'timestamp without time zone': 'q',
+                'timestamp with time zone': 'q', 'date': 'i'}
+_TYPE_ALIASES = {'varchar': 'text', 'character varying': 'text',
+                 'char': 'text', 'character': 'text', 'int': 'integer',
+                 'int4': 'integer', 'int8': 'bigint', 'int2': 'smallint',
+                 'float': 'double precision',
+                 'float4': 'real', 'float8': 'double precision',
+                 'bool': 'boolean', 'timestamp': 'timestamp without time zone',
+                 'datetime': 'timestamp without time zone',
+                 'timestamptz': 'timestamp with time zone'}
+
+
+def _to_pg_timestamp(val):
+    if val.tzinfo is not None:
+        val = val.astimezone(timezone.utc).replace(tzinfo=None)
+    return (val - _PG_EPOCH) // _ONE_US
+
+
+def _to_pg_date(val):
+    return (val - _PG_EPOCH_DATE).days
+
+
+_CONVERTERS = {'timestamp without time zone': _to_pg_timestamp,
+               'timestamp with time zone': _to_pg_timestamp,
+               'date': _to_pg_date}
+
+
+def _normalize_type(pg_type):
+    pg_type = pg_type.lower().split('(')[0].strip()
+    return _TYPE_ALIASES.get(pg_type, pg_type)
+
+
+def _get_value_encoder(pg_type):
+    """Get a function that encodes a (non-null) value with its length."""
+    if pg_type in _FIXED_CODES:
+        fmt = Struct('>i' + _FIXED_CODES[pg_type])
+        width = fmt.size - 4
+        convert = _CONVERTERS.get(pg_type)
+        if convert is None:
+            return lambda val: fmt.pack(width, val)
+        return lambda val: fmt.pack(width, convert(val))
+
+    if pg_type in {'text', 'bytea'}:
+        def encode(val):
+            # Dicts are stored as json, as they always have been.
+            if isinstance(val, dict):
+                val = json.dumps(val)
+            if isinstance(val, str):
+                val = val.encode('utf-8')
+            return _LEN.pack(len(val)) + val
+        return encode
+
+    if pg_type in {'json', 'jsonb'}:
+        # The binary jsonb format is the text prefixed with a version number.
+        prefix = b'\x01' if pg_type == 'jsonb' else b''
+
+        def encode(val):
+            if isinstance(val, (dict, list)):
+                val = json.dumps(val)
+            if isinstance(val, str):
+                val = val.encode('utf-8')
+            return _LEN.pack(len(val) + len(prefix)) + prefix + val
+        return encode
+
+    raise IndraDbException(f"No binary copy encoder for type {pg_type}.")
+
+
+class BinaryCopyEncoder(object):
+    """Encode rows in the binary COPY format, with encoders compiled per column.
+
+    Rows are formatted directly from python (or NumPy) values into the format
+    read by `COPY ... FROM STDIN WITH BINARY`, based on the postgres type of
+    each column, rather than checking the type of each value.
+
+    Parameters
+    ----------
+    cols : list[str]
+        The names of the columns, in the order they appear in each row.
+    pg_types : list[str]
+        The postgres types of the columns, e.g. "bigint" or "VARCHAR(20)".
+    """
+    def __init__(self, cols, pg_types):
+        self.cols = tuple(cols)
+        self.pg_types = tuple(_normalize_type(t) for t in pg_types)
+        self.extra = ()
+        self._encoders = [_get_value_encoder(t) for t in self.pg_types]
+        self._row_head = Struct('>h').pack(len(self.cols))
+
+        # If every column has a fixed width, the values of each row can be
+        # packed at once, and laid out as rows in a single pass.
+        codes = [_FIXED_CODES.get(t) for t in self.pg_types]
+        self.fixed_width = all(codes)
+        if self.fixed_width:
+            self._codes = codes
+            self._widths = [Struct('>' + c).size for c in codes]
+            self._converters = [_CONVERTERS.get(t) for t in self.pg_types]
+            self._fixed_packers = {}
+
+    @staticmethod
+    def is_supported(pg_type):
+        """Check whether values of a postgres type can be encoded."""
+        pg_type = _normalize_type(pg_type)
+        return pg_type in _FIXED_CODES \
+            or pg_type in {'text', 'bytea', 'json', 'jsonb'}
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Build an encoder from sqlalchemy column objects.
+
+        Returns None if any of the column types is not supported.
+        """
+        from sqlalchemy.dialects import postgresql
+        dialect = postgresql.dialect()
+        pg_types = [col.type.compile(dialect=dialect) for col in columns]
+        if not all(cls.is_supported(t) for t in pg_types):
+            return None
+        return cls([col.name for col in columns], pg_types)
+
+    def with_extra(self, extra):
+        """Get a copy of this encoder that appends `extra` to every row."""
+        new = copy(self)
+        new.extra = tuple(extra)
+        if self.fixed_width:
+            new._fixed_packers = {}
+        return new
+
+    def encode(self, data):
+        """Encode a list of rows, or a NumPy array, as binary COPY data."""
+        if type(data).__module__ == 'numpy':
+            return self.encode_array(data)
+        if self.fixed_width:
+            return self._encode_fixed(data)
+        return self._encode_rows(data)
+
+    def _encode_rows(self, data):
+        n_cols = len(self.cols)
+        encoders = self._encoders
+        row_head = self._row_head
+        tail = b''.join(self._encode_value(i, val) for i, val
+                        in enumerate(self.extra, n_cols - len(self.extra)))
+        parts = [BINCOPY_HEADER]
+        append = parts.append
+        for row in data:
+            if len(row) + len(self.extra) != n_cols:
+                raise ValueError("Number of columns does not match number of "
+                                 "columns in data.")
+            append(row_head)
+            try:
+                for encode, val in zip(encoders, row):
+                    append(_NULL if val is None else encode(val))
+            except (StructError, TypeError, AttributeError):
+                self._raise_bad_row(row)
+            append(tail)
+        append(BINCOPY_TRAILER)
+        return b''.join(parts)
+
+    def _encode_value(self, idx, val):
+        if val is None:
+            return _NULL
+        return self._encoders[idx](val)
+
+    def _raise_bad_row(self, row):
+        for idx, val in enumerate(row):
+            try:
+                self._encode_value(idx, val)
+            except (StructError, TypeError, AttributeError) as err:
+                raise IndraDbException(
+                    f"Could not encode {val!r} ({type(val)}) for column "
+                    f"{self.cols[idx]} of type {self.pg_types[idx]}: {err}"
+                )
+        raise IndraDbException(f"Could not encode row: {row}")
+
+    def _make_values_packer(self, n_data_cols):
+        """Get a function that packs the values of rows into a NumPy array.
+
+        The values of each row are packed with a single call of a struct
+        precompiled for the columns, which is several times faster than
+        packing them one by one. None is returned if any row has a null,
+        though a null is only looked for ahead of time if it could be packed
+        (as False, in a boolean column), and is otherwise found by the error
+        it causes.
+        """
+        import numpy as np
+        codes = self._codes[:n_data_cols]
+        values_struct = Struct('>' + ''.join(codes))
+        pack_into = values_struct.pack_into
+        size = values_struct.size
+        dtype = np.dtype([(f'v{i}', '>' + code)
+                          for i, code in enumerate(codes)])
+        assert dtype.itemsize == size, "Values struct is not packed."
+        converters = [(i, conv) for i, conv
+                      in enumerate(self._converters[:n_data_cols])
+                      if conv is not None]
+        check_nulls = '?' in codes
+
+        def pack_values(data):
+            buf = bytearray(len(data)*size)
+            offset = 0
+            for row in data:
+                if check_nulls and None in row:
+                    return None
+                if converters:
+                    row = list(row)
+                    for i, conv in converters:
+                        row[i] = conv(row[i])
+                pack_into(buf, offset, *row)
+                offset += size
+            return np.frombuffer(buf, dtype=dtype)
+        return pack_values
+
+    def _encode_fixed(self, data):
+        n_data_cols = len(self.cols) - len(self.extra)
+        if n_data_cols == 0 or None in self.extra:
+            return self._encode_rows(data)
+        if n_data_cols not in self._fixed_packers:
+            self._fixed_packers[n_data_cols] = \
+                self._make_values_packer(n_data_cols)
+        pack_values = self._fixed_packers[n_data_cols]
+        try:
+            values = pack_values(data)
+        except (StructError, TypeError, AttributeError, IndexError):
+            if any(None in row for row in data):
+                return self._encode_rows(data)
+
+            # Find the row that caused the problem.
+            for row in data:
+                if len(row) != n_data_cols:
+                    raise ValueError("Number of columns does not match "
+                                     "number of columns in data.")
+            self._encode_rows(data)
+            raise
+
+        # Rows with nulls are shorter, so they are encoded one by one.
+        if values is None:
+            return self._encode_rows(data)
+        tail = [conv(val) if conv else val for conv, val
+                in zip(self._converters[n_data_cols:], self.extra)]
+        return self._encode_columns([values[name]
+                                     for name in values.dtype.names], tail)
+
+    def encode_array(self, arr):
+        """Encode the rows of a NumPy array without a python-level loop.
+
+        The array may be 2-dimensional, with a column for each column of the
+        table, or a structured array with a field for each column. All columns
+        must have a fixed-width type, and nulls are not supported.
+        """
+        if not self.fixed_width:
+            raise IndraDbException("Only tables with fixed-width columns can "
+                                   "be copied from arrays.")
+        if arr.dtype.names:
+            columns = [arr[name] for name in arr.dtype.names]
+        elif arr.ndim == 2:
+            columns = [arr[:, i] for i in range(arr.shape[1])]
+        else:
+            raise ValueError("Array must be 2-dimensional or structured.")
+        return self._encode_columns(columns, self.extra)
+
+    def _encode_columns(self, columns, tail):
+        """Lay out columns of values (and constant tail values) as rows."""
+        import numpy as np
+        n_rows = len(columns[0])
+        columns = list(columns) + [np.full(n_rows, val) for val in tail]
+        if len(columns) != len(self.cols):
+            raise ValueError("Number of columns does not match number of "
+                             "columns in data.")
+
+        fields = [('n_cols', '>i2')]
+        for i, (code, width) in enumerate(zip(self._codes, self._widths)):
+            fields += [(f'len_{i}', '>i4'), (f'val_{i}', '>' + code)]
+        rows = np.empty(n_rows, dtype=fields)
+        rows['n_cols'] = len(self.cols)
+        for i, (col, width) in enumerate(zip(columns, self._widths)):
+            if np.issubdtype(col.dtype, np.datetime64):
+                col = (col - np.datetime64(_PG_EPOCH)).astype('timedelta64[us]')\
+                    .astype(np.int64)
+            elif col.dtype == object and self._converters[i]:
+                col = np.array([self._converters[i](v) for v in col])
+            rows[f'len_{i}'] = width
+            rows[f'val_{i}'] = col
+        return BINCOPY_HEADER + rows.tobytes() + BINCOPY_TRAILER
+
+
+class TypedCopyManager(CopyManager):
+    """A copy manager that can use a precompiled `BinaryCopyEncoder`."""
+    def __init__(self, conn, table, cols, encoder=None):
+        super().__init__(conn, table, cols)
+        self.encoder = encoder
+        return
+
+    def copy(self, data, fobject_factory=tempfile.TemporaryFile):
+        if self.encoder is None:
+            return super().copy(data, fobject_factory)
+
+        encoded = self.encoder.encode(data)
+        if fobject_factory is BytesIO:
+            datastream = BytesIO(encoded)
+        else:
+            datastream = fobject_factory()
+            datastream.write(encoded)
+            datastream.seek(0)
+        self.copystream(datastream)
+        datastream.close()
+        return
+
+
+class LazyCopyManager(TypedCopyManager):
     """A copy manager that ignores entries which violate constraints."""
     _fill_tmp_fmt = ('CREATE TEMP TABLE "tmp_{table}"\n'
                      'ON COMMIT DROP\n'
@@ -22,8 +348,8 @@ class LazyCopyManager(CopyManager):
                   'SELECT "{cols}"\n'
                   'FROM "tmp_{table}" ON CONFLICT ')
 
-    def __init__(self, conn, table, cols, constraint=None):
-        super().__init__(conn, table, cols)
+    def __init__(self, conn, table, cols, constraint=None, encoder=None):
+        super().__init__(conn, table, cols, encoder=encoder)
         self.constraint = constraint
         return
 
@@ -7,11 +7,15 @@ import json
 import random
 import logging
 import string
-from io import BytesIO
+import threading
+from io import BytesIO, StringIO
+from os import path
+from shutil import copyfileobj
 from numbers import Number
 from functools import wraps
 from datetime import datetime
 from time import sleep
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 
@@ -28,19 +32,11 @@ from sqlalchemy.engine.url import make_url
 from indra.util import batch_iter
 from indra_db.config import CONFIG, build_db_url, is_db_testing
 from indra_db.schemas.mixins import IndraDBTableMetaClass
-from indra_db.util import S3Path
 from indra_db.exceptions import IndraDbException
 from indra_db.schemas import principal_schema, readonly_schema
 from indra_db.schemas.readonly_schema import CREATE_ORDER
 
 
-try:
-    import networkx as nx
-    WITH_NX = True
-except ImportError:
-    WITH_NX = False
-
-
 logger = logging.getLogger(__name__)
 
 
@@ -160,6 +156,15 @@ class IndraTableError(IndraDbException):
         super(IndraTableError, self).__init__(self, msg)
 
 
+class ReadonlyRefreshError(IndraDbException):
+    pass
+
+
+# The schema in which the changes made by a refresh of the readonly schema are
+# staged and exported.
+READONLY_DELTA_SCHEMA = 'readonly_delta'
+
+
 class RdsInstanceNotFoundError(IndraDbException):
     def __init__(self, instance_identifier):
         msg = f"No instance with name \"{instance_identifier}\" found on RDS."
@@ -196,6 +201,35 @@ def get_instance_attribute(attribute, instance_identifier):
     raise RdsInstanceNotFoundError(instance_identifier)
 
 
+class _ThreadHandles(object):
+    """Handles to a database, one for each thread, all closed on exit."""
+    def __init__(self, db):
+        self.db = db
+        self._local = threading.local()
+        self._handles = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Get the handle of the current thread, making it if need be."""
+        if not hasattr(self._local, 'db'):
+            self._local.db = self.db.__class__(self.db.url,
+                                               label=self.db.label)
+            with self._lock:
+                self._handles.append(self._local.db)
+        return self._local.db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        for db in self._handles:
+            if db.session is not None:
+                db.session.close()
+            db.engine.dispose()
+        self._handles = []
+        return
+
+
 class DatabaseManager(object):
     """An object used to access INDRA's database.
 
@@ -243,40 +277,86 @@ class DatabaseManager(object):
         self.session = None
         self.label = label
         self._conn = None
+        self._available = None
+        self._tables = None
+        self._foreign_key_map = None
+        self.__foreign_key_graph = None
+        self._copy_encoders = {}
 
         # To stringify table classes, we must merge the two meta classes.
         class BaseMeta(DeclarativeMeta, IndraDBTableMetaClass):
             pass
         self.Base = declarative_base(metaclass=BaseMeta)
 
-        # Check to see if the database if available.
-        self.available = True
-        try:
-            create_engine(
-                self.url,
-                connect_args={'connect_timeout': 1}
-            ).execute('SELECT 1 AS ping;')
-        except Exception as err:
-            logger.warning(f"Database {repr(self.url)} is not available: {err}")
-            self.available = False
-            return
-
-        # Create the engine (connection manager).
+        # Create the engine (connection manager). No connection is made until
+        # one is needed.
         self.engine = create_engine(self.url)
         return
 
+    @property
+    def available(self):
+        """Whether the database can be reached, checked on first access."""
+        if self._available is None:
+            self._available = True
+            try:
+                create_engine(
+                    self.url,
+                    connect_args={'connect_timeout': 1}
+                ).execute('SELECT 1 AS ping;')
+            except Exception as err:
+                logger.warning(f"Database {repr(self.url)} is not available: "
+                               f"{err}")
+                self._available = False
+        return self._available
+
+    @property
+    def tables(self):
+        """The table classes, keyed by table name, built on first access."""
+        if self._tables is None:
+            self._tables = {}
+            self._init_tables()
+        return self._tables
+
+    def _init_tables(self):
+        """Construct the table classes, populating `_tables`."""
+        return
+
+    def get_metadata(self):
+        """Get the sqlalchemy metadata, with all the tables defined."""
+        if self._tables is None:
+            self.tables
+        return self.Base.metadata
+
+    def __getattr__(self, item):
+        # Only called when an attribute is not found, which includes the table
+        # classes (e.g. db.TextRef) before the schema is constructed.
+        if item.startswith('__') or self.__dict__.get('_tables', {}) \
+                is not None:
+            raise AttributeError(f"'{self.__class__.__name__}' object has no "
+                                 f"attribute '{item}'")
+        self.tables
+        return getattr(self, item)
+
     def _init_foreign_key_map(self, foreign_key_map):
         # There are some useful shortcuts that can be used if
-        # networkx is available, specifically the DatabaseManager.link
-        if WITH_NX and foreign_key_map:
+        # networkx is available, specifically the DatabaseManager.link. The
+        # graph is only built when first needed.
+        self._foreign_key_map = foreign_key_map
+
+    def _get_foreign_key_graph(self):
+        if self.__foreign_key_graph is None and self._foreign_key_map:
+            try:
+                import networkx as nx
+            except ImportError:
+                return None
             G = nx.Graph()
-            G.add_edges_from(foreign_key_map)
+            G.add_edges_from(self._foreign_key_map)
             self.__foreign_key_graph = G
-        else:
-            self.__foreign_key_graph = None
+        return self.__foreign_key_graph
 
     def __del__(self, *args, **kwargs):
-        if not self.available:
+        # If no session was ever made, there is nothing to roll back.
+        if self.__dict__.get('session') is None:
             return
         try:
             self.grab_session()
@@ -434,6 +514,39 @@ class DatabaseManager(object):
                         % (schema_name, 'CASCADE' if cascade else ''))
         return
 
+    def get_schema_state(self, schema_name):
+        """Get the record of how a schema was built, if there is one.
+
+        The record is a json dict stored as the comment on the schema.
+        """
+        if schema_name not in self.get_schemas():
+            return None
+        with self.engine.connect() as con:
+            res = con.execute(f"SELECT obj_description("
+                              f"'{schema_name}'::regnamespace, "
+                              f"'pg_namespace');")
+            comment, = res.fetchone()
+        if not comment:
+            return None
+        try:
+            return json.loads(comment)
+        except ValueError:
+            return None
+
+    def _set_schema_state(self, schema_name, state, cursor=None):
+        """Record how a schema was built, see `get_schema_state`."""
+        sql = f"COMMENT ON SCHEMA {schema_name} IS %s;"
+        if cursor is not None:
+            cursor.execute(sql, (json.dumps(state),))
+            return
+        conn = self.engine.raw_connection()
+        try:
+            conn.cursor().execute(sql, (json.dumps(state),))
+            conn.commit()
+        finally:
+            conn.close()
+        return
+
     def get_column_names(self, table):
         """"Get a list of the column labels for a table.
 
@@ -450,7 +563,7 @@ class DatabaseManager(object):
         """
         if isinstance(table, type(self.Base)):
             table = table.full_name()
-        return self.Base.metadata.tables[table].columns
+        return self.get_metadata().tables[table].columns
 
     def commit(self, err_msg):
         "Commit, and give useful info if there is an exception."
@@ -500,9 +613,10 @@ class DatabaseManager(object):
         """
         table_name_1 = table_1.__tablename__
         table_name_2 = table_2.__tablename__
-        if WITH_NX:
-            fk_path = nx.shortest_path(self.__foreign_key_graph, table_name_1,
-                                       table_name_2)
+        fk_graph = self._get_foreign_key_graph()
+        if fk_graph is not None:
+            import networkx as nx
+            fk_path = nx.shortest_path(fk_graph, table_name_1, table_name_2)
         else:
             fk_path = [table_name_1, table_name_2]
 
@@ -612,12 +726,48 @@ class DatabaseManager(object):
         """
         return random.randint(-2**30, 2**30)
 
+    def _get_copy_encoder(self, tbl_name, cols):
+        """Get the binary copy encoder for the given columns of a table.
+
+        Encoders are compiled from the column types once, and cached. If any
+        of the column types is not supported, None is returned.
+        """
+        key = (tbl_name, tuple(cols))
+        if key in self._copy_encoders:
+            return self._copy_encoders[key]
+
+        col_objs = self.get_column_objects(tbl_name)
+        encoder = BinaryCopyEncoder.from_columns([col_objs[c] for c in cols])
+
+        # The binary format must match the types in the database exactly, so
+        # make sure they have not diverged from the table definitions.
+        if encoder is not None:
+            cursor = self._conn.cursor()
+            cursor.execute("SELECT attname, format_type(atttypid, atttypmod) "
+                           "FROM pg_attribute "
+                           "WHERE attrelid = %s::regclass AND attnum > 0 "
+                           "  AND NOT attisdropped;", (tbl_name,))
+            db_types = dict(cursor.fetchall())
+            db_types = [db_types[c] for c in cols]
+            if not all(BinaryCopyEncoder.is_supported(t) for t in db_types):
+                encoder = None
+            else:
+                db_encoder = BinaryCopyEncoder(cols, db_types)
+                if db_encoder.pg_types != encoder.pg_types:
+                    logger.warning(f"Column types of {tbl_name} in the "
+                                   f"database ({db_encoder.pg_types}) do not "
+                                   f"match those defined ({encoder.pg_types}). "
+                                   f"Using the types in the database.")
+                    encoder = db_encoder
+        self._copy_encoders[key] = encoder
+        return encoder
+
     def _prep_copy(self, tbl_name, data, cols):
 
         # If cols is not specified, use all the cols in the table, else check
         # to make sure the names are valid.
         if cols is None:
-            cols = self.get_column_names(tbl_name)
+            cols = tuple(self.get_column_names(tbl_name))
         else:
             db_cols = self.get_column_names(tbl_name)
             assert all([col in db_cols for col in cols]), \
@@ -627,16 +777,30 @@ class DatabaseManager(object):
         # Check for automatic timestamps which won't be applied by the
         # database when using copy, and manually insert them.
         auto_timestamp_type = type(func.now())
+        extra = ()
         for col in self.get_column_objects(tbl_name):
             if col.default is not None:
                 if isinstance(col.default.arg, auto_timestamp_type) \
                         and col.name not in cols:
                     logger.info("Applying timestamps to %s." % col.name)
-                    now = datetime.utcnow()
-                    cols += (col.name,)
-                    data = [datum + (now,) for datum in data]
+                    cols = tuple(cols) + (col.name,)
+                    extra += (datetime.utcnow(),)
 
-        # Format the data for the copy.
+        # Prep the connection.
+        if self._conn is None:
+            self._conn = self.engine.raw_connection()
+            self._conn.rollback()
+
+        # Get the encoder, which formats the data for the copy.
+        encoder = self._get_copy_encoder(tbl_name, cols)
+        if encoder is not None:
+            if extra:
+                encoder = encoder.with_extra(extra)
+            return cols, data, encoder
+
+        # Otherwise, format the data for pgcopy.
+        if extra:
+            data = [tuple(datum) + extra for datum in data]
         data_bts = []
         n_cols = len(cols)
         for entry in data:
@@ -666,18 +830,13 @@ class DatabaseManager(object):
                     )
             data_bts.append(tuple(new_entry))
 
-        # Prep the connection.
-        if self._conn is None:
-            self._conn = self.engine.raw_connection()
-            self._conn.rollback()
-
-        return cols, data_bts
+        return cols, data_bts, None
 
     @_copy_method(list)
     def copy_report_lazy(self, tbl_name, data, cols=None, commit=True,
                          constraint=None, return_cols=None, order_by=None):
         """Copy lazily, and report what rows were skipped."""
-        cols, data_bts = self._prep_copy(tbl_name, data, cols)
+        cols, data_bts, encoder = self._prep_copy(tbl_name, data, cols)
 
         if not order_by:
             order_by = getattr(self.tables[tbl_name],
@@ -687,17 +846,17 @@ class DatabaseManager(object):
                                  "and no `order_by` was specified." % tbl_name)
 
         mngr = LazyCopyManager(self._conn, tbl_name, cols,
-                               constraint=constraint)
+                               constraint=constraint, encoder=encoder)
         return mngr.report_copy(data_bts, order_by, return_cols, BytesIO)
 
     @_copy_method()
     def copy_lazy(self, tbl_name, data, cols=None, commit=True,
                   constraint=None):
         "Copy lazily, skip any rows that violate constraints."
-        cols, data_bts = self._prep_copy(tbl_name, data, cols)
+        cols, data_bts, encoder = self._prep_copy(tbl_name, data, cols)
 
         mngr = LazyCopyManager(self._conn, tbl_name, cols,
-                               constraint=constraint)
+                               constraint=constraint, encoder=encoder)
         mngr.copy(data_bts, BytesIO)
         return
 
@@ -743,13 +902,13 @@ class DatabaseManager(object):
     def copy_push(self, tbl_name, data, cols=None, commit=True,
                   constraint=None):
         "Copy, pushing any changes to constraint violating rows."
-        cols, data_bts = self._prep_copy(tbl_name, data, cols)
+        cols, data_bts, encoder = self._prep_copy(tbl_name, data, cols)
 
         if constraint is None:
             constraint = self._infer_constraint(tbl_name, cols)
 
         mngr = PushCopyManager(self._conn, tbl_name, cols,
-                               constraint=constraint)
+                               constraint=constraint, encoder=encoder)
         mngr.copy(data_bts, BytesIO)
         return
 
@@ -757,7 +916,7 @@ class DatabaseManager(object):
     def copy_report_push(self, tbl_name, data, cols=None, commit=True,
                          constraint=None, return_cols=None, order_by=None):
         """Report on the rows skipped when pushing and copying."""
-        cols, data_bts = self._prep_copy(tbl_name, data, cols)
+        cols, data_bts, encoder = self._prep_copy(tbl_name, data, cols)
 
         if constraint is None:
             constraint = self._infer_constraint(tbl_name, cols)
@@ -770,14 +929,14 @@ class DatabaseManager(object):
                                  % tbl_name)
 
         mngr = PushCopyManager(self._conn, tbl_name, cols,
-                               constraint=constraint)
+                               constraint=constraint, encoder=encoder)
         return mngr.report_copy(data_bts, order_by, return_cols, BytesIO)
 
     @_copy_method()
     def copy(self, tbl_name, data, cols=None, commit=True):
         "Use pg_copy to copy over a large amount of data."
-        cols, data_bts = self._prep_copy(tbl_name, data, cols)
-        mngr = CopyManager(self._conn, tbl_name, cols)
+        cols, data_bts, encoder = self._prep_copy(tbl_name, data, cols)
+        mngr = TypedCopyManager(self._conn, tbl_name, cols, encoder=encoder)
         mngr.copy(data_bts, BytesIO)
         return
 
@@ -967,7 +1126,7 @@ class DatabaseManager(object):
                 '-w',  # Don't prompt for a password, forces use of env.
                 '-d', self.url.database]
 
-    def pg_dump(self, dump_file, **options):
+    def pg_dump(self, dump_file, jobs=None, **options):
         """Use the pg_dump command to dump part of the database onto s3.
 
         The `pg_dump` tool must be installed, and must be a compatible version
@@ -975,7 +1134,7 @@ class DatabaseManager(object):
 
         All keyword arguments are converted into flags/arguments of pg_dump. For
         documentation run `pg_dump --help`. This will also confirm you have
-        `pg_dump` installed.
+        `pg_dump` installed. A list of values gives the flag once for each.
 
         By default, the "General" and "Connection" options are already set. The
         most likely specification you will want to use is `--table` or
@@ -984,14 +1143,16 @@ class DatabaseManager(object):
         Parameters
         ----------
         dump_file : S3Path or str
-            The location on s3 where the content should be dumped.
+            The location on s3 where the content should be dumped. A string
+            that is not an s3 url (s3://...) is taken as a local file path.
+        jobs : Optional[int]
+            If given, dump `jobs` tables at a time using the directory format,
+            and upload the directory as a single (tar) archive. Such archives
+            are recognized automatically by `pg_restore`. By default, a single
+            process custom-format dump is made.
         """
-        if isinstance(dump_file, str):
-            dump_file = S3Path.from_string(dump_file)
-        elif dump_file is not None and not isinstance(dump_file, S3Path):
-            raise ValueError("Argument `dump_file` must be appropriately "
-                             "formatted string or S3Path object, not %s."
-                             % type(dump_file))
+        from indra_db.util.s3_path import S3Path
+        dump_file = _resolve_dump_file(dump_file)
 
         from os import environ
         from subprocess import run, PIPE
@@ -1006,12 +1167,17 @@ class DatabaseManager(object):
 
         # Dump the database onto s3, piping through this machine (errors if
         # anything went wrong).
-        option_list = [f'--{opt}' if isinstance(val, bool) and val
-                       else f'--{opt}={val}' for opt, val in options.items()]
+        option_list = _form_pg_options(options)
+        if jobs is not None:
+            self._pg_dump_directory(dump_file, jobs, option_list, my_env)
+            return dump_file
+
         cmd = ["pg_dump", *self._form_pg_args(), *option_list, '-Fc']
 
         # If we are testing the database, we
-        if not is_db_testing():
+        if not isinstance(dump_file, S3Path):
+            run(cmd + ['-f', dump_file], env=my_env, check=True)
+        elif not is_db_testing():
             cmd += ['|', 'aws', 's3', 'cp', '-', dump_file.to_string()]
             run(' '.join(cmd), shell=True, env=my_env, check=True)
         else:
@@ -1021,6 +1187,29 @@ class DatabaseManager(object):
             dump_file.upload(boto3.client('s3'), res.stdout)
         return dump_file
 
+    def _pg_dump_directory(self, dump_file, jobs, option_list, env):
+        """Dump in parallel to a directory, and ship it as one tar archive."""
+        from tempfile import TemporaryDirectory
+        from subprocess import Popen, PIPE
+
+        with TemporaryDirectory() as tmp_dir:
+            dump_dir = path.join(tmp_dir, 'dump')
+            logger.info(f"Dumping with {jobs} jobs.")
+            cmd = ['pg_dump', *self._form_pg_args(), *option_list,
+                   '--format=directory', f'--jobs={jobs}', '--verbose',
+                   '-f', dump_dir]
+            _run_pg_tool(cmd, env)
+
+            # Stream the directory as a tar archive to its destination, without
+            # writing the archive itself to disk.
+            logger.info(f"Transferring the dump to {dump_file}.")
+            tar = Popen(['tar', '-C', dump_dir, '-cf', '-', '.'], stdout=PIPE)
+            _write_dump_stream(dump_file, tar.stdout)
+            if tar.wait():
+                raise IndraDbException(f"Failed to archive the dump "
+                                       f"(exit code {tar.returncode}).")
+        return
+
     def vacuum(self, analyze=True):
         conn = self.engine.raw_connection()
         conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
@@ -1028,14 +1217,22 @@ class DatabaseManager(object):
         cursor.execute('VACUUM' + (' ANALYZE;' if analyze else ''))
         return
 
-    def pg_restore(self, dump_file, **options):
-        """Load content into the database from a dump file on s3."""
-        if isinstance(dump_file, str):
-            dump_file = S3Path.from_string(dump_file)
-        elif dump_file is not None and not isinstance(dump_file, S3Path):
-            raise ValueError("Argument `dump_file` must be appropriately "
-                             "formatted string or S3Path object, not %s."
-                             % type(dump_file))
+    def pg_restore(self, dump_file, jobs=None, **options):
+        """Load content into the database from a dump file on s3.
+
+        Parameters
+        ----------
+        dump_file : S3Path or str
+            The location of the dump on s3. A string that is not an s3 url
+            (s3://...) is taken as a local file path.
+        jobs : Optional[int]
+            The number of tables to restore at a time if the dump is a
+            directory-format archive (see `pg_dump`). Such archives are
+            always restored from a directory, with 1 job by default. Ignored
+            for custom-format dumps, which are streamed into `pg_restore`.
+        """
+        from indra_db.util.s3_path import S3Path
+        dump_file = _resolve_dump_file(dump_file)
 
         from subprocess import run, PIPE
         from os import environ
@@ -1049,21 +1246,147 @@ class DatabaseManager(object):
 
         # Pipe the database dump from s3 through this machine into the database
         logger.info("Dumping into the database.")
-        option_list = [f'--{opt}' if isinstance(val, bool) and val
-                       else f'--{opt}={val}' for opt, val in options.items()]
-        cmd = ['pg_restore', *self._form_pg_args(), *option_list, '--no-owner']
-        if not is_db_testing():
-            cmd = ['aws', 's3', 'cp', dump_file.to_string(), '-', '|'] + cmd
-            run(' '.join(cmd), shell=True, env=my_env, check=True)
+        option_list = _form_pg_options(options)
+        if _is_directory_archive(dump_file):
+            self._pg_restore_directory(dump_file, jobs or 1, option_list,
+                                       my_env)
         else:
-            import boto3
-            res = dump_file.get(boto3.client('s3'))
-            run(' '.join(cmd), shell=True, env=my_env, input=res['Body'].read(),
-                check=True)
+            cmd = ['pg_restore', *self._form_pg_args(), *option_list,
+                   '--no-owner']
+            if not isinstance(dump_file, S3Path):
+                run(cmd + [dump_file], env=my_env, check=True)
+            elif not is_db_testing():
+                cmd = ['aws', 's3', 'cp', dump_file.to_string(), '-', '|'] \
+                      + cmd
+                run(' '.join(cmd), shell=True, env=my_env, check=True)
+            else:
+                import boto3
+                res = dump_file.get(boto3.client('s3'))
+                run(' '.join(cmd), shell=True, env=my_env,
+                    input=res['Body'].read(), check=True)
         self.session.close()
         self.grab_session()
         return dump_file
 
+    def _pg_restore_directory(self, dump_file, jobs, option_list, env):
+        """Unpack a directory-format archive as it arrives, then restore it."""
+        from tempfile import TemporaryDirectory
+        from subprocess import Popen, PIPE
+
+        with TemporaryDirectory() as tmp_dir:
+            logger.info(f"Transferring the dump from {dump_file}.")
+            tar = Popen(['tar', '-C', tmp_dir, '-xf', '-'], stdin=PIPE)
+            _read_dump_stream(dump_file, tar.stdin)
+            tar.stdin.close()
+            if tar.wait():
+                raise IndraDbException(f"Failed to unpack the dump "
+                                       f"(exit code {tar.returncode}).")
+
+            logger.info(f"Restoring with {jobs} jobs.")
+            cmd = ['pg_restore', *self._form_pg_args(), *option_list,
+                   '--no-owner', f'--jobs={jobs}', '--verbose', tmp_dir]
+            _run_pg_tool(cmd, env)
+        return
+
+
+def _resolve_dump_file(dump_file):
+    """Get an S3Path, or a local path for strings that aren't s3 urls."""
+    # Imported here to avoid a circular import with indra_db.util.
+    from indra_db.util.s3_path import S3Path
+    if isinstance(dump_file, str):
+        if dump_file.startswith('s3://'):
+            return S3Path.from_string(dump_file)
+        return path.abspath(dump_file)
+    elif dump_file is not None and not isinstance(dump_file, S3Path):
+        raise ValueError("Argument `dump_file` must be appropriately "
+                         "formatted string or S3Path object, not %s."
+                         % type(dump_file))
+    return dump_file
+
+
+def _write_dump_stream(dump_file, stream):
+    """Copy a stream of bytes to a dump location without staging it."""
+    from subprocess import run
+    from indra_db.util.s3_path import S3Path
+    if not isinstance(dump_file, S3Path):
+        with open(dump_file, 'wb') as f:
+            copyfileobj(stream, f)
+    elif not is_db_testing():
+        run(['aws', 's3', 'cp', '-', dump_file.to_string()], stdin=stream,
+            check=True)
+    else:
+        import boto3
+        boto3.client('s3').upload_fileobj(stream, **dump_file.kw())
+    return
+
+
+def _read_dump_stream(dump_file, stream):
+    """Copy the bytes at a dump location into a stream without staging it."""
+    from subprocess import run
+    from indra_db.util.s3_path import S3Path
+    if not isinstance(dump_file, S3Path):
+        with open(dump_file, 'rb') as f:
+            copyfileobj(f, stream)
+    elif not is_db_testing():
+        run(['aws', 's3', 'cp', dump_file.to_string(), '-'], stdout=stream,
+            check=True)
+    else:
+        import boto3
+        copyfileobj(dump_file.get(boto3.client('s3'))['Body'], stream)
+    return
+
+
+def _is_directory_archive(dump_file):
+    """Check whether a dump is a (tar) archive of a directory-format dump."""
+    # Custom format dumps start with "PGDMP", whereas tar archives are marked
+    # by "ustar" at byte 257.
+    if not isinstance(dump_file, S3Path):
+        with open(dump_file, 'rb') as f:
+            head = f.read(262)
+    else:
+        import boto3
+        s3 = boto3.client('s3')
+        head = s3.get_object(Range='bytes=0-261', **dump_file.kw())['Body']\
+            .read()
+    return head[257:262] == b'ustar'
+
+
+def _form_pg_options(options):
+    """Get the command line options of a pg tool from a dict of options.
+
+    True values are given as flags, and each value of a list or tuple is given
+    as a repetition of its option.
+    """
+    option_list = []
+    for opt, val in options.items():
+        if isinstance(val, bool) and val:
+            option_list.append(f'--{opt}')
+        elif isinstance(val, (list, tuple)):
+            option_list += [f'--{opt}={v}' for v in val]
+        else:
+            option_list.append(f'--{opt}={val}')
+    return option_list
+
+
+def _run_pg_tool(cmd, env):
+    """Run a pg tool in verbose mode, logging its progress through tables."""
+    from subprocess import Popen, PIPE, CalledProcessError
+
+    start = datetime.now()
+    proc = Popen(cmd, env=env, stderr=PIPE)
+    for line in proc.stderr:
+        line = line.decode('utf-8', errors='replace').strip()
+        elapsed = (datetime.now() - start).total_seconds()
+        if 'table' in line or 'error' in line.lower():
+            logger.info(f"[{elapsed:8.1f}s] {line}")
+        else:
+            logger.debug(f"[{elapsed:8.1f}s] {line}")
+    if proc.wait():
+        raise CalledProcessError(proc.returncode, cmd)
+    logger.info(f"{cmd[0]} finished in "
+                f"{(datetime.now() - start).total_seconds():.1f}s.")
+    return
+
 
 class PrincipalDatabaseManager(DatabaseManager):
     """This class represents the methods special to the principal database."""
@@ -1075,23 +1398,22 @@ class PrincipalDatabaseManager(DatabaseManager):
 
     def __init__(self, host, label=None):
         super(self.__class__, self).__init__(host, label)
-        if not self.available:
-            return
+        self._init_foreign_key_map(principal_schema.foreign_key_map)
+        return
 
+    def _init_tables(self):
         self.public = principal_schema.get_schema(self.Base)
         self.readonly = readonly_schema.get_schema(self.Base)
-        self.tables = {k: v for d in [self.public, self.readonly]
-                       for k, v in d.items()}
+        self._tables.update({k: v for d in [self.public, self.readonly]
+                             for k, v in d.items()})
 
-        for tbl in self.tables.values():
+        for tbl in self._tables.values():
             if tbl.__name__ == '_PaStmtSrc':
                 self.__PaStmtSrc = tbl
             elif tbl.__name__ == 'SourceMeta':
                 self.__SourceMeta = tbl
             else:
                 setattr(self, tbl.__name__, tbl)
-
-        self._init_foreign_key_map(principal_schema.foreign_key_map)
         return
 
     def __getattribute__(self, item):
@@ -1103,9 +1425,15 @@ class PrincipalDatabaseManager(DatabaseManager):
             return self.__SourceMeta
         return super(DatabaseManager, self).__getattribute__(item)
 
-    def generate_readonly(self, belief_dict, allow_continue=True):
+    def generate_readonly(self, belief_dict, allow_continue=True,
+                          n_workers=4, keep_temp=False):
         """Manage the materialized views.
 
+        The order in which tables are built is determined by a dependency
+        graph derived from the table definitions, such that tables (and
+        indices) that do not depend on each other are built concurrently, each
+        on a separate connection.
+
         Parameters
         ----------
         belief_dict : dict
@@ -1113,6 +1441,19 @@ class PrincipalDatabaseManager(DatabaseManager):
         allow_continue : bool
             If True (default), continue to build the schema if it already
             exists. If False, give up if the schema already exists.
+        n_workers : int
+            The number of tables and/or indices that may be built at the same
+            time. Default is 4.
+        keep_temp : bool
+            If True, build and keep the temp tables, which are required in
+            order to later update the schema with `refresh_readonly`. Default
+            is False.
+
+        Returns
+        -------
+        timings : dict
+            The time in seconds spent building each table and each index,
+            keyed by table name and then by "table" or the index name.
         """
         # Optionally create the schema.
         if 'readonly' in self.get_schemas():
@@ -1126,21 +1467,8 @@ class PrincipalDatabaseManager(DatabaseManager):
         else:
             logger.info("Creating the schema.")
             self.create_schema('readonly')
-
-        # Create function to quickly check if a table will be used further down
-        # the line.
-        def table_is_used(tbl, other_tables):
-            if not tbl._temp:
-                return True
-            for other_idx, tbl_name in enumerate(other_tables):
-                if tbl_name in self.get_active_tables(schema='readonly'):
-                    continue
-                other_tbl = self.readonly[tbl_name]
-                if not table_is_used(other_tbl, other_tables[other_idx+1:]):
-                    continue
-                if tbl.full_name() in other_tbl.definition(self):
-                    return True
-            return False
+            self._set_schema_state('readonly', self._get_new_build_state())
+        build_state = self.get_schema_state('readonly')
 
         # Perform some sanity checks (this would fail only due to developer
         # errors.)
@@ -1153,43 +1481,366 @@ class PrincipalDatabaseManager(DatabaseManager):
             f"extra in create_order={to_create-in_ro}\n" \
             f"extra in tables={in_ro-to_create}."
 
+        # Work out which tables each table is built from (and vice versa).
+        deps = {}
+        users = {ro_name: set() for ro_name in CREATE_ORDER}
+        for i, ro_name in enumerate(CREATE_ORDER):
+            deps[ro_name] = \
+                self.readonly[ro_name].get_dependencies() & to_create
+            assert deps[ro_name] <= set(CREATE_ORDER[:i]), \
+                f"{ro_name} depends on tables built after it in CREATE_ORDER: " \
+                f"{deps[ro_name] - set(CREATE_ORDER[:i])}."
+            for dep in deps[ro_name]:
+                users[dep].add(ro_name)
+
         # Dump the belief dict into the database.
         self.Belief.__table__.create(bind=self.engine)
         self.copy(self.Belief.full_name(),
                   [(int(h), n) for h, n in belief_dict.items()],
                   ('mk_hash', 'belief'))
 
-        # Build the tables.
-        for i, ro_name in enumerate(CREATE_ORDER):
-            # Check to see if the table has already been build (skip if so).
-            if ro_name in self.get_active_tables(schema='readonly'):
-                logger.info(f"[{i}] Build of {ro_name} done, continuing...")
+        # Decide (once) which tables need to be built. A temp table is only
+        # built if a table that will be built is built from it.
+        done = set(self.get_active_tables(schema='readonly'))
+        to_build = set()
+        for ro_name in reversed(CREATE_ORDER):
+            if ro_name in done:
+                logger.info(f"Build of {ro_name} done, continuing...")
                 continue
-
-            # Get table object, and check to see that if it is temp it is used.
-            ro_tbl = self.readonly[ro_name]
-            if not table_is_used(ro_tbl, CREATE_ORDER[i+1:]):
-                logger.info(f"[{i}] {ro_name} is marked as a temp table "
-                            f"but is not used in future tables. Skipping.")
+            if self.readonly[ro_name]._temp and not keep_temp \
+                    and not users[ro_name] & to_build:
+                logger.info(f"{ro_name} is marked as a temp table but is not "
+                            f"used in future tables. Skipping.")
                 continue
+            to_build.add(ro_name)
+
+        # Temp tables can be dropped as soon as the last table using them is
+        # done.
+        pending_users = {ro_name: users[ro_name] & to_build
+                         for ro_name in CREATE_ORDER
+                         if self.readonly[ro_name]._temp and not keep_temp}
+        self.drop_tables([ro_name for ro_name, remaining in pending_users.items()
+                          if ro_name in done and not remaining], force=True)
+
+        # Build the tables and their indices, starting each as soon as the
+        # tables it depends on are complete.
+        timings = {ro_name: {} for ro_name in to_build}
+        # The handles used by the worker threads are closed once they are done.
+        with _ThreadHandles(self) as handles, \
+                ThreadPoolExecutor(max_workers=n_workers) as executor:
+            jobs = {}
+            indices_left = {}
+
+            def submit_ready_tables():
+                for ro_name in CREATE_ORDER:
+                    if ro_name not in to_build or ro_name in done \
+                            or ro_name in indices_left:
+                        continue
+                    if deps[ro_name] <= done:
+                        logger.info(f"Creating {ro_name} readonly table...")
+                        job = executor.submit(self._build_readonly_table,
+                                              handles, ro_name)
+                        jobs[job] = (ro_name, None)
+                        indices_left[ro_name] = None
+
+            def complete_table(ro_name):
+                logger.info(f"Build of {ro_name} done.")
+                done.add(ro_name)
+                to_drop = []
+                for dep in deps[ro_name]:
+                    if dep not in pending_users:
+                        continue
+                    pending_users[dep].discard(ro_name)
+                    if not pending_users[dep]:
+                        to_drop.append(dep)
+                self.drop_tables(to_drop, force=True)
+
+            submit_ready_tables()
+            while jobs:
+                finished, _ = wait(jobs, return_when=FIRST_COMPLETED)
+                for job in finished:
+                    ro_name, index = jobs.pop(job)
+                    timings[ro_name][index or 'table'] = job.result()
+                    if index is None:
+                        # Start building the remaining indices.
+                        ro_tbl = self.readonly[ro_name]
+                        clustered = ro_tbl.get_clustered_index()
+                        indices_left[ro_name] = {idx.name
+                                                 for idx in ro_tbl._indices
+                                                 if idx is not clustered}
+                        for idx in ro_tbl._indices:
+                            if idx is clustered:
+                                continue
+                            logger.info(f"Building index: {idx.name}")
+                            job = executor.submit(self._build_readonly_index,
+                                                  handles, ro_name, idx.name)
+                            jobs[job] = (ro_name, idx.name)
+                    else:
+                        indices_left[ro_name].remove(index)
+
+                    if not indices_left[ro_name]:
+                        del indices_left[ro_name]
+                        complete_table(ro_name)
+                submit_ready_tables()
+
+        # Report how long everything took.
+        report = '\n'.join(
+            f'{ro_name:<25} {sum(times.values()):10.1f}s '
+            f'(table: {times.get("table", 0):.1f}s, '
+            f'{len(times) - 1} indices: '
+            f'{sum(times.values()) - times.get("table", 0):.1f}s)'
+            for ro_name, times in sorted(timings.items(),
+                                         key=lambda t: -sum(t[1].values()))
+        )
+        logger.info(f"Time spent building readonly tables:\n{report}")
+
+        # Record that the build is complete, so it can later be refreshed.
+        if build_state is not None:
+            build_state['complete'] = True
+            self._set_schema_state('readonly', build_state)
+        return timings
+
+    def _build_readonly_table(self, handles, ro_name):
+        """Create a readonly table and its clustered index, if any."""
+        db = handles.get()
+        ro_tbl = db.readonly[ro_name]
+        start = datetime.now()
+        ro_tbl.create(db)
+        clustered = ro_tbl.get_clustered_index()
+        if clustered is not None:
+            logger.info(f"Building clustered index: {clustered.name}")
+            ro_tbl.create_index(db, clustered)
+        return (datetime.now() - start).total_seconds()
+
+    def _build_readonly_index(self, handles, ro_name, index_name):
+        """Create a single (non-clustered) index of a readonly table."""
+        db = handles.get()
+        ro_tbl = db.readonly[ro_name]
+        index = next(idx for idx in ro_tbl._indices if idx.name == index_name)
+        start = datetime.now()
+        ro_tbl.create_index(db, index)
+        return (datetime.now() - start).total_seconds()
+
+    def _get_new_build_state(self):
+        """Note the point in time from which a readonly schema is built."""
+        with self.engine.connect() as con:
+            built, max_link_id, max_mesh_id, max_mti_id = con.execute(
+                'SELECT now()::timestamp,\n'
+                '       (SELECT max(id) FROM raw_unique_links),\n'
+                '       (SELECT max(id) FROM mesh_ref_annotations),\n'
+                '       (SELECT max(id) FROM mti_ref_annotations_test);'
+            ).fetchone()
+        return {'built': built.isoformat(), 'max_link_id': max_link_id or 0,
+                'max_mesh_id': max_mesh_id or 0,
+                'max_mti_id': max_mti_id or 0, 'complete': False}
+
+    def refresh_readonly(self, belief_dict):
+        """Update the readonly schema with changes since it was built.
+
+        Rather than rebuilding every table, this finds the hashes, raw
+        statements, and readings that have changed since the schema was built
+        (new pa statements and raw-unique links, changed beliefs, and new or
+        updated readings, text content and text refs, along with the
+        statements read from them), deletes the rows derived from them
+        in each table, and re-inserts the rows from each table's definition.
+        All tables are updated in a single transaction, so readers see either
+        the old or the new schema.
+
+        The refreshed rows of each persistent table are also copied into the
+        `readonly_delta` schema, which can be exported with
+        `dump_readonly_delta` and applied to a readonly database with
+        `ReadonlyDatabaseManager.load_delta`.
+
+        Mesh annotations are only ever added, so the mesh_terms and
+        mesh_concepts rows of the papers with annotations added since the
+        build are refreshed. However the counts derived from them are only
+        refreshed for the statements that have changed, so new annotations of
+        existing papers do not reach them, and a full build should still be
+        run periodically.
 
-            # Build the table and its indices.
-            logger.info(f"[{i}] Creating {ro_name} readonly table...")
-            ro_tbl.create(self)
-            ro_tbl.build_indices(self)
+        Parameters
+        ----------
+        belief_dict : dict
+            The dictionary, keyed by hash, of belief calculated for Statements.
 
-            # Drop any temp tables that will not be used further down the line.
-            to_drop = []
-            for existing_tbl in self.get_active_tables(schema='readonly'):
-                if not table_is_used(self.readonly[existing_tbl],
-                                     CREATE_ORDER[i+1:]):
-                    to_drop.append(existing_tbl)
-            self.drop_tables(to_drop, force=True)
+        Returns
+        -------
+        timings : dict
+            The time in seconds spent refreshing each table.
+
+        Raises
+        ------
+        ReadonlyRefreshError
+            If the schema cannot be refreshed, for example if it was not
+            built with `keep_temp=True`, or if a new source has appeared. In
+            that case the schema must be rebuilt using `generate_readonly`.
+        """
+        state = self.get_schema_state('readonly')
+        if state is None or not state.get('complete'):
+            raise ReadonlyRefreshError("There is no record of a complete "
+                                       "build of the readonly schema.")
+        if 'max_mesh_id' not in state:
+            raise ReadonlyRefreshError("The readonly schema was built before "
+                                       "mesh annotations were tracked.")
+        missing = (set(CREATE_ORDER) | {'belief'}) \
+            - set(self.get_active_tables(schema='readonly'))
+        if missing:
+            raise ReadonlyRefreshError(f"Readonly tables missing: {missing}. "
+                                       f"Note that temp tables are only kept "
+                                       f"if built with keep_temp=True.")
+        new_state = self._get_new_build_state()
+        delta = READONLY_DELTA_SCHEMA
 
-        return
+        conn = self.engine.raw_connection()
+        cursor = conn.cursor()
+        timings = {}
+        try:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {delta} CASCADE;\n"
+                           f"CREATE SCHEMA {delta};\n"
+                           f"CREATE TABLE {delta}.new_belief "
+                           f"(mk_hash bigint PRIMARY KEY, belief real);")
+            belief_data = '\n'.join(f'{int(h)}\t{n}'
+                                    for h, n in belief_dict.items())
+            cursor.copy_expert(f"COPY {delta}.new_belief FROM STDIN;",
+                               StringIO(belief_data))
+
+            # Find what has changed since the last build.
+            logger.info("Finding what has changed since %s." % state['built'])
+            params = {key: state[key] for key in
+                      ['built', 'max_link_id', 'max_mesh_id', 'max_mti_id']}
+            # The statements of changed readings are refreshed as well, as
+            # the tables keyed by hash join to their text refs.
+            cursor.execute(
+                f"CREATE TABLE {delta}.refresh_rid AS\n"
+                f"SELECT reading.id AS rid\n"
+                f"FROM reading\n"
+                f"  JOIN text_content ON text_content.id = text_content_id\n"
+                f"  JOIN text_ref ON text_ref.id = text_ref_id\n"
+                f"WHERE reading.create_date > %(built)s\n"
+                f"   OR reading.last_updated > %(built)s\n"
+                f"   OR text_content.last_updated > %(built)s\n"
+                f"   OR text_ref.last_updated > %(built)s;\n"
+                f"CREATE TABLE {delta}.refresh_mk_hash AS\n"
+                f"SELECT mk_hash FROM pa_statements\n"
+                f"WHERE create_date > %(built)s\n"
+                f"UNION\n"
+                f"SELECT pa_stmt_mk_hash FROM raw_unique_links\n"
+                f"WHERE id > %(max_link_id)s\n"
+                f"UNION\n"
+                f"SELECT new.mk_hash FROM {delta}.new_belief AS new\n"
+                f"  LEFT JOIN readonly.belief AS old\n"
+                f"  ON new.mk_hash = old.mk_hash\n"
+                f"WHERE old.belief IS NULL OR old.belief <> new.belief\n"
+                f"UNION\n"
+                f"SELECT mk_hash FROM readonly.belief\n"
+                f"WHERE mk_hash NOT IN "
+                f"(SELECT mk_hash FROM {delta}.new_belief)\n"
+                f"UNION\n"
+                f"SELECT link.pa_stmt_mk_hash\n"
+                f"FROM raw_unique_links AS link\n"
+                f"  JOIN raw_statements AS raw ON raw.id = link.raw_stmt_id\n"
+                f"WHERE raw.reading_id IN "
+                f"(SELECT rid FROM {delta}.refresh_rid);\n"
+                f"CREATE TABLE {delta}.refresh_sid AS\n"
+                f"SELECT id AS sid FROM raw_statements\n"
+                f"WHERE create_date > %(built)s\n"
+                f"UNION\n"
+                f"SELECT raw_stmt_id FROM raw_unique_links\n"
+                f"WHERE id > %(max_link_id)s\n"
+                f"UNION\n"
+                f"SELECT id FROM raw_statements\n"
+                f"WHERE reading_id IN "
+                f"(SELECT rid FROM {delta}.refresh_rid);\n"
+                f"CREATE TABLE {delta}.refresh_pmid_num AS\n"
+                f"SELECT pmid_num FROM mesh_ref_annotations\n"
+                f"WHERE id > %(max_mesh_id)s\n"
+                f"UNION\n"
+                f"SELECT pmid_num FROM mti_ref_annotations_test\n"
+                f"WHERE id > %(max_mti_id)s;",
+                params
+            )
+            for key in ['mk_hash', 'sid', 'rid', 'pmid_num']:
+                cursor.execute(f"CREATE INDEX ON {delta}.refresh_{key} "
+                               f"({key});\n"
+                               f"ANALYZE {delta}.refresh_{key};\n"
+                               f"SELECT count(*) FROM {delta}.refresh_{key};")
+                logger.info(f"Found {cursor.fetchone()[0]} {key}s to refresh.")
+
+            # Update the belief table.
+            cursor.execute(f"DELETE FROM readonly.belief\n"
+                           f"WHERE mk_hash IN "
+                           f"(SELECT mk_hash FROM {delta}.refresh_mk_hash);\n"
+                           f"INSERT INTO readonly.belief (mk_hash, belief)\n"
+                           f"SELECT mk_hash, belief FROM {delta}.new_belief\n"
+                           f"WHERE mk_hash IN "
+                           f"(SELECT mk_hash FROM {delta}.refresh_mk_hash);\n"
+                           f"DROP TABLE {delta}.new_belief;")
+
+            # Update the other tables, in order.
+            for ro_name in CREATE_ORDER:
+                logger.info(f"Refreshing {ro_name}...")
+                ro_tbl = self.readonly[ro_name]
+                start = datetime.now()
+                ro_tbl.refresh(self, cursor, delta)
+                timings[ro_name] = (datetime.now() - start).total_seconds()
+
+                # The columns of pa_stmt_src (and thus source_meta) depend on
+                # the sources present, which can only change with a rebuild.
+                if ro_name == 'raw_stmt_src':
+                    cursor.execute("SELECT DISTINCT src "
+                                   "FROM readonly.raw_stmt_src;")
+                    srcs = {src for src, in cursor.fetchall()}
+                    old_srcs = \
+                        set(self._PaStmtSrc.get_active_columns(cursor)) \
+                        - {'mk_hash'}
+                    if srcs != old_srcs:
+                        raise ReadonlyRefreshError(
+                            f"The sources have changed (new: "
+                            f"{srcs - old_srcs}, gone: {old_srcs - srcs}).")
+
+            # Stage the refreshed rows of the persistent tables for export.
+            for ro_name in ['belief'] + CREATE_ORDER:
+                ro_tbl = self.readonly[ro_name]
+                if getattr(ro_tbl, '_temp', False):
+                    continue
+                key = ro_tbl._refresh_key
+                sql = (f"CREATE TABLE {delta}.{ro_name} AS\n"
+                       f"SELECT * FROM {ro_tbl.full_name(force_schema=True)}")
+                if key is not None:
+                    sql += (f"\nWHERE {key} IN "
+                            f"(SELECT {key} FROM {delta}.refresh_{key})")
+                cursor.execute(sql + ';')
+
+            new_state['complete'] = True
+            self._set_schema_state('readonly', new_state, cursor)
+            self._set_schema_state(delta, {'base': state, 'state': new_state},
+                                   cursor)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        report = '\n'.join(f'{ro_name:<25} {secs:10.1f}s'
+                           for ro_name, secs in timings.items())
+        logger.info(f"Time spent refreshing readonly tables:\n{report}")
+        return timings
+
+    def dump_readonly_delta(self, dump_file):
+        """Dump the changes staged by `refresh_readonly` to s3."""
+        if READONLY_DELTA_SCHEMA not in self.get_schemas():
+            raise ReadonlyRefreshError("No readonly refresh has been staged.")
+        self.pg_dump(dump_file, schema=READONLY_DELTA_SCHEMA)
+        self.drop_schema(READONLY_DELTA_SCHEMA)
+        return dump_file
+
+    def dump_readonly(self, dump_file=None, jobs=None):
+        """Dump the readonly schema to s3.
 
-    def dump_readonly(self, dump_file=None):
-        """Dump the readonly schema to s3."""
+        If `jobs` is given, the tables are dumped in parallel (see `pg_dump`).
+        Temp tables kept for refreshes (see `generate_readonly`) are left out.
+        """
 
         # Form the name of the s3 file, if not given.
         if dump_file is None:
@@ -1197,7 +1848,11 @@ class PrincipalDatabaseManager(DatabaseManager):
             now_str = datetime.utcnow().strftime('%Y-%m-%d-%H-%M-%S')
             dump_loc = get_s3_dump()
             dump_file = dump_loc.get_element_path('readonly-%s.dump' % now_str)
-        return self.pg_dump(dump_file, schema='readonly')
+        temp_tables = [tbl.full_name(force_schema=True)
+                       for tbl in self.readonly.values()
+                       if getattr(tbl, '_temp', False)]
+        return self.pg_dump(dump_file, jobs=jobs, schema='readonly',
+                            **{'exclude-table': temp_tables})
 
     def create_tables(self, tbl_list=None):
         """Create the public tables for INDRA database."""
@@ -1265,7 +1920,7 @@ class PrincipalDatabaseManager(DatabaseManager):
                 return False
         if tbl_list is None:
             logger.info("Removing all tables...")
-            self.Base.metadata.drop_all(self.engine)
+            self.get_metadata().drop_all(self.engine)
             logger.debug("All tables removed.")
         else:
             for tbl in tbl_list:
@@ -1300,18 +1955,18 @@ class ReadonlyDatabaseManager(DatabaseManager):
 
     def __init__(self, host, label=None):
         super(self.__class__, self).__init__(host, label)
-        if not self.available:
-            return
+        self.__non_source_cols = None
 
-        self.tables = readonly_schema.get_schema(self.Base)
-        for tbl in self.tables.values():
+    def _init_tables(self):
+        self._tables.update(readonly_schema.get_schema(self.Base))
+        for tbl in self._tables.values():
             if tbl.__name__ == '_PaStmtSrc':
                 self.__PaStmtSrc = tbl
             elif tbl.__name__ == 'SourceMeta':
                 self.__SourceMeta = tbl
             else:
                 setattr(self, tbl.__name__, tbl)
-        self.__non_source_cols = None
+        return
 
     def get_config_string(self):
         res = super(ReadonlyDatabaseManager, self).get_config_string()
@@ -1346,8 +2001,12 @@ class ReadonlyDatabaseManager(DatabaseManager):
         """
         return super(ReadonlyDatabaseManager, self).get_active_tables(schema)
 
-    def load_dump(self, dump_file, force_clear=True):
-        """Load from a dump of the readonly schema on s3."""
+    def load_dump(self, dump_file, force_clear=True, jobs=None):
+        """Load from a dump of the readonly schema on s3.
+
+        If the dump was made in parallel, `jobs` tables are restored at a time
+        (see `pg_restore`).
+        """
 
         # Make sure the database is clear.
         if 'readonly' in self.get_schemas():
@@ -1359,7 +2018,7 @@ class ReadonlyDatabaseManager(DatabaseManager):
                                        "is False.")
 
         # Do the restore
-        self.pg_restore(dump_file)
+        self.pg_restore(dump_file, jobs=jobs)
 
         # Run Vacuuming
         logger.info("Running vacuuming.")
@@ -1367,3 +2026,59 @@ class ReadonlyDatabaseManager(DatabaseManager):
 
         return
 
+    def load_delta(self, dump_file):
+        """Apply changes dumped by `PrincipalDatabaseManager.refresh_readonly`.
+
+        The rows of each table are replaced in a single transaction, so
+        readers see either the old or the new content.
+
+        Raises
+        ------
+        ReadonlyRefreshError
+            If the changes were not made relative to the build of the readonly
+            schema currently loaded. In that case a full dump must be loaded
+            with `load_dump`.
+        """
+        delta = READONLY_DELTA_SCHEMA
+        state = self.get_schema_state('readonly')
+        self.drop_schema(delta)
+        self.pg_restore(dump_file)
+        delta_state = self.get_schema_state(delta)
+        if state is None or delta_state is None \
+                or delta_state['base'] != state:
+            self.drop_schema(delta)
+            raise ReadonlyRefreshError("The changes were not made relative to "
+                                       "the current readonly schema.")
+
+        conn = self.engine.raw_connection()
+        cursor = conn.cursor()
+        try:
+            for tbl_name in self.get_active_tables(schema=delta):
+                if tbl_name not in self.tables:
+                    continue
+                logger.info(f"Loading changes to {tbl_name}.")
+                tbl = self.tables[tbl_name]
+                full_name = tbl.full_name(force_schema=True)
+                key = tbl._refresh_key
+                if key is None:
+                    cursor.execute(f"DELETE FROM {full_name};")
+                else:
+                    cursor.execute(f"DELETE FROM {full_name}\n"
+                                   f"WHERE {key} IN "
+                                   f"(SELECT {key} FROM {delta}.refresh_{key});")
+                cols = ', '.join(tbl.get_active_columns(cursor))
+                cursor.execute(f"INSERT INTO {full_name} ({cols})\n"
+                               f"SELECT {cols} FROM {delta}.{tbl_name};")
+            self._set_schema_state('readonly', delta_state['state'], cursor)
+            cursor.execute(f"DROP SCHEMA {delta} CASCADE;")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        logger.info("Running vacuuming.")
+        self.vacuum()
+        return
+
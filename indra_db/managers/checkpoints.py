@@ -0,0 +1,192 @@
+"""Keep track of the batches of content uploaded, on the database itself.
+
+Content is uploaded from large files (archives of xml files from pmc, xml
+files of pubmed articles) in batches. Each batch is recorded in the
+ingestion_batch table: it is first claimed by an uploader, and then marked
+done in the same transaction as the last copy of its content, so that a batch
+is never marked done without its content nor its content kept without the
+mark. A run that is picked up after an error can then skip the batches
+already done with a lookup on the (source, file_name, batch_idx) index.
+
+Claims also allow several hosts to share a run: a batch claimed by one is
+skipped by the others, unless the claim is older than `claim_timeout`, in
+which case the claimant is assumed to have died.
+
+>>> checkpoints = BatchCheckpoints(db, 'pmc_oa')
+>>> claim = checkpoints.claim('oa_comm_xml.tar.gz', 1)
+>>> if claim is not None:
+...     db.copy('text_content', rows, cols, commit=False)
+...     claim.complete(n_records=len(rows), n_content=len(rows))
+...     db.commit_copy('Failed to commit batch.')
+"""
+
+__all__ = ['BatchCheckpoints', 'BatchClaim']
+
+import socket
+import logging
+from datetime import timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class BatchClaim(object):
+    """The claim of an uploader on a batch, got from `BatchCheckpoints.claim`.
+    """
+    def __init__(self, checkpoints, claim_id, file_name, batch_idx):
+        self.checkpoints = checkpoints
+        self.id = claim_id
+        self.file_name = file_name
+        self.batch_idx = batch_idx
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.file_name}, {self.batch_idx})'
+
+    def complete(self, n_records=None, n_content=None):
+        """Mark the batch done, in the current transaction of the copies.
+
+        This does NOT commit. The mark is committed by the next call to
+        `db.commit_copy`, along with any copies made since the last commit.
+        """
+        db = self.checkpoints.db
+        cur = db.get_copy_cursor()
+        cur.execute("UPDATE ingestion_batch "
+                    "SET status = 'done', n_records = %s, n_content = %s, "
+                    "    finished = clock_timestamp(), "
+                    "    seconds = EXTRACT(EPOCH FROM clock_timestamp() "
+                    "                                 - claimed) "
+                    "WHERE id = %s AND status = 'running' AND host = %s",
+                    (n_records, n_content, self.id, self.checkpoints.host))
+        if cur.rowcount != 1:
+            logger.warning(f"The claim on batch {self.batch_idx} of "
+                           f"{self.file_name} was taken over by another "
+                           f"host, which may load it again.")
+        return
+
+    def fail(self):
+        """Roll back any uncommitted copies, and mark the batch failed.
+
+        A failed batch may be claimed again right away.
+        """
+        db = self.checkpoints.db
+        cur = db.get_copy_cursor()
+        cur.connection.rollback()
+        cur.execute("UPDATE ingestion_batch "
+                    "SET status = 'failed', finished = clock_timestamp() "
+                    "WHERE id = %s AND status = 'running' AND host = %s",
+                    (self.id, self.checkpoints.host))
+        db.commit_copy(f"Failed to release {self}.")
+        return
+
+
+class BatchCheckpoints(object):
+    """Claim, complete, and skip the batches of the files of a source.
+
+    Parameters
+    ----------
+    db : indra_db.DatabaseManager
+        The database to which the content is uploaded.
+    source : str
+        The source of the content, e.g. 'pubmed'.
+    host : str
+        The name under which batches are claimed. Claims made under the same
+        name are taken to be stale, and so a run picked up after an error can
+        take over the claims of the run that failed. Two uploaders on the same
+        machine must therefore be given different names. By default this is
+        the host name.
+    """
+    # Another host's claim that is older than this is taken to be abandoned.
+    claim_timeout = timedelta(hours=2)
+
+    def __init__(self, db, source, host=None):
+        self.db = db
+        self.source = source
+        if host is None:
+            host = socket.gethostname()
+        self.host = host
+
+    def claim(self, file_name, batch_idx, redo=False):
+        """Claim a batch of a file, unless it is done or claimed elsewhere.
+
+        Parameters
+        ----------
+        file_name : str
+            The name of the file the batch is from.
+        batch_idx : int
+            The number of the batch in the file.
+        redo : bool
+            If True, a batch that is already done is claimed again, for
+            instance to load a file afresh. Default is False.
+
+        Returns
+        -------
+        claim : BatchClaim or None
+            The claim on the batch, or None if the batch should be skipped.
+        """
+        cur = self.db.get_copy_cursor()
+        cur.execute("INSERT INTO ingestion_batch "
+                    "    (source, file_name, batch_idx, status, host, claimed) "
+                    "VALUES (%(source)s, %(file_name)s, %(batch_idx)s, "
+                    "        'running', %(host)s, clock_timestamp()) "
+                    "ON CONFLICT (source, file_name, batch_idx) DO UPDATE "
+                    "SET status = 'running', host = EXCLUDED.host, "
+                    "    claimed = EXCLUDED.claimed, finished = NULL, "
+                    "    seconds = NULL, n_records = NULL, n_content = NULL "
+                    "WHERE ingestion_batch.status = 'failed' "
+                    "   OR (ingestion_batch.status = 'done' AND %(redo)s) "
+                    "   OR (ingestion_batch.status = 'running' "
+                    "       AND (ingestion_batch.host = EXCLUDED.host "
+                    "            OR ingestion_batch.claimed "
+                    "               < EXCLUDED.claimed - %(timeout)s)) "
+                    "RETURNING id",
+                    {'source': self.source, 'file_name': file_name,
+                     'batch_idx': batch_idx, 'host': self.host,
+                     'redo': redo, 'timeout': self.claim_timeout})
+        row = cur.fetchone()
+        self.db.commit_copy(f"Failed to claim batch {batch_idx} of "
+                            f"{file_name}.")
+        if row is None:
+            return None
+        return BatchClaim(self, row[0], file_name, batch_idx)
+
+    def get_done(self, file_name):
+        """Get the numbers of the batches of a file that are done."""
+        cur = self.db.get_copy_cursor()
+        cur.execute("SELECT batch_idx FROM ingestion_batch "
+                    "WHERE source = %s AND file_name = %s "
+                    "  AND status = 'done'",
+                    (self.source, file_name))
+        done = {batch_idx for batch_idx, in cur.fetchall()}
+        self.db.commit_copy(f"Failed to get the batches of {file_name}.")
+        return done
+
+    def finish_file(self, file_name, batch_idxs):
+        """Add a file to source_file, if all of its batches are done.
+
+        Batches that were skipped by this uploader may still be loading
+        elsewhere, in which case the file is left for whichever uploader
+        finishes last.
+
+        Parameters
+        ----------
+        file_name : str
+            The name of the file.
+        batch_idxs : iterable[int]
+            The numbers of all the batches of the file.
+
+        Returns
+        -------
+        finished : bool
+            True if all the batches of the file are done.
+        """
+        remaining = set(batch_idxs) - self.get_done(file_name)
+        if remaining:
+            logger.info(f"{len(remaining)} batches of {file_name} are not "
+                        f"done yet, leaving it unfinished.")
+            return False
+        cur = self.db.get_copy_cursor()
+        cur.execute("INSERT INTO source_file (source, name, load_date) "
+                    "VALUES (%s, %s, now()) "
+                    "ON CONFLICT (source, name) DO NOTHING",
+                    (self.source, file_name))
+        self.db.commit_copy(f"Failed to add {file_name} to source_file.")
+        return True
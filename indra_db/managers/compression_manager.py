@@ -0,0 +1,276 @@
+"""Train zstd dictionaries for text content, and recompress what is stored.
+
+Content is compressed with zstd by the content managers only once a dictionary
+has been trained for its source and text type (see `ContentManager.use_codec`),
+and content already on the database stays as it was loaded. This module trains
+the dictionaries, and recompresses the stored content in the background:
+
+    python -m indra_db.managers.compression_manager train pubmed abstract
+    python -m indra_db.managers.compression_manager recompress -s pubmed
+
+Content is recompressed in batches of a fixed range of ids, each of which is
+updated and checkpointed in one transaction (see
+`indra_db.managers.checkpoints`), so the recompression may be stopped and
+picked up again, or spread over several hosts. Readers are never affected, as
+content of either codec is read back the same way, and `last_updated` is left
+alone, as the content itself does not change.
+"""
+
+__all__ = ['train_content_dict', 'recompress_content']
+
+import time
+import logging
+from argparse import ArgumentParser
+
+from sqlalchemy import func
+from psycopg2.extras import execute_values
+
+from indra_db.util import get_db
+from indra_db.util.compression import GZIP, ZSTD, CODECS, CAN_ZSTD, zstd, \
+    pack_content, unpack_content, get_codec, get_dict_id, get_latest_dicts
+from indra_db.managers.checkpoints import BatchCheckpoints
+
+logger = logging.getLogger(__name__)
+
+
+def train_content_dict(db, source, text_type, n_samples=5000,
+                       dict_size=112640):
+    """Train a zstd dictionary on a sample of content, and store it.
+
+    Parameters
+    ----------
+    db : indra_db.DatabaseManager
+        The database whose content is sampled, and on which the dictionary is
+        stored.
+    source : str
+        The source of the content, e.g. 'pubmed'.
+    text_type : str
+        The text type of the content, e.g. 'abstract'.
+    n_samples : int
+        The number of texts to sample. Default is 5000.
+    dict_size : int
+        The most bytes the dictionary may take. Default is 110 KiB, zstd's
+        own default.
+
+    Returns
+    -------
+    zstd_dict : ZstdDict
+        The new dictionary, which will be used for new content of this source
+        and text type from then on.
+    """
+    if not CAN_ZSTD:
+        raise RuntimeError("Dictionaries cannot be trained without zstd.")
+    TC = db.TextContent
+    contents = (db.session.query(TC.content)
+                .filter(TC.source == source, TC.text_type == text_type,
+                        TC.content.isnot(None))
+                .order_by(func.random())
+                .limit(n_samples)
+                .all())
+    if not contents:
+        raise ValueError(f"There is no {text_type} content from {source} to "
+                         f"train on.")
+    samples = [unpack_content(content, db) for content, in contents]
+    logger.info(f"Training a dictionary on {len(samples)} {text_type} texts "
+                f"from {source}.")
+    zstd_dict = zstd.train_dict(samples, dict_size)
+    db.insert(db.ContentDictionary, dict_id=zstd_dict.dict_id, source=source,
+              text_type=text_type, dictionary=zstd_dict.dict_content,
+              n_samples=len(samples))
+    logger.info(f"Stored dictionary {zstd_dict.dict_id} of "
+                f"{len(zstd_dict.dict_content)} bytes.")
+    return zstd_dict
+
+
+def _get_id_range(db, source=None, text_type=None):
+    cur = db.get_copy_cursor()
+    cur.execute("SELECT min(id), max(id) FROM text_content "
+                "WHERE (%(source)s IS NULL OR source = %(source)s) "
+                "  AND (%(text_type)s IS NULL OR text_type = %(text_type)s)",
+                {'source': source, 'text_type': text_type})
+    min_id, max_id = cur.fetchone()
+    db.commit_copy("Failed to get the range of text content ids.")
+    return min_id, max_id
+
+
+def recompress_content(db, source=None, text_type=None, codec=ZSTD,
+                       level=None, batch_size=1000, pause=0, redo=False,
+                       host=None):
+    """Recompress the content on the database with a codec, batch by batch.
+
+    Content that is already compressed as it would be now is left as it is.
+    With zstd, that means with the latest dictionary of its source and text
+    type, or without a dictionary if there is none.
+
+    Parameters
+    ----------
+    db : indra_db.DatabaseManager
+        The database whose content is recompressed.
+    source : str
+        Only recompress content from this source. Optional.
+    text_type : str
+        Only recompress content of this text type. Optional.
+    codec : str
+        The codec to use, either 'zstd' (the default) or 'gzip'.
+    level : int
+        The level of compression, only used with zstd. Optional.
+    batch_size : int
+        The number of text content ids in a batch. Default is 1000.
+    pause : float
+        Seconds to wait between batches, to leave room for other work on the
+        database. Default is 0.
+    redo : bool
+        If True, batches done by an earlier run are done again, for instance
+        after new dictionaries have been trained. Default is False.
+    host : str
+        The name under which batches are claimed, see `BatchCheckpoints`.
+
+    Returns
+    -------
+    n_updated : int
+        The number of texts that were recompressed.
+    """
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec: {codec}. Options are {CODECS}.")
+    dicts_by_source = {}
+
+    def get_dict(tc_source, tc_text_type):
+        if codec != ZSTD:
+            return None
+        if tc_source not in dicts_by_source:
+            dicts_by_source[tc_source] = get_latest_dicts(db, tc_source)
+        return dicts_by_source[tc_source].get(tc_text_type)
+
+    min_id, max_id = _get_id_range(db, source, text_type)
+    if min_id is None:
+        logger.info("There is no content to recompress.")
+        return 0
+
+    # The batches are only the same from one run to the next if they are
+    # counted from the same place, so they are counted from 0.
+    checkpoints = BatchCheckpoints(db, f'recompress-{codec}', host)
+    file_name = f"text_content:{source or '*'}:{text_type or '*'}:{batch_size}"
+    n_updated = 0
+    for batch_idx in range(min_id // batch_size, max_id // batch_size + 1):
+        claim = checkpoints.claim(file_name, batch_idx, redo)
+        if claim is None:
+            continue
+        try:
+            cur = db.get_copy_cursor()
+            cur.execute("SELECT id, source, text_type, content "
+                        "FROM text_content "
+                        "WHERE id >= %(start)s AND id < %(stop)s "
+                        "  AND content IS NOT NULL "
+                        "  AND (%(source)s IS NULL OR source = %(source)s) "
+                        "  AND (%(text_type)s IS NULL "
+                        "       OR text_type = %(text_type)s)",
+                        {'start': batch_idx*batch_size,
+                         'stop': (batch_idx + 1)*batch_size,
+                         'source': source, 'text_type': text_type})
+            rows = cur.fetchall()
+
+            updates = []
+            n_old_bytes = n_new_bytes = 0
+            for tcid, tc_source, tc_text_type, content in rows:
+                content = bytes(content)
+                zstd_dict = get_dict(tc_source, tc_text_type)
+                dict_id = 0 if zstd_dict is None else zstd_dict.dict_id
+                if get_codec(content) == codec \
+                        and (codec == GZIP or get_dict_id(content) == dict_id):
+                    continue
+                text = unpack_content(content, db).decode('utf8')
+                new_content = pack_content(text, codec, zstd_dict, level)
+                updates.append((tcid, new_content))
+                n_old_bytes += len(content)
+                n_new_bytes += len(new_content)
+
+            if updates:
+                execute_values(cur,
+                               "UPDATE text_content AS tc "
+                               "SET content = new.content "
+                               "FROM (VALUES %s) AS new (id, content) "
+                               "WHERE tc.id = new.id",
+                               updates, page_size=len(updates))
+            claim.complete(n_records=len(rows), n_content=len(updates))
+            db.commit_copy(f"Failed to recompress batch {batch_idx}.")
+        except Exception:
+            claim.fail()
+            raise
+        n_updated += len(updates)
+        logger.info(f"Recompressed {len(updates)} of {len(rows)} texts in "
+                    f"batch {batch_idx}, from {n_old_bytes} to {n_new_bytes} "
+                    f"bytes.")
+        if pause:
+            time.sleep(pause)
+    logger.info(f"Recompressed {n_updated} texts in all.")
+    return n_updated
+
+
+def _make_parser():
+    parser = ArgumentParser(
+        description='Compress the text content on INDRA\'s database.'
+    )
+    parser.add_argument(
+        '-D', '--database',
+        default='primary',
+        help='Choose a database from the names given in the config.'
+    )
+    subparsers = parser.add_subparsers(dest='task')
+    subparsers.required = True
+
+    train_parser = subparsers.add_parser(
+        'train',
+        help='Train a zstd dictionary for the content of a source.'
+    )
+    train_parser.add_argument('source')
+    train_parser.add_argument('text_type')
+    train_parser.add_argument(
+        '--n-samples',
+        type=int,
+        default=5000,
+        help='The number of texts to train the dictionary on.'
+    )
+    train_parser.add_argument(
+        '--dict-size',
+        type=int,
+        default=112640,
+        help='The most bytes the dictionary may take.'
+    )
+
+    recomp_parser = subparsers.add_parser(
+        'recompress',
+        help='Recompress the content on the database.'
+    )
+    recomp_parser.add_argument('-s', '--source')
+    recomp_parser.add_argument('-t', '--text-type')
+    recomp_parser.add_argument('--codec', choices=CODECS, default=ZSTD)
+    recomp_parser.add_argument('--level', type=int)
+    recomp_parser.add_argument('--batch-size', type=int, default=1000)
+    recomp_parser.add_argument(
+        '--pause',
+        type=float,
+        default=0,
+        help='Seconds to wait between batches.'
+    )
+    recomp_parser.add_argument(
+        '--redo',
+        action='store_true',
+        help='Redo the batches done by an earlier run.'
+    )
+    return parser
+
+
+def _main():
+    args = _make_parser().parse_args()
+    db = get_db(args.database)
+    if args.task == 'train':
+        train_content_dict(db, args.source, args.text_type, args.n_samples,
+                           args.dict_size)
+    elif args.task == 'recompress':
+        recompress_content(db, args.source, args.text_type, args.codec,
+                           args.level, args.batch_size, args.pause,
+                           args.redo)
+
+
+if __name__ == '__main__':
+    _main()
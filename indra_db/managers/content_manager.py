@@ -1,33 +1,42 @@
 import re
 import csv
-import time
+import gzip
+import shutil
 import tarfile
+import subprocess
 import zlib
 import logging
 import pickle
-import multiprocessing as mp
 import xml.etree.ElementTree as ET
 
 from io import BytesIO
 from ftplib import FTP
 from functools import wraps
+from threading import Thread
+from contextlib import contextmanager
 from argparse import ArgumentParser
+from collections import defaultdict
 from datetime import datetime, timedelta
 from os import path, remove, rename, listdir
 
 from indra.literature.crossref_client import get_publisher
 from indra.literature.pubmed_client import get_metadata_for_ids
-from indra.literature.elsevier_client import download_article_from_ids
 
 from indra.util import zip_string
 from indra.literature import pubmed_client
-from indra.literature.pmc_client import id_lookup
 from indra.util import UnicodeXMLTreeBuilder as UTB
 
 from indra_db.util import get_db
 from indra_db.databases import texttypes, formats
 from indra_db.databases import sql_expressions as sql_exp
 from indra_db.util.data_gatherer import DataGatherer, DGContext
+from indra_db.util.compression import GZIP, ZSTD, CODECS, pack_content, \
+    get_latest_dicts
+from indra_db.managers.pipeline import Pipeline, Stage
+from indra_db.managers.text_ref_index import TextRefIndex
+from indra_db.managers.checkpoints import BatchCheckpoints
+from indra_db.managers.pmid_resolver import PmidResolver
+from indra_db.managers.elsevier_fetcher import ElsevierFetcher
 
 
 try:
@@ -127,6 +136,27 @@ class _NihFtpClient(object):
                 buf.flush()
         return
 
+    @contextmanager
+    def open_file(self, f_path):
+        """Open a binary stream that reads a file as it is downloaded.
+
+        Unlike `ret_file`, nothing is buffered beyond what the caller has not
+        yet read, so large archives can be processed without a local copy.
+        """
+        full_path = self._path_join(self.my_path, f_path)
+        if self.is_local:
+            with open(self._path_join(self.ftp_url, full_path), 'rb') as f:
+                yield f
+            return
+
+        with self.get_ftp_connection() as ftp:
+            ftp.voidcmd('TYPE I')
+            with ftp.transfercmd('RETR /%s' % full_path) as conn:
+                with conn.makefile('rb', buffering=ftp_blocksize) as f:
+                    yield f
+            ftp.voidresp()
+        return
+
     def download_file(self, f_path, dest=None):
         "Download a file into a file given by f_path."
         name = path.basename(f_path)
@@ -207,12 +237,66 @@ class ContentManager(object):
 
     def __init__(self):
         self.review_fname = None
+        self.text_ref_index = None
+        self.codec = GZIP
+        self.content_dicts = {}
         return
 
-    def copy_into_db(self, db, tbl_name, data, cols=None):
+    def use_codec(self, db, codec):
+        """Compress new content with a codec, either 'gzip' or 'zstd'.
+
+        With zstd, the content of each text type is compressed with the latest
+        dictionary trained on this source's content of that type, if there is
+        one (see `indra_db.managers.compression_manager`). Content of either
+        codec is read back with `indra_db.util.unpack`.
+        """
+        if codec not in CODECS:
+            raise ValueError("Unknown codec: %s. Options are %s."
+                             % (codec, CODECS))
+        self.codec = codec
+        if codec == ZSTD:
+            self.content_dicts = get_latest_dicts(db, self.my_source)
+            logger.info("Compressing %s content with zstd, with dictionaries "
+                        "for %s." % (self.my_source,
+                                     list(self.content_dicts) or 'nothing'))
+        else:
+            self.content_dicts = {}
+        return
+
+    def compress_content(self, content, text_type):
+        """Compress a text of a given text type with the codec in use."""
+        return pack_content(content, self.codec,
+                            self.content_dicts.get(text_type))
+
+    def use_text_ref_index(self, db, dirname=None):
+        """Reconcile text refs using a local index of the text_ref table.
+
+        Rather than querying for every id of every record in each batch,
+        `filter_text_refs` will look the ids up in a `TextRefIndex`, and load
+        only the text refs that they hit. The index is built from the database
+        once, or loaded from (and if need be saved to) `dirname`, and is kept
+        up to date with the refs added while it is in use.
+
+        Parameters
+        ----------
+        db : indra_db.DatabaseManager
+            The database whose text refs will be indexed.
+        dirname : str
+            A directory in which to keep snapshots of the index between runs,
+            one for each source. Optional. If not given, the index is built
+            from scratch.
+        """
+        if dirname is not None:
+            dirname = path.join(dirname, self.my_source)
+        self.text_ref_index = TextRefIndex.from_db(db, self.tr_cols, dirname)
+        return
+
+    def copy_into_db(self, db, tbl_name, data, cols=None, commit=True):
         """Wrapper around the db.copy feature, pickles args upon exception.
 
         This function also regularizes any text ref data put into the database.
+        If `commit` is False, the copy is left to be committed with whatever
+        follows it, see `db.commit_copy`.
         """
 
         # Handle the breaking of text ref IDs into smaller more searchable bits
@@ -257,7 +341,7 @@ class ContentManager(object):
                 new_data.append(tuple(new_row))
             data = new_data
 
-        return db.copy_report_lazy(tbl_name, data, cols)
+        return db.copy_report_lazy(tbl_name, data, cols, commit=commit)
 
     def make_text_ref_str(self, tr):
         """Make a string from a text ref using tr_cols."""
@@ -275,34 +359,12 @@ class ContentManager(object):
             f.write(msg + '\n')
         return
 
-    def filter_text_refs(self, db, tr_data_set, primary_id_types=None):
-        """Try to reconcile the data we have with what's already on the db.
-
-        Note that this method is VERY slow in general, and therefore should
-        be avoided whenever possible.
-
-        The process can be sped up considerably by multiple orders of
-        magnitude if you specify a limited set of id types to query to get
-        text refs. This does leave some possibility of missing relevant refs.
-        """
-        logger.info("Beginning to filter %d text refs..." % len(tr_data_set))
-
-        # This is a helper for accessing the data tuples we create
+    def _query_text_refs(self, db, tr_data_set, match_id_types):
+        """Get the text refs with any of the ids of the records."""
         def id_idx(id_type):
             return self.tr_cols.index(id_type)
 
-        # If there are not actual refs to work with, don't waste time.
-        N = len(tr_data_set)
-        if not N:
-            return set(), []
-
-        # Get all text refs that match any of the id data we have.
-        logger.debug("Getting list of existing text refs...")
         or_list = []
-        if primary_id_types is not None:
-            match_id_types = primary_id_types
-        else:
-            match_id_types = self.tr_cols
         # Get IDs from the tr_data_set that have one or more of the listed
         # id types.
         for id_type in match_id_types:
@@ -331,9 +393,63 @@ class ContentManager(object):
                                 "query." % (len(bad_ids), id_type))
                     or_list.append(getattr(db.TextRef, id_type).in_(bad_ids))
         if len(or_list) == 1:
-            tr_list = db.select_all(db.TextRef, or_list[0])
+            return db.select_all(db.TextRef, or_list[0])
+        return db.select_all(db.TextRef, sql_exp.or_(*or_list))
+
+    def _get_indexed_text_refs(self, db, tr_data_set, match_id_types):
+        """Get the text refs with any of the ids of the records by the index.
+
+        Only the text refs that the index finds are loaded, and any that do
+        not really share an id with the records are dropped.
+        """
+        index = self.text_ref_index
+        index.refresh(db)
+        keys_by_type = {}
+        trids = set()
+        for id_type in match_id_types:
+            id_list = [entry[self.tr_cols.index(id_type)]
+                       for entry in tr_data_set]
+            keys_by_type[id_type], type_trids = index.lookup(id_type, id_list)
+            trids |= type_trids
+        if not trids:
+            return []
+        tr_list = db.select_all(db.TextRef, db.TextRef.id.in_(trids))
+        return [tr for tr in tr_list if index.matches(tr, keys_by_type)]
+
+    def filter_text_refs(self, db, tr_data_set, primary_id_types=None):
+        """Try to reconcile the data we have with what's already on the db.
+
+        Note that this method is VERY slow in general, and therefore should
+        be avoided whenever possible.
+
+        The process can be sped up considerably by multiple orders of
+        magnitude if you specify a limited set of id types to query to get
+        text refs. This does leave some possibility of missing relevant refs.
+        It is also much faster over many batches to look the ids up in a local
+        index, see `use_text_ref_index`.
+        """
+        logger.info("Beginning to filter %d text refs..." % len(tr_data_set))
+
+        # This is a helper for accessing the data tuples we create
+        def id_idx(id_type):
+            return self.tr_cols.index(id_type)
+
+        # If there are not actual refs to work with, don't waste time.
+        N = len(tr_data_set)
+        if not N:
+            return set(), []
+
+        # Get all text refs that match any of the id data we have.
+        logger.debug("Getting list of existing text refs...")
+        if primary_id_types is not None:
+            match_id_types = primary_id_types
         else:
-            tr_list = db.select_all(db.TextRef, sql_exp.or_(*or_list))
+            match_id_types = self.tr_cols
+        if self.text_ref_index is not None:
+            tr_list = self._get_indexed_text_refs(db, tr_data_set,
+                                                  match_id_types)
+        else:
+            tr_list = self._query_text_refs(db, tr_data_set, match_id_types)
         logger.debug("Found %d potentially relevant text refs." % len(tr_list))
 
         # Create an index of tupled data entries for quick lookups by any id
@@ -453,6 +569,11 @@ class ContentManager(object):
         for tr, id_updates, record in update_dict.values():
             if record not in multi_match_records:
                 tr.update(**id_updates)
+                if self.text_ref_index is not None:
+                    self.text_ref_index.add_rows(
+                        [(tr.id,) + tuple(getattr(tr, id_type) for id_type
+                                          in self.text_ref_index.id_types)]
+                    )
             else:
                 logger.warning("Skipping update of text ref %d with %s due "
                                "to multiple matches to record %s."
@@ -536,6 +657,11 @@ class Pubmed(_NihManager):
     my_source = 'pubmed'
     tr_cols = ('pmid', 'pmcid', 'doi', 'pii',)
 
+    # The number of articles that are parsed and uploaded at a time. Chunks
+    # are checkpointed by their number in the file, so this should not change
+    # between a run and its continuation.
+    article_chunk_size = 5000
+
     def __init__(self, *args, categories=None, tables=None,
                  max_annotations=500000, **kwargs):
         super(Pubmed, self).__init__(*args, **kwargs)
@@ -557,27 +683,73 @@ class Pubmed(_NihManager):
         return
 
     def get_deleted_pmids(self):
+        """Get the frozenset of deleted pmids, which is only loaded once."""
         if self.deleted_pmids is None:
             del_pmid_str = self.ftp.get_uncompressed_bytes(
                 'deleted.pmids.gz'
                 )
-            pmid_list = [
+            self.deleted_pmids = frozenset(
                 line.strip() for line in del_pmid_str.split('\n')
-                ]
-            self.deleted_pmids = pmid_list
-        return self.deleted_pmids[:]
+                if line.strip()
+                )
+        return self.deleted_pmids
 
     def get_file_list(self, sub_dir):
         all_files = self.ftp.ftp_ls(sub_dir)
         return [sub_dir + '/' + k for k in all_files if k.endswith('.xml.gz')]
 
+    def iter_article_info(self, xml_file, chunk_size=None):
+        """Iterate over chunks of the article info in a pubmed xml file.
+
+        The gzipped file is streamed from the ftp service and parsed as it
+        arrives, and each article's elements are discarded as soon as its
+        metadata has been read, so that no more than one chunk of articles is
+        held in memory at once. Each chunk is a dict of the metadata of (at
+        most) `chunk_size` articles keyed by pmid, as from
+        `pubmed_client.get_metadata_from_xml_tree`. By default the chunk size
+        is `article_chunk_size`.
+        """
+        if chunk_size is None:
+            chunk_size = self.article_chunk_size
+        chunk = {}
+        with self.ftp.open_file(xml_file) as f, \
+                gzip.GzipFile(fileobj=f, mode='rb') as xml_stream:
+            events = ET.iterparse(xml_stream, events=('start', 'end'))
+            _, root = next(events)
+            for event, elem in events:
+                if event != 'end' or elem.tag not in ('PubmedArticle',
+                                                      'PubmedBookArticle'):
+                    continue
+                if elem.tag == 'PubmedArticle':
+                    info = pubmed_client.get_metadata_from_pubmed_article(
+                        elem,
+                        get_abstracts=True,
+                        prepend_title=False
+                        )
+                    chunk[info['pmid']] = info
+                root.clear()
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = {}
+        if chunk:
+            yield chunk
+        return
+
+    def _get_article_chunks(self, xml_file):
+        """Get the numbered chunks of article info in a file, then a marker.
+
+        Chunks are numbered from 1, and the marker is `(xml_file, None, None)`.
+        """
+        logger.info("Loading %s." % xml_file)
+        for chunk_idx, article_info in \
+                enumerate(self.iter_article_info(xml_file), 1):
+            yield xml_file, chunk_idx, article_info
+        yield xml_file, None, None
+
     def get_article_info(self, xml_file, q=None):
-        tree = self.ftp.get_xml_file(xml_file)
-        article_info = pubmed_client.get_metadata_from_xml_tree(
-            tree,
-            get_abstracts=True,
-            prepend_title=False
-            )
+        article_info = {}
+        for chunk in self.iter_article_info(xml_file):
+            article_info.update(chunk)
         if q is not None:
             q.put((xml_file, article_info))
             return
@@ -596,6 +768,23 @@ class Pubmed(_NihManager):
         logger.info("Fixing doubled doi: %s" % doi)
         return doi[:L//2]
 
+    def make_text_ref_records(self, article_info, pmids):
+        """Get the text ref records of some pmids, in the order of tr_cols.
+
+        The records are built a column at a time, each id type being cleaned
+        in one pass over its column, and then zipped together.
+        """
+        pmids = list(pmids)
+        infos = [article_info[pmid] for pmid in pmids]
+        columns = [pmids]
+        for id_type in self.tr_cols[1:]:
+            column = [info.get(id_type) for info in infos]
+            if id_type == 'doi':
+                column = [self.fix_doi(doi) if doi else doi for doi in column]
+            columns.append([val.strip().upper() if val else None
+                            for val in column])
+        return set(zip(*columns))
+
     def add_annotations(self, db, article_info):
         "Load annotations into the database."
         for pmid, info_dict in article_info.items():
@@ -612,8 +801,7 @@ class Pubmed(_NihManager):
         "Sanitize, update old, and upload new text refs."
 
         # Remove PMID's listed as deleted.
-        deleted_pmids = self.get_deleted_pmids()
-        valid_pmids = set(article_info.keys()) - set(deleted_pmids)
+        valid_pmids = article_info.keys() - self.get_deleted_pmids()
         logger.info("%d valid PMIDs" % len(valid_pmids))
 
         # Remove existing pmids if we're not being careful (this suffices for
@@ -629,18 +817,10 @@ class Pubmed(_NihManager):
             valid_pmids -= existing_pmids
             logger.info("%d PMIDs to add to text_refs" % len(valid_pmids))
 
-        # Convert the article_info into a list of tuples for insertion into
-        # the text_ref table
-
-        def get_val(data, id_type):
-            r = data.get(id_type)
-            if id_type == 'doi':
-                r = self.fix_doi(r)
-            return None if not r else r.strip().upper()
-
-        text_ref_records = {tuple([pmid]+[get_val(article_info[pmid], id_type)
-                                          for id_type in self.tr_cols[1:]])
-                            for pmid in valid_pmids}
+        # Convert the article_info into a set of tuples for insertion into
+        # the text_ref table.
+        text_ref_records = self.make_text_ref_records(article_info,
+                                                      valid_pmids)
 
         # Check the ids more carefully against what is already in the db.
         if carefully:
@@ -664,7 +844,12 @@ class Pubmed(_NihManager):
         return valid_pmids
 
     def load_text_content(self, db, article_info, valid_pmids,
-                          carefully=False):
+                          carefully=False, commit=True):
+        """Upload the titles and abstracts of the valid pmids.
+
+        Returns the number of text content entries that were copied. If
+        `commit` is False, the copy is left to be committed by the caller.
+        """
 
         # Build a dict mapping PMIDs to text_ref IDs
         tr_qry = db.filter_query(db.TextRef, db.TextRef.pmid.in_(valid_pmids))
@@ -704,7 +889,7 @@ class Pubmed(_NihManager):
 
                 content = article_info[pmid].get(cat)
                 if content and content.strip():
-                    content_gz = zip_string(content)
+                    content_gz = self.compress_content(content, cat)
                     text_content_records.append((tr_id, self.my_source,
                                                  formats.TEXT, cat,
                                                  content_gz))
@@ -716,13 +901,20 @@ class Pubmed(_NihManager):
             'text_content',
             text_content_records,
             cols=('text_ref_id', 'source', 'format', 'text_type',
-                  'content')
+                  'content'),
+            commit=commit
             )
         gatherer.add('content', len(text_content_records))
-        return
+        return len(text_content_records)
 
-    def upload_article(self, db, article_info, carefully=False):
-        "Process the content of an xml dataset and load into the database."
+    def upload_article(self, db, article_info, carefully=False, claim=None):
+        """Process the content of an xml dataset and load into the database.
+
+        If a `claim` on the chunk of articles is given (see
+        `checkpoints.BatchCheckpoints`) it is completed in the same
+        transaction as the copy of the content. Note that the mesh annotations
+        are gathered and copied separately, see `add_annotations`.
+        """
         logger.info("%d PMIDs in XML dataset" % len(article_info))
 
         self.add_annotations(db, article_info)
@@ -734,8 +926,15 @@ class Pubmed(_NihManager):
             valid_pmids = set(article_info.keys()) & self.db_pmids
             logger.info("%d pmids are valid." % len(valid_pmids))
 
+        n_content = None
         if 'text_content' in self.tables:
-            self.load_text_content(db, article_info, valid_pmids, carefully)
+            n_content = self.load_text_content(db, article_info, valid_pmids,
+                                               carefully,
+                                               commit=claim is None)
+
+        if claim is not None:
+            claim.complete(n_records=len(article_info), n_content=n_content)
+            db.commit_copy("Failed to commit %s." % claim)
         return True
 
     def load_files(self, db, dirname, n_procs=1, continuing=False,
@@ -759,58 +958,45 @@ class Pubmed(_NihManager):
         else:
             existing_files = set()
 
+        to_load = []
+        for xml_file in sorted(xml_files):
+            if continuing and xml_file in existing_files:
+                logger.info("Skipping %s. Already uploaded." % xml_file)
+                continue
+            to_load.append(xml_file)
+
+        # Files are streamed and parsed in processes, and the articles are
+        # uploaded here in chunks as they are parsed. Each chunk is
+        # checkpointed, so that if continuing, those already done are skipped.
         logger.info('Beginning upload with %d processes...' % n_procs)
-        if n_procs > 1:
-            # Download the XML files in parallel
-            q = mp.Queue()
-            proc_list = []
-            for xml_file in sorted(xml_files):
-                if continuing and xml_file in existing_files:
-                    logger.info("Skipping %s. Already uploaded." % xml_file)
-                    continue
-                p = mp.Process(
-                    target=self.get_article_info,
-                    args=(xml_file, q)
-                    )
-                proc_list.append(p)
-            n_tot = len(proc_list)
-
-            for _ in range(n_procs):
-                if len(proc_list):
-                    p = proc_list.pop(0)
-                    p.start()
-
-            def upload_and_record_next(start_new):
-                # Wait until at least one article is done.
-                xml_file, article_info = q.get()
-                if start_new:
-                    proc_list.pop(0).start()
-                logger.info("Beginning to upload %s." % xml_file)
-                self.upload_article(db, article_info, carefully)
+        pipeline = Pipeline([Stage('parse', self._get_article_chunks,
+                                   n_workers=n_procs, processes=n_procs > 1)],
+                            sink_name='upload')
+        checkpoints = BatchCheckpoints(db, self.my_source)
+        chunks_seen = defaultdict(set)
+        for xml_file, chunk_idx, article_info in pipeline.run(to_load):
+            if chunk_idx is None:
                 logger.info("Completed %s." % xml_file)
-                if log_update and xml_file not in existing_files:
-                    db.insert('source_file', source=self.my_source,
-                              name=xml_file)
+                chunk_idxs = chunks_seen.pop(xml_file, set())
+                if log_update:
+                    checkpoints.finish_file(xml_file, chunk_idxs)
+                continue
 
-            while len(proc_list):
-                upload_and_record_next(True)
-                n_tot -= 1
+            chunks_seen[xml_file].add(chunk_idx)
+            claim = checkpoints.claim(xml_file, chunk_idx,
+                                      redo=not continuing)
+            if claim is None:
+                logger.info("Chunk %d of %s is done or being loaded "
+                            "elsewhere: skipping..." % (chunk_idx, xml_file))
+                continue
 
-            while n_tot is not 0:
-                upload_and_record_next(False)
-                n_tot -= 1
-        else:
-            for xml_file in sorted(xml_files):
-                if continuing and xml_file in existing_files:
-                    logger.info("Skipping %s. Already uploaded." % xml_file)
-                    continue
-                article_info = self.get_article_info(xml_file)
-                logger.info("Beginning to upload %s." % xml_file)
-                self.upload_article(db, article_info, carefully)
-                logger.info("Completed %s." % xml_file)
-                if log_update and xml_file not in existing_files:
-                    db.insert('source_file', source=self.my_source,
-                              name=xml_file)
+            logger.info("Beginning to upload %d articles from %s."
+                        % (len(article_info), xml_file))
+            try:
+                self.upload_article(db, article_info, carefully, claim)
+            except BaseException:
+                claim.fail()
+                raise
 
         return True
 
@@ -883,18 +1069,110 @@ class Pubmed(_NihManager):
         return did_base or did_update
 
 
+@contextmanager
+def _gunzip_stream(fileobj):
+    """Get a stream of the decompressed contents of a gzipped stream.
+
+    If `pigz` is installed, decompression is handed off to a `pigz` process
+    (fed from a thread), so that it runs alongside the consumer of the stream
+    rather than in turn with it. Otherwise python's own gzip is used.
+
+    The whole stream must be read for its integrity to be checked.
+    """
+    pigz = shutil.which('pigz')
+    if pigz is None:
+        with gzip.GzipFile(fileobj=fileobj, mode='rb') as f:
+            yield f
+        return
+
+    proc = subprocess.Popen([pigz, '-dc'], stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE)
+    feed_errors = []
+
+    def feed():
+        try:
+            shutil.copyfileobj(fileobj, proc.stdin, 2**20)
+        except BrokenPipeError:
+            # The reader stopped early; the error (if any) is raised there.
+            pass
+        except Exception as err:
+            feed_errors.append(err)
+        finally:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+    feeder = Thread(target=feed, daemon=True)
+    feeder.start()
+    finished = False
+    try:
+        yield proc.stdout
+        finished = True
+    finally:
+        if not finished:
+            proc.kill()
+        proc.wait()
+        proc.stdout.close()
+        feeder.join()
+    if feed_errors:
+        raise feed_errors[0]
+    if proc.returncode != 0:
+        raise EOFError("pigz exited with code %d while decompressing."
+                       % proc.returncode)
+    return
+
+
+@contextmanager
+def _open_tar_stream(fileobj):
+    """Open a gzipped tar stream for strictly sequential reading."""
+    with _gunzip_stream(fileobj) as stream:
+        with tarfile.open(fileobj=stream, mode='r|') as tar:
+            yield tar
+        # Read past the padding after the end of the archive, which also
+        # checks that the compressed stream is complete.
+        while stream.read(2**20):
+            pass
+    return
+
+
 class PmcManager(_NihManager):
-    """Abstract class for uploaders of PMC content: PmcOA and Manuscripts."""
+    """Abstract class for uploaders of PMC content: PmcOA and Manuscripts.
+
+    Parameters
+    ----------
+    stream_archives : bool
+        If True, archives are unpacked as they are downloaded, rather than
+        first being downloaded in full to a local file. This saves the disk
+        space and the time of a separate download, but the FTP connection is
+        held open while the archive is processed, and a failed archive must
+        be downloaded again from the start. Default is False.
+    pmid_resolver : pmid_resolver.PmidResolver
+        Used to look up the pmids of articles that come without one, and that
+        are not on the database. By default, a resolver that keeps its cache
+        in this directory is made when first needed.
+
+    Other arguments are passed to `_NihFtpClient`.
+    """
     my_source = NotImplemented
     tr_cols = ('pmid', 'pmcid', 'doi', 'manuscript_id',)
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, stream_archives=False, pmid_resolver=None,
+                 **kwargs):
         super(PmcManager, self).__init__(*args, **kwargs)
+        self.stream_archives = stream_archives
+        self.pmid_resolver = pmid_resolver
         self.tc_cols = ('text_ref_id', 'source', 'format', 'text_type',
                         'content',)
 
+    def get_pmid_resolver(self):
+        if self.pmid_resolver is None:
+            self.pmid_resolver = \
+                PmidResolver(path.join(THIS_DIR, 'pmid_cache.sqlite'))
+        return self.pmid_resolver
+
     def get_missing_pmids(self, db, tr_data):
-        "Try to get missing pmids using the pmc client."
+        "Try to get missing pmids using the pmc id converter service."
 
         logger.info("Getting missing pmids.")
 
@@ -918,12 +1196,15 @@ class PmcManager(_NihManager):
                          if tr.pmid is not None}
 
         logger.debug("Found %d pmids on the databse." % len(pmids_from_db))
+        pmids_from_service = self.get_pmid_resolver().resolve(
+            tr_entry['pmcid'] for tr_entry in missing_pmid_entries
+            if tr_entry['pmcid'] not in pmids_from_db.keys()
+            )
         num_found_non_db = 0
         for tr_entry in missing_pmid_entries:
             if tr_entry['pmcid'] not in pmids_from_db.keys():
-                ret = id_lookup(tr_entry['pmcid'], idtype='pmcid')
-                if 'pmid' in ret.keys() and ret['pmid'] is not None:
-                    tr_entry['pmid'] = ret['pmid']
+                if tr_entry['pmcid'] in pmids_from_service.keys():
+                    tr_entry['pmid'] = pmids_from_service[tr_entry['pmcid']]
                     num_found_non_db += 1
                     num_missing -= 1
             else:
@@ -983,8 +1264,12 @@ class PmcManager(_NihManager):
         logger.info("Finished filtering the text content.")
         return list(set(filtered_tc_records))
 
-    def upload_batch(self, db, tr_data, tc_data):
-        "Add a batch of text refs and text content to the database."
+    def upload_batch(self, db, tr_data, tc_data, claim=None):
+        """Add a batch of text refs and text content to the database.
+
+        If a `claim` on the batch is given (see `checkpoints.BatchCheckpoints`)
+        it is completed in the same transaction as the copy of the content.
+        """
 
         # Check for any pmids we can get from the pmc client (this is slow!)
         self.get_missing_pmids(db, tr_data)
@@ -1028,8 +1313,13 @@ class PmcManager(_NihManager):
             db,
             'text_content',
             filtered_tc_records,
-            self.tc_cols
+            self.tc_cols,
+            commit=claim is None
             )
+        if claim is not None:
+            claim.complete(n_records=len(tr_data),
+                           n_content=len(filtered_tc_records))
+            db.commit_copy("Failed to commit %s." % claim)
         gatherer.add('content', len(filtered_tc_records))
         return
 
@@ -1057,7 +1347,8 @@ class PmcManager(_NihManager):
         tc_datum = {
             'pmcid': id_data['pmcid'],
             'text_type': texttypes.FULLTEXT,
-            'content': zip_string(xml_str)
+            'content': self.compress_content(xml_str,
+                                             texttypes.FULLTEXT)
             }
         return tr_datum, tc_datum
 
@@ -1069,40 +1360,108 @@ class PmcManager(_NihManager):
         upload by another process. Otherwise, if `db` is provided, upload the
         batches of data on this process. One or the other MUST be provided.
         """
-        with tarfile.open(archive_path, mode='r:gz') as tar:
-            xml_files = [m for m in tar.getmembers() if m.isfile()
-                         and m.name.endswith('xml')]
-            N_tot = len(xml_files)
-            logger.info('Loading %s which contains %d files.'
-                        % (path.basename(archive_path), N_tot))
-            N_batches = N_tot//batch_size + 1
-            for i in range(N_batches):
-                tr_data = []
-                tc_data = []
-                for xml_file in xml_files[i*batch_size:(i+1)*batch_size]:
-                    xml_str = tar.extractfile(xml_file).read().decode('utf8')
-                    res = self.get_data_from_xml_str(xml_str, xml_file.name)
-                    if res is None:
-                        continue
-                    else:
-                        tr, tc = res
+        with open(archive_path, 'rb') as f:
+            self.unpack_archive_stream(f, path.basename(archive_path), q=q,
+                                       db=db, batch_size=batch_size)
+        return
+
+    def iter_archive_batches(self, stream, archive_name, batch_size=10000):
+        """Iterate over batches of the contents of a gzipped tar archive.
+
+        The archive is read from a binary stream strictly in order, in a
+        single pass, and the xml files are parsed as they are decompressed.
+        Each batch of `batch_size` xml files is yielded as soon as it is
+        complete, as a tuple of a label and the text ref and text content
+        data.
+
+        Batches are numbered in archive order from 1, as they were when the
+        whole archive was listed up front, so the batches checkpointed by
+        `upload_archives` remain valid. The label is a tuple of the batch
+        number, the total number of batches and the archive name, but the
+        total is only known at the last batch, so for any other it is '?'.
+        """
+        logger.info('Loading %s.' % archive_name)
+        batch_idx = 0
+        n_files = 0
+        n_tot = 0
+        tr_data = []
+        tc_data = []
+        with _open_tar_stream(stream) as tar:
+            for member in tar:
+                if not member.isfile() or not member.name.endswith('xml'):
+                    continue
+                xml_str = tar.extractfile(member).read().decode('utf8')
+                res = self.get_data_from_xml_str(xml_str, member.name)
+                n_files += 1
+                n_tot += 1
+                if res is not None:
+                    tr, tc = res
                     tr_data.append(tr)
                     tc_data.append(tc)
+                if n_files == batch_size:
+                    batch_idx += 1
+                    yield (batch_idx, '?', archive_name), tr_data, tc_data
+                    n_files = 0
+                    tr_data = []
+                    tc_data = []
+        batch_idx += 1
+        yield (batch_idx, batch_idx, archive_name), tr_data, tc_data
+        logger.info('Finished loading %s: %d xml files in %d batches.'
+                    % (archive_name, n_tot, batch_idx))
+        return
 
-                if q is not None:
-                    label = (i+1, N_batches, path.basename(archive_path))
-                    logger.debug("Submitting batch %d/%d for %s to queue."
-                                 % label)
-                    q.put((label, tr_data[:], tc_data[:]))
-                elif db is not None:
-                    self.upload_batch(db, tr_data[:], tc_data[:])
-                else:
-                    raise UploadError(
-                        "unpack_archive_path must receive either a db instance"
-                        " or a queue instance."
-                        )
+    def unpack_archive_stream(self, stream, archive_name, q=None, db=None,
+                              batch_size=10000):
+        """Unpack the contents of a gzipped tar archive from a binary stream.
+
+        Each batch of the archive (see `iter_archive_batches`) is handed off
+        as soon as it is complete, either onto `q` or, if no queue is given,
+        uploaded to `db`. One or the other MUST be provided.
+        """
+        if q is None and db is None:
+            raise UploadError(
+                "unpack_archive_stream must receive either a db instance or a "
+                "queue instance."
+                )
+
+        for label, tr_data, tc_data in \
+                self.iter_archive_batches(stream, archive_name, batch_size):
+            if q is not None:
+                logger.debug("Submitting batch %s/%s for %s to queue."
+                             % label)
+                q.put((label, tr_data, tc_data))
+            else:
+                self.upload_batch(db, tr_data, tc_data)
         return
 
+    def download_archive(self, archive, continuing=False):
+        """Download an archive into THIS_DIR, returning the local path.
+
+        If `continuing`, an archive of the same name that is already there is
+        used instead.
+        """
+        # This is a guess at the location of the archive.
+        archive_local_path = path.join(THIS_DIR, path.basename(archive))
+
+        # Download the archive if need be.
+        if continuing and path.exists(archive_local_path):
+            logger.info('Archive %s found locally at %s, not loading again.'
+                        % (archive, archive_local_path))
+        else:
+            logger.info('Downloading archive %s.' % archive)
+            try:
+                archive_local_path = self.ftp.download_file(archive,
+                                                            dest=THIS_DIR)
+                logger.debug("Download succesfully completed for %s."
+                             % archive)
+            except BaseException:
+                logger.error("Failed to download %s. Deleting corrupt file."
+                             % archive)
+                if path.exists(archive_local_path):
+                    remove(archive_local_path)
+                raise
+        return archive_local_path
+
     def process_archive(self, archive, q=None, db=None, continuing=False):
         """Download an archive and begin unpacking it.
 
@@ -1128,26 +1487,14 @@ class PmcManager(_NihManager):
             archive of the same name is already downloaded locally. Default is
             False.
         """
+        if self.stream_archives:
+            logger.info('Streaming archive %s.' % archive)
+            with self.ftp.open_file(archive) as f:
+                self.unpack_archive_stream(f, path.basename(archive), q=q,
+                                           db=db)
+            return
 
-        # This is a guess at the location of the archive.
-        archive_local_path = path.join(THIS_DIR, path.basename(archive))
-
-        # Download the archive if need be.
-        if continuing and path.exists(archive_local_path):
-            logger.info('Archive %s found locally at %s, not loading again.'
-                        % (archive, archive_local_path))
-        else:
-            logger.info('Downloading archive %s.' % archive)
-            try:
-                archive_local_path = self.ftp.download_file(archive,
-                                                            dest=THIS_DIR)
-                logger.debug("Download succesfully completed for %s."
-                             % archive)
-            except BaseException:
-                logger.error("Failed to download %s. Deleting corrupt file."
-                             % archive)
-                remove(archive_local_path)
-                raise
+        archive_local_path = self.download_archive(archive, continuing)
 
         # Now unpack the archive.
         self.unpack_archive_path(archive_local_path, q=q, db=db)
@@ -1157,6 +1504,39 @@ class PmcManager(_NihManager):
         remove(archive_local_path)
         return
 
+    def _download_for_pipeline(self, archive, continuing):
+        try:
+            return archive, self.download_archive(archive, continuing)
+        except Exception:
+            logger.exception("Could not download %s." % archive)
+            return None
+
+    def _get_archive_batches(self, archive, local_path=None):
+        """Get the batches of an archive, ending with an empty marker.
+
+        The archive is streamed from the ftp service, unless a local path is
+        given, in which case that file is read, and removed when done. Each
+        batch is yielded with the name of the archive, and once all of them
+        are, `(archive, None, None, None)` marks the archive complete. Errors
+        are logged, so that one bad archive doesn't stop the rest.
+        """
+        archive_name = path.basename(archive)
+        try:
+            if local_path is None:
+                with self.ftp.open_file(archive) as f:
+                    for batch in self.iter_archive_batches(f, archive_name):
+                        yield (archive,) + batch
+            else:
+                with open(local_path, 'rb') as f:
+                    for batch in self.iter_archive_batches(f, archive_name):
+                        yield (archive,) + batch
+                logger.info("Removing %s." % local_path)
+                remove(local_path)
+        except Exception:
+            logger.exception("Failed to unpack %s." % archive)
+            return
+        yield archive, None, None, None
+
     def is_archive(self, *args):
         raise NotImplementedError("is_archive must be defined by the child.")
 
@@ -1164,83 +1544,59 @@ class PmcManager(_NihManager):
         return [k for k in self.ftp.ftp_ls() if self.is_archive(k)]
 
     def upload_archives(self, db, archives, n_procs=1, continuing=False):
-        "Do the grunt work of downloading and processing a list of archives."
-        q = mp.Queue(len(archives))
-        wait_list = []
-        for archive in archives:
-            p = mp.Process(
-                target=self.process_archive,
-                args=(archive, ),
-                kwargs={'q': q, 'continuing': continuing},
-                daemon=True
-                )
-            wait_list.append((archive, p))
-
-        active_list = []
-
-        def start_next_proc():
-            if len(wait_list) is not 0:
-                archive, proc = wait_list.pop(0)
-                proc.start()
-                active_list.append((archive, proc))
-
-        # Start the processes running
-        for _ in range(min(n_procs, len(archives))):
-            start_next_proc()
-
-        # Monitor the processes while any are still active.
-        batch_log = path.join(THIS_DIR, '%s_batch_log.tmp' % self.my_source)
-        batch_entry_fmt = '%s %d\n'
-        open(batch_log, 'a+').close()
-        while len(active_list) is not 0:
-            # Check for processes that have been unpacking archives to
-            # complete, and when they do, add them to the source_file table.
-            # If there are any more archives waiting to be processed, start
-            # the next one.
-            for a, p in [(a, p) for a, p in active_list if not p.is_alive()]:
-                if p.exitcode is 0:
-                    sf_list = db.select_all(
-                        db.SourceFile,
-                        db.SourceFile.source == self.my_source,
-                        db.SourceFile.name == a
-                        )
-                    if not sf_list:
-                        db.insert('source_file', source=self.my_source, name=a)
-                else:
-                    logger.error("Process for %s exitted with exit code %d."
-                                 % (path.basename(a), p.exitcode))
-                active_list.remove((a, p))
-                start_next_proc()
+        """Do the grunt work of downloading and processing a list of archives.
+
+        Archives are downloaded one at a time, and unpacked in `n_procs`
+        processes (see `pipeline.Pipeline`), while the batches they produce
+        are uploaded here. Few archives are downloaded ahead of the unpacking,
+        to limit the disk space taken up. If `stream_archives` is set, each
+        unpacking process streams its archive from the ftp service instead.
+
+        Each batch is checkpointed in the ingestion_batch table (see
+        `checkpoints.BatchCheckpoints`). If `continuing`, batches that are
+        already done are skipped, otherwise they are loaded again. Batches
+        claimed by an uploader on another host are skipped either way, so
+        several hosts may share the upload of a set of archives. An archive
+        is added to source_file once all of its batches are done.
+        """
+        if self.stream_archives:
+            stages = [Stage('unpack', self._get_archive_batches,
+                            n_workers=n_procs, processes=True)]
+        else:
+            stages = [
+                Stage('download',
+                      lambda a: self._download_for_pipeline(a, continuing),
+                      queue_size=1),
+                Stage('unpack', lambda t: self._get_archive_batches(*t),
+                      n_workers=n_procs, processes=True, queue_size=1)
+            ]
+        pipeline = Pipeline(stages, sink_name='upload')
+
+        checkpoints = BatchCheckpoints(db, self.my_source)
+        batches_seen = defaultdict(set)
+        for archive, label, tr_data, tc_data in pipeline.run(archives):
+            # When an archive has been completely unpacked, add it to the
+            # source_file table.
+            if label is None:
+                checkpoints.finish_file(archive,
+                                        batches_seen.pop(archive, set()))
+                continue
 
-            # Wait for the next output from an archive unpacker.
-            try:
-                # This will not block until at least one is done
-                label, tr_data, tc_data = q.get_nowait()
-            except Exception:
+            batch_id = label[0]
+            batches_seen[archive].add(batch_id)
+            claim = checkpoints.claim(archive, batch_id, redo=not continuing)
+            if claim is None:
+                logger.info("Batch %d of %s is done or being loaded "
+                            "elsewhere: skipping..." % (batch_id, archive))
                 continue
-            logger.info("Beginning to upload batch %d/%d from %s..." % label)
-            batch_id, _, arc_name = label
-            if continuing:
-                with open(batch_log, 'r') as f:
-                    if batch_entry_fmt % (arc_name, batch_id) in f.readlines():
-                        logger.info("Batch %d already completed: skipping..."
-                                    % batch_id)
-                        continue
-            self.upload_batch(db, tr_data, tc_data)
-            with open(batch_log, 'a+') as f:
-                f.write(batch_entry_fmt % (arc_name, batch_id))
-            logger.info("Finished batch %d/%d from %s..." % label)
-            time.sleep(0.1)
-
-        # Empty the queue.
-        while not q.empty():
-            try:
-                tr_data, tc_data = q.get(timeout=1)
-            except Exception:
-                break
-            self.upload_batch(db, tr_data, tc_data)
 
-        remove(batch_log)
+            logger.info("Beginning to upload batch %s/%s from %s..." % label)
+            try:
+                self.upload_batch(db, tr_data, tc_data, claim)
+            except BaseException:
+                claim.fail()
+                raise
+            logger.info("Finished batch %s/%s from %s..." % label)
 
         return
 
@@ -1411,8 +1767,9 @@ class Elsevier(ContentManager):
     tc_cols = ('text_ref_id', 'source', 'format', 'text_type',
                'content',)
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, fetcher=None, **kwargs):
         super(Elsevier, self).__init__(*args, **kwargs)
+        self.fetcher = fetcher
         with open(path.join(THIS_DIR, 'elsevier_titles.txt'), 'r') as f:
             self.__journal_set = {self.__regularize_title(t)
                                   for t in f.read().splitlines()}
@@ -1469,19 +1826,29 @@ class Elsevier(ContentManager):
                         elsevier_tr_set.add(tr_dict[pmid])
         return elsevier_tr_set
 
+    def get_fetcher(self):
+        if self.fetcher is None:
+            cache_dir = path.join(THIS_DIR, 'elsevier_cache')
+            self.fetcher = ElsevierFetcher(cache_dir=cache_dir)
+        return self.fetcher
+
     def __get_content(self, trs):
-        """Get the content."""
-        article_tuples = set()
+        """Get the content, fetching the articles of the batch at once."""
+        id_dicts = {}
         for tr in trs:
             id_dict = {id_type: getattr(tr, id_type)
                        for id_type in ['doi', 'pmid', 'pii']
                        if getattr(tr, id_type) is not None}
             if id_dict:
-                content_str = download_article_from_ids(**id_dict)
-                if content_str is not None:
-                    content_zip = zip_string(content_str)
-                    article_tuples.add((tr.id, self.my_source, formats.TEXT,
-                                        texttypes.FULLTEXT, content_zip))
+                id_dicts[tr.id] = id_dict
+        contents = self.get_fetcher().fetch_all(id_dicts)
+
+        article_tuples = set()
+        for trid, content_str in contents.items():
+            content_zip = self.compress_content(content_str,
+                                                texttypes.FULLTEXT)
+            article_tuples.add((trid, self.my_source, formats.TEXT,
+                                texttypes.FULLTEXT, content_zip))
         return article_tuples
 
     def __process_batch(self, db, tr_batch):
@@ -1543,7 +1910,8 @@ class Elsevier(ContentManager):
     def populate(self, db, n_procs=1, continuing=False):
         """Load all available elsevier content for refs with no pmc content."""
         # Note that we do not implement multiprocessing, because by the nature
-        # of the web API's used, we are limited by bandwidth from any one IP.
+        # of the web API's used, we are limited by the rate allowed from any
+        # one IP, which the fetcher keeps to (see `ElsevierFetcher`).
         tr_w_pmc_q = db.filter_query(
             db.TextRef,
             db.TextRef.id == db.TextContent.text_ref_id,
@@ -1623,6 +1991,31 @@ def _make_parser():
         help=('Specify which sources are to be uploaded. Defaults are pubmed, '
               'pmc_oa, and manuscripts.')
     )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help=('Unpack the pmc_oa and manuscripts archives as they are '
+              'downloaded, rather than saving them locally first.')
+    )
+    parser.add_argument(
+        '--ref-index',
+        action='store_true',
+        help=('Reconcile new text refs against an index of the text_ref table '
+              'held in memory, rather than querying for each batch.')
+    )
+    parser.add_argument(
+        '--ref-index-dir',
+        help=('A directory in which to keep a snapshot of the text ref index '
+              'between runs. Implies --ref-index.')
+    )
+    parser.add_argument(
+        '--codec',
+        choices=CODECS,
+        default=GZIP,
+        help=('The codec with which to compress new content. With zstd, the '
+              'latest dictionary trained for each source and text type is '
+              'used, if any. The default is gzip.')
+    )
     parser.add_argument(
         '-D', '--database',
         default='primary',
@@ -1675,18 +2068,35 @@ def _main():
         if not args.continuing:
             logger.info("Clearing TextContent and TextRef tables.")
             clear_succeeded = db._clear([db.TextContent, db.TextRef,
-                                         db.SourceFile, db.Updates])
+                                         db.SourceFile, db.IngestionBatch,
+                                         db.Updates])
             if not clear_succeeded:
                 sys.exit()
         for Updater in [Pubmed, PmcOA, Manuscripts, Elsevier]:
             if Updater.my_source in args.sources:
                 logger.info("Populating %s." % Updater.my_source)
-                Updater().populate(db, args.num_procs, args.continuing)
+                updater = Updater()
+                if issubclass(Updater, PmcManager):
+                    updater.stream_archives = args.stream
+                if issubclass(Updater, _NihManager) \
+                        and (args.ref_index or args.ref_index_dir):
+                    updater.use_text_ref_index(db, args.ref_index_dir)
+                if args.codec != GZIP:
+                    updater.use_codec(db, args.codec)
+                updater.populate(db, args.num_procs, args.continuing)
     elif args.task == 'update':
         for Updater in [Pubmed, PmcOA, Manuscripts, Elsevier]:
             if Updater.my_source in args.sources:
                 logger.info("Updating %s." % Updater.my_source)
-                Updater().update(db, args.num_procs)
+                updater = Updater()
+                if issubclass(Updater, PmcManager):
+                    updater.stream_archives = args.stream
+                if issubclass(Updater, _NihManager) \
+                        and (args.ref_index or args.ref_index_dir):
+                    updater.use_text_ref_index(db, args.ref_index_dir)
+                if args.codec != GZIP:
+                    updater.use_codec(db, args.codec)
+                updater.update(db, args.num_procs)
 
 
 if __name__ == '__main__':
@@ -8,8 +8,9 @@ from argparse import ArgumentParser
 
 from indra.statements import get_all_descendants
 from indra.statements.io import stmts_from_json
-from indra_db.belief import get_belief
+from indra_db.belief import get_belief, get_belief_update, get_last_link_id
 from indra_db.config import CONFIG, get_s3_dump, record_in_test
+from indra_db.databases import ReadonlyRefreshError
 from indra_db.util import get_db, get_ro, S3Path
 from indra_db.util.aws import get_role_kwargs
 from indra_db.util.dump_sif import dump_sif, get_source_counts
@@ -76,6 +77,13 @@ def get_latest_dump_s3_path(dumper_name):
     return None
 
 
+def get_belief_delta_path(belief_path):
+    """Get the path of the belief delta recorded with a belief dump."""
+    dump_dir = belief_path.key.rsplit('/', 1)[0]
+    return S3Path(belief_path.bucket, dump_dir)\
+        .get_element_path('belief_delta.json')
+
+
 class Dumper(object):
     name = NotImplemented
     fmt = NotImplemented
@@ -158,7 +166,8 @@ class Dumper(object):
             return False
         if s3_base.key not in s3_path.key:
             return False
-        if cls.name not in s3_path.key:
+        # Match the whole file (or directory) name, not a part of another.
+        if cls.file_name() not in s3_path.key.split('/'):
             return False
         return True
 
@@ -268,10 +277,59 @@ class Belief(Dumper):
     db_required = True
     db_options = ['principal']
 
-    def dump(self, continuing=False):
-        belief_dict = get_belief(self.db, partition=False)
+    def dump(self, continuing=False, incremental=False):
+        """Dump the beliefs of all the pa statements.
+
+        If `incremental`, the beliefs of the latest earlier dump are updated
+        with the evidence linked since it was made (see
+        `indra_db.belief.get_belief_update`). If there is no earlier dump, or
+        no record of the evidence it included, all the beliefs are
+        calculated.
+
+        Each dump is recorded alongside it in a belief delta file (see
+        `get_belief_delta_path`), which holds the last raw_unique_links id it
+        included, the earlier dump it updated (if any), and the beliefs that
+        changed and were removed from that earlier dump.
+        """
         s3 = boto3.client('s3')
-        self.get_s3_path().upload(s3, json.dumps(belief_dict).encode('utf-8'))
+
+        # Evidence linked while the beliefs are calculated is left for the
+        # next update, so the last link is found first.
+        last_link_id = get_last_link_id(self.db)
+
+        prev_dump = None
+        prev_record = None
+        if incremental:
+            prev_dump = get_latest_dump_s3_path(self.name)
+            if prev_dump is None:
+                logger.info("No earlier belief dump found, calculating all "
+                            "beliefs.")
+            else:
+                record_path = get_belief_delta_path(prev_dump)
+                if record_path.exists(s3):
+                    prev_record = \
+                        json.loads(record_path.get(s3)['Body'].read())
+                else:
+                    logger.info(f"No record of the evidence included in "
+                                f"{prev_dump}, calculating all beliefs.")
+
+        if prev_record is None:
+            belief_dict = get_belief(self.db, partition=False)
+            record = {'base': None, 'changed': {}, 'removed': []}
+        else:
+            logger.info(f"Updating the beliefs from {prev_dump}.")
+            prev_beliefs = json.loads(prev_dump.get(s3)['Body'].read())
+            belief_dict, delta = \
+                get_belief_update(self.db, prev_beliefs,
+                                  prev_record['last_link_id'])
+            record = dict(base=prev_dump.to_string(), **delta)
+        record['last_link_id'] = last_link_id
+
+        belief_path = self.get_s3_path()
+        belief_path.upload(s3, json.dumps(belief_dict).encode('utf-8'))
+        get_belief_delta_path(belief_path).upload(
+            s3, json.dumps(record).encode('utf-8')
+        )
 
 
 class SourceCount(Dumper):
@@ -326,7 +384,8 @@ class Readonly(Dumper):
     db_required = True
     db_options = ['principal']
 
-    def dump(self, belief_dump, continuing=False):
+    def dump(self, belief_dump, continuing=False, keep_temp=False,
+             jobs=None):
 
         logger.info("%s - Generating readonly schema (est. a long time)"
                     % datetime.now())
@@ -334,11 +393,31 @@ class Readonly(Dumper):
         s3 = boto3.client('s3')
         belief_data = belief_dump.get(s3)
         belief_dict = json.loads(belief_data['Body'].read())
-        self.db.generate_readonly(belief_dict, allow_continue=continuing)
+        self.db.generate_readonly(belief_dict, allow_continue=continuing,
+                                  keep_temp=keep_temp)
 
         logger.info("%s - Beginning dump of database (est. 1 + epsilon hours)"
                     % datetime.now())
-        self.db.dump_readonly(self.get_s3_path())
+        self.db.dump_readonly(self.get_s3_path(), jobs=jobs)
+        return
+
+
+class ReadonlyDelta(Dumper):
+    name = 'ro_delta'
+    fmt = 'dump'
+    db_required = True
+    db_options = ['principal']
+
+    def dump(self, belief_dump, continuing=False):
+
+        logger.info("%s - Refreshing the readonly schema" % datetime.now())
+        s3 = boto3.client('s3')
+        belief_data = belief_dump.get(s3)
+        belief_dict = json.loads(belief_data['Body'].read())
+        self.db.refresh_readonly(belief_dict)
+
+        logger.info("%s - Beginning dump of changes" % datetime.now())
+        self.db.dump_readonly_delta(self.get_s3_path())
         return
 
 
@@ -366,12 +445,12 @@ class StatementHashMeshId(Dumper):
         self.get_s3_path().upload(s3, pickle.dumps(mesh_data))
 
 
-def load_readonly_dump(principal_db, readonly_db, dump_file):
+def load_readonly_dump(principal_db, readonly_db, dump_file, jobs=None):
     logger.info("Using dump_file = \"%s\"." % dump_file)
     logger.info("%s - Beginning upload of content (est. ~30 minutes)"
                 % datetime.now())
     with ReadonlyTransferEnv(principal_db, readonly_db):
-        readonly_db.load_dump(dump_file)
+        readonly_db.load_dump(dump_file, jobs=jobs)
 
 
 def get_lambda_client():
@@ -413,7 +492,19 @@ dumpers = {dumper.name: dumper for dumper in get_all_descendants(Dumper)}
 
 
 def dump(principal_db, readonly_db, delete_existing=False, allow_continue=True,
-         load_only=False, dump_only=False):
+         load_only=False, dump_only=False, incremental=False, jobs=None):
+    """Build the readonly schema, dump it to s3, and load it onto readonly.
+
+    If `incremental` is True, the readonly schema is kept on the principal
+    database after the dump, and at the next dump only the rows derived from
+    content that has changed are refreshed and transferred (see
+    `PrincipalDatabaseManager.refresh_readonly`). A full build is done if the
+    schema cannot be refreshed. Likewise only the beliefs of statements that
+    may have changed are recalculated.
+
+    If `jobs` is given, full dumps of the readonly schema are made and loaded
+    with that many parallel jobs, using the directory format of pg_dump.
+    """
     if delete_existing and 'readonly' in principal_db.get_schemas():
         principal_db.drop_schema('readonly')
 
@@ -426,21 +517,46 @@ def dump(principal_db, readonly_db, delete_existing=False, allow_continue=True,
             logger.info("Dumping belief.")
             belief_dumper = Belief(db=principal_db,
                                    date_stamp=starter.date_stamp)
-            belief_dumper.dump(continuing=allow_continue)
+            belief_dumper.dump(continuing=allow_continue,
+                               incremental=incremental)
             belief_dump = belief_dumper.get_s3_path()
         else:
             logger.info("Belief dump exists, skipping.")
 
         dump_file = Readonly.from_list(starter.manifest)
-        if not allow_continue or not dump_file:
-            logger.info("Generating readonly schema (est. a long time)")
-            ro_dumper = Readonly(db=principal_db,
-                                 date_stamp=starter.date_stamp)
-            ro_dumper.dump(belief_dump=belief_dump,
-                           continuing=allow_continue)
-            dump_file = ro_dumper.get_s3_path()
-        else:
+        delta_file = ReadonlyDelta.from_list(starter.manifest)
+        if not allow_continue:
+            dump_file = delta_file = None
+
+        if dump_file or delta_file:
             logger.info("Readonly dump exists, skipping.")
+        else:
+            if incremental:
+                try:
+                    logger.info("Refreshing the readonly schema.")
+                    delta_dumper = ReadonlyDelta(db=principal_db,
+                                                 date_stamp=starter.date_stamp)
+                    delta_dumper.dump(belief_dump=belief_dump,
+                                      continuing=allow_continue)
+                    delta_file = delta_dumper.get_s3_path()
+                except ReadonlyRefreshError as err:
+                    logger.warning(f"Could not refresh the readonly schema: "
+                                   f"{err}. Falling back to a full build.")
+
+                    # Only throw out complete builds, not partial ones that
+                    # may be continued.
+                    state = principal_db.get_schema_state('readonly')
+                    if state is not None and state.get('complete'):
+                        principal_db.drop_schema('readonly')
+
+            if not delta_file:
+                logger.info("Generating readonly schema (est. a long time)")
+                ro_dumper = Readonly(db=principal_db,
+                                     date_stamp=starter.date_stamp)
+                ro_dumper.dump(belief_dump=belief_dump,
+                               continuing=allow_continue,
+                               keep_temp=incremental, jobs=jobs)
+                dump_file = ro_dumper.get_s3_path()
 
         if not allow_continue or not Sif.from_list(starter.manifest):
             logger.info("Dumping sif from the readonly schema on principal.")
@@ -473,10 +589,27 @@ def dump(principal_db, readonly_db, delete_existing=False, allow_continue=True,
             raise Exception("Could not find any suitable readonly dumps.")
 
     if not dump_only:
-        print("Dump file:", dump_file)
-        load_readonly_dump(principal_db, readonly_db, dump_file)
+        if not load_only and delta_file:
+            print("Delta dump file:", delta_file)
+            try:
+                readonly_db.load_delta(delta_file)
+            except ReadonlyRefreshError as err:
+                # The readonly database was not loaded from the previous build
+                # on principal, so it needs the whole schema.
+                logger.warning(f"Could not apply changes to readonly: {err}. "
+                               f"Loading a full dump instead.")
+                dump_file = Readonly(db=principal_db,
+                                     date_stamp=starter.date_stamp)\
+                    .get_s3_path()
+                principal_db.dump_readonly(dump_file, jobs=jobs)
+                load_readonly_dump(principal_db, readonly_db, dump_file,
+                                   jobs=jobs)
+        else:
+            print("Dump file:", dump_file)
+            load_readonly_dump(principal_db, readonly_db, dump_file,
+                               jobs=jobs)
 
-    if not load_only:
+    if not load_only and not incremental:
         # This database no longer needs this schema (this only executes if
         # the check_call does not error).
         principal_db.session.close()
@@ -528,6 +661,19 @@ def parse_args():
         help=('Use this flag to only load the latest s3 file onto the '
               'readonly database.')
     )
+    parser.add_argument(
+        '-i', '--incremental',
+        action='store_true',
+        help=('Keep the readonly schema on the principal database, and only '
+              'refresh and transfer what changed since the last build when '
+              'possible.')
+    )
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        help=('The number of tables to dump and load in parallel. By default '
+              'a single process is used.')
+    )
 
     args = parser.parse_args()
     return args
@@ -536,4 +682,5 @@ def parse_args():
 if __name__ == '__main__':
     args = parse_args()
     dump(get_db(args.database), get_ro(args.readonly), args.delet_existing,
-         args.allow_continue, args.load_only, args.dump_only)
+         args.allow_continue, args.load_only, args.dump_only,
+         args.incremental, args.jobs)
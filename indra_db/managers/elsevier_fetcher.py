@@ -0,0 +1,330 @@
+"""Fetch articles from Elsevier many at a time, keeping the raw responses.
+
+Getting the articles of a batch of text refs one after the other leaves the
+upload waiting on the latency of each request, far below the rate the
+Elsevier API allows. An `ElsevierFetcher` instead has several requests in
+flight at once, held to the allowed rate by a token bucket, and tries each
+request again (waiting longer each time) when the API is busy or the
+connection fails.
+
+Every response is kept in a local cache: the raw articles are stored once,
+under the sha256 digest of their bytes, and a SQLite index maps each id to the
+digest of its article, or to nothing if Elsevier has no article for it. An id
+is therefore never fetched twice, except for ids without an article, which are
+tried again once their answer is older than `miss_ttl`.
+
+Requests go through a client, which may be replaced, for instance by one
+pointed at a local stand-in server in tests: any object with a `get` method
+taking an id type and an id, and returning the status code and the bytes of
+the response (see `ElsevierHttpClient`).
+"""
+
+__all__ = ['ElsevierFetcher', 'ElsevierHttpClient', 'ResponseCache']
+
+import gzip
+import time
+import logging
+import sqlite3
+from os import path, makedirs, replace
+from hashlib import sha256
+from threading import Lock
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+from indra import has_config, get_config
+from indra.literature.elsevier_client import elsevier_api_url, \
+    API_KEY_ENV_NAME, INST_KEY_ENV_NAME
+
+logger = logging.getLogger(__name__)
+
+# The id types an article may be requested by, in the order they are tried.
+ID_TYPES = ('eid', 'doi', 'pmid', 'pii')
+
+
+class ElsevierHttpClient(object):
+    """Get articles from the Elsevier article retrieval API.
+
+    Parameters
+    ----------
+    api_url : str
+        The root of the API. By default this is Elsevier's own.
+    headers : dict
+        The headers sent with each request. By default, these hold the API key
+        and institution token from the INDRA config or environment.
+    timeout : float
+        The seconds to wait for a response. Default is 60.
+    """
+    def __init__(self, api_url=elsevier_api_url, headers=None, timeout=60):
+        self.api_url = api_url.rstrip('/')
+        if headers is None:
+            headers = {}
+            for header, key in [('X-ELS-APIKey', API_KEY_ENV_NAME),
+                                ('X-ELS-Insttoken', INST_KEY_ENV_NAME)]:
+                if has_config(key):
+                    headers[header] = get_config(key)
+            if 'X-ELS-APIKey' not in headers:
+                logger.error(f"No Elsevier API key {API_KEY_ENV_NAME} found: "
+                             f"articles cannot be downloaded.")
+        self.headers = headers
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def get(self, id_type, id_val):
+        if id_type == 'pmid':
+            id_type = 'pubmed_id'
+        res = self._session.get(f'{self.api_url}/article/{id_type}/{id_val}',
+                                params={'httpAccept': 'text/xml'},
+                                headers=self.headers, timeout=self.timeout)
+        return res.status_code, res.content
+
+
+class ResponseCache(object):
+    """A content addressed cache of the articles found for each id.
+
+    Parameters
+    ----------
+    dirname : str
+        The directory holding the cache. It is created if it does not exist.
+    """
+    def __init__(self, dirname):
+        self.dirname = dirname
+        makedirs(path.join(dirname, 'objects'), exist_ok=True)
+        self._lock = Lock()
+        self._conn = sqlite3.connect(path.join(dirname, 'index.sqlite'),
+                                     check_same_thread=False)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    id_type TEXT NOT NULL,
+                    id_val TEXT NOT NULL,
+                    digest TEXT,
+                    fetched REAL NOT NULL,
+                    PRIMARY KEY (id_type, id_val)
+                )
+            """)
+
+    def close(self):
+        self._conn.close()
+
+    def _get_object_path(self, digest):
+        return path.join(self.dirname, 'objects', digest[:2],
+                         digest + '.xml.gz')
+
+    def get(self, id_type, id_val, miss_ttl):
+        """Get the cached answer for an id.
+
+        Returns
+        -------
+        found : bool
+            True if there is an answer for the id that still holds.
+        content : bytes or None
+            The article, or None if there is none.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest, fetched FROM responses "
+                "WHERE id_type = ? AND id_val = ?",
+                (id_type, id_val)
+            ).fetchone()
+        if row is None:
+            return False, None
+        digest, fetched = row
+        if digest is None:
+            return fetched >= time.time() - miss_ttl.total_seconds(), None
+        try:
+            with gzip.open(self._get_object_path(digest), 'rb') as f:
+                return True, f.read()
+        except FileNotFoundError:
+            logger.warning(f"Cached article for {id_type} {id_val} is "
+                           f"missing, it will be fetched again.")
+            return False, None
+
+    def put(self, id_type, id_val, content):
+        """Cache the answer for an id: an article, or None if there is none.
+        """
+        digest = None
+        if content is not None:
+            digest = sha256(content).hexdigest()
+            obj_path = self._get_object_path(digest)
+            if not path.exists(obj_path):
+                makedirs(path.dirname(obj_path), exist_ok=True)
+                # Write the object whole before it may be found.
+                tmp_path = f'{obj_path}.{id(content)}.tmp'
+                with gzip.open(tmp_path, 'wb') as f:
+                    f.write(content)
+                replace(tmp_path, obj_path)
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO responses "
+                               "(id_type, id_val, digest, fetched) "
+                               "VALUES (?, ?, ?, ?)",
+                               (id_type, id_val, digest, time.time()))
+        return
+
+
+class _TokenBucket(object):
+    """Allow `rate` calls to `take` per second, and bursts of `capacity`."""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = Lock()
+
+    def take(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity,
+                                   self._tokens + (now - self._last)*self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens)/self.rate
+            time.sleep(wait)
+
+
+class ElsevierFetcher(object):
+    """Fetch the articles for many sets of ids at once, through a cache.
+
+    Parameters
+    ----------
+    client : object
+        The client requests are made with. By default, the Elsevier API is
+        used (see `ElsevierHttpClient`).
+    cache_dir : str
+        The directory of the response cache (see `ResponseCache`). If None,
+        responses are not cached.
+    n_workers : int
+        The most requests in flight at once. Default is 5.
+    rate : float
+        The most requests made per second, on average. Default is 5.
+    burst : int
+        The most requests that may be made at once after a lull. By default,
+        this is the same as `rate`.
+    max_tries : int
+        The number of times a request is tried before giving up on it, when
+        the API is busy or the connection fails. Default is 4.
+    backoff : float
+        The seconds to wait before the first retry, which double with each
+        retry after it. Default is 1.
+    miss_ttl : timedelta
+        How long an answer of no article holds before the id is tried again.
+        Default is 30 days.
+    """
+    def __init__(self, client=None, cache_dir=None, n_workers=5, rate=5.0,
+                 burst=None, max_tries=4, backoff=1.0,
+                 miss_ttl=timedelta(days=30)):
+        if client is None:
+            client = ElsevierHttpClient()
+        self.client = client
+        self.cache = None if cache_dir is None else ResponseCache(cache_dir)
+        self.n_workers = n_workers
+        self.max_tries = max_tries
+        self.backoff = backoff
+        self.miss_ttl = miss_ttl
+        self._bucket = _TokenBucket(rate, rate if burst is None else burst)
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.close()
+
+    def _request(self, id_type, id_val):
+        """Request the article for an id.
+
+        Returns
+        -------
+        answered : bool
+            False if no answer could be got, in which case the id should be
+            tried again another time.
+        content : bytes or None
+            The article, or None if there is none.
+        """
+        for n_try in range(1, self.max_tries + 1):
+            self._bucket.take()
+            try:
+                status, content = self.client.get(id_type, id_val)
+            except Exception as err:
+                status, content = None, err
+            if status == 200:
+                if content.startswith(b'<service-error>'):
+                    logger.error(f"Got a service error for {id_type} "
+                                 f"{id_val}: {content[:200]}")
+                    return False, None
+                return True, content
+            elif status == 404:
+                return True, None
+            elif status is not None and status != 429 and status < 500:
+                logger.error(f"Elsevier API error {status} for {id_type} "
+                             f"{id_val}: {content[:200]}")
+                return False, None
+
+            if n_try < self.max_tries:
+                wait = self.backoff*2**(n_try - 1)
+                logger.warning(f"Request for {id_type} {id_val} failed "
+                               f"({status or content}), trying again in "
+                               f"{wait} seconds...")
+                time.sleep(wait)
+        logger.error(f"Giving up on {id_type} {id_val} after {n_try} tries.")
+        return False, None
+
+    def fetch(self, id_dict):
+        """Get the article for a set of ids, trying each id type in turn.
+
+        Parameters
+        ----------
+        id_dict : dict
+            The ids of the article, by id type (any of eid, doi, pmid, pii).
+
+        Returns
+        -------
+        content : str or None
+            The article xml, or None if it could not be found.
+        """
+        for id_type in ID_TYPES:
+            id_val = id_dict.get(id_type)
+            if id_val is None:
+                continue
+            if id_type == 'doi' and id_val.lower().startswith('doi:'):
+                id_val = id_val[4:]
+
+            if self.cache is not None:
+                found, content = self.cache.get(id_type, id_val,
+                                                self.miss_ttl)
+                if found:
+                    if content is not None:
+                        return content.decode('utf-8')
+                    continue
+
+            answered, content = self._request(id_type, id_val)
+            if answered and self.cache is not None:
+                self.cache.put(id_type, id_val, content)
+            if content is not None:
+                return content.decode('utf-8')
+        return None
+
+    def fetch_all(self, id_dicts):
+        """Get the articles for many sets of ids at once.
+
+        Parameters
+        ----------
+        id_dicts : dict
+            The ids of each article (see `fetch`), keyed by any label.
+
+        Returns
+        -------
+        contents : dict
+            The articles that were found, keyed by the labels of their ids.
+        """
+        contents = {}
+        with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+            jobs = {executor.submit(self.fetch, id_dict): key
+                    for key, id_dict in id_dicts.items()}
+            for job in as_completed(jobs):
+                content = job.result()
+                if content is not None:
+                    contents[jobs[job]] = content
+        logger.info(f"Found {len(contents)} of {len(id_dicts)} articles.")
+        return contents
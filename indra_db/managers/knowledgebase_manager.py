@@ -2,7 +2,7 @@ __all__ = ['TasManager', 'CBNManager', 'HPRDManager', 'SignorManager',
            'BiogridManager', 'BelLcManager', 'PathwayCommonsManager',
            'RlimspManager', 'TrrustManager', 'PhosphositeManager',
            'CTDManager', 'VirHostNetManager', 'PhosphoElmManager',
-           'DrugBankManager']
+           'DrugBankManager', 'StatementKeyIndex', 'refresh_knowledgebases']
 
 import os
 import zlib
@@ -10,46 +10,175 @@ import boto3
 import pickle
 import logging
 import tempfile
+from time import perf_counter
 from collections import defaultdict
+from concurrent.futures import as_completed
+
+import numpy as np
+
 from indra.statements.validate import assert_valid_statement
-from indra_db.util import insert_db_stmts
+from indra_db.util import insert_db_stmts, get_process_pool
+from indra_db.util.insert import get_raw_stmt_record
 from indra_db.util.distill_statements import extract_duplicates, KeyFunc
 
 logger = logging.getLogger(__name__)
 
 
+def _prepare_chunk(stmts):
+    """Validate a chunk of statements and get their raw statement records.
+    """
+    # Raise any validity issues with statements as exceptions here
+    # to avoid uploading invalid content.
+    for stmt in stmts:
+        assert_valid_statement(stmt)
+    return [get_raw_stmt_record(stmt) for stmt in stmts]
+
+
+class StatementKeyIndex(object):
+    """A sorted array of the (mk_hash, source_hash) keys of raw statements.
+
+    Statements are looked up a chunk at a time with a binary search, rather
+    than one at a time in a set of tuples, which for the larger knowledge
+    bases would take several GB to hold.
+    """
+    dtype = np.dtype([('mk_hash', 'i8'), ('source_hash', 'i8')])
+
+    def __init__(self, keys):
+        self.keys = np.sort(np.asarray(keys, dtype=self.dtype))
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_db(cls, db, dbid, fetch_size=1000000):
+        """Load the keys of the raw statements of a knowledge base."""
+        conn = db.engine.raw_connection()
+        try:
+            cur = conn.cursor(name='kb_statement_keys')
+            cur.itersize = fetch_size
+            cur.execute("SELECT mk_hash, source_hash FROM raw_statements "
+                        "WHERE db_info_id = %s AND source_hash IS NOT NULL",
+                        (dbid,))
+            parts = []
+            rows = cur.fetchmany(fetch_size)
+            while rows:
+                parts.append(np.array(rows, dtype=cls.dtype))
+                rows = cur.fetchmany(fetch_size)
+            cur.close()
+        finally:
+            conn.close()
+        if not parts:
+            return cls(np.empty(0, dtype=cls.dtype))
+        return cls(np.concatenate(parts))
+
+    def contains(self, keys):
+        """Get a boolean array of which of a list of keys are in the index.
+        """
+        keys = np.asarray(keys, dtype=self.dtype)
+        if not len(self.keys):
+            return np.zeros(len(keys), dtype=bool)
+        idxs = np.searchsorted(self.keys, keys)
+        found = self.keys[np.minimum(idxs, len(self.keys) - 1)] == keys
+        return found & (idxs < len(self.keys))
+
+
 class KnowledgebaseManager(object):
     """This is a class to lay out the methods for updating a dataset."""
     name = NotImplemented
     short_name = NotImplemented
     source = NotImplemented
 
-    def upload(self, db):
-        """Upload the content for this dataset into the database."""
+    # The number of statements validated and hashed at a time.
+    chunk_size = 10000
+
+    def _iter_prepared(self, stmts, n_workers=1):
+        """Yield chunks of statements along with their records, in order.
+
+        With more than one worker, the chunks are prepared in worker
+        processes, a few at a time.
+        """
+        chunks = (stmts[i:i+self.chunk_size]
+                  for i in range(0, len(stmts), self.chunk_size))
+        executor = get_process_pool(n_workers)
+        if executor is None:
+            for chunk in chunks:
+                yield chunk, _prepare_chunk(chunk)
+            return
+
+        with executor:
+            jobs = []
+            for chunk in chunks:
+                jobs.append((chunk, executor.submit(_prepare_chunk, chunk)))
+                if len(jobs) >= 2*n_workers:
+                    chunk, job = jobs.pop(0)
+                    yield chunk, job.result()
+            for chunk, job in jobs:
+                yield chunk, job.result()
+
+    def upload(self, db, n_workers=1):
+        """Upload the content for this dataset into the database.
+
+        Returns a dict of the number of statements and the time taken by each
+        step.
+        """
+        stats = {}
         dbid = self._check_reference(db)
-        stmts = self._get_statements()
-        # Raise any validity issues with statements as exceptions here
-        # to avoid uploading invalid content.
-        for stmt in stmts:
-            assert_valid_statement(stmt)
-        insert_db_stmts(db, stmts, dbid)
-        return
 
-    def update(self, db):
-        """Add any new statements that may have come into the dataset."""
+        start = perf_counter()
+        stmts = self._get_statements()
+        stats['get statements'] = perf_counter() - start
+
+        # Every statement is validated before any are uploaded.
+        start = perf_counter()
+        records = []
+        for _, chunk_records in self._iter_prepared(stmts, n_workers):
+            records.extend(chunk_records)
+        stats['prepare'] = perf_counter() - start
+
+        start = perf_counter()
+        insert_db_stmts(db, stmts, dbid, stmt_records=records)
+        stats['insert'] = perf_counter() - start
+        stats['statements'] = stats['new statements'] = len(stmts)
+        return stats
+
+    def update(self, db, n_workers=1):
+        """Add any new statements that may have come into the dataset.
+
+        Returns a dict of the number of statements and the time taken by each
+        step.
+        """
+        stats = {}
         dbid = self._check_reference(db, can_create=False)
         if dbid is None:
             raise ValueError("This knowledge base has not yet been "
                              "registered.")
-        existing_keys = set(db.select_all([db.RawStatements.mk_hash,
-                                           db.RawStatements.source_hash],
-                                          db.RawStatements.db_info_id == dbid))
+        start = perf_counter()
+        existing_keys = StatementKeyIndex.from_db(db, dbid)
+        stats['load keys'] = perf_counter() - start
+
+        start = perf_counter()
         stmts = self._get_statements()
-        filtered_stmts = [s for s in stmts
-                          if (s.get_hash(), s.evidence[0].get_source_hash())
-                          not in existing_keys]
-        insert_db_stmts(db, filtered_stmts, dbid)
-        return
+        stats['get statements'] = perf_counter() - start
+
+        # Each chunk is compared with the existing keys as it is prepared, so
+        # that only the records of the new statements are kept.
+        start = perf_counter()
+        new_stmts = []
+        new_records = []
+        for chunk, records in self._iter_prepared(stmts, n_workers):
+            is_old = existing_keys.contains([rec[1:3] for rec in records])
+            for stmt, record, old in zip(chunk, records, is_old):
+                if not old:
+                    new_stmts.append(stmt)
+                    new_records.append(record)
+        stats['prepare'] = perf_counter() - start
+
+        start = perf_counter()
+        insert_db_stmts(db, new_stmts, dbid, stmt_records=new_records)
+        stats['insert'] = perf_counter() - start
+        stats['statements'] = len(stmts)
+        stats['new statements'] = len(new_stmts)
+        return stats
 
     def _check_reference(self, db, can_create=True):
         """Ensure that this database has an entry in the database."""
@@ -436,18 +565,100 @@ def _expanded(stmts):
             yield stmt
 
 
+# The database and managers of a worker of `refresh_knowledgebases`.
+_worker_db = None
+_worker_kbms = None
+
+
+def _init_refresh_worker(db, kbms):
+    global _worker_db, _worker_kbms
+    # Connections are not shared with the parent, so a new manager is made.
+    _worker_db = db.__class__(db.url, label=db.label)
+    _worker_db.grab_session()
+    _worker_kbms = kbms
+
+
+def _refresh_one(kbm_idx, mode, n_chunk_workers, db=None, kbms=None):
+    if db is None:
+        db, kbms = _worker_db, _worker_kbms
+    kbm = kbms[kbm_idx]
+    start = perf_counter()
+    stats = getattr(kbm, mode)(db, n_workers=n_chunk_workers)
+    stats['total'] = perf_counter() - start
+    return stats
+
+
+def refresh_knowledgebases(db, kbms=None, mode='update', n_workers=1,
+                           n_chunk_workers=1):
+    """Upload or update many knowledge bases at once.
+
+    Each knowledge base is refreshed in its own worker process, with its own
+    connection to the database. A knowledge base that fails is logged and
+    skipped, without stopping the others.
+
+    Parameters
+    ----------
+    db : indra_db.DatabaseManager
+        The database to refresh the knowledge bases on.
+    kbms : list[KnowledgebaseManager]
+        The managers of the knowledge bases to refresh. By default, one of
+        each kind of manager is used.
+    mode : str
+        Either 'upload' or 'update' (the default).
+    n_workers : int
+        The number of knowledge bases refreshed at once. Default is 1.
+    n_chunk_workers : int
+        The number of worker processes each knowledge base validates and
+        hashes its statements with. Default is 1.
+
+    Returns
+    -------
+    all_stats : dict
+        The stats of each knowledge base (see `KnowledgebaseManager.update`),
+        keyed by short name, with an 'error' for any that failed.
+    """
+    if mode not in ('upload', 'update'):
+        raise ValueError(f"Invalid mode: {mode}.")
+    if kbms is None:
+        kbms = [Manager() for Manager in KnowledgebaseManager.__subclasses__()]
+
+    all_stats = {}
+
+    def record(kbm, get_stats):
+        try:
+            stats = get_stats()
+        except Exception as err:
+            logger.exception(err)
+            logger.error(f"Failed to {mode} {kbm.name}.")
+            all_stats[kbm.short_name] = {'error': repr(err)}
+            return
+        all_stats[kbm.short_name] = stats
+        logger.info(f"Finished {kbm.name}: "
+                    + ', '.join(f"{k} {v:.1f} s" if isinstance(v, float)
+                                else f"{k} {v}" for k, v in stats.items()))
+
+    executor = get_process_pool(n_workers, _init_refresh_worker, (db, kbms))
+    if executor is None:
+        for i, kbm in enumerate(kbms):
+            logger.info(f"Refreshing {kbm.name}...")
+            record(kbm, lambda: _refresh_one(i, mode, n_chunk_workers, db,
+                                             kbms))
+    else:
+        with executor:
+            jobs = {executor.submit(_refresh_one, i, mode, n_chunk_workers):
+                    kbm for i, kbm in enumerate(kbms)}
+            for job in as_completed(jobs):
+                record(jobs[job], job.result)
+    return all_stats
+
+
 if __name__ == '__main__':
     import sys
     from indra_db.util import get_db
     mode = sys.argv[1]
+    n_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 1
     db = get_db('primary')
-    for Manager in KnowledgebaseManager.__subclasses__():
-        kbm = Manager()
-        print(kbm.name, '...')
-        if mode == 'upload':
-            kbm.upload(db)
-        elif mode == 'update':
-            kbm.update(db)
-        else:
-            print("Invalid mode: %s" % mode)
-            sys.exit(1)
+    if mode not in ('upload', 'update'):
+        print("Invalid mode: %s" % mode)
+        sys.exit(1)
+    refresh_knowledgebases(db, mode=mode, n_workers=n_workers)
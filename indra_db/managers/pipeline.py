@@ -0,0 +1,310 @@
+"""Run the stages of a content upload concurrently, with bounded queues.
+
+Loading content is a chain of steps with very different costs: fetching
+files is bound by the network, parsing by the CPU, and reconciling and
+copying by the database. A `Pipeline` runs each step as a `Stage` with its own
+pool of worker threads or processes, connected by bounded queues so that a
+fast stage waits for a slow one rather than piling up its output in memory.
+
+The last step, which uses the database, is left to the caller, who iterates
+over the results of the pipeline (a database session cannot be shared between
+threads or processes):
+
+>>> pipeline = Pipeline([Stage('fetch', fetch, n_workers=2),
+...                      Stage('parse', parse, n_workers=4, processes=True)],
+...                     sink_name='upload')
+>>> for result in pipeline.run(file_names):
+...     upload(db, result)
+
+When the run is done, the number of items each stage took in and put out, the
+time its workers spent working and the time they spent waiting on the next
+stage are logged, and are available from `get_metrics`.
+"""
+
+__all__ = ['Pipeline', 'Stage', 'PipelineError']
+
+import queue
+import logging
+import traceback
+from time import perf_counter
+from inspect import isgenerator
+from threading import Thread, Event
+from multiprocessing import get_context, get_all_start_methods
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineError(Exception):
+    pass
+
+
+class _Stop(object):
+    """Marks the end of the items on a queue."""
+    pass
+
+
+class Stage(object):
+    """A step of a `Pipeline`, which applies a function to each of its items.
+
+    Parameters
+    ----------
+    name : str
+        The name of the stage, used in logs and metrics.
+    func : callable
+        The function applied to each item. Its return value is passed on to
+        the next stage, unless it is None. If it returns a generator, each of
+        the values it yields is passed on as it is yielded.
+    n_workers : int
+        The number of workers that apply `func` at once. Default is 1.
+    processes : bool
+        If True, the workers are (forked) processes, otherwise they are
+        threads. Processes are needed for work that holds the GIL, but the
+        items and results must then be pickled. Default is False.
+    queue_size : int
+        The most items that may wait to be taken up by this stage. By default
+        this is twice the number of workers.
+    """
+    def __init__(self, name, func, n_workers=1, processes=False,
+                 queue_size=None):
+        self.name = name
+        self.func = func
+        self.n_workers = n_workers
+        self.processes = processes
+        if queue_size is None:
+            queue_size = 2*n_workers
+        self.queue_size = queue_size
+
+    def __repr__(self):
+        kind = 'processes' if self.processes else 'threads'
+        return f'{self.__class__.__name__}({self.name}, {self.n_workers} ' \
+               f'{kind})'
+
+
+def _get(q, abort):
+    """Get the next item from a queue, or a _Stop if the run is aborted."""
+    while True:
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            if abort.is_set():
+                return _Stop()
+
+
+def _put(q, item, abort):
+    """Put an item on a queue, unless the run is aborted first."""
+    while True:
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            if abort.is_set():
+                return False
+
+
+def _work(stage, in_q, out_q, report_q, abort):
+    """Apply the function of a stage to items until told to stop."""
+    n_in = n_out = 0
+    busy = blocked = 0.0
+    while True:
+        item = _get(in_q, abort)
+        if isinstance(item, _Stop):
+            break
+        start = perf_counter()
+        try:
+            results = stage.func(item)
+            if not isgenerator(results):
+                results = [results]
+            for result in results:
+                if result is None:
+                    continue
+                put_start = perf_counter()
+                if not _put(out_q, result, abort):
+                    break
+                blocked += perf_counter() - put_start
+                n_out += 1
+        except BaseException:
+            report_q.put(('error', stage.name, traceback.format_exc()))
+            abort.set()
+            break
+        finally:
+            busy += perf_counter() - start
+        n_in += 1
+    if abort.is_set() and hasattr(out_q, 'cancel_join_thread'):
+        # Don't hang on exit trying to flush items no one will read.
+        out_q.cancel_join_thread()
+    report_q.put(('stats', stage.name, n_in, n_out, busy - blocked, blocked))
+    return
+
+
+class Pipeline(object):
+    """A chain of stages, each working on the results of the one before.
+
+    Parameters
+    ----------
+    stages : list[Stage]
+        The stages, in order. The first is given the items passed to `run`.
+    sink_name : str
+        The name under which to report the work done by the caller on the
+        results of the last stage. Default is 'sink'.
+    """
+    def __init__(self, stages, sink_name='sink'):
+        if not stages:
+            raise ValueError("A pipeline needs at least one stage.")
+        self.stages = list(stages)
+        self.sink_name = sink_name
+        self._metrics = None
+
+    def _get_context(self):
+        if 'fork' in get_all_start_methods():
+            return get_context('fork')
+        return get_context()
+
+    def run(self, items):
+        """Run the items through the stages, yielding the final results.
+
+        The results are yielded in the order they are finished, which need
+        not be the order of the items. If any stage raises an exception, the
+        run is stopped and a PipelineError is raised here.
+        """
+        ctx = self._get_context()
+        use_processes = any(stage.processes for stage in self.stages)
+        abort = ctx.Event() if use_processes else Event()
+        report_q = ctx.Queue() if use_processes else queue.Queue()
+
+        # Items pass between processes on multiprocessing queues, and between
+        # threads on plain ones.
+        queues = []
+        for i, stage in enumerate(self.stages + [None]):
+            size = stage.queue_size if stage is not None else 1
+            neighbors = self.stages[max(i - 1, 0):i + 1]
+            if any(s.processes for s in neighbors):
+                queues.append(ctx.Queue(size))
+            else:
+                queues.append(queue.Queue(size))
+
+        # Start all the processes before any threads, as forking a process
+        # with other threads running is prone to deadlock.
+        workers = []
+        for i, stage in enumerate(self.stages):
+            args = (stage, queues[i], queues[i+1], report_q, abort)
+            worker_cls = ctx.Process if stage.processes else Thread
+            workers.append([worker_cls(target=_work, args=args, daemon=True)
+                            for _ in range(stage.n_workers)])
+        for stage, stage_workers in sorted(zip(self.stages, workers),
+                                           key=lambda t: not t[0].processes):
+            for worker in stage_workers:
+                worker.start()
+
+        def feed_and_close():
+            try:
+                for item in items:
+                    if not _put(queues[0], item, abort):
+                        return
+            except BaseException:
+                report_q.put(('error', 'input', traceback.format_exc()))
+                abort.set()
+                return
+            # Once each stage is done, tell the workers of the next to stop.
+            for i, stage_workers in enumerate(workers):
+                for _ in stage_workers:
+                    if not _put(queues[i], _Stop(), abort):
+                        return
+                for worker in stage_workers:
+                    worker.join()
+            _put(queues[-1], _Stop(), abort)
+
+        closer = Thread(target=feed_and_close, daemon=True)
+        start = perf_counter()
+        closer.start()
+        n_results = 0
+        sink_time = 0.0
+        finished = False
+        try:
+            while True:
+                result = _get(queues[-1], abort)
+                if isinstance(result, _Stop):
+                    break
+                n_results += 1
+                sink_start = perf_counter()
+                yield result
+                sink_time += perf_counter() - sink_start
+            finished = not abort.is_set()
+        finally:
+            # If the caller stopped early, or a stage failed, stop the rest.
+            if not finished:
+                abort.set()
+            closer.join()
+            lost = []
+            for stage, stage_workers in zip(self.stages, workers):
+                for worker in stage_workers:
+                    worker.join(timeout=5)
+                    if not stage.processes:
+                        continue
+                    if worker.is_alive():
+                        worker.terminate()
+                        worker.join()
+                    elif worker.exitcode != 0 and not abort.is_set():
+                        lost.append((stage.name, f"A worker process exited "
+                                                 f"with {worker.exitcode}."))
+            errors = self._collect_reports(report_q, perf_counter() - start,
+                                           n_results, sink_time)
+        errors += lost
+        if errors:
+            name, trace = errors[0]
+            raise PipelineError(f"Stage {name} failed:\n{trace}")
+        return
+
+    def _collect_reports(self, report_q, wall_time, n_results, sink_time):
+        stats = {stage.name: [stage.n_workers, 0, 0, 0.0, 0.0]
+                 for stage in self.stages}
+        errors = []
+        while True:
+            try:
+                report = report_q.get(timeout=0.1)
+            except queue.Empty:
+                break
+            if report[0] == 'error':
+                errors.append(report[1:])
+                continue
+            _, name, n_in, n_out, busy, blocked = report
+            for i, val in enumerate([n_in, n_out, busy, blocked]):
+                stats[name][i + 1] += val
+        stats[self.sink_name] = [1, n_results, n_results, sink_time, 0.0]
+        self._metrics = {
+            name: {'workers': n_workers, 'in': n_in, 'out': n_out,
+                   'busy': busy, 'blocked': blocked,
+                   'per_sec': n_in/wall_time if wall_time else 0.0,
+                   'utilization': busy/(wall_time*n_workers)
+                   if wall_time else 0.0}
+            for name, (n_workers, n_in, n_out, busy, blocked) in stats.items()
+        }
+        self._metrics['total'] = {'wall': wall_time}
+        self.log_metrics()
+        return errors
+
+    def get_metrics(self):
+        """Get the metrics of each stage of the last run.
+
+        For each stage there is a dict with the number of workers, the number
+        of items taken `in` and put `out`, the seconds spent `busy` working
+        on items and `blocked` waiting to pass results on (summed over the
+        workers), the items taken in `per_sec` of the run, and the fraction
+        of the workers' time spent busy (the `utilization`). The slowest
+        stage is the one with the highest utilization.
+        """
+        return self._metrics
+
+    def log_metrics(self):
+        if self._metrics is None:
+            return
+        lines = [f'{"stage":<12} {"workers":>7} {"in":>8} {"out":>8} '
+                 f'{"busy":>10} {"blocked":>10} {"per sec":>8} {"util":>5}']
+        for name, m in self._metrics.items():
+            if name == 'total':
+                continue
+            lines.append(f'{name:<12} {m["workers"]:7d} {m["in"]:8d} '
+                         f'{m["out"]:8d} {m["busy"]:9.1f}s '
+                         f'{m["blocked"]:9.1f}s {m["per_sec"]:8.2f} '
+                         f'{m["utilization"]:5.0%}')
+        lines.append(f'{"total":<12} {self._metrics["total"]["wall"]:.1f}s')
+        logger.info("Pipeline metrics:\n" + '\n'.join(lines))
@@ -0,0 +1,215 @@
+"""Find the pmids of pmcids in batches, keeping the answers between runs.
+
+Many of the articles in the pmc archives come without a pmid, which must then
+be looked up with the PMC ID converter service. Rather than asking the service
+about each pmcid in turn, a `PmidResolver` asks about many at once, with a few
+requests in flight at a time (but no more per second than the service allows),
+and keeps every answer in a local SQLite file, so that no pmcid is looked up
+twice. Pmcids the service has no pmid for are looked up again once their
+answer is older than `miss_ttl`, as pmids are often assigned late.
+
+The service is reached through a backend, which may be replaced, for instance
+by a local stand-in in tests: any object with a `max_ids` attribute and a
+`lookup` method taking a list of (at most `max_ids`) pmcids and returning a
+dict of the pmid of each pmcid found, or None if it has no pmid.
+"""
+
+__all__ = ['PmidResolver', 'IdConverterBackend']
+
+import time
+import logging
+import sqlite3
+from os import path, makedirs
+from threading import Lock
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from indra.literature import pubmed_client
+from indra.literature.pmc_client import pmid_convert_url
+
+logger = logging.getLogger(__name__)
+
+
+class IdConverterBackend(object):
+    """Look up pmcids with the PMC ID converter service, many at a time.
+
+    Parameters
+    ----------
+    tool : str
+        The name of the tool making the requests, as asked by NCBI.
+    email : str
+        A contact email address, as asked by NCBI. Optional.
+    """
+    # The most ids the service takes in one request.
+    max_ids = 200
+
+    def __init__(self, tool='indra_db', email=None):
+        self.tool = tool
+        self.email = email
+
+    def lookup(self, pmcids):
+        data = {'ids': ','.join(pmcids), 'idtype': 'pmcid',
+                'tool': self.tool}
+        if self.email is not None:
+            data['email'] = self.email
+        tree = pubmed_client.send_request(pmid_convert_url, data)
+        if tree is None:
+            raise IOError(f"Failed to look up {len(pmcids)} pmcids.")
+        return self.parse_records(tree)
+
+    @staticmethod
+    def parse_records(tree):
+        """Get the pmids of the pmcids found, from a response of the service.
+        """
+        pmids = {}
+        for record in tree.findall('record'):
+            if record.attrib.get('status') == 'error':
+                continue
+            pmcid = record.attrib.get('requested-id',
+                                      record.attrib.get('pmcid'))
+            if pmcid is None:
+                continue
+            pmids[pmcid] = record.attrib.get('pmid')
+        return pmids
+
+
+class _RateLimiter(object):
+    """Space out the calls to `wait`, across threads, to `rate` per second."""
+    def __init__(self, rate):
+        self.interval = 1/rate
+        self._next = 0.0
+        self._lock = Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+        return
+
+
+class PmidResolver(object):
+    """Find the pmids of pmcids, caching the answers in a SQLite file.
+
+    Parameters
+    ----------
+    cache_path : str
+        The location of the SQLite file of answers. It is created if it does
+        not exist. If None, answers are only kept in memory.
+    backend : object
+        The backend used to look up pmcids. By default, the PMC ID converter
+        service is used (see `IdConverterBackend`).
+    n_workers : int
+        The most requests to the backend in flight at once. Default is 3.
+    rate : float
+        The most requests made per second. Default is 3, the limit NCBI sets
+        for users without an API key.
+    max_tries : int
+        The number of times a request is tried before giving up on its
+        pmcids, which are then left unresolved for this run. Default is 3.
+    miss_ttl : timedelta
+        How long an answer of no pmid holds before the pmcid is looked up
+        again. Default is 30 days.
+    """
+    def __init__(self, cache_path=None, backend=None, n_workers=3, rate=3.0,
+                 max_tries=3, miss_ttl=timedelta(days=30)):
+        if backend is None:
+            backend = IdConverterBackend()
+        self.backend = backend
+        self.n_workers = n_workers
+        self.max_tries = max_tries
+        self.miss_ttl = miss_ttl
+        self._limiter = _RateLimiter(rate)
+
+        if cache_path is None:
+            cache_path = ':memory:'
+        else:
+            dir_name = path.dirname(cache_path)
+            if dir_name:
+                makedirs(dir_name, exist_ok=True)
+        self.cache_path = cache_path
+        self._conn = sqlite3.connect(cache_path)
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS pmids (
+                    pmcid TEXT PRIMARY KEY,
+                    pmid TEXT,
+                    checked REAL NOT NULL
+                )
+            """)
+
+    def close(self):
+        self._conn.close()
+
+    def _get_cached(self, pmcids):
+        """Get the cached answers for some pmcids, leaving out stale misses."""
+        min_checked = time.time() - self.miss_ttl.total_seconds()
+        cached = {}
+        pmcids = list(pmcids)
+        # Stay well under SQLite's limit on the number of parameters.
+        for i in range(0, len(pmcids), 500):
+            chunk = pmcids[i:i+500]
+            rows = self._conn.execute(
+                f"SELECT pmcid, pmid, checked FROM pmids "
+                f"WHERE pmcid IN ({','.join('?'*len(chunk))})",
+                chunk
+            )
+            for pmcid, pmid, checked in rows:
+                if pmid is not None or checked >= min_checked:
+                    cached[pmcid] = pmid
+        return cached
+
+    def _lookup(self, pmcids):
+        for n_try in range(1, self.max_tries + 1):
+            self._limiter.wait()
+            try:
+                return self.backend.lookup(pmcids)
+            except Exception as err:
+                if n_try == self.max_tries:
+                    logger.error(f"Giving up on {len(pmcids)} pmcids after "
+                                 f"{n_try} tries: {err}")
+                    return None
+                logger.warning(f"Failed to look up {len(pmcids)} pmcids "
+                               f"({err}), trying again...")
+                time.sleep(n_try)
+
+    def resolve(self, pmcids):
+        """Get a dict of the pmids of those pmcids that have one.
+
+        Pmcids are answered from the cache where possible, and the rest are
+        looked up in batches of `backend.max_ids`, which are then cached.
+        """
+        pmcids = set(pmcids)
+        answers = self._get_cached(pmcids)
+        to_look_up = sorted(pmcids - answers.keys())
+        logger.debug(f"Found {len(answers)} of {len(pmcids)} pmcids in the "
+                     f"cache.")
+        if to_look_up:
+            batch_size = self.backend.max_ids
+            batches = [to_look_up[i:i+batch_size]
+                       for i in range(0, len(to_look_up), batch_size)]
+            logger.info(f"Looking up {len(to_look_up)} pmcids in "
+                        f"{len(batches)} requests.")
+            with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+                jobs = {executor.submit(self._lookup, batch): batch
+                        for batch in batches}
+                for job in as_completed(jobs):
+                    found = job.result()
+                    if found is None:
+                        continue
+                    # Every pmcid asked about is answered, if only with None.
+                    now = time.time()
+                    new_answers = {pmcid: found.get(pmcid)
+                                   for pmcid in jobs[job]}
+                    with self._conn:
+                        self._conn.executemany(
+                            "INSERT OR REPLACE INTO pmids "
+                            "(pmcid, pmid, checked) VALUES (?, ?, ?)",
+                            ((pmcid, pmid, now)
+                             for pmcid, pmid in new_answers.items())
+                        )
+                    answers.update(new_answers)
+        return {pmcid: pmid for pmcid, pmid in answers.items()
+                if pmid is not None}
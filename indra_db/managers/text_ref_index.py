@@ -0,0 +1,291 @@
+__all__ = ['TextRefIndex']
+
+import json
+import logging
+from os import path, makedirs, replace
+from hashlib import blake2b
+from datetime import datetime
+from collections import defaultdict
+
+import numpy as np
+from sqlalchemy import func
+
+logger = logging.getLogger(__name__)
+
+
+def _hash_str(s):
+    """Get a stable signed 64 bit hash of a string."""
+    digest = blake2b(s.encode('utf8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little', signed=True)
+
+
+class TextRefIndex(object):
+    """A local index from the ids of text refs to the ids of their rows.
+
+    Reconciling new text ref records with the text_ref table normally takes a
+    large query per batch, OR-ing together the id lists of every id type. This
+    index answers the same question locally: every id of every text ref is
+    reduced to an int64 key, and the keys of each id type are held in a sorted
+    array alongside the text ref ids (trids) they belong to. Records are then
+    looked up with a binary search, and only the text refs they hit need to be
+    loaded from the database.
+
+    Ids are keyed the way they are matched on the database: pmids and pmcids
+    by their numbers, dois by their namespace and id, and anything else
+    (including malformed pmids, pmcids and dois) by a hash of the string. A
+    hash collision can only add a candidate, which `matches` then rejects.
+
+    New text refs are added with `add_rows`, and are kept in a small dict
+    until there are enough of them to be worth merging into the arrays. The
+    arrays can be saved to a directory and memory-mapped back with `load`.
+
+    Parameters
+    ----------
+    text_ref_cls : type
+        The TextRef table class of the database, whose `process_*` methods are
+        used to normalize the ids.
+    id_types : iterable[str]
+        The id types (columns of text_ref) to index.
+    """
+    # When this many ids have been added since the last merge, merge them into
+    # the sorted arrays.
+    merge_size = 2**20
+
+    def __init__(self, text_ref_cls, id_types):
+        self.text_ref_cls = text_ref_cls
+        self.id_types = tuple(id_types)
+        empty = np.array([], dtype=np.int64)
+        self._keys = {id_type: empty for id_type in self.id_types}
+        self._trids = {id_type: empty for id_type in self.id_types}
+        self._recent = {id_type: defaultdict(set) for id_type in self.id_types}
+        self._n_recent = 0
+        self.max_id = 0
+        self.last_refresh = None
+
+    def __len__(self):
+        return sum(len(self._keys[id_type]) for id_type in self.id_types) \
+            + self._n_recent
+
+    def get_key(self, id_type, id_val):
+        """Get the int64 key of an id, or None if there is no id."""
+        if not id_val:
+            return None
+        TextRef = self.text_ref_cls
+        if id_type == 'pmid':
+            _, pmid_num = TextRef.process_pmid(id_val)
+            if pmid_num is not None:
+                return pmid_num
+        elif id_type == 'pmcid':
+            _, pmcid_num, _ = TextRef.process_pmcid(id_val)
+            if pmcid_num:
+                return pmcid_num
+        elif id_type == 'doi':
+            _, doi_ns, doi_id = TextRef.process_doi(id_val)
+            if doi_ns and doi_id:
+                return _hash_str(f'{doi_ns}/{doi_id}')
+        return _hash_str(id_val)
+
+    def _get_pairs(self, rows):
+        """Get the (key, trid) pairs of each id type for some text ref rows."""
+        pairs = {id_type: [] for id_type in self.id_types}
+        for trid, *id_vals in rows:
+            for id_type, id_val in zip(self.id_types, id_vals):
+                key = self.get_key(id_type, id_val)
+                if key is not None:
+                    pairs[id_type].append((key, trid))
+            self.max_id = max(self.max_id, trid)
+        return pairs
+
+    def add_rows(self, rows):
+        """Add text refs, as tuples of (trid, *ids in order of id_types)."""
+        n_added = 0
+        for id_type, pairs in self._get_pairs(rows).items():
+            for key, trid in pairs:
+                self._recent[id_type][key].add(trid)
+            n_added += len(pairs)
+        self._n_recent += n_added
+        if self._n_recent >= self.merge_size:
+            self._merge()
+        return n_added
+
+    def _merge(self, new_pairs=None):
+        """Merge the recently added ids into the sorted arrays."""
+        if new_pairs is None:
+            new_pairs = {id_type: [] for id_type in self.id_types}
+        for id_type in self.id_types:
+            recent = self._recent[id_type]
+            new_pairs[id_type] += [np.array([(key, trid) for key, trids
+                                             in recent.items()
+                                             for trid in trids],
+                                            dtype=np.int64).reshape(-1, 2)]
+            recent.clear()
+            new_pairs[id_type] = np.concatenate(new_pairs[id_type])
+            if not len(new_pairs[id_type]):
+                continue
+            keys = np.concatenate([self._keys[id_type],
+                                   new_pairs[id_type][:, 0]])
+            trids = np.concatenate([self._trids[id_type],
+                                    new_pairs[id_type][:, 1]])
+            # Sort by key, then trid, and drop pairs that were added again,
+            # e.g. by a refresh that checks for updates.
+            order = np.lexsort((trids, keys))
+            keys, trids = keys[order], trids[order]
+            keep = np.ones(len(keys), dtype=bool)
+            keep[1:] = (keys[1:] != keys[:-1]) | (trids[1:] != trids[:-1])
+            self._keys[id_type] = keys[keep]
+            self._trids[id_type] = trids[keep]
+        self._n_recent = 0
+
+    def lookup(self, id_type, id_vals):
+        """Get the keys of some ids, and the set of trids that have them."""
+        keys = {key for key in (self.get_key(id_type, id_val)
+                                for id_val in id_vals)
+                if key is not None}
+        trids = set()
+        if not keys:
+            return keys, trids
+
+        key_arr = np.fromiter(keys, dtype=np.int64, count=len(keys))
+        sorted_keys = self._keys[id_type]
+        starts = np.searchsorted(sorted_keys, key_arr, side='left')
+        stops = np.searchsorted(sorted_keys, key_arr, side='right')
+        for start, stop in zip(starts[starts < stops], stops[starts < stops]):
+            trids.update(self._trids[id_type][start:stop].tolist())
+
+        recent = self._recent[id_type]
+        for key in keys & recent.keys():
+            trids |= recent[key]
+        return keys, trids
+
+    def matches(self, text_ref, keys_by_type):
+        """Check that a text ref really has one of the looked-up keys."""
+        return any(self.get_key(id_type, getattr(text_ref, id_type)) in keys
+                   for id_type, keys in keys_by_type.items())
+
+    def _get_rows_query(self, db):
+        cols = [getattr(db.TextRef, id_type) for id_type in self.id_types]
+        return db.session.query(db.TextRef.id, *cols)
+
+    def _add_from_query(self, query, bulk=False, yield_per=100000):
+        # In bulk, the pairs are gathered into arrays and sorted in once at
+        # the end, rather than merged in piece by piece.
+        bulk_pairs = {id_type: [] for id_type in self.id_types}
+        n_rows = 0
+        batch = []
+
+        def add_batch():
+            if bulk:
+                for id_type, pairs in self._get_pairs(batch).items():
+                    bulk_pairs[id_type].append(
+                        np.array(pairs, dtype=np.int64).reshape(-1, 2)
+                    )
+            else:
+                self.add_rows(batch)
+            return len(batch)
+
+        for row in query.yield_per(yield_per):
+            batch.append(tuple(row))
+            if len(batch) == yield_per:
+                n_rows += add_batch()
+                batch = []
+        n_rows += add_batch()
+        if bulk:
+            self._merge(bulk_pairs)
+        return n_rows
+
+    @classmethod
+    def build(cls, db, id_types):
+        """Build an index of every text ref on the database."""
+        index = cls(db.TextRef, id_types)
+        index.last_refresh = db.session.query(func.now()).scalar()
+        logger.info(f"Building an index of text refs by "
+                    f"{', '.join(index.id_types)}...")
+        n_rows = index._add_from_query(index._get_rows_query(db), bulk=True)
+        logger.info(f"Indexed {n_rows} text refs.")
+        return index
+
+    def refresh(self, db, check_updates=False):
+        """Add any text refs inserted since the index was built or refreshed.
+
+        New rows are found by their id, which is cheap. Text refs that gained
+        ids in an update since the last refresh are only found if
+        `check_updates` is True, which needs a scan of the table; updates made
+        through `filter_text_refs` on this index are added as they happen.
+        """
+        now = db.session.query(func.now()).scalar()
+        cond = db.TextRef.id > self.max_id
+        if check_updates and self.last_refresh is not None:
+            cond |= db.TextRef.last_updated > self.last_refresh
+        n_rows = self._add_from_query(self._get_rows_query(db).filter(cond))
+        self.last_refresh = now
+        if n_rows:
+            logger.debug(f"Added {n_rows} text refs to the index.")
+        return n_rows
+
+    def save(self, dirname):
+        """Save the index in a directory, so it can be loaded with `load`."""
+        self._merge()
+        makedirs(dirname, exist_ok=True)
+        # Each file is written aside and moved into place, as the arrays may be
+        # memory-mapped from the files being replaced.
+        for id_type in self.id_types:
+            for name, arrays in [('keys', self._keys), ('trids', self._trids)]:
+                file_path = path.join(dirname, f'{id_type}_{name}.npy')
+                with open(file_path + '.tmp', 'wb') as f:
+                    np.save(f, arrays[id_type])
+                replace(file_path + '.tmp', file_path)
+        meta = {'id_types': self.id_types, 'max_id': self.max_id,
+                'last_refresh': self.last_refresh.isoformat()
+                if self.last_refresh is not None else None}
+        with open(path.join(dirname, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        return
+
+    @classmethod
+    def load(cls, text_ref_cls, dirname, mmap=True):
+        """Load an index saved with `save`, memory-mapping the arrays.
+
+        Note that the loaded index is only as current as it was when saved,
+        see `refresh`.
+        """
+        with open(path.join(dirname, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        index = cls(text_ref_cls, meta['id_types'])
+        mmap_mode = 'r' if mmap else None
+        for id_type in index.id_types:
+            index._keys[id_type] = np.load(
+                path.join(dirname, f'{id_type}_keys.npy'), mmap_mode=mmap_mode
+            )
+            index._trids[id_type] = np.load(
+                path.join(dirname, f'{id_type}_trids.npy'), mmap_mode=mmap_mode
+            )
+        index.max_id = meta['max_id']
+        if meta['last_refresh'] is not None:
+            index.last_refresh = datetime.fromisoformat(meta['last_refresh'])
+        return index
+
+    @classmethod
+    def from_db(cls, db, id_types, dirname=None):
+        """Load the index from `dirname` if it is there, else build it.
+
+        A loaded index is brought up to date with the database, including any
+        updated text refs, and saved again, so the next load need only look
+        for changes since then. A built index is saved to `dirname`, if given.
+        """
+        if dirname is not None and path.exists(path.join(dirname,
+                                                         'meta.json')):
+            index = cls.load(db.TextRef, dirname)
+            if not set(id_types) <= set(index.id_types):
+                logger.warning(f"Index in {dirname} does not cover all of "
+                               f"{id_types}. Rebuilding.")
+            else:
+                logger.info(f"Loaded text ref index from {dirname}, "
+                            f"refreshing...")
+                index.refresh(db, check_updates=True)
+                index.save(dirname)
+                return index
+
+        index = cls.build(db, id_types)
+        if dirname is not None:
+            index.save(dirname)
+        return index
@@ -0,0 +1,280 @@
+"""Find which statements could possibly refine each other before comparing.
+
+Comparing every batch of statements against every other batch grows
+quadratically with the size of the corpus. However, a statement can only refine
+another if, among other things, it is of the same (or a more specific) type,
+and each of the agents of the more general statement is matched, in the same
+role, by an agent of the more specific statement that is the same entity or
+one of its children in the ontology.
+
+Here, each statement is given an "anchor": a key built from its type and the
+grounding of one of its agents, chosen as INDRA would choose it to match
+entities. Any statement that refines it must then produce that same key from
+its own type and agents (or their ontological parents). Statements are ordered
+by their anchors, so that similar statements land in the same batch, and an
+inverted index from keys to batches tells which batches could share links.
+"""
+
+__all__ = ['AgentKeyIndex']
+
+import logging
+from collections import defaultdict
+
+from networkx import NetworkXError
+from indra.statements import get_statement_by_name, Statement
+
+try:
+    from indra.statements.agent import default_ns_order
+except ImportError:
+    default_ns_order = ['FPLX', 'UPPRO', 'HGNC', 'UP', 'CHEBI', 'GO', 'MESH',
+                        'MIRBASE', 'DOID', 'HP', 'EFO']
+
+from indra_db.util import regularize_agent_id
+
+logger = logging.getLogger(__name__)
+
+
+# The prefixes dropped by `regularize_agent_id`, with the length to which the
+# remaining number must be padded to recover the original id.
+_ID_PREFIXES = {'CHEBI': ('CHEBI:', 0), 'GO': ('GO:', 7), 'HMDB': ('HMDB', 7),
+                'PF': ('PF', 5), 'IP': ('IP', 0)}
+
+# Statements without any agents are anchored on their type alone.
+_NO_AGENT = ('', '', '')
+
+
+class AgentKeyIndex(object):
+    """Index statements by keys derived from their types and agents.
+
+    Parameters
+    ----------
+    ontology : indra.ontology.IndraOntology
+        The ontology used by the preassembler to find refinements.
+    stmt_type : Optional[str]
+        If given, only statements of this type are indexed.
+    """
+    def __init__(self, ontology, stmt_type=None):
+        self.ontology = ontology
+        self.stmt_type = stmt_type
+        self._ns_rank = {ns: i for i, ns in enumerate(default_ns_order)}
+        self._ns_rank['NAME'] = len(default_ns_order)
+        self._key_ids = {}
+        self._parents = {}
+        self._type_ancestors = {}
+
+    def iter_rows(self, db):
+        """Iterate over (mk_hash, type, ag_num, role, db_name, db_id) rows.
+
+        Statements without agents yield a single row with None for the agent
+        values.
+        """
+        q = (db.filter_query([db.PAStatements.mk_hash, db.PAStatements.type,
+                              db.PAAgents.ag_num, db.PAAgents.role,
+                              db.PAAgents.db_name, db.PAAgents.db_id])
+             .outerjoin(db.PAAgents,
+                        db.PAAgents.stmt_mk_hash == db.PAStatements.mk_hash))
+        if self.stmt_type is not None:
+            q = q.filter(db.PAStatements.type == self.stmt_type)
+        return q.yield_per(100000)
+
+    def _get_type_ancestors(self, stmt_type):
+        """Get the names of a statement type and its parent types."""
+        if stmt_type not in self._type_ancestors:
+            stmt_class = get_statement_by_name(stmt_type)
+            self._type_ancestors[stmt_type] = \
+                [cls.__name__ for cls in stmt_class.__mro__
+                 if issubclass(cls, Statement) and cls is not Statement]
+        return self._type_ancestors[stmt_type]
+
+    def _get_parents(self, db_name, db_id):
+        """Get the (regularized) ontological parents of a grounding."""
+        if (db_name, db_id) not in self._parents:
+            prefix, pad = _ID_PREFIXES.get(db_name, ('', 0))
+            ont_id = db_id if not prefix else prefix + db_id.zfill(pad)
+            try:
+                parents = [(ns, regularize_agent_id(p_id, ns)) for ns, p_id
+                           in self.ontology.get_parents(db_name, ont_id)]
+            except NetworkXError as err:
+                # Without its parents, statements about this entity are not
+                # compared with those about its parents, so make it known.
+                logger.warning(f"Could not get the parents of {db_name}:"
+                               f"{ont_id}, so refinements of statements "
+                               f"about its parents will be missed: {err}")
+                parents = []
+            self._parents[(db_name, db_id)] = parents
+        return self._parents[(db_name, db_id)]
+
+    def _get_anchor_keys(self, rows):
+        """Get the anchor key of each statement from its agent rows."""
+        best = {}
+        for mk_hash, stmt_type, ag_num, role, db_name, db_id in rows:
+            if ag_num is None:
+                best.setdefault(mk_hash, ((-1, 0), (stmt_type,) + _NO_AGENT))
+                continue
+            rank = self._ns_rank.get(db_name)
+            if rank is None:
+                continue
+            order = (ag_num, rank)
+            if mk_hash not in best or best[mk_hash][0] > order:
+                best[mk_hash] = (order, (stmt_type, role, db_name, db_id))
+        return {h: key for h, (_, key) in best.items()}
+
+    def _get_key_id(self, key):
+        if key not in self._key_ids:
+            self._key_ids[key] = len(self._key_ids)
+        return self._key_ids[key]
+
+    def _get_match_key_ids(self, stmt_type, role, db_name, db_id):
+        """Get the ids of the anchors a statement with this agent could refine.
+
+        Keys that are not the anchor of any indexed statement are skipped.
+        """
+        groundings = [_NO_AGENT]
+        if db_name is not None:
+            groundings.append((role, db_name, db_id))
+            groundings += [(role, ns, p_id)
+                           for ns, p_id in self._get_parents(db_name, db_id)]
+        key_ids = set()
+        for anc_type in self._get_type_ancestors(stmt_type):
+            for grounding in groundings:
+                key_id = self._key_ids.get((anc_type,) + grounding)
+                if key_id is not None:
+                    key_ids.add(key_id)
+        return key_ids
+
+    def block_batches(self, db, hash_list, batch_size):
+        """Order the statements and find which batches must be compared.
+
+        Parameters
+        ----------
+        db : PrincipalDatabaseManager
+            The database containing the pa_statements and pa_agents.
+        hash_list : list[int]
+            The hashes of the statements to be compared.
+        batch_size : int
+            The number of statements in each batch.
+
+        Returns
+        -------
+        ordered_hashes : list[int]
+            The hashes, ordered such that similar statements are together.
+        partners : dict[int, list[int]]
+            For each batch index, the sorted indices of the later batches that
+            contain statements it could have links with.
+        """
+        hash_set = set(hash_list)
+
+        # Order the statements by anchor, and note which batches contain each
+        # anchor.
+        anchors = self._get_anchor_keys(row for row in self.iter_rows(db)
+                                        if row[0] in hash_set)
+        missing = hash_set - anchors.keys()
+        if missing:
+            logger.warning(f"Found no record for {len(missing)} statements. "
+                           f"They will be compared to all others.")
+        ordered_hashes = sorted(anchors.keys(), key=lambda h: (anchors[h], h))
+        batch_idx = {}
+        anchor_batches = defaultdict(set)
+        for i, h in enumerate(ordered_hashes):
+            batch_idx[h] = i // batch_size
+            anchor_batches[self._get_key_id(anchors[h])].add(i // batch_size)
+        del anchors
+
+        # Place any statements that could not be found at the end, where they
+        # are compared to everything.
+        n_found = len(ordered_hashes)
+        ordered_hashes += sorted(missing)
+        n_batches = len(ordered_hashes) // batch_size + 1
+        everywhere = set()
+        if missing:
+            everywhere = set(range(n_found // batch_size, n_batches))
+
+        # Find the batches with anchors that the statements of each batch
+        # could refine.
+        partners = defaultdict(set)
+        for mk_hash, stmt_type, ag_num, role, db_name, db_id \
+                in self.iter_rows(db):
+            if mk_hash not in batch_idx:
+                continue
+            this_batch = batch_idx[mk_hash]
+            for key_id in self._get_match_key_ids(stmt_type, role, db_name,
+                                                  db_id):
+                for other_batch in anchor_batches.get(key_id, ()):
+                    if other_batch != this_batch:
+                        partners[min(this_batch, other_batch)]\
+                            .add(max(this_batch, other_batch))
+
+        for i in range(n_batches):
+            partners[i] |= {j for j in everywhere if j > i}
+            if i in everywhere:
+                partners[i] |= set(range(i + 1, n_batches))
+
+        n_pairs = sum(len(others) for others in partners.values())
+        logger.info(f"Blocking reduced the comparisons between {n_batches} "
+                    f"batches to {n_pairs} of {n_batches*(n_batches-1)//2} "
+                    f"pairs.")
+        return ordered_hashes, {i: sorted(partners[i])
+                                for i in range(n_batches)}
+
+    def find_related(self, db, batches, other_hashes):
+        """Find which other statements could have links with each batch.
+
+        Parameters
+        ----------
+        db : PrincipalDatabaseManager
+            The database containing the pa_statements and pa_agents.
+        batches : list[list[int]]
+            The hashes of the statements in each batch.
+        other_hashes : set[int]
+            The hashes of the statements that might be related.
+
+        Returns
+        -------
+        related : dict[int, set[int]]
+            For each batch index, the hashes of other statements that could
+            have links with those in the batch.
+        """
+        batch_idx = {h: i for i, batch in enumerate(batches) for h in batch}
+        anchors = self._get_anchor_keys(row for row in self.iter_rows(db)
+                                        if row[0] in batch_idx
+                                        or row[0] in other_hashes)
+
+        # Index the batches by their anchors.
+        anchor_batches = defaultdict(set)
+        for h, i in batch_idx.items():
+            if h in anchors:
+                anchor_batches[self._get_key_id(anchors[h])].add(i)
+
+        # Index the other statements by their anchors.
+        anchor_others = defaultdict(set)
+        for h in other_hashes:
+            if h in anchors:
+                anchor_others[self._get_key_id(anchors[h])].add(h)
+        unanchored = set(other_hashes) - anchors.keys()
+        del anchors
+
+        # Any statement that could not be anchored could match anything.
+        related = defaultdict(set)
+        if unanchored:
+            for i in range(len(batches)):
+                related[i] |= unanchored
+        for mk_hash, stmt_type, ag_num, role, db_name, db_id \
+                in self.iter_rows(db):
+            if mk_hash in batch_idx:
+                # Statements in the batch could refine other statements...
+                i = batch_idx[mk_hash]
+                for key_id in self._get_match_key_ids(stmt_type, role,
+                                                      db_name, db_id):
+                    if key_id in anchor_others:
+                        related[i] |= anchor_others[key_id]
+            elif mk_hash in other_hashes:
+                # ...and other statements could refine those in the batch.
+                for key_id in self._get_match_key_ids(stmt_type, role,
+                                                      db_name, db_id):
+                    for i in anchor_batches.get(key_id, ()):
+                        related[i].add(mk_hash)
+
+        n_related = sum(len(hashes) for hashes in related.values())
+        logger.info(f"Found {n_related} candidate statements for "
+                    f"{len(batches)} batches, out of {len(other_hashes)}.")
+        return related
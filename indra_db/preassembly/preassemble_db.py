@@ -2,10 +2,13 @@ import json
 import pickle
 import logging
 from os import path
+from time import perf_counter
+from tempfile import gettempdir
 from functools import wraps
 from datetime import datetime
 from collections import defaultdict
 from argparse import ArgumentParser
+from concurrent.futures import wait, FIRST_COMPLETED
 
 from sqlalchemy import or_
 
@@ -21,8 +24,12 @@ from indra.ontology.bio import bio_ontology
 from indra_db.reading.read_db_aws import bucket_name
 
 from indra_db.util.data_gatherer import DataGatherer, DGContext
-from indra_db.util import insert_pa_stmts, distill_stmts, get_db, \
-    extract_agent_data, insert_pa_agents, hash_pa_agents, S3Path
+from indra_db.preassembly.blocking import AgentKeyIndex
+from indra_db.preassembly.support_queue import SupportQueue
+from indra_db.preassembly.stmt_cache import StatementCache
+from indra_db.util import insert_pa_stmts, iter_distilled_stmts, get_db, \
+    extract_agent_data, insert_pa_agents, hash_pa_agents, S3Path, IntSet, \
+    get_process_pool
 
 site_logger.setLevel(logging.INFO)
 grounding_logger.setLevel(logging.INFO)
@@ -65,10 +72,28 @@ class DbPreassembler:
         Select the maximum number of statements you wish to be handled at a
         time. In general, a larger batch size will somewhat be faster, but
         require much more memory.
+    n_workers : int
+        The number of processes used to map the grounding and sequences of raw
+        statements, and to compare batches of statements when finding support
+        links. Default is 1, in which case all the work is done in this
+        process.
+    work_dir : Optional[str]
+        The local directory in which the queue of batch comparisons is kept,
+        so that an interrupted job can be continued. By default, a directory
+        within the system's temporary directory is used.
+    clean_chunk_size : int
+        When using more than one worker, the number of raw statements each
+        worker maps at a time. Default is 1000.
     """
     def __init__(self, batch_size=10000, s3_cache=None, print_logs=False,
-                 stmt_type=None, yes_all=False, ontology=None):
+                 stmt_type=None, yes_all=False, ontology=None, n_workers=1,
+                 work_dir=None, clean_chunk_size=1000):
         self.batch_size = batch_size
+        self.n_workers = n_workers
+        self.clean_chunk_size = clean_chunk_size
+        if work_dir is None:
+            work_dir = path.join(gettempdir(), 'indra_db_preassembly')
+        self.work_dir = work_dir
         if s3_cache is not None:
             # Make the cache specific to stmt type. This guards against
             # technical errors resulting from mixing this key parameter.
@@ -150,8 +175,10 @@ class DbPreassembler:
                              .get_element_path(file_name))
 
     def _init_cache(self, continuing):
+        # Without a cache there is nothing to continue, but the start time is
+        # still needed to tell the new pa statements from the old.
         if self.s3_cache is None:
-            return
+            return datetime.utcnow()
 
         import boto3
         s3 = boto3.client('s3')
@@ -200,7 +227,12 @@ class DbPreassembler:
         # If continuing, try to retrieve the file.
         if continuing and result_cache.exists(s3):
             s3_result = result_cache.get(s3)
-            return pickle.loads(s3_result['Body'].read())
+            results = pickle.loads(s3_result['Body'].read())
+
+            # Results cached by earlier versions may be plain sets.
+            if isinstance(results, (set, frozenset)):
+                results = IntSet(results)
+            return results
 
         # If not continuing or the file doesn't exist, run the function.
         results = func(*args, **kwargs)
@@ -208,33 +240,6 @@ class DbPreassembler:
         result_cache.put(s3, pickle_data)
         return results
 
-    def _put_support_mark(self, outer_idx):
-        if self.s3_cache is None:
-            return
-
-        import boto3
-        s3 = boto3.client('s3')
-
-        supp_file = self._get_cache_path('support_idx.pkl')
-        supp_file.put(s3, pickle.dumps(outer_idx*self.batch_size))
-        return
-
-    def _get_support_mark(self, continuing):
-        if self.s3_cache is None:
-            return -1
-
-        if not continuing:
-            return -1
-
-        import boto3
-        s3 = boto3.client('s3')
-
-        supp_file = self._get_cache_path('support_idx.pkl')
-        if not supp_file.exists(s3):
-            return -1
-        s3_resp = supp_file.get(s3)
-        return pickle.loads(s3_resp['Body'].read()) // self.batch_size
-
     def _raw_sid_stmt_iter(self, db, id_set, do_enumerate=False):
         """Return a generator over statements with the given database ids."""
         def _fixed_raw_stmt_from_json(s_json, tr):
@@ -264,12 +269,9 @@ class DbPreassembler:
             else:
                 yield data
 
-    def _make_idx_batches(self, hash_list, continuing):
-        N = len(hash_list)
+    def _split_batches(self, hash_list):
         B = self.batch_size
-        idx_batch_list = [(n*B, min((n + 1)*B, N)) for n in range(0, N//B + 1)]
-        start_idx = self._get_support_mark(continuing) + 1
-        return idx_batch_list, start_idx
+        return [hash_list[i:i + B] for i in range(0, len(hash_list), B)]
 
     @clockit
     def _extract_and_push_unique_statements(self, db, raw_sids, num_stmts,
@@ -279,52 +281,63 @@ class DbPreassembler:
                   % len(raw_sids))
 
         if mk_done is None:
-            mk_done = set()
+            mk_done = IntSet()
 
-        new_mk_set = set()
+        new_mk_set = IntSet()
         num_batches = num_stmts/self.batch_size
-        for i, stmt_tpl_batch in self._raw_sid_stmt_iter(db, raw_sids, True):
-            self._log("Processing batch %d/%d of %d/%d statements."
-                      % (i, num_batches, len(stmt_tpl_batch), num_stmts))
-
-            # Get a list of statements and generate a mapping from uuid to sid.
-            stmts = []
-            uuid_sid_dict = {}
-            for sid, stmt in stmt_tpl_batch:
-                uuid_sid_dict[stmt.uuid] = sid
-                stmts.append(stmt)
-
-            # Map groundings and sequences.
-            cleaned_stmts, eliminated_uuids = self._clean_statements(stmts)
-            discarded_stmts = [(uuid_sid_dict[uuid], reason)
-                               for reason, uuid_set in eliminated_uuids.items()
-                               for uuid in uuid_set]
-            db.copy('discarded_statements', discarded_stmts,
-                    ('stmt_id', 'reason'), commit=False)
-
-            # Use the shallow hash to condense unique statements.
-            new_unique_stmts, evidence_links, agent_tuples = \
-                self._condense_statements(cleaned_stmts, mk_done, new_mk_set,
-                                          uuid_sid_dict)
-
-            # Insert the statements and their links.
-            self._log("Insert new statements into database...")
-            insert_pa_stmts(db, new_unique_stmts, ignore_agents=True,
-                            commit=False)
-            gatherer.add('stmts', len(new_unique_stmts))
-
-            self._log("Insert new raw_unique links into the database...")
-            ev_links = flatten_evidence_dict(evidence_links)
-            db.copy('raw_unique_links', ev_links,
-                    ('pa_stmt_mk_hash', 'raw_stmt_id'), commit=False)
-            gatherer.add('evidence', len(ev_links))
-
-            db.copy_lazy('pa_agents', hash_pa_agents(agent_tuples),
-                         ('stmt_mk_hash', 'ag_num', 'db_name', 'db_id', 'role',
-                          'agent_ref_hash'),
-                         commit=False)
-            insert_pa_agents(db, new_unique_stmts, verbose=True,
-                             skip=['agents'])  # This will commit
+        # A pool of workers, if any, is kept for all the batches, so that their
+        # grounding and sequence mapping caches stay warm.
+        executor = self._get_executor()
+        try:
+            stmt_batch_iter = self._raw_sid_stmt_iter(db, raw_sids, True)
+            for i, stmt_tpl_batch in stmt_batch_iter:
+                self._log("Processing batch %d/%d of %d/%d statements."
+                          % (i, num_batches, len(stmt_tpl_batch), num_stmts))
+
+                # Get a list of statements and generate a mapping from uuid to
+                # sid.
+                stmts = []
+                uuid_sid_dict = {}
+                for sid, stmt in stmt_tpl_batch:
+                    uuid_sid_dict[stmt.uuid] = sid
+                    stmts.append(stmt)
+
+                # Map groundings and sequences.
+                cleaned_stmts, eliminated_uuids = \
+                    self._clean_statements(stmts, executor)
+                discarded_stmts = [(uuid_sid_dict[uuid], reason)
+                                   for reason, uuid_set
+                                   in eliminated_uuids.items()
+                                   for uuid in uuid_set]
+                db.copy('discarded_statements', discarded_stmts,
+                        ('stmt_id', 'reason'), commit=False)
+
+                # Use the shallow hash to condense unique statements.
+                new_unique_stmts, evidence_links, agent_tuples = \
+                    self._condense_statements(cleaned_stmts, mk_done,
+                                              new_mk_set, uuid_sid_dict)
+
+                # Insert the statements and their links.
+                self._log("Insert new statements into database...")
+                insert_pa_stmts(db, new_unique_stmts, ignore_agents=True,
+                                commit=False)
+                gatherer.add('stmts', len(new_unique_stmts))
+
+                self._log("Insert new raw_unique links into the database...")
+                ev_links = flatten_evidence_dict(evidence_links)
+                db.copy('raw_unique_links', ev_links,
+                        ('pa_stmt_mk_hash', 'raw_stmt_id'), commit=False)
+                gatherer.add('evidence', len(ev_links))
+
+                db.copy_lazy('pa_agents', hash_pa_agents(agent_tuples),
+                             ('stmt_mk_hash', 'ag_num', 'db_name', 'db_id',
+                              'role', 'agent_ref_hash'),
+                             commit=False)
+                insert_pa_agents(db, new_unique_stmts, verbose=True,
+                                 skip=['agents'])  # This will commit
+        finally:
+            if executor is not None:
+                executor.shutdown()
 
         self._log("Added %d new pa statements into the database."
                   % len(new_mk_set))
@@ -337,13 +350,16 @@ class DbPreassembler:
         new_unique_stmts = []
         evidence_links = defaultdict(lambda: set())
         agent_tuples = set()
-        for s in cleaned_stmts:
-            h = s.get_hash(refresh=True)
 
+        # Find which of the statements are already known all at once.
+        hashes = [s.get_hash(refresh=True) for s in cleaned_stmts]
+        is_known = mk_done.contains(hashes) | new_mk_set.contains(hashes)
+        batch_mk_set = set()
+        for s, h, known in zip(cleaned_stmts, hashes, is_known):
             # If this statement is new, make it.
-            if h not in mk_done and h not in new_mk_set:
+            if not known and h not in batch_mk_set:
                 new_unique_stmts.append(s.make_generic_copy())
-                new_mk_set.add(h)
+                batch_mk_set.add(h)
 
             # Add the evidence to the dict.
             evidence_links[h].add(uuid_sid_dict[s.uuid])
@@ -352,6 +368,7 @@ class DbPreassembler:
             ref_data, _, _ = extract_agent_data(s, h)
             agent_tuples |= set(ref_data)
 
+        new_mk_set |= batch_mk_set
         return new_unique_stmts, evidence_links, agent_tuples
 
     def _dump_links(self, db, supp_links):
@@ -381,7 +398,8 @@ class DbPreassembler:
 
         if continuing:
             # Get discarded statements
-            skip_ids = {i for i, in db.select_all(db.DiscardedStatements.stmt_id)}
+            skip_ids = IntSet(i for i,
+                              in db.select_all(db.DiscardedStatements.stmt_id))
             self._log("Found %d discarded statements from earlier run."
                       % len(skip_ids))
 
@@ -390,11 +408,11 @@ class DbPreassembler:
             clauses = [db.RawStatements.type == self.stmt_type]
         else:
             clauses = []
-        stmt_ids = self._run_cached(continuing, distill_stmts, db,
-                                    clauses=clauses)
+        stmt_ids = self._run_cached(continuing, self._distill_stmt_ids, db,
+                                    clauses)
 
         # Handle the possibility we're picking up after an earlier job...
-        mk_done = set()
+        mk_done = IntSet()
         if continuing:
             self._log("Getting set of statements already de-duplicated...")
             link_q = db.filter_query([db.RawUniqueLinks.raw_stmt_id,
@@ -406,13 +424,13 @@ class DbPreassembler:
             link_resp = link_q.all()
             if link_resp:
                 checked_raw_stmt_ids, pa_stmt_hashes = zip(*link_resp)
-                stmt_ids -= set(checked_raw_stmt_ids)
+                stmt_ids -= IntSet(checked_raw_stmt_ids)
                 self._log("Found %d raw statements without links to unique."
                           % len(stmt_ids))
                 stmt_ids -= skip_ids
                 self._log("Found %d raw statements that still need to be "
                           "processed." % len(stmt_ids))
-                mk_done = set(pa_stmt_hashes)
+                mk_done = IntSet(pa_stmt_hashes)
                 self._log("Found %d preassembled statements already done."
                           % len(mk_done))
 
@@ -421,61 +439,37 @@ class DbPreassembler:
                                       self._extract_and_push_unique_statements,
                                       db, stmt_ids, len(stmt_ids), mk_done)
 
-        # Now get the support links between all batches.
-        support_links = set()
-        hash_list = list(new_mk_set | mk_done)
-        self._log(f"Beginning to find support relations for {len(hash_list)} "
-                  f"new statements.")
-        hash_list.sort()
-        idx_batches, start_idx = self._make_idx_batches(hash_list, continuing)
-        for outer_idx, (out_si, out_ei) in enumerate(idx_batches[start_idx:]):
-            outer_idx += start_idx
-            sj_query = db.filter_query(
-                db.PAStatements.json,
-                db.PAStatements.mk_hash.in_(hash_list[out_si:out_ei])
-            )
-            outer_batch = [_stmt_from_json(sj) for sj, in sj_query.all()]
-
-            # Get internal support links
-            self._log(f'Getting internal support links outer batch '
-                      f'{outer_idx}/{len(idx_batches)-1}.')
-            some_support_links = self._get_support_links(outer_batch)
-
-            # Get links with all other batches
-            in_start = outer_idx + 1
-            for inner_idx, (in_si, in_ei) in enumerate(idx_batches[in_start:]):
-                inner_sj_q = db.filter_query(
-                    db.PAStatements.json,
-                    db.PAStatements.mk_hash.in_(hash_list[in_si:in_ei])
-                )
-                inner_batch = [_stmt_from_json(sj) for sj, in inner_sj_q.all()]
-                split_idx = len(inner_batch)
-                full_list = inner_batch + outer_batch
-                self._log(f'Getting support between outer batch {outer_idx}/'
-                          f'{len(idx_batches)-1} and inner batch {inner_idx}/'
-                          f'{len(idx_batches)-in_start-1}.')
-                some_support_links |= \
-                    self._get_support_links(full_list, split_idx=split_idx)
-
-            # Add all the new support links
-            support_links |= some_support_links
-
-            # There are generally few support links compared to the number of
-            # statements, so it doesn't make sense to copy every time, but for
-            # long preassembly, this allows for better failure recovery.
-            if len(support_links) >= self.batch_size:
-                self._dump_links(db, support_links)
-                self._put_support_mark(outer_idx)
-                support_links = set()
-
-        # Insert any remaining support links.
-        if support_links:
-            self._log('Final (overflow) batch of links.')
-            self._dump_links(db, support_links)
+        # Now get the support links between all batches. Only batches that
+        # could contain related statements are compared.
+        queue = self._get_support_queue()
+        if not continuing or not queue.is_populated():
+            hash_list = (new_mk_set | mk_done).tolist()
+            self._log(f"Beginning to find support relations for "
+                      f"{len(hash_list)} new statements.")
+            key_index = AgentKeyIndex(self.pa.ontology, self.stmt_type)
+            hash_list, partners = \
+                key_index.block_batches(db, hash_list, self.batch_size)
+            batches = self._split_batches(hash_list)
+            pairs = []
+            for outer_idx in range(len(batches)):
+                pairs.append((outer_idx, None))
+                pairs += [(outer_idx, inner_idx)
+                          for inner_idx in partners[outer_idx]
+                          if inner_idx < len(batches)]
+            self._populate_support_queue(queue, batches, pairs)
+        self._run_support_queue(db, queue)
 
         self._clear_cache()
         return True
 
+    def _distill_stmt_ids(self, db, clauses):
+        """Get the ids of the distilled raw statements, as a compact set.
+
+        The ids are streamed straight into the set, so they are never held as
+        python ints all at once.
+        """
+        return IntSet(iter_distilled_stmts(db, clauses=clauses))
+
     def _get_new_stmt_ids(self, db):
         """Get all the uuids of statements not included in evidence."""
         olds_q = db.filter_query(
@@ -488,7 +482,7 @@ class DbPreassembler:
         if self.stmt_type is not None:
             alls_q = alls_q.filter(db.RawStatements.type == self.stmt_type)
         new_id_q = alls_q.except_(olds_q)
-        all_new_stmt_ids = {sid for sid, in new_id_q.all()}
+        all_new_stmt_ids = IntSet(sid for sid, in new_id_q.all())
         self._log("Found %d new statement ids." % len(all_new_stmt_ids))
         return all_new_stmt_ids
 
@@ -510,17 +504,19 @@ class DbPreassembler:
             clauses = [db.RawStatements.type == self.stmt_type]
         else:
             clauses = []
-        stmt_ids = self._run_cached(continuing, distill_stmts, db,
-                                    get_full_stmts=False, clauses=clauses)
+        stmt_ids = self._run_cached(continuing, self._distill_stmt_ids, db,
+                                    clauses)
 
         # Get discarded statements
-        skip_ids = {i for i, in db.select_all(db.DiscardedStatements.stmt_id)}
+        skip_ids = IntSet(i for i,
+                          in db.select_all(db.DiscardedStatements.stmt_id))
 
         # Select only the good new statement ids.
         new_stmt_ids = new_ids & stmt_ids - skip_ids
 
         # Get the set of new unique statements and link to any new evidence.
-        old_mk_set = {mk for mk, in db.select_all(db.PAStatements.mk_hash)}
+        old_mk_set = IntSet(mk for mk,
+                            in db.select_all(db.PAStatements.mk_hash))
         self._log("Found %d old pa statements." % len(old_mk_set))
 
         new_mk_set = self._run_cached(
@@ -539,78 +535,39 @@ class DbPreassembler:
 
     def _supplement_support(self, db, new_hashes, start_time, continuing=False):
         """Calculate the support for the given date range of pa statements."""
-        if not isinstance(new_hashes, list):
-            new_hashes = list(new_hashes)
-        new_hashes.sort()
-
-        # If we are continuing, check for support links that were already found
-        support_links = set()
-        idx_batches, start_idx = self._make_idx_batches(new_hashes, continuing)
-        for outer_idx, (out_s, out_e) in enumerate(idx_batches[start_idx:]):
-            outer_idx += start_idx
-            # Create the statements from the jsons.
-            npa_json_q = db.filter_query(
-                db.PAStatements.json,
-                db.PAStatements.mk_hash.in_(new_hashes[out_s:out_e])
-            )
-            npa_batch = [_stmt_from_json(s_json) for s_json in npa_json_q.all()]
-
-            # Compare internally
-            self._log(f"Getting support for new pa batch {outer_idx}/"
-                      f"{len(idx_batches)}.")
-            some_support_links = self._get_support_links(npa_batch)
-
-            # Compare against the other new batch statements.
-            in_start = outer_idx + 1
-            for in_idx, (in_s, in_e) in enumerate(idx_batches[in_start:]):
-                other_npa_q = db.filter_query(
-                    db.PAStatements.json,
-                    db.PAStatements.mk_hash.in_(new_hashes[in_s:in_e])
-                )
-                other_npa_batch = [_stmt_from_json(sj)
-                                   for sj, in other_npa_q.all()]
-                split_idx = len(npa_batch)
-                full_list = npa_batch + other_npa_batch
-                self._log(f"Comparing outer batch {outer_idx}/"
-                          f"{len(idx_batches)-1} to inner batch {in_idx}/"
-                          f"{len(idx_batches)-in_start-1} of other new "
-                          f"statements.")
-                some_support_links |= \
-                    self._get_support_links(full_list, split_idx=split_idx)
-
-            # Compare against the existing statements.
-            opa_args = (db.PAStatements.create_date < start_time,)
-            if self.stmt_type is not None:
-                opa_args += (db.PAStatements.type == self.stmt_type,)
-
-            opa_json_iter = db.select_all_batched(self.batch_size,
-                                                  db.PAStatements.json,
-                                                  *opa_args)
-            for opa_idx, opa_json_batch in opa_json_iter:
-                opa_batch = [_stmt_from_json(s_json)
-                             for s_json, in opa_json_batch]
-                split_idx = len(npa_batch)
-                full_list = npa_batch + opa_batch
-                self._log(f"Comparing new batch {outer_idx}/"
-                          f"{len(idx_batches)-1} to batch {opa_idx} of old pa "
-                          f"statements.")
-                some_support_links |= \
-                    self._get_support_links(full_list, split_idx=split_idx)
-
-            support_links |= some_support_links
-
-            # There are generally few support links compared to the number of
-            # statements, so it doesn't make sense to copy every time, but for
-            # long preassembly, this allows for better failure recovery.
-            if len(support_links) >= self.batch_size:
-                self._dump_links(db, support_links)
-                self._put_support_mark(outer_idx)
-                support_links = set()
-
-        # Insert any remaining support links.
-        if support_links:
-            self._log("Final (overflow) batch of new support links.")
-            self._dump_links(db, support_links)
+        queue = self._get_support_queue()
+        if continuing and queue.is_populated():
+            self._run_support_queue(db, queue)
+            return
+
+        # Only compare batches, and old statements, that could be related.
+        key_index = AgentKeyIndex(self.pa.ontology, self.stmt_type)
+        new_hashes, partners = \
+            key_index.block_batches(db, list(new_hashes), self.batch_size)
+        batches = self._split_batches(new_hashes)
+
+        opa_args = (db.PAStatements.create_date < start_time,)
+        if self.stmt_type is not None:
+            opa_args += (db.PAStatements.type == self.stmt_type,)
+        old_q = db.filter_query(db.PAStatements.mk_hash, *opa_args)
+        old_hashes = IntSet(h for h, in old_q.yield_per(self.batch_size))
+        related_old = key_index.find_related(db, batches, old_hashes)
+
+        # Compare each batch of new statements internally, against the other
+        # new batches, and against the old statements that could be related.
+        pairs = []
+        n_new = len(batches)
+        for outer_idx in range(n_new):
+            pairs.append((outer_idx, None))
+            pairs += [(outer_idx, inner_idx)
+                      for inner_idx in partners[outer_idx]
+                      if inner_idx < n_new]
+            opa_hashes = sorted(related_old.get(outer_idx, set()))
+            for opa_batch in self._split_batches(opa_hashes):
+                pairs.append((outer_idx, len(batches)))
+                batches.append(opa_batch)
+        self._populate_support_queue(queue, batches, pairs)
+        self._run_support_queue(db, queue)
         return
 
     @_handle_update_table
@@ -638,6 +595,173 @@ class DbPreassembler:
         self.__tag = 'Unpurposed'
         return True
 
+    def _get_support_queue(self):
+        """Open the local queue of batch comparisons for this task."""
+        file_name = f'{self.__tag}_{self.stmt_type or "all"}_support.sqlite'
+        return SupportQueue(path.join(self.work_dir, file_name))
+
+    def _get_stmt_cache(self):
+        """Get the local cache of the statements in each batch of the queue."""
+        dir_name = f'{self.__tag}_{self.stmt_type or "all"}_stmts'
+        return StatementCache(path.join(self.work_dir, dir_name))
+
+    def _populate_support_queue(self, queue, batches, pairs):
+        """Fill the queue, discarding any statements cached for an old one."""
+        self._get_stmt_cache().clear()
+        queue.populate(batches, pairs)
+        return
+
+    def _run_support_queue(self, db, queue):
+        """Make the pending batch comparisons and copy the links found.
+
+        The statements of each batch are first fetched and deserialized once,
+        into the local statement cache, from which the comparisons then load
+        them. Links are copied into the database as they accumulate, and the
+        units that produced them are only marked done once they are stored.
+        When done, the queue and cache are removed.
+        """
+        pending = queue.get_pending()
+        self._log(f"{len(pending)} of {queue.get_stats()['units']} batch "
+                  f"comparisons remain, using {self.n_workers} worker(s).")
+        self._stmt_cache = self._get_stmt_cache()
+
+        executor = self._get_executor()
+        try:
+            # Deserialize each batch that is needed and not yet cached.
+            needed = sorted({b for _, outer, inner in pending
+                             for b in (outer, inner)
+                             if b is not None
+                             and not self._stmt_cache.has(b)})
+            self._log(f"Caching the statements of {len(needed)} batches.")
+            cache_tasks = ((batch_id, (batch_id, self._get_batch_jsons(
+                                db, queue.get_batch(batch_id))))
+                           for batch_id in needed)
+            for batch_id, duration in \
+                    self._map_tasks(executor, '_cache_batch', cache_tasks):
+                self._log(f"Cached batch {batch_id} in {duration:.2f} "
+                          f"seconds.", level='debug')
+
+            # Compare the batches.
+            support_links = set()
+            done_records = []
+
+            def flush():
+                if support_links:
+                    self._dump_links(db, support_links)
+                queue.mark_done(done_records)
+                support_links.clear()
+                done_records.clear()
+
+            compare_tasks = ((unit, unit[1:]) for unit in pending)
+            for (unit_id, outer, inner), (links, load_time, compare_time) \
+                    in self._map_tasks(executor, '_compare_batches',
+                                       compare_tasks):
+                inner_desc = 'itself' if inner is None else f'batch {inner}'
+                self._log(f"Compared batch {outer} to {inner_desc}, finding "
+                          f"{len(links)} links in {compare_time:.2f} seconds "
+                          f"(loaded in {load_time:.2f} seconds).",
+                          level='debug')
+                support_links |= links
+                done_records.append((unit_id, len(links), load_time,
+                                     compare_time))
+
+                # There are generally few support links compared to the number
+                # of statements, so they are only copied once enough
+                # accumulate.
+                if not support_links or len(support_links) >= self.batch_size:
+                    flush()
+
+            # Insert any remaining support links.
+            if support_links:
+                self._log("Final (overflow) batch of links.")
+            flush()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+        stats = queue.get_stats()
+        if stats['done']:
+            self._log(f"Finished {stats['done']} batch comparisons, finding "
+                      f"{stats['links']} links. Loading took "
+                      f"{stats['load_time']:.1f} seconds and comparing "
+                      f"{stats['compare_time']:.1f} seconds in total, with "
+                      f"{stats['compare_time']/stats['done']:.2f} seconds on "
+                      f"average and {stats['max_compare_time']:.2f} at most.")
+        queue.remove()
+        self._stmt_cache.clear()
+        return
+
+    def _get_executor(self):
+        """Get a pool of worker processes, or None if only one is used."""
+        executor = get_process_pool(self.n_workers, _init_worker, (self,))
+        if executor is not None:
+            # The workers are only forked with the first job, so start them
+            # now, before any batch query below has a cursor open. With fork,
+            # the first job starts all of them.
+            executor.submit(int).result()
+        return executor
+
+    def _map_tasks(self, executor, method_name, tasks):
+        """Run a method over (key, args) tasks, yielding (key, result) pairs.
+
+        If an executor is given, the tasks are run in its worker processes, a
+        few at a time so that the arguments are not all loaded at once, and
+        the results are yielded as they finish.
+        """
+        if executor is None:
+            method = getattr(self, method_name)
+            for key, args in tasks:
+                yield key, method(*args)
+            return
+
+        jobs = {}
+
+        def submit_next():
+            for key, args in tasks:
+                job = executor.submit(_call_in_worker, method_name, *args)
+                jobs[job] = key
+                return
+
+        for _ in range(2*self.n_workers):
+            submit_next()
+        while jobs:
+            finished, _ = wait(jobs, return_when=FIRST_COMPLETED)
+            for job in finished:
+                key = jobs.pop(job)
+                yield key, job.result()
+                submit_next()
+
+    @staticmethod
+    def _get_batch_jsons(db, hashes):
+        """Get the json of the pa statements with the given hashes."""
+        json_q = db.filter_query(db.PAStatements.json,
+                                 db.PAStatements.mk_hash.in_(hashes))
+        return [sj for sj, in json_q.all()]
+
+    def _cache_batch(self, batch_id, stmt_jsons):
+        """Deserialize a batch of statements into the cache."""
+        start = perf_counter()
+        self._stmt_cache.put(batch_id,
+                             [_stmt_from_json(sj) for sj in stmt_jsons])
+        return perf_counter() - start
+
+    def _compare_batches(self, outer, inner=None):
+        """Find the support links between the statements in two batches.
+
+        If `inner` is None, the outer statements are compared with each other.
+        Returns the links found, and the time taken to load and compare the
+        statements.
+        """
+        start = perf_counter()
+        stmts = list(self._stmt_cache.get(outer))
+        split_idx = None
+        if inner is not None:
+            split_idx = len(stmts)
+            stmts += self._stmt_cache.get(inner)
+        load_time = perf_counter() - start
+        links = self._get_support_links(stmts, split_idx=split_idx)
+        return links, load_time, perf_counter() - start - load_time
+
     def _log(self, msg, level='info'):
         """Applies a task specific tag to the log message."""
         if self.__print_logs:
@@ -646,13 +770,37 @@ class DbPreassembler:
         getattr(logger, level)("(%s) %s" % (self.__tag, msg))
 
     @clockit
-    def _clean_statements(self, stmts):
+    def _clean_statements(self, stmts, executor=None):
         """Perform grounding, sequence mapping, and find unique set from stmts.
 
         This method returns a list of statement objects, as well as a set of
         tuples of the form (uuid, matches_key) which represent the links between
         raw (evidence) statements and their unique/preassembled counterparts.
+
+        If an executor is given, the statements are mapped in chunks by its
+        workers, and the results are put back together in the original order.
         """
+        if executor is None:
+            return self._map_grounding_and_sequence(stmts)
+
+        B = self.clean_chunk_size
+        chunks = [stmts[i:i + B] for i in range(0, len(stmts), B)]
+        self._log(f"Map grounding and sequences in {len(chunks)} chunks...")
+        results = dict(self._map_tasks(
+            executor, '_map_grounding_and_sequence',
+            ((i, (chunk,)) for i, chunk in enumerate(chunks))
+        ))
+        stmts = []
+        eliminated_uuids = defaultdict(set)
+        for i in range(len(chunks)):
+            chunk_stmts, chunk_eliminated_uuids = results.pop(i)
+            stmts += chunk_stmts
+            for reason, uuid_set in chunk_eliminated_uuids.items():
+                eliminated_uuids[reason] |= uuid_set
+        return stmts, dict(eliminated_uuids)
+
+    def _map_grounding_and_sequence(self, stmts):
+        """Map the grounding and sequences of statements, noting any lost."""
         eliminated_uuids = {}
         all_uuids = {s.uuid for s in stmts}
         self._log("Map grounding...")
@@ -683,6 +831,19 @@ class DbPreassembler:
         return ret
 
 
+# The DbPreassembler used by a worker process.
+_worker_preassembler = None
+
+
+def _init_worker(db_preassembler):
+    global _worker_preassembler
+    _worker_preassembler = db_preassembler
+
+
+def _call_in_worker(method_name, *args):
+    return getattr(_worker_preassembler, method_name)(*args)
+
+
 def _stmt_from_json(stmt_json_bytes):
     return Statement._from_json(json.loads(stmt_json_bytes.decode('utf-8')))
 
@@ -766,6 +927,20 @@ def _make_parser():
               'greatly multi-process the task by having separate machines '
               'preassemble different types.')
     )
+    parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        default=1,
+        help=('Select the number of processes used to map the grounding and '
+              'sequences of statements, and to compare batches of statements '
+              'when finding support links. The default is 1.')
+    )
+    parser.add_argument(
+        '-W', '--work-dir',
+        help=('Choose the local directory in which the queue of batch '
+              'comparisons is kept, allowing jobs to continue after '
+              'stopping. By default a temporary directory is used.')
+    )
     parser.add_argument(
         '-Y', '--yes-all',
         action='store_true',
@@ -787,7 +962,8 @@ def _main():
     db.grab_session()
     s3_cache = S3Path.from_string(args.cache)
     pa = DbPreassembler(args.batch, s3_cache,
-                        stmt_type=args.stmt_type, yes_all=args.yes_all)
+                        stmt_type=args.stmt_type, yes_all=args.yes_all,
+                        n_workers=args.workers, work_dir=args.work_dir)
 
     desc = 'Continuing' if args.continuing else 'Beginning'
     print("%s to %s preassembled corpus." % (desc, args.task))
@@ -0,0 +1,73 @@
+"""A local cache of deserialized preassembled statements, by batch.
+
+Finding support links compares each batch of statements against many others,
+so without a cache the json of the same statements would be fetched from the
+database and deserialized many times over. Here each batch is deserialized
+once and pickled to its own shard file, from which it can be loaded far more
+quickly, and the most recently used batches are also kept in memory.
+"""
+
+__all__ = ['StatementCache']
+
+import os
+import pickle
+import shutil
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class StatementCache(object):
+    """Statements stored in pickle shards, with an in-memory LRU of batches.
+
+    Parameters
+    ----------
+    cache_dir : str
+        The directory in which the shards are kept.
+    max_batches : int
+        The maximum number of batches to hold in memory. Default is 4.
+    """
+    def __init__(self, cache_dir, max_batches=4):
+        self.cache_dir = cache_dir
+        self.max_batches = max_batches
+        self._hot = OrderedDict()
+
+    def _get_shard_path(self, batch_id):
+        return os.path.join(self.cache_dir, f'batch_{batch_id}.pkl')
+
+    def has(self, batch_id):
+        """Check whether a batch has been stored."""
+        return os.path.exists(self._get_shard_path(batch_id))
+
+    def put(self, batch_id, stmts):
+        """Store a batch of statements in its shard."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        shard_path = self._get_shard_path(batch_id)
+
+        # Write to a temporary file first so an interrupted write never leaves
+        # a partial shard behind.
+        tmp_path = shard_path + f'.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(stmts, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, shard_path)
+        return
+
+    def get(self, batch_id):
+        """Get a batch of statements, from memory if possible."""
+        if batch_id in self._hot:
+            self._hot.move_to_end(batch_id)
+            return self._hot[batch_id]
+
+        with open(self._get_shard_path(batch_id), 'rb') as f:
+            stmts = pickle.load(f)
+        self._hot[batch_id] = stmts
+        while len(self._hot) > self.max_batches:
+            self._hot.popitem(last=False)
+        return stmts
+
+    def clear(self):
+        """Remove all the stored batches, and the cache directory."""
+        self._hot.clear()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        return
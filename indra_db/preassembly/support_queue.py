@@ -0,0 +1,136 @@
+"""A durable queue of the batch comparisons used to find support links.
+
+Finding the support links between preassembled statements is broken into
+units of work, each comparing the statements of one batch against those of
+another (or against themselves). The batches and units are recorded in a local
+SQLite file, and units are only marked done once their links have been copied
+into the database, so an interrupted job can pick up exactly where it stopped.
+"""
+
+__all__ = ['SupportQueue']
+
+import logging
+import sqlite3
+from array import array
+from os import path, makedirs, remove
+
+logger = logging.getLogger(__name__)
+
+
+class SupportQueue(object):
+    """A queue of batch comparisons stored in a SQLite file.
+
+    Parameters
+    ----------
+    file_path : str
+        The location of the SQLite file. It is created if it does not exist.
+    """
+    def __init__(self, file_path):
+        self.file_path = file_path
+        dir_name = path.dirname(file_path)
+        if dir_name:
+            makedirs(dir_name, exist_ok=True)
+        self._conn = sqlite3.connect(file_path)
+        with self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS batches (
+                    id INTEGER PRIMARY KEY,
+                    hashes BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS units (
+                    id INTEGER PRIMARY KEY,
+                    outer_batch INTEGER NOT NULL,
+                    inner_batch INTEGER,
+                    done INTEGER NOT NULL DEFAULT 0,
+                    n_links INTEGER,
+                    load_time REAL,
+                    compare_time REAL
+                );
+                CREATE TABLE IF NOT EXISTS info (
+                    populated INTEGER NOT NULL
+                );
+            """)
+
+    def is_populated(self):
+        """Check whether the queue was completely filled by an earlier run."""
+        return self._conn.execute('SELECT 1 FROM info').fetchone() is not None
+
+    def populate(self, batches, pairs):
+        """Replace the contents of the queue.
+
+        Parameters
+        ----------
+        batches : iterable[list[int]]
+            The hashes of the statements in each batch. Batches are identified
+            by their position in this sequence.
+        pairs : iterable[tuple]
+            The (outer, inner) batch indices to be compared. An inner index of
+            None indicates the outer batch is to be compared with itself.
+        """
+        with self._conn:
+            self._conn.execute('DELETE FROM info')
+            self._conn.execute('DELETE FROM batches')
+            self._conn.execute('DELETE FROM units')
+            self._conn.executemany(
+                'INSERT INTO batches (id, hashes) VALUES (?, ?)',
+                ((i, array('q', hashes).tobytes())
+                 for i, hashes in enumerate(batches))
+            )
+            self._conn.executemany(
+                'INSERT INTO units (outer_batch, inner_batch) VALUES (?, ?)',
+                pairs
+            )
+            self._conn.execute('INSERT INTO info (populated) VALUES (1)')
+        return
+
+    def get_batch(self, batch_id):
+        """Get the list of hashes in a batch."""
+        blob, = self._conn.execute('SELECT hashes FROM batches WHERE id = ?',
+                                   (batch_id,)).fetchone()
+        hashes = array('q')
+        hashes.frombytes(blob)
+        return hashes.tolist()
+
+    def get_pending(self):
+        """Get the (unit id, outer, inner) of each unit not yet done."""
+        return self._conn.execute(
+            'SELECT id, outer_batch, inner_batch FROM units WHERE done = 0 '
+            'ORDER BY id'
+        ).fetchall()
+
+    def mark_done(self, records):
+        """Mark units done, given a list of tuples of the form
+        (unit id, number of links, load time, compare time)."""
+        with self._conn:
+            self._conn.executemany(
+                'UPDATE units SET done = 1, n_links = ?, load_time = ?, '
+                'compare_time = ? WHERE id = ?',
+                ((n, t_load, t_comp, unit_id)
+                 for unit_id, n, t_load, t_comp in records)
+            )
+        return
+
+    def get_stats(self):
+        """Summarize the progress and timing of the units."""
+        n_units, n_done, n_links, load_time, compare_time, max_time = \
+            self._conn.execute(
+                'SELECT count(*), coalesce(sum(done), 0), '
+                '       coalesce(sum(n_links), 0), '
+                '       coalesce(sum(load_time), 0), '
+                '       coalesce(sum(compare_time), 0), '
+                '       coalesce(max(compare_time), 0) '
+                'FROM units'
+            ).fetchone()
+        return {'units': n_units, 'done': n_done, 'links': n_links,
+                'load_time': load_time, 'compare_time': compare_time,
+                'max_compare_time': max_time}
+
+    def close(self):
+        self._conn.close()
+
+    def remove(self):
+        """Close and delete the queue file."""
+        self.close()
+        if path.exists(self.file_path):
+            remove(self.file_path)
+        return
@@ -306,7 +306,7 @@ class DatabaseReader(object):
             tc_tbr_query = tc_query
 
         for tc in tc_tbr_query.distinct().yield_per(self.batch_size):
-            processed_content = process_content(tc)
+            processed_content = process_content(tc, self._db)
             if processed_content is not None:
                 yield processed_content
         return
@@ -587,7 +587,7 @@ class DatabaseReader(object):
 # =============================================================================
 # Content Retrieval
 # =============================================================================
-def process_content(text_content):
+def process_content(text_content, db=None):
     """Get the appropriate content object from the text content."""
     if text_content.format == formats.TEXT:
         cont_fmt = 'txt'
@@ -596,9 +596,10 @@ def process_content(text_content):
         cont_fmt = 'nxml'
     else:
         cont_fmt = text_content.format
+    # The content may be gzipped or zstd compressed, so it is unpacked here
+    # rather than by the Content object, which only knows gzip.
     content = Content.from_string(text_content.id, cont_fmt,
-                                  text_content.content, compressed=True,
-                                  encoded=True)
+                                  unpack(text_content.content, db=db))
     if text_content.source == 'elsevier':
         raw_xml_text = content.get_text()
         elsevier_text = process_elsevier(raw_xml_text)
@@ -1,3 +1,4 @@
+import re
 import logging
 from termcolor import colored
 from psycopg2.errors import DuplicateTable
@@ -58,19 +59,31 @@ class IndraDBTable(metaclass=IndraDBTableMetaClass):
                 cls.execute(db, cluster_sql)
         return sql
 
+    @classmethod
+    def get_clustered_index(cls):
+        """Get the index this table is clustered on, or None if there is none.
+        """
+        clustered = [index for index in cls._indices if index.cluster]
+        if len(clustered) > 1:
+            raise DbIndexError("Only one index may be clustered at a time.")
+        return clustered[0] if clustered else None
+
     @classmethod
     def build_indices(cls, db):
-        found_a_clustered = False
+        cls.get_clustered_index()
         for index in cls._indices:
-            if index.cluster:
-                if not found_a_clustered:
-                    found_a_clustered = True
-                else:
-                    raise DbIndexError("Only one index may be clustered "
-                                       "at a time.")
             logger.info("Building index: %s" % index.name)
             cls.create_index(db, index)
 
+    @classmethod
+    def get_active_columns(cls, cursor):
+        """Get the names of this table's columns in the database, in order."""
+        cursor.execute("SELECT column_name FROM information_schema.columns\n"
+                       "WHERE table_schema = %s AND table_name = %s\n"
+                       "ORDER BY ordinal_position;",
+                       (cls.get_schema('public'), cls.__tablename__))
+        return [col_name for col_name, in cursor.fetchall()]
+
     @staticmethod
     def execute(db, sql):
         conn = db.engine.raw_connection()
@@ -158,6 +171,10 @@ class ReadonlyTable(IndraDBTable):
     # to live beyond the readonly build process.
     _temp = False
 
+    # The column used to select the rows that must be replaced when the table
+    # is refreshed (see `refresh`). Tables without one are rebuilt entirely.
+    _refresh_key = None
+
     @classmethod
     def create(cls, db, commit=True):
         sql = cls.__create_table_fmt__ \
@@ -175,8 +192,63 @@ class ReadonlyTable(IndraDBTable):
     def definition(cls, db):
         return cls.get_definition()
 
+    @classmethod
+    def get_refresh_definition(cls, db, key_schema):
+        """Get the definition, limited to the rows with refreshed keys."""
+        definition = cls.definition(db)
+        if cls._refresh_key is None:
+            return definition
+        key = cls._refresh_key
+        return (f"SELECT * FROM ({definition}) AS definition\n"
+                f"WHERE {key} IN (SELECT {key} FROM {key_schema}.refresh_{key})")
+
+    @classmethod
+    def refresh(cls, db, cursor, key_schema):
+        """Replace the rows of this table whose sources have changed.
+
+        The keys of the rows to be replaced are taken from the table
+        `refresh_<key>` in the schema `key_schema`. Nothing is committed, so
+        that an entire schema may be refreshed in a single transaction.
+        """
+        full_name = cls.full_name(force_schema=True)
+        key = cls._refresh_key
+        if key is None:
+            cursor.execute(f"DELETE FROM {full_name};")
+        else:
+            cursor.execute(f"DELETE FROM {full_name}\n"
+                           f"WHERE {key} IN (SELECT {key} "
+                           f"FROM {key_schema}.refresh_{key});")
+        cols = ', '.join(cls.get_active_columns(cursor))
+        cursor.execute(f"INSERT INTO {full_name} ({cols})\n"
+                       f"SELECT {cols} FROM (\n"
+                       f"{cls.get_refresh_definition(db, key_schema)}\n"
+                       f") AS refreshed;")
+        return
+
+    @classmethod
+    def _get_definition_template(cls):
+        return cls.get_definition()
+
+    @classmethod
+    def get_dependencies(cls):
+        """Get the names of the readonly tables this table is built from.
+
+        The names are found from the `readonly.` references in the table's
+        definition, so they can be determined without access to a database.
+        """
+        refs = re.findall(r'\breadonly\.(\w+)',
+                          cls._get_definition_template())
+        return set(refs) - {cls.__tablename__}
+
 
 class SpecialColumnTable(ReadonlyTable):
+    __definition_fmt__ = NotImplemented
+
+    @classmethod
+    def _get_definition_template(cls):
+        # The full definition can only be formed once the tables it draws its
+        # columns from exist, however the format has all the references.
+        return cls.__definition_fmt__
 
     @classmethod
     def create(cls, db, commit=True):
@@ -215,6 +287,7 @@ class SpecialColumnTable(ReadonlyTable):
 
 class NamespaceLookup(ReadonlyTable):
     __dbname__ = NotImplemented
+    _refresh_key = 'mk_hash'
 
     @classmethod
     def get_definition(cls):
@@ -3,7 +3,7 @@ __all__ = ['get_schema', 'foreign_key_map']
 import logging
 
 from sqlalchemy import Column, Integer, String, UniqueConstraint, ForeignKey, \
-     Boolean, DateTime, func, BigInteger, or_, tuple_
+     Boolean, DateTime, func, BigInteger, Float, or_, tuple_
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import BYTEA, INET, JSONB
 
@@ -265,6 +265,26 @@ def get_schema(Base):
         )
     table_dict[SourceFile.__tablename__] = SourceFile
 
+    class IngestionBatch(Base, IndraDBTable):
+        __tablename__ = 'ingestion_batch'
+        _always_disp = ['source', 'file_name', 'batch_idx', 'status']
+        id = Column(Integer, primary_key=True)
+        source = Column(String(250), nullable=False)
+        file_name = Column(String(250), nullable=False)
+        batch_idx = Column(Integer, nullable=False)
+        status = Column(String(20), nullable=False)
+        host = Column(String(250))
+        n_records = Column(Integer)
+        n_content = Column(Integer)
+        claimed = Column(DateTime)
+        finished = Column(DateTime)
+        seconds = Column(Float)
+        __table_args__ = (
+            UniqueConstraint('source', 'file_name', 'batch_idx',
+                             name='source-file-batch'),
+        )
+    table_dict[IngestionBatch.__tablename__] = IngestionBatch
+
     class Updates(Base, IndraDBTable):
         __tablename__ = 'updates'
         _skip_disp = ['unresolved_conflicts_file']
@@ -297,6 +317,22 @@ def get_schema(Base):
         )
     table_dict[TextContent.__tablename__] = TextContent
 
+    class ContentDictionary(Base, IndraDBTable):
+        __tablename__ = 'content_dictionary'
+        _skip_disp = ['dictionary']
+        _always_disp = ['dict_id', 'source', 'text_type']
+        id = Column(Integer, primary_key=True)
+        dict_id = Column(BigInteger, nullable=False)
+        source = Column(String(250), nullable=False)
+        text_type = Column(String(250), nullable=False)
+        dictionary = Column(BYTEA, nullable=False)
+        n_samples = Column(Integer)
+        create_date = Column(DateTime, default=func.now())
+        __table_args__ = (
+            UniqueConstraint('dict_id', name='content-dict-id'),
+        )
+    table_dict[ContentDictionary.__tablename__] = ContentDictionary
+
     class Reading(Base, IndraDBTable):
         __tablename__ = 'reading'
         _skip_disp = ['bytes']
@@ -1,13 +1,12 @@
 __all__ = ['get_schema']
 
+import json
 import logging
 
 from sqlalchemy import Column, Integer, String, BigInteger, Boolean,\
     SmallInteger
 from sqlalchemy.dialects.postgresql import BYTEA, JSON, JSONB, REAL
 
-from indra.statements import get_all_descendants, Statement
-
 from .mixins import ReadonlyTable, NamespaceLookup, SpecialColumnTable, \
     IndraDBTable
 from .indexes import *
@@ -67,15 +66,32 @@ class StatementTypeMapping(StringIntMapping):
     arg = 'type'
 
     def __init__(self):
-        all_stmt_classes = get_all_descendants(Statement)
-        stmt_class_names = [sc.__name__ for sc in all_stmt_classes]
-        stmt_class_names.sort()
-
-        self._int_to_str = {}
-        self._str_to_int = {}
-        for stmt_type_num, stmt_type in enumerate(stmt_class_names):
-            self._int_to_str[stmt_type_num] = stmt_type
-            self._str_to_int[stmt_type] = stmt_type_num
+        # The statement types are only listed when first needed, as loading
+        # indra.statements is slow (it loads networkx, among others).
+        self.__maps = None
+
+    def __get_maps(self):
+        if self.__maps is None:
+            from indra.statements import get_all_descendants, Statement
+            all_stmt_classes = get_all_descendants(Statement)
+            stmt_class_names = [sc.__name__ for sc in all_stmt_classes]
+            stmt_class_names.sort()
+
+            int_to_str = {}
+            str_to_int = {}
+            for stmt_type_num, stmt_type in enumerate(stmt_class_names):
+                int_to_str[stmt_type_num] = stmt_type
+                str_to_int[stmt_type] = stmt_type_num
+            self.__maps = (int_to_str, str_to_int)
+        return self.__maps
+
+    @property
+    def _int_to_str(self):
+        return self.__get_maps()[0]
+
+    @property
+    def _str_to_int(self):
+        return self.__get_maps()[1]
 
 
 ro_type_map = StatementTypeMapping()
@@ -141,6 +157,7 @@ def get_schema(Base):
     class Belief(Base, IndraDBTable):
         __tablename__ = 'belief'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'mk_hash'
         _indices = [BtreeIndex('belief_mk_hash_idx', 'mk_hash')]
         _temp = False
         mk_hash = Column(BigInteger, primary_key=True)
@@ -150,6 +167,7 @@ def get_schema(Base):
     class EvidenceCounts(Base, ReadonlyTable):
         __tablename__ = 'evidence_counts'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'mk_hash'
         __definition__ = ('SELECT count(id) AS ev_count, mk_hash '
                           'FROM readonly.fast_raw_pa_link '
                           'GROUP BY mk_hash')
@@ -161,6 +179,7 @@ def get_schema(Base):
     class ReadingRefLink(Base, ReadonlyTable):
         __tablename__ = 'reading_ref_link'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'rid'
         __definition__ = ('SELECT pmid, pmid_num, pmcid, pmcid_num, '
                           'pmcid_version, doi, doi_ns, doi_id, tr.id AS trid,'
                           'pii, url, manuscript_id, tc.id AS tcid, '
@@ -200,6 +219,7 @@ def get_schema(Base):
     class FastRawPaLink(Base, ReadonlyTable):
         __tablename__ = 'fast_raw_pa_link'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'mk_hash'
         __definition__ = ('WITH %s\n'
                           'SELECT raw.id AS id,\n'
                           '       raw.json AS raw_json,\n'
@@ -240,6 +260,7 @@ def get_schema(Base):
     class PAAgentCounts(Base, ReadonlyTable):
         __tablename__ = 'pa_agent_counts'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'mk_hash'
         __definition__ = ("SELECT count(distinct ag_num) as agent_count,"
                           "       stmt_mk_hash as mk_hash\n"
                           "FROM pa_agents GROUP BY stmt_mk_hash")
@@ -251,6 +272,7 @@ def get_schema(Base):
     class RawStmtSrc(Base, ReadonlyTable):
         __tablename__ = 'raw_stmt_src'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'sid'
         __definition__ = ('SELECT raw_statements.id AS sid, '
                           'lower(reading.reader) AS src '
                           'FROM raw_statements, reading '
@@ -269,6 +291,7 @@ def get_schema(Base):
     class _PaStmtSrc(Base, SpecialColumnTable):
         __tablename__ = 'pa_stmt_src'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'mk_hash'
         __definition_fmt__ = ("SELECT * FROM crosstab("
                               "'SELECT mk_hash, src, count(id) "
                               "  FROM readonly.fast_raw_pa_link "
@@ -304,6 +327,16 @@ def get_schema(Base):
                                             ', '.join(entries))
             return sql
 
+        @classmethod
+        def get_refresh_definition(cls, db, key_schema):
+            # Limit the crosstab query itself, so the counts need only be
+            # found for the refreshed hashes.
+            group_by = "  GROUP BY (mk_hash, src)"
+            restriction = (f"  WHERE mk_hash IN (SELECT mk_hash "
+                           f"FROM {key_schema}.refresh_mk_hash)")
+            return cls.definition(db).replace(group_by,
+                                              restriction + group_by)
+
         def get_sources(self, include_none=False):
             src_dict = {}
             for k, v in self.__dict__.items():
@@ -316,6 +349,7 @@ def get_schema(Base):
     class _PaRefLink(Base, ReadonlyTable):
         __tablename__ = 'pa_ref_link'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'mk_hash'
         __definition__ = ('SELECT mk_hash, trid, pmid_num, pmcid_num, source,\n'
                           '       reader\n'
                           'FROM readonly.fast_raw_pa_link\n'
@@ -336,6 +370,7 @@ def get_schema(Base):
     class _MeshTerms(Base, ReadonlyTable):
         __tablename__ = 'mesh_terms'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'pmid_num'
         __definition__ = ('SELECT pmid_num, mesh_num FROM mesh_ref_annotations\n'
                           '  WHERE is_concept IS NOT true\n'
                           'UNION\n'
@@ -350,6 +385,7 @@ def get_schema(Base):
     class _MeshConcepts(Base, ReadonlyTable):
         __tablename__ = 'mesh_concepts'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'pmid_num'
         __definition__ = ('SELECT pmid_num, mesh_num FROM mesh_ref_annotations\n'
                           '  WHERE is_concept IS true\n'
                           'UNION\n'
@@ -364,6 +400,7 @@ def get_schema(Base):
     class _HashPmidCounts(Base, ReadonlyTable):
         __tablename__ = 'hash_pmid_counts'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'mk_hash'
         __definition__ = ('SELECT mk_hash,\n'
                           '       count(distinct pmid_num)::integer as pmid_count\n'
                           'FROM readonly.pa_ref_link GROUP BY mk_hash')
@@ -376,6 +413,7 @@ def get_schema(Base):
     class MeshTermRefCounts(Base, ReadonlyTable):
         __tablename__ = 'mesh_term_ref_counts'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'mk_hash'
         __definition__ = ('WITH mesh_hash_pmids AS (\n'
                           '    SELECT readonly.mesh_terms.pmid_num, mk_hash,\n'
                           '           mesh_num\n'
@@ -401,6 +439,7 @@ def get_schema(Base):
     class MeshConceptRefCounts(Base, ReadonlyTable):
         __tablename__ = 'mesh_concept_ref_counts'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'mk_hash'
         __definition__ = ('WITH mesh_hash_pmids AS (\n'
                           '    SELECT readonly.mesh_concepts.pmid_num, mk_hash,\n'
                           '           mesh_num\n'
@@ -426,6 +465,7 @@ def get_schema(Base):
     class RawStmtMeshTerms(Base, ReadonlyTable):
         __tablename__ = 'raw_stmt_mesh_terms'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'sid'
         __definition__ = ('SELECT DISTINCT raw_statements.id as sid,\n'
                           '       mesh_num\n'
                           'FROM text_ref\n'
@@ -445,6 +485,7 @@ def get_schema(Base):
     class RawStmtMeshConcepts(Base, ReadonlyTable):
         __tablename__ = 'raw_stmt_mesh_concepts'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'sid'
         __definition__ = ('SELECT DISTINCT raw_statements.id as sid,\n'
                           '       mesh_num\n'
                           'FROM text_ref\n'
@@ -464,6 +505,7 @@ def get_schema(Base):
     class _PaMeta(Base, ReadonlyTable):
         __tablename__ = 'pa_meta'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'mk_hash'
         __definition__ = (
             'SELECT pa_agents.db_name, pa_agents.db_id,\n'
             '       pa_agents.id AS ag_id, role_num, pa_agents.ag_num,\n'
@@ -505,7 +547,23 @@ def get_schema(Base):
                   % (cls.full_name(force_schema=True),
                      cls.get_definition())
             sql += '\n'
-            sql += (f'INSERT INTO readonly.pa_meta \n'
+            sql += cls._get_complex_dup_sql()
+            if commit:
+                cls.execute(db, sql)
+            return sql
+
+        @classmethod
+        def refresh(cls, db, cursor, key_schema):
+            super(_PaMeta, cls).refresh(db, cursor, key_schema)
+            cursor.execute(cls._get_complex_dup_sql()
+                           + f'  AND NOT is_complex_dup\n'
+                             f'  AND mk_hash IN (SELECT mk_hash '
+                             f'FROM {key_schema}.refresh_mk_hash)\n')
+            return
+
+        @staticmethod
+        def _get_complex_dup_sql():
+            return (f'INSERT INTO readonly.pa_meta \n'
                     f'SELECT db_name, db_id, ag_id,\n '
                     f'  generate_series(-1, 1, 2) AS role_num,\n'
                     f'  generate_series(0, 1) AS ag_num,\n'
@@ -513,9 +571,6 @@ def get_schema(Base):
                     f'  is_active, agent_count, true AS is_complex_dup\n'
                     f'FROM readonly.pa_meta\n'
                     f'WHERE type_num = {ro_type_map.get_int("Complex")}\n')
-            if commit:
-                cls.execute(db, sql)
-            return sql
 
         @classmethod
         def get_definition(cls):
@@ -529,6 +584,7 @@ def get_schema(Base):
     class SourceMeta(Base, SpecialColumnTable):
         __tablename__ = 'source_meta'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'mk_hash'
         __definition_fmt__ = (
             'WITH jsonified AS (\n'
             '    SELECT mk_hash, \n'
@@ -662,6 +718,7 @@ def get_schema(Base):
     class OtherMeta(Base, ReadonlyTable):
         __tablename__ = 'other_meta'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'mk_hash'
         __definition__ = ("SELECT db_name, db_id, ag_id, role_num, ag_num,\n"
                           "       type_num, mk_hash, ev_count, belief,\n"
                           "       activity, is_active, agent_count,\n"
@@ -691,6 +748,7 @@ def get_schema(Base):
     class MeshTermMeta(Base, ReadonlyTable):
         __tablename__ = 'mesh_term_meta'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'mk_hash'
         __definition__ = ("SELECT DISTINCT meta.mk_hash, meta.ev_count,\n"
                           "       meta.belief, mesh_num, type_num, activity,\n"
                           "       is_active, agent_count\n"
@@ -718,6 +776,7 @@ def get_schema(Base):
     class MeshConceptMeta(Base, ReadonlyTable):
         __tablename__ = 'mesh_concept_meta'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'mk_hash'
         __definition__ = ("SELECT DISTINCT meta.mk_hash, meta.ev_count,\n"
                           "       meta.belief, mesh_num, type_num, activity,\n"
                           "       is_active, agent_count\n"
@@ -744,6 +803,7 @@ def get_schema(Base):
     class AgentInteractions(Base, ReadonlyTable):
         __tablename__ = 'agent_interactions'
         __table_args__ = {'schema': 'readonly'}
+        _refresh_key = 'mk_hash'
         __definition__ = ("SELECT\n" 
                           "  low_level_names.mk_hash AS mk_hash, \n"
                           "  jsonb_object(\n"
@@ -797,32 +857,64 @@ def get_schema(Base):
                     BtreeIndex('agent_interactions_type_num_idx', 'type_num')]
         _always_disp = ['mk_hash', 'agent_json']
 
+        _complex_dup_cols = ('mk_hash', 'ev_count', 'belief', 'type_num',
+                             'agent_count', 'agent_json', 'src_json',
+                             'is_complex_dup')
+
         @classmethod
         def create(cls, db, commit=True):
             super(AgentInteractions, cls).create(db, commit)
-            from itertools import permutations
             interactions = db.select_all(
-                db.AgentInteractions,
+                [db.AgentInteractions.mk_hash, db.AgentInteractions.ev_count,
+                 db.AgentInteractions.belief, db.AgentInteractions.type_num,
+                 db.AgentInteractions.agent_count,
+                 db.AgentInteractions.agent_json,
+                 db.AgentInteractions.src_json],
                 db.AgentInteractions.type_num == ro_type_map.get_int('Complex')
             )
+            db.copy('readonly.agent_interactions',
+                    cls._get_complex_dups(interactions),
+                    cls._complex_dup_cols)
+            return
+
+        @classmethod
+        def refresh(cls, db, cursor, key_schema):
+            super(AgentInteractions, cls).refresh(db, cursor, key_schema)
+            cursor.execute(f"SELECT mk_hash, ev_count, belief, type_num,\n"
+                           f"       agent_count, agent_json, src_json\n"
+                           f"FROM readonly.agent_interactions\n"
+                           f"WHERE type_num = %s AND NOT is_complex_dup\n"
+                           f"  AND mk_hash IN (SELECT mk_hash "
+                           f"FROM {key_schema}.refresh_mk_hash);",
+                           (ro_type_map.get_int('Complex'),))
+            new_interactions = cls._get_complex_dups(cursor.fetchall())
+            cursor.executemany(
+                f"INSERT INTO readonly.agent_interactions "
+                f"({', '.join(cls._complex_dup_cols)})\n"
+                f"VALUES (%s, %s, %s, %s, %s, %s, %s, %s);",
+                [row[:5] + (json.dumps(row[5]), json.dumps(row[6]), row[7])
+                 for row in new_interactions]
+            )
+            return
+
+        @staticmethod
+        def _get_complex_dups(interactions):
+            from itertools import permutations
             new_interactions = []
-            for interaction in interactions:
-                if interaction.agent_count < 2:
+            for mk_hash, ev_count, belief, type_num, agent_count, \
+                    agent_json, src_json in interactions:
+                if agent_count < 2:
                     continue
-                for pair in permutations(interaction.agent_json, 2):
-                    if interaction.agent_count == 2 and pair == ('0', '1'):
+                for pair in permutations(agent_json, 2):
+                    if agent_count == 2 and pair == ('0', '1'):
                         continue
-                    new_agent_json = {str(i): interaction.agent_json[j]
+                    new_agent_json = {str(i): agent_json[j]
                                       for i, j in enumerate(pair)}
                     new_interactions.append(
-                        (interaction.mk_hash, interaction.ev_count,
-                         interaction.belief, interaction.type_num, 2,
-                         new_agent_json, interaction.src_json, True)
+                        (mk_hash, ev_count, belief, type_num, 2,
+                         new_agent_json, src_json, True)
                     )
-            db.copy('readonly.agent_interactions', new_interactions,
-                    ('mk_hash', 'ev_count', 'belief', 'type_num', 'agent_count',
-                     'agent_json', 'src_json', 'is_complex_dup'))
-            return
+            return new_interactions
 
         mk_hash = Column(BigInteger, primary_key=True)
         ev_count = Column(Integer)
@@ -1,8 +1,12 @@
+import random
+
+import numpy as np
 from nose.plugins.attrib import attr
 
 from indra.belief import BeliefEngine
 from indra_db.belief import MockStatement, MockEvidence, populate_support, \
-    load_mock_statements, calculate_belief
+    load_mock_statements, calculate_belief, BeliefArrays, get_belief, \
+    get_belief_update, get_last_link_id, _get_components
 from indra_db.tests.util import get_prepped_db
 
 
@@ -85,3 +89,126 @@ def test_mock_stmt_load_and_belief_calc():
     assert len(belief_dict) == len(stmts), (len(belief_dict), len(stmts))
     assert all([0 < b < 1 for b in belief_dict.values()]),\
         'Belief values out of range.'
+
+
+def _get_random_mock_statements(n_stmts, n_links, seed):
+    rng = random.Random(seed)
+    evidence_options = [('reach', None), ('sparser', None), ('signor', None),
+                        ('biopax', 'pc11'), ('biopax', 'phosphosite'),
+                        ('biopax', 'reactome'), ('bel', None)]
+    hashes = set()
+    while len(hashes) < n_stmts:
+        hashes.add(rng.randint(-2**63, 2**63 - 1))
+
+    stmts = []
+    for mk_hash in sorted(hashes):
+        evidence = [MockEvidence(src, source_sub_id=sub_id)
+                    for src, sub_id in rng.choices(evidence_options,
+                                                   k=rng.randint(1, 6))]
+        stmts.append(MockStatement(mk_hash, evidence))
+
+    # Links only go from earlier to later statements, so there are no cycles.
+    links = set()
+    while len(links) < n_links:
+        i, j = sorted(rng.sample(range(n_stmts), 2))
+        links.add((stmts[j].get_hash(), stmts[i].get_hash()))
+    populate_support(stmts, links)
+    return stmts
+
+
+def test_vectorized_belief_matches_engine():
+    stmts = _get_random_mock_statements(200, 300, seed=1)
+    expected = calculate_belief(stmts)
+    arrays = BeliefArrays.from_mock_statements(stmts)
+    assert len(arrays) == len(stmts)
+    beliefs = arrays.get_belief_dict()
+    assert beliefs.keys() == expected.keys()
+    assert all(abs(beliefs[h] - expected[h]) < 1e-12 for h in expected), \
+        max(abs(beliefs[h] - expected[h]) for h in expected)
+
+    # A cycle in the support is an error, as it is for the belief engine.
+    h1, h2 = stmts[0].get_hash(), stmts[1].get_hash()
+    arrays = BeliefArrays.from_counts([(h1, 'reach', None, 1),
+                                       (h2, 'reach', None, 2)],
+                                      [(h1, h2), (h2, h1)])
+    try:
+        arrays.score()
+        assert False, "Cycle not detected."
+    except ValueError:
+        pass
+
+
+@attr('nonpublic')
+def test_belief_update():
+    db = get_prepped_db(1000, with_pa=True)
+    full_beliefs = get_belief(db, vectorized=True)
+    expected = calculate_belief(load_mock_statements(db))
+    assert full_beliefs.keys() == expected.keys()
+    assert all(abs(full_beliefs[h] - expected[h]) < 1e-12 for h in expected)
+
+    # Statements missing from the earlier beliefs are recalculated, along with
+    # the others in their components.
+    last_link_id = get_last_link_id(db)
+    missing = random.sample(sorted(full_beliefs), 20)
+    prev_beliefs = {h: b for h, b in full_beliefs.items() if h not in missing}
+    beliefs, delta = get_belief_update(db, prev_beliefs, last_link_id)
+    assert beliefs.keys() == full_beliefs.keys()
+    assert all(abs(beliefs[h] - full_beliefs[h]) < 1e-12 for h in beliefs)
+    assert set(missing) <= set(delta['changed']), delta
+    assert not delta['removed'], delta
+
+    # Statements no longer in the corpus are removed.
+    prev_beliefs['1'] = 0.5
+    beliefs, delta = get_belief_update(db, prev_beliefs, last_link_id)
+    assert '1' not in beliefs and delta['removed'] == ['1'], delta
+
+    # Evidence linked to a statement later is found, however old its raw
+    # statement is.
+    raw_id, old_hash = db.select_one([db.RawUniqueLinks.raw_stmt_id,
+                                      db.RawUniqueLinks.pa_stmt_mk_hash])
+    new_hash = next(int(h) for h in sorted(full_beliefs)
+                    if int(h) != old_hash)
+    db.insert(db.RawUniqueLinks, raw_stmt_id=raw_id,
+              pa_stmt_mk_hash=new_hash)
+    expected = get_belief(db, vectorized=True)
+    beliefs, delta = get_belief_update(db, full_beliefs, last_link_id)
+    assert all(abs(beliefs[h] - expected[h]) < 1e-12 for h in expected)
+    assert str(new_hash) in delta['changed'], delta
+
+
+def test_get_components():
+    # Edges in both directions, a chain joined from its far end, and a
+    # singleton (4).
+    src = np.array([1, 2, 5, 7, 6])
+    dst = np.array([0, 1, 3, 6, 2])
+    labels = _get_components(8, src, dst)
+    assert labels.tolist() == [0, 0, 0, 3, 4, 3, 0, 0], labels
+    assert _get_components(3, src[:0], dst[:0]).tolist() == [0, 1, 2]
+
+    # Compare with a plain union-find on a larger random graph.
+    rng = random.Random(0)
+    n_nodes = 500
+    edges = [tuple(rng.sample(range(n_nodes), 2)) for _ in range(300)]
+    parents = list(range(n_nodes))
+
+    def find(i):
+        while parents[i] != i:
+            i = parents[i]
+        return i
+
+    for a, b in edges:
+        ra, rb = find(a), find(b)
+        parents[max(ra, rb)] = min(ra, rb)
+    src, dst = np.array(edges).T
+    labels = _get_components(n_nodes, src, dst)
+    assert labels.tolist() == [find(i) for i in range(n_nodes)]
+
+
+@attr('nonpublic')
+def test_partitioned_belief():
+    db = get_prepped_db(1000, with_pa=True)
+    expected = get_belief(db, partition=False)
+    for n_workers in [1, 2]:
+        beliefs = get_belief(db, partition=True, n_workers=n_workers)
+        assert beliefs.keys() == expected.keys(), n_workers
+        assert all(abs(beliefs[h] - expected[h]) < 1e-12 for h in beliefs)
@@ -0,0 +1,85 @@
+from types import SimpleNamespace
+
+from nose import SkipTest
+
+from indra.util import zip_string
+
+from indra_db.util import unpack
+from indra_db.util.compression import GZIP, ZSTD, CAN_ZSTD, zstd, \
+    pack_content, get_codec, get_dict_id, register_dict, MissingDictError
+
+import indra_db.util.compression as compression
+
+
+class _StandInDb(object):
+    """Holds dictionaries the way the content_dictionary table does."""
+    class _DictIdColumn(object):
+        def notin_(self, dict_ids):
+            return dict_ids
+
+    ContentDictionary = SimpleNamespace(dictionary='dictionary',
+                                        dict_id=_DictIdColumn())
+
+    def __init__(self, zstd_dicts):
+        self.zstd_dicts = zstd_dicts
+
+    def select_all(self, column, loaded_ids):
+        return [(d.dict_content,) for d in self.zstd_dicts
+                if d.dict_id not in loaded_ids]
+
+
+def _get_texts():
+    return [f"Protein {i} phosphorylates protein {i+1} at serine {i*7}, which "
+            f"activates the MAPK pathway in cell line {i % 13}." * (1 + i % 3)
+            for i in range(500)]
+
+
+def test_gzip_content():
+    text = 'MEK phosphorylates ERK. ' * 10
+    content = pack_content(text, GZIP)
+    assert content == zip_string(text)
+    assert get_codec(content) == GZIP
+    assert get_dict_id(content) == 0
+    assert unpack(content) == text
+
+
+def test_zstd_content():
+    if not CAN_ZSTD:
+        raise SkipTest("Zstd is not available.")
+    texts = _get_texts()
+    zstd_dict = zstd.train_dict([t.encode('utf8') for t in texts], 4096)
+
+    plain = pack_content(texts[0], ZSTD)
+    assert get_codec(plain) == ZSTD
+    assert get_dict_id(plain) == 0
+    assert unpack(plain) == texts[0]
+
+    packed = pack_content(texts[1], ZSTD, zstd_dict)
+    assert get_dict_id(packed) == zstd_dict.dict_id
+    assert len(packed) < len(plain)
+
+    # The dictionary must be found for the content to be read back.
+    compression._dicts.pop(zstd_dict.dict_id, None)
+    try:
+        unpack(packed, db=_StandInDb([]))
+        assert False, "Content was unpacked without its dictionary."
+    except MissingDictError:
+        pass
+    assert unpack(packed, db=_StandInDb([zstd_dict])) == texts[1]
+    compression._dicts.pop(zstd_dict.dict_id, None)
+    register_dict(zstd_dict.dict_content)
+    assert unpack(packed) == texts[1]
+    assert unpack(packed, decode=False) == texts[1].encode('utf8')
+
+
+def test_unknown_codec():
+    try:
+        get_codec(b'MEK phosphorylates ERK.')
+        assert False, "Uncompressed content was given a codec."
+    except ValueError:
+        pass
+    try:
+        pack_content('MEK phosphorylates ERK.', 'lzma')
+        assert False, "Content was packed with an unknown codec."
+    except ValueError:
+        pass
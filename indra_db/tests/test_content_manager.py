@@ -1,4 +1,10 @@
-from os import remove, path
+import gzip
+import tarfile
+
+from io import BytesIO
+from datetime import timedelta
+from os import remove, path, makedirs
+from tempfile import TemporaryDirectory
 
 from sqlalchemy.exc import IntegrityError
 
@@ -12,6 +18,10 @@ from indra_db.managers.reading_manager import BulkLocalReadingManager
 
 from indra_db.managers.content_manager import Pubmed, PmcOA, Manuscripts,\
     Elsevier
+from indra_db.managers.checkpoints import BatchCheckpoints
+from indra_db.managers.compression_manager import train_content_dict, \
+    recompress_content
+from indra_db.util.compression import CAN_ZSTD, get_codec, get_dict_id
 from indra_db.tests.util import get_temp_db, get_test_ftp_url,\
     assert_contents_equal
 
@@ -521,6 +531,190 @@ def test_nested_dict():
                            str((('B', 'C'), d['B']['C']))])
 
 
+def test_unpack_archive_stream():
+    "Test that archives are unpacked from a stream in fixed-size batches."
+    archive = BytesIO()
+    with tarfile.open(fileobj=archive, mode='w:gz') as tar:
+        for i in range(25):
+            xml = ('<article><front><article-meta>'
+                   '<article-id pub-id-type="pmc">%d</article-id>'
+                   '<article-id pub-id-type="pmid">%d</article-id>'
+                   '</article-meta></front></article>' % (i, 1000 + i))
+            info = tarfile.TarInfo('articles/%d.nxml' % i)
+            info.size = len(xml)
+            tar.addfile(info, BytesIO(xml.encode('utf8')))
+        info = tarfile.TarInfo('articles/README.txt')
+        info.size = 0
+        tar.addfile(info, BytesIO())
+
+    class Queue(list):
+        put = list.append
+
+    q = Queue()
+    PmcOA(local=True).unpack_archive_stream(BytesIO(archive.getvalue()),
+                                            'test.tar.gz', q=q, batch_size=10)
+    assert [label for label, _, _ in q] \
+        == [(1, '?', 'test.tar.gz'), (2, '?', 'test.tar.gz'),
+            (3, 3, 'test.tar.gz')], q
+    assert [len(tr_data) for _, tr_data, _ in q] == [10, 10, 5]
+    assert q[0][1][0]['pmcid'] == 'PMC0' and q[0][1][0]['pmid'] == '1000'
+    assert q[2][2][-1]['pmcid'] == 'PMC24'
+
+    # A truncated archive is an error, not a short archive.
+    try:
+        PmcOA(local=True).unpack_archive_stream(
+            BytesIO(archive.getvalue()[:-100]), 'test.tar.gz', q=Queue()
+        )
+    except (EOFError, tarfile.ReadError):
+        pass
+    else:
+        assert False, "Truncated archive was not detected."
+
+
+def test_iter_article_info():
+    "Test that pubmed files are parsed in chunks as they are streamed."
+    article_fmt = ('<PubmedArticle><MedlineCitation><PMID>%d</PMID><Article>'
+                   '<Journal><JournalIssue><PubDate><Year>2000</Year>'
+                   '</PubDate></JournalIssue><Title>Journal</Title></Journal>'
+                   '<ArticleTitle>Title %d</ArticleTitle><Abstract>'
+                   '<AbstractText>Abstract %d</AbstractText></Abstract>'
+                   '</Article></MedlineCitation><PubmedData><ArticleIdList>'
+                   '<ArticleId IdType="doi">10.1/%d</ArticleId>'
+                   '</ArticleIdList></PubmedData></PubmedArticle>')
+    xml = ''.join(article_fmt % ((i,)*4) for i in range(1, 8))
+    xml = '<PubmedArticleSet>%s</PubmedArticleSet>' % xml
+    with TemporaryDirectory() as ftp_dir:
+        makedirs(path.join(ftp_dir, 'pubmed', 'baseline'))
+        with gzip.open(path.join(ftp_dir, 'pubmed', 'baseline',
+                                 'pubmed00n0001.xml.gz'), 'wt') as f:
+            f.write(xml)
+
+        pm = Pubmed(ftp_url=ftp_dir, local=True)
+        chunks = list(pm.iter_article_info('baseline/pubmed00n0001.xml.gz',
+                                           chunk_size=3))
+    assert [sorted(chunk) for chunk in chunks] \
+        == [['1', '2', '3'], ['4', '5', '6'], ['7']], chunks
+    info = chunks[1]['5']
+    assert info['title'] == 'Title 5', info
+    assert info['abstract'] == 'Abstract 5', info
+    assert info['doi'] == '10.1/5', info
+
+
+def test_make_text_ref_records():
+    "Test that text ref records are built as they were row by row."
+    article_info = {
+        '1': {'pmcid': 'pmc1', 'doi': '10.1/a10.1/a', 'pii': ' s1 '},
+        '2': {'pmcid': None, 'doi': '10.1/b', 'pii': ''},
+        '3': {'doi': '10.1/c'},
+        '4': {'pmcid': 'PMC4', 'doi': None},
+        '5': {'pmcid': 'PMC5', 'doi': '10.1/e'},
+    }
+    with TemporaryDirectory() as ftp_dir:
+        makedirs(path.join(ftp_dir, 'pubmed'))
+        with gzip.open(path.join(ftp_dir, 'pubmed', 'deleted.pmids.gz'),
+                       'wt') as f:
+            f.write('3\n5\n99\n')
+
+        pm = Pubmed(ftp_url=ftp_dir, local=True)
+        valid_pmids = article_info.keys() - pm.get_deleted_pmids()
+    assert valid_pmids == {'1', '2', '4'}, valid_pmids
+
+    def get_val(data, id_type):
+        r = data.get(id_type)
+        if id_type == 'doi':
+            r = pm.fix_doi(r)
+        return None if not r else r.strip().upper()
+
+    old_records = {tuple([pmid] + [get_val(article_info[pmid], id_type)
+                                   for id_type in pm.tr_cols[1:]])
+                   for pmid in valid_pmids}
+    records = pm.make_text_ref_records(article_info, valid_pmids)
+    assert records == old_records, records ^ old_records
+    assert ('1', 'PMC1', '10.1/A', 'S1') in records, records
+
+@attr('nonpublic')
+def test_batch_checkpoints():
+    "Test that batches are claimed, completed, and skipped correctly."
+    db = get_temp_db(clear=True)
+    here = BatchCheckpoints(db, 'pmc_oa', host='here')
+    there = BatchCheckpoints(db, 'pmc_oa', host='there')
+    arc = 'oa_bulk/test.xml.tar.gz'
+
+    # A batch can only be claimed by one host at a time.
+    claim_1 = here.claim(arc, 1)
+    assert claim_1 is not None
+    assert there.claim(arc, 1) is None, "Batch was claimed twice."
+    claim_2 = there.claim(arc, 2)
+    assert claim_2 is not None
+
+    # A batch is marked done only when the copy with it is committed.
+    db.copy('text_ref', [('PMC1',)], ('pmcid',), commit=False)
+    claim_2.complete(n_records=1, n_content=0)
+    claim_2.fail()
+    assert not db.select_all(db.TextRef), "Copy was not rolled back."
+    assert here.get_done(arc) == set()
+
+    db.copy('text_ref', [('PMC1',)], ('pmcid',), commit=False)
+    claim_1.complete(n_records=1, n_content=0)
+    db.commit_copy('Failed to commit the test batch.')
+    assert len(db.select_all(db.TextRef)) == 1
+    assert here.get_done(arc) == {1}
+    batch = db.select_one(db.IngestionBatch, db.IngestionBatch.batch_idx == 1)
+    assert batch.n_records == 1 and batch.seconds >= 0, batch
+
+    # Done batches are skipped unless redone, failed ones are claimed again.
+    assert there.claim(arc, 1) is None
+    claim_1 = there.claim(arc, 1, redo=True)
+    assert claim_1 is not None
+    claim_2 = here.claim(arc, 2)
+    assert claim_2 is not None
+
+    # A stale claim from another host is taken over.
+    assert there.claim(arc, 2) is None
+    there.claim_timeout = timedelta(0)
+    claim_2 = there.claim(arc, 2)
+    assert claim_2 is not None
+
+    # The archive is only finished when all its batches are done.
+    claim_2.complete()
+    db.commit_copy('Failed to commit the test batch.')
+    assert not here.finish_file(arc, [1, 2]), "Batch 1 is being redone."
+    claim_1.complete()
+    db.commit_copy('Failed to commit the test batch.')
+    assert here.finish_file(arc, [1, 2])
+    assert there.finish_file(arc, [1, 2]), "Finishing twice failed."
+    assert [sf.name for sf in db.select_all(db.SourceFile)] == [arc]
+
+
+@attr('nonpublic')
+def test_recompress_content():
+    "Test that content is recompressed with zstd without changing it."
+    if not CAN_ZSTD:
+        raise SkipTest("Zstd is not available.")
+    db = get_test_db_with_pubmed_content()
+    tcs = db.select_all([db.TextRef.pmid, db.TextContent.text_type],
+                        *db.link(db.TextRef, db.TextContent))
+    pmids = [pmid for pmid, _ in tcs]
+    abstracts = get_content_by_refs(db, pmid_list=pmids)
+    assert abstracts
+
+    zstd_dict = train_content_dict(db, 'pubmed', 'abstract', dict_size=4096)
+    n_updated = recompress_content(db, source='pubmed', batch_size=10)
+    assert n_updated == len(tcs), (n_updated, len(tcs))
+    for tc in db.select_all(db.TextContent):
+        assert get_codec(tc.content) == 'zstd'
+        if tc.text_type == 'abstract':
+            assert get_dict_id(tc.content) == zstd_dict.dict_id
+        assert tc.last_updated is None, "Recompression touched last_updated."
+    assert get_content_by_refs(db, pmid_list=pmids) == abstracts, \
+        "Content changed."
+
+    # A second run has nothing left to do.
+    assert recompress_content(db, source='pubmed', batch_size=10) == 0
+    assert recompress_content(db, source='pubmed', batch_size=10,
+                              redo=True) == 0
+
+
 @attr('nonpublic', 'slow')
 def test_ftp_service():
     "Test the NIH FTP access client on the content managers."
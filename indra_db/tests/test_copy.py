@@ -1,3 +1,7 @@
+from datetime import datetime
+
+from indra_db.copy import BinaryCopyEncoder
+from indra_db.exceptions import IndraDbException
 from indra_db.tests.util import get_temp_db
 
 
@@ -83,3 +87,57 @@ def test_push_report_copy():
     new_date = db.select_one(db.TextRef.create_date,
                              db.TextRef.pmid == 'b')
     assert new_date != original_date, 'PMID b was not updated.'
+
+
+def test_binary_encoder():
+    fixed_types = ['INTEGER', 'BIGINT', 'REAL', 'TIMESTAMP WITHOUT TIME ZONE']
+    enc = BinaryCopyEncoder(['a', 'b', 'c', 'd'], fixed_types)
+    assert enc.fixed_width
+    rows = [(1, 2**40, 0.5, datetime(2000, 1, 1, 0, 0, 1)),
+            (2, None, 1.5, datetime(2020, 1, 1))]
+    res = enc.encode(rows)
+    assert res.startswith(b'PGCOPY\n\xff\r\n\x00') and res.endswith(b'\xff\xff')
+
+    # The fixed width path must match the general path, nulls included.
+    assert res == enc._encode_rows(rows)
+    assert b'\x00\x00\x00\x08\x00\x00\x00\x00\x00\x0f\x42\x40' in res
+
+    # Constant columns are appended to each row.
+    enc_extra = BinaryCopyEncoder(['a', 'b', 'c', 'd'], fixed_types)\
+        .with_extra((datetime(2020, 1, 1),))
+    assert enc_extra.encode([row[:3] for row in rows[1:]]) \
+        == enc.encode(rows[1:])
+
+    # Variable width types.
+    enc = BinaryCopyEncoder(['s', 'j', 'b'], ['VARCHAR(20)', 'JSONB', 'BYTEA'])
+    assert not enc.fixed_width
+    res = enc.encode([('x', {'a': 1}, b'\x00'), (None, None, None)])
+    assert b'\x00\x00\x00\x01x' in res
+    assert b'\x00\x00\x00\x09\x01{"a": 1}' in res
+
+    # Dicts in text and bytea columns are stored as json.
+    res = enc.encode([({'b': 2}, None, {'c': 3})])
+    assert b'\x00\x00\x00\x08{"b": 2}' in res
+    assert b'\x00\x00\x00\x08{"c": 3}' in res
+
+    # Bad data.
+    try:
+        enc.encode([('x', 'y')])
+        assert False, "Encoded a row with the wrong number of columns."
+    except ValueError:
+        pass
+    try:
+        enc.encode([(1, 'y', b'z')])
+        assert False, "Encoded an int as text."
+    except IndraDbException:
+        pass
+
+
+def test_binary_encoder_arrays():
+    import numpy as np
+    enc = BinaryCopyEncoder(['a', 'b'], ['INTEGER', 'BIGINT'])
+    rows = [(i, i * 2**33) for i in range(100)]
+    assert enc.encode(np.array(rows)) == enc.encode(rows)
+
+    arr = np.array(rows, dtype=[('a', 'i4'), ('b', 'i8')])
+    assert enc.encode(arr) == enc.encode(rows)
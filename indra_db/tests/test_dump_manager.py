@@ -6,7 +6,7 @@ import moto
 from indra.statements import Phosphorylation, Agent, Activation, Inhibition, \
     Complex, Evidence, Conversion
 from indra_db import config
-from indra_db.databases import reader_versions
+from indra_db.databases import reader_versions, READONLY_DELTA_SCHEMA
 from indra_db.managers import dump_manager as dm
 from indra_db.managers.dump_manager import dump
 from indra_db.preassembly.preassemble_db import DbPreassembler
@@ -110,6 +110,30 @@ def test_list_dumps_empty():
     assert dm.list_dumps() == []
 
 
+def test_readonly_dependencies():
+    """Test the dependency graph derived from the readonly table definitions.
+    """
+    from sqlalchemy.ext.declarative import declarative_base, DeclarativeMeta
+    from indra_db.schemas.mixins import IndraDBTableMetaClass
+    from indra_db.schemas.readonly_schema import get_schema, CREATE_ORDER
+
+    class BaseMeta(DeclarativeMeta, IndraDBTableMetaClass):
+        pass
+    ro_tables = get_schema(declarative_base(metaclass=BaseMeta))
+
+    for i, ro_name in enumerate(CREATE_ORDER):
+        deps = ro_tables[ro_name].get_dependencies() - {'belief'}
+        assert deps <= set(CREATE_ORDER[:i]), (ro_name, deps)
+
+    assert ro_tables['raw_stmt_src'].get_dependencies() == set()
+    assert ro_tables['mesh_terms'].get_dependencies() == set()
+    assert ro_tables['pa_stmt_src'].get_dependencies() == {'fast_raw_pa_link'}
+    assert ro_tables['source_meta'].get_dependencies() \
+        == {'pa_stmt_src', 'name_meta'}
+    assert ro_tables['mesh_term_ref_counts'].get_dependencies() \
+        == {'mesh_terms', 'pa_ref_link', 'hash_pmid_counts'}
+
+
 def _get_preassembler():
     s3 = boto3.client('s3')
     test_ontology_path = S3Path(bucket='bigmech',
@@ -122,34 +146,9 @@ def _get_preassembler():
 prass = _get_preassembler()
 
 
-@moto.mock_s3
-@moto.mock_sts
-@moto.mock_lambda
-@config.run_in_test_mode
-def test_dump_build():
-    """Test the dump pipeline.
-
-    Method
-    ------
-    CREATE CONTEXT:
-    - Create a local principal database with a small amount of content.
-      Aim for representation of stmt motifs and sources.
-    - Create a local readonly database.
-    - Create a fake bucket (moto)
-
-    RUN THE DUMP
-
-    CHECK THE RESULTS
+def _get_dump_test_db():
+    """Get a principal database with a small amount of preassembled content.
     """
-    assert config.is_db_testing()
-
-    # Create the dump locale.
-    s3 = boto3.client('s3')
-    dump_head = config.get_s3_dump()
-    s3.create_bucket(Bucket=dump_head.bucket)
-    assert dump_head.bucket == S3_DATA_LOC['bucket']
-
-    # Create the principal database.
     db = get_temp_db(clear=True)
 
     db.copy('text_ref', [        # trid
@@ -270,6 +269,38 @@ def test_dump_build():
 
     # Run preassembly.
     prass.create_corpus(db)
+    return db
+
+
+@moto.mock_s3
+@moto.mock_sts
+@moto.mock_lambda
+@config.run_in_test_mode
+def test_dump_build():
+    """Test the dump pipeline.
+
+    Method
+    ------
+    CREATE CONTEXT:
+    - Create a local principal database with a small amount of content.
+      Aim for representation of stmt motifs and sources.
+    - Create a local readonly database.
+    - Create a fake bucket (moto)
+
+    RUN THE DUMP
+
+    CHECK THE RESULTS
+    """
+    assert config.is_db_testing()
+
+    # Create the dump locale.
+    s3 = boto3.client('s3')
+    dump_head = config.get_s3_dump()
+    s3.create_bucket(Bucket=dump_head.bucket)
+    assert dump_head.bucket == S3_DATA_LOC['bucket']
+
+    # Create the principal database.
+    db = _get_dump_test_db()
 
     # Do the dump proceedure.
     ro = get_temp_ro(clear=True)
@@ -325,3 +356,99 @@ def test_dump_build():
     assert 'INDRAROOVERRIDE' in call_records[0].args[1]
     assert call_records[0].args[1]['INDRAROOVERRIDE'] == str(db.url)
     assert not call_records[1].args[1]
+
+
+@moto.mock_s3
+@moto.mock_sts
+@moto.mock_lambda
+@config.run_in_test_mode
+def test_incremental_dump():
+    """Test refreshing the readonly schema with only what has changed."""
+    s3 = boto3.client('s3')
+    dump_head = config.get_s3_dump()
+    s3.create_bucket(Bucket=dump_head.bucket)
+
+    # Do a full build, keeping the schema on principal.
+    db = _get_dump_test_db()
+    ro = get_temp_ro(clear=True)
+    dump(db, ro, incremental=True)
+    assert 'readonly' in db.get_schemas()
+    assert db.get_schema_state('readonly')['complete']
+    assert ro.get_schema_state('readonly') == db.get_schema_state('readonly')
+
+    # The temp tables kept on principal are not in the dump.
+    active_tables = ro.get_active_tables()
+    for tbl in ro.get_tables():
+        assert (tbl in active_tables) != bool(ro.tables[tbl]._temp), tbl
+
+    # Add some new content and preassemble it.
+    simple_insert_stmts(db, {'reading': {8: [
+        Activation(
+            Agent('ERK', db_refs={'FPLX': 'ERK', 'TEXT': 'ERK'}),
+            Agent('JNK', db_refs={'FPLX': 'JNK', 'TEXT': 'JNK'}),
+            evidence=Evidence(text='ERK activates JNK, for sure.')
+        ),
+        Activation(
+            Agent('RAF', db_refs={'FPLX': 'RAF', 'TEXT': 'RAF'}),
+            Agent('MEK', db_refs={'FPLX': 'MEK', 'TEXT': 'MEK'}),
+            evidence=Evidence(text='RAF activates MEK.')
+        )
+    ]}})
+    prass.supplement_corpus(db)
+    db.copy('mesh_ref_annotations', [(3, 14, False)],
+            ('pmid_num', 'mesh_num', 'is_concept'))
+    db.session.query(db.TextRef).filter(db.TextRef.id == 1)\
+        .update({'pmid': '11', 'pmid_num': 11}, synchronize_session=False)
+    db.session.commit()
+
+    # Refresh, and check that only the changes were transferred.
+    dump(db, ro, allow_continue=False, incremental=True)
+    file_list = dm.list_dumps()[0].list_objects(s3)
+    assert dm.ReadonlyDelta.from_list(file_list)
+    assert READONLY_DELTA_SCHEMA not in db.get_schemas()
+    assert READONLY_DELTA_SCHEMA not in ro.get_schemas()
+    assert ro.get_schema_state('readonly') == db.get_schema_state('readonly')
+
+    # Check the contents match what a full build would have.
+    assert len(ro.select_all(ro.FastRawPaLink)) \
+           == len(db.select_all(db.RawUniqueLinks))
+    assert {h for h, in ro.select_all(ro.SourceMeta.mk_hash)} \
+           == {h for h, in db.select_all(db.PAStatements.mk_hash)}
+    from indra_db.client.readonly import HasAgent
+    res = HasAgent('RAF').get_statements(ro)
+    assert len(res.statements()) == 2, len(res.statements())
+
+    # New mesh annotations are picked up by the kept mesh tables.
+    mesh_terms = {tuple(row) for row in db.session.execute(
+        'SELECT pmid_num, mesh_num FROM readonly.mesh_terms'
+    )}
+    assert (3, 14) in mesh_terms, mesh_terms
+
+    # So is the new pmid of an updated text ref, for every statement read from
+    # it, not only those that changed.
+    pmid_nums = {str(pmid_num) for pmid_num, in db.session.execute(
+        'SELECT DISTINCT pmid_num FROM readonly.pa_ref_link WHERE trid = 1'
+    )}
+    assert pmid_nums == {'11'}, pmid_nums
+
+
+@config.run_in_test_mode
+def test_parallel_dump_local():
+    """Test a parallel dump and restore through a local archive."""
+    from tempfile import TemporaryDirectory
+    from indra_db.belief import get_belief
+
+    db = _get_dump_test_db()
+    db.generate_readonly(get_belief(db))
+
+    ro = get_temp_ro(clear=True)
+    with TemporaryDirectory() as tmp_dir:
+        dump_file = tmp_dir + '/readonly.dump'
+        db.dump_readonly(dump_file, jobs=2)
+        with open(dump_file, 'rb') as f:
+            assert f.read(262)[257:] == b'ustar'
+        ro.load_dump(dump_file, jobs=2)
+
+    assert len(ro.select_all(ro.FastRawPaLink)) \
+           == len(db.select_all(db.RawUniqueLinks))
+    db.drop_schema('readonly')
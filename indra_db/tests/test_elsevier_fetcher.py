@@ -0,0 +1,94 @@
+from threading import Thread, Lock
+from tempfile import TemporaryDirectory
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from indra_db.managers.elsevier_fetcher import ElsevierFetcher, \
+    ElsevierHttpClient
+
+
+class StandInServer(object):
+    """A local stand-in for the Elsevier article API."""
+    def __init__(self, articles, busy=None):
+        self.articles = articles
+        self.busy = dict(busy or {})
+        self.requests = []
+        self._lock = Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                id_path = self.path.split('?')[0][len('/content/article/'):]
+                with server._lock:
+                    server.requests.append(id_path)
+                    if server.busy.get(id_path):
+                        server.busy[id_path] -= 1
+                        self.send_error(429)
+                        return
+                if id_path not in server.articles:
+                    self.send_error(404)
+                    return
+                body = server.articles[id_path].encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                return
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d/content' % self.httpd.server_port
+
+    def __enter__(self):
+        Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def _article(i):
+    return '<full-text-retrieval-response>%d</full-text-retrieval-response>' \
+        % i
+
+
+def test_fetch_all():
+    articles = {'doi/10.1016/%d' % i: _article(i) for i in range(6)}
+    articles['pubmed_id/106'] = _article(6)
+    id_dicts = {i: {'doi': 'doi:10.1016/%d' % i} for i in range(6)}
+    id_dicts[6] = {'doi': '10.1016/6', 'pmid': '106'}
+    id_dicts[7] = {'pii': 'S0000'}
+    with TemporaryDirectory() as cache_dir, \
+            StandInServer(articles, busy={'doi/10.1016/2': 2}) as server:
+        client = ElsevierHttpClient(server.url, headers={})
+        fetcher = ElsevierFetcher(client, cache_dir, n_workers=3, rate=100,
+                                  backoff=0.01)
+        contents = fetcher.fetch_all(id_dicts)
+        assert contents == {i: _article(i) for i in range(7)}, contents
+        assert server.requests.count('doi/10.1016/2') == 3, server.requests
+        assert len(server.requests) == 11, server.requests
+        fetcher.close()
+
+        # Every answer is now cached, including those of no article.
+        server.requests = []
+        fetcher = ElsevierFetcher(client, cache_dir, rate=100)
+        assert fetcher.fetch_all(id_dicts) == contents
+        assert server.requests == []
+        fetcher.close()
+
+
+def test_fetch_gives_up():
+    with TemporaryDirectory() as cache_dir, \
+            StandInServer({'doi/1': _article(1)},
+                          busy={'doi/1': 5}) as server:
+        client = ElsevierHttpClient(server.url, headers={})
+        fetcher = ElsevierFetcher(client, cache_dir, rate=100, max_tries=2,
+                                  backoff=0.01)
+        assert fetcher.fetch({'doi': '1'}) is None
+        assert len(server.requests) == 2
+
+        # The failure is not cached, so the id is tried again.
+        server.busy = {}
+        assert fetcher.fetch({'doi': '1'}) == _article(1)
+        fetcher.close()
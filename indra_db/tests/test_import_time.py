@@ -0,0 +1,39 @@
+import sys
+import logging
+from subprocess import run, PIPE
+
+logger = logging.getLogger(__name__)
+
+
+def _get_import_times(module):
+    """Get the cumulative import time (in us) of everything `module` loads."""
+    proc = run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+               stderr=PIPE, check=True)
+    times = {}
+    for line in proc.stderr.decode('utf-8').splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+
+    slowest = sorted(times.items(), key=lambda t: t[1], reverse=True)[:10]
+    logger.info(f"Slowest imports for {module}:\n"
+                + '\n'.join(f'{t/1e3:10.1f} ms  {name}'
+                            for name, t in slowest))
+    return times
+
+
+def test_package_import_is_lazy():
+    """Importing the package alone should not load the database machinery."""
+    times = _get_import_times('indra_db')
+    assert 'indra_db' in times
+    for name in ['indra_db.databases', 'indra_db.util', 'sqlalchemy',
+                 'indra.statements']:
+        assert name not in times, name
+
+
+def test_databases_import_is_lean():
+    """Heavy optional dependencies are only loaded when used."""
+    times = _get_import_times('indra_db.databases')
+    for name in ['networkx', 'boto3', 'indra.databases.hgnc_client']:
+        assert name not in times, name
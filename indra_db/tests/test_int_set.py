@@ -0,0 +1,36 @@
+import pickle
+
+from indra_db.util.int_set import IntSet
+
+
+def test_int_set_algebra():
+    a = IntSet({5, 3, 1, 9, -2**63})
+    b = IntSet(i for i in [3, 4, 5, 2**63 - 1])
+    assert len(a) == 5
+    assert (a | b) == {-2**63, 1, 3, 4, 5, 9, 2**63 - 1}
+    assert (a & b) == {3, 5}
+    assert (a - b) == {-2**63, 1, 9}
+    assert (a & b - IntSet([3])) == {5}
+
+    # Sets on the left give IntSets too.
+    assert isinstance({1, 2} | a, IntSet) and ({1, 2} | a) == (a | {1, 2})
+    assert isinstance({1, 2} & a, IntSet) and ({1, 2} & a) == {1}
+    assert isinstance({1, 2} - a, IntSet) and ({1, 2} - a) == {2}
+    assert frozenset({9, 10}) - a == {10}
+
+    assert 3 in a and 4 not in a and 10 not in a and 10 not in IntSet()
+    assert a.contains([1, 2, 9, 10]).tolist() == [True, False, True, False]
+
+    a |= [100, 1]
+    a -= {1}
+    assert a == {-2**63, 3, 5, 9, 100}
+    assert a.tolist() == sorted(a)
+    assert all(type(i) is int for i in a)
+
+
+def test_int_set_pickle():
+    ids = IntSet(range(0, 10**6, 3))
+    pickled = pickle.dumps(ids)
+    assert len(pickled) < 8*len(ids) + 1000
+    assert pickle.loads(pickled) == ids
+    assert pickle.loads(pickle.dumps(IntSet())) == set()
@@ -4,6 +4,7 @@ from indra.statements.statements import Agent, Phosphorylation, Complex, \
     Evidence
 
 from indra_db.managers.knowledgebase_manager import *
+from indra_db.managers.knowledgebase_manager import KnowledgebaseManager
 from indra_db.util import insert_db_stmts
 from indra_db.tests.util import get_temp_db
 
@@ -90,3 +91,55 @@ def test_simple_db_insert():
     assert len(db_stmts) == 2, len(db_stmts)
     assert len(db_agents) == 8, len(db_agents)
     db.session.close()
+
+
+class _LocalKbManager(KnowledgebaseManager):
+    """A knowledge base of statements kept in memory."""
+    source = 'local'
+
+    def __init__(self, short_name, stmts):
+        self.name = self.short_name = short_name
+        self.stmts = stmts
+
+    def _get_statements(self):
+        return self.stmts
+
+
+def _make_stmts(name, n):
+    return [Phosphorylation(Agent('MEK', db_refs={'FPLX': 'MEK'}),
+                            Agent('ERK', db_refs={'FPLX': 'ERK'}),
+                            position=str(i),
+                            evidence=Evidence(source_api='local',
+                                              source_id=name))
+            for i in range(n)]
+
+
+def test_statement_key_index():
+    index = StatementKeyIndex([(3, 1), (1, 2), (-5, 7)])
+    assert len(index) == 3
+    assert index.contains([(1, 2), (1, 1), (-5, 7), (4, 0)]).tolist() \
+        == [True, False, True, False]
+    assert not StatementKeyIndex([]).contains([(1, 2)]).any()
+
+
+@attr('nonpublic')
+def test_refresh_knowledgebases():
+    db = get_temp_db(clear=True)
+    kbms = [_LocalKbManager('kb_a', _make_stmts('a', 30)),
+            _LocalKbManager('kb_b', _make_stmts('b', 5))]
+    kbms[0].chunk_size = 7
+    stats = refresh_knowledgebases(db, kbms, mode='upload', n_workers=2,
+                                   n_chunk_workers=2)
+    assert stats['kb_a']['new statements'] == 30, stats
+    assert stats['kb_b']['new statements'] == 5, stats
+    assert len(db.select_all(db.RawStatements)) == 35
+
+    # Only the statements that are not already there are added.
+    kbms[0].stmts = _make_stmts('a', 40)
+    kbms[1].stmts = [Phosphorylation(None, Agent('ERK')),
+                     Phosphorylation(None, Agent('ERK'))]
+    stats = refresh_knowledgebases(db, kbms, n_workers=2, n_chunk_workers=2)
+    assert stats['kb_a']['new statements'] == 10, stats
+    assert 'error' in stats['kb_b'], stats
+    assert len(db.select_all(db.RawStatements)) == 45
+    db.session.close()
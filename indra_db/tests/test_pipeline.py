@@ -0,0 +1,46 @@
+from indra_db.managers.pipeline import Pipeline, Stage, PipelineError
+
+
+def _split(n):
+    for i in range(n % 3):
+        yield n, i
+
+
+def _fail_on_seven(n):
+    if n == 7:
+        raise ValueError("Seven!")
+    return n
+
+
+def test_pipeline_stages():
+    pipeline = Pipeline([Stage('double', lambda n: 2*n, n_workers=3),
+                         Stage('split', _split, n_workers=2, processes=True),
+                         Stage('odd', lambda t: t if t[1] else None)],
+                        sink_name='collect')
+    results = sorted(pipeline.run(range(20)))
+    assert results == [(n, 1) for n in range(2, 40, 6)], results
+
+    metrics = pipeline.get_metrics()
+    assert [metrics[name]['in'] for name in ['double', 'split', 'odd']] \
+        == [20, 20, 20], metrics
+    assert metrics['split']['out'] == 20
+    assert metrics['collect']['in'] == len(results)
+    assert metrics['split']['workers'] == 2
+
+
+def test_pipeline_errors():
+    for processes in [False, True]:
+        pipeline = Pipeline([Stage('check', _fail_on_seven, n_workers=2,
+                                   processes=processes)])
+        try:
+            list(pipeline.run(range(100)))
+        except PipelineError as err:
+            assert 'Seven!' in str(err)
+        else:
+            assert False, "The error was not raised."
+
+    # Stopping early stops the workers too.
+    pipeline = Pipeline([Stage('split', _split, processes=True)])
+    results = pipeline.run(range(10**6))
+    assert next(results) == (1, 0)
+    results.close()
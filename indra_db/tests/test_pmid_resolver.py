@@ -0,0 +1,80 @@
+from os import path
+from datetime import timedelta
+from tempfile import TemporaryDirectory
+from xml.etree import ElementTree as ET
+
+from indra_db.managers.pmid_resolver import PmidResolver, IdConverterBackend
+
+
+class LocalBackend(object):
+    """A stand-in for the id converter service."""
+    max_ids = 3
+
+    def __init__(self, pmids, fail_on=None):
+        self.pmids = pmids
+        self.fail_on = fail_on
+        self.requests = []
+
+    def lookup(self, pmcids):
+        self.requests.append(sorted(pmcids))
+        if self.fail_on in pmcids:
+            raise IOError("Service unavailable.")
+        return {pmcid: self.pmids[pmcid] for pmcid in pmcids
+                if pmcid in self.pmids}
+
+
+def test_resolve_in_batches():
+    pmids = {f'PMC{i}': str(1000 + i) for i in range(8)}
+    pmids['PMC8'] = None
+    backend = LocalBackend(pmids)
+    resolver = PmidResolver(backend=backend, n_workers=2, rate=100)
+    pmcids = [f'PMC{i}' for i in range(10)]
+    assert resolver.resolve(pmcids) == {f'PMC{i}': str(1000 + i)
+                                        for i in range(8)}
+    assert sorted(pmcid for req in backend.requests for pmcid in req) \
+        == sorted(pmcids)
+    assert max(len(req) for req in backend.requests) == 3
+
+    # Everything, including the pmcids with no pmid, is now cached.
+    backend.requests = []
+    assert resolver.resolve(['PMC1', 'PMC8', 'PMC9']) == {'PMC1': '1001'}
+    assert backend.requests == []
+
+    # Unless the answer of no pmid is too old.
+    resolver.miss_ttl = timedelta(0)
+    backend.pmids['PMC9'] = '1009'
+    assert resolver.resolve(['PMC1', 'PMC9']) == {'PMC1': '1001',
+                                                  'PMC9': '1009'}
+    assert backend.requests == [['PMC9']]
+
+
+def test_resolver_cache_and_failures():
+    with TemporaryDirectory() as tmp_dir:
+        cache_path = path.join(tmp_dir, 'cache', 'pmids.sqlite')
+        backend = LocalBackend({'PMC1': '1', 'PMC2': '2', 'PMC5': '5'},
+                               fail_on='PMC5')
+        resolver = PmidResolver(cache_path, backend=backend, n_workers=1,
+                                rate=100, max_tries=2)
+        assert resolver.resolve(['PMC1', 'PMC2', 'PMC4', 'PMC5']) \
+            == {'PMC1': '1', 'PMC2': '2'}
+        assert len(backend.requests) == 3, backend.requests
+        resolver.close()
+
+        # A new resolver picks up the answers, but not the failed lookups.
+        backend = LocalBackend({'PMC4': '4', 'PMC5': '5'})
+        resolver = PmidResolver(cache_path, backend=backend, rate=100)
+        assert resolver.resolve(['PMC1', 'PMC5']) == {'PMC1': '1',
+                                                      'PMC5': '5'}
+        assert backend.requests == [['PMC5']]
+        resolver.close()
+
+
+def test_parse_id_converter_records():
+    xml = ('<pmcids status="ok">'
+           '<record requested-id="PMC1" pmcid="PMC1" pmid="11"/>'
+           '<record requested-id="PMC2" pmcid="PMC2"/>'
+           '<record requested-id="PMC3" status="error" '
+           'errmsg="invalid article id"/>'
+           '</pmcids>')
+    assert IdConverterBackend.parse_records(ET.XML(xml)) \
+        == {'PMC1': '11', 'PMC2': None}
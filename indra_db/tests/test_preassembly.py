@@ -30,6 +30,7 @@ from indra_db import util as db_util
 from indra_db import client as db_client
 from indra_db.managers import preassembly_manager as pm
 from indra_db.managers.preassembly_manager import shash
+from indra_db.preassembly.preassemble_db import DbPreassembler
 from indra_db.tests.util import get_pa_loaded_db, get_temp_db
 
 from nose.plugins.attrib import attr
@@ -355,6 +356,10 @@ def _check_statement_distillation(num_stmts):
     assert len(stmts_p) == len(stmt_ids)
     stmt_ids_p = db_util.distill_stmts(db)
     assert stmt_ids_p == stmt_ids
+    stmt_ids_s = db_util.distill_stmts(db, stream=True)
+    assert stmt_ids_s == stmt_ids
+    stmt_ids_i = list(db_util.iter_distilled_stmts(db))
+    assert len(stmt_ids_i) == len(stmt_ids) and set(stmt_ids_i) == stmt_ids
 
 
 @needs_py3
@@ -463,6 +468,58 @@ def test_distillation_on_curated_set():
         (len(filtered_set), len(filtered_id_set))
 
 
+def test_streamed_distillation_on_curated_set():
+    stmt_dict, stmt_list, target_sets, target_bettered_ids, ev_link_sids = \
+        make_raw_statement_set_for_distillation()
+    bettered_ids = set()
+    filtered_set = set(
+        db_util.iter_filtered_rdg_stmts(stmt_dict.items(), get_full_stmts=True,
+                                        linked_sids=ev_link_sids,
+                                        bettered_duplicate_sids=bettered_ids)
+    )
+    for stmt_set, dup_set in target_sets:
+        if stmt_set == filtered_set:
+            break
+    else:
+        assert False, "Filtered set does not match any valid possibilities."
+    assert bettered_ids == target_bettered_ids
+
+
+class _FakeMappingPreassembler(DbPreassembler):
+    """Lose statements to "grounding" and "sequence mapping" by their index.
+    """
+    def _map_grounding_and_sequence(self, stmts):
+        grounded = [s for s in stmts if int(s.enz.name[1:]) % 5]
+        mapped = [s for s in grounded if int(s.enz.name[1:]) % 7]
+        return mapped, {
+            'grounding': {s.uuid for s in stmts} - {s.uuid for s in grounded},
+            'sequence mapping': {s.uuid for s in grounded}
+                                - {s.uuid for s in mapped}
+        }
+
+
+def test_clean_statements_in_chunks():
+    stmts = [Phosphorylation(Agent('A%d' % i), Agent('B'),
+                             evidence=[Evidence(text='A%d' % i)])
+             for i in range(1, 101)]
+    dp = _FakeMappingPreassembler(ontology=object(), clean_chunk_size=7)
+    serial_stmts, serial_eliminated = dp._clean_statements(stmts)
+    assert len(serial_stmts) == 68, len(serial_stmts)
+
+    # The last chunk holds only 2 statements.
+    for n_workers in [2, 3]:
+        dp.n_workers = n_workers
+        executor = dp._get_executor()
+        try:
+            chunked_stmts, chunked_eliminated = \
+                dp._clean_statements(stmts, executor)
+        finally:
+            executor.shutdown()
+        assert [s.uuid for s in chunked_stmts] \
+            == [s.uuid for s in serial_stmts]
+        assert chunked_eliminated == serial_eliminated
+
+
 @attr('nonpublic')
 def test_statement_distillation_small():
     _check_statement_distillation(1000)
@@ -0,0 +1,86 @@
+from networkx import NetworkXError
+
+from indra_db.preassembly.blocking import AgentKeyIndex
+
+
+class _Ontology(object):
+    def get_parents(self, ns, id):
+        return {('HGNC', '1'): [('FPLX', 'ERK')]}.get((ns, id), [])
+
+
+class _BrokenOntology(_Ontology):
+    def get_parents(self, ns, id):
+        if (ns, id) == ('HGNC', '1'):
+            raise NetworkXError("HGNC:1 is broken.")
+        if (ns, id) == ('HGNC', '3'):
+            raise KeyError(id)
+        return super(_BrokenOntology, self).get_parents(ns, id)
+
+
+# (mk_hash, type, ag_num, role, db_name, db_id)
+ROWS = [
+    # Phosphorylation of HGNC:2 by ERK.
+    (1, 'Phosphorylation', 0, 'SUBJECT', 'FPLX', 'ERK'),
+    (1, 'Phosphorylation', 0, 'SUBJECT', 'NAME', 'ERK'),
+    (1, 'Phosphorylation', 1, 'OBJECT', 'HGNC', '2'),
+    (1, 'Phosphorylation', 1, 'OBJECT', 'NAME', 'B'),
+
+    # Phosphorylation of HGNC:2 by HGNC:1, which is an ERK.
+    (2, 'Phosphorylation', 0, 'SUBJECT', 'HGNC', '1'),
+    (2, 'Phosphorylation', 0, 'SUBJECT', 'NAME', 'A'),
+    (2, 'Phosphorylation', 1, 'OBJECT', 'HGNC', '2'),
+    (2, 'Phosphorylation', 1, 'OBJECT', 'NAME', 'B'),
+
+    # Unrelated statements.
+    (3, 'Phosphorylation', 0, 'SUBJECT', 'HGNC', '3'),
+    (3, 'Phosphorylation', 1, 'OBJECT', 'HGNC', '4'),
+    (4, 'Activation', 0, 'SUBJECT', 'HGNC', '1'),
+    (4, 'Activation', 1, 'OBJECT', 'HGNC', '2'),
+
+    # A statement without agents.
+    (5, 'Phosphorylation', None, None, None, None),
+]
+
+
+class _TestIndex(AgentKeyIndex):
+    def iter_rows(self, db):
+        return iter(ROWS)
+
+
+def test_block_batches():
+    index = _TestIndex(_Ontology())
+    hashes, partners = index.block_batches(None, [1, 2, 3, 4], 1)
+    assert hashes == [4, 1, 2, 3], hashes
+    assert partners == {0: [], 1: [2], 2: [], 3: [], 4: []}, partners
+
+    # A statement without agents could be refined by any other statement of
+    # the same type.
+    hashes, partners = index.block_batches(None, [1, 2, 3, 4, 5], 2)
+    assert hashes == [4, 5, 1, 2, 3], hashes
+    assert partners == {0: [1, 2], 1: [], 2: []}, partners
+
+
+def test_find_related():
+    index = _TestIndex(_Ontology())
+    related = index.find_related(None, [[2]], {1, 3, 4})
+    assert dict(related) == {0: {1}}, related
+
+    index = _TestIndex(_Ontology())
+    related = index.find_related(None, [[1], [3]], {2, 4})
+    assert dict(related) == {0: {2}}, related
+
+
+def test_parent_lookup_errors():
+    # A grounding whose parents cannot be looked up has none, so statement 2
+    # no longer shares a batch with statement 1, which it refines.
+    index = _TestIndex(_BrokenOntology())
+    hashes, partners = index.block_batches(None, [1, 2, 4], 1)
+    assert partners == {0: [], 1: [], 2: [], 3: []}, partners
+
+    # Any other error is not hidden.
+    index = _TestIndex(_BrokenOntology())
+    try:
+        index.block_batches(None, [1, 2, 3], 1)
+        assert False, "The error was hidden."
+    except KeyError:
+        pass
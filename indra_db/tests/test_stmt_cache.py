@@ -0,0 +1,27 @@
+from os import path
+from tempfile import TemporaryDirectory
+
+from indra_db.preassembly.stmt_cache import StatementCache
+
+
+def test_statement_cache():
+    with TemporaryDirectory() as tmp_dir:
+        cache = StatementCache(path.join(tmp_dir, 'stmts'), max_batches=2)
+        assert not cache.has(0)
+        for i in range(3):
+            cache.put(i, [{'batch': i, 'n': n} for n in range(3)])
+        assert all(cache.has(i) for i in range(3))
+
+        # Only the most recently used batches are kept in memory.
+        first = cache.get(0)
+        assert first == [{'batch': 0, 'n': n} for n in range(3)]
+        assert cache.get(0) is first
+        cache.get(1)
+        cache.get(2)
+        assert cache.get(0) is not first
+        assert cache.get(0) == first
+
+        # A new cache on the same directory finds the same batches.
+        assert StatementCache(cache.cache_dir).get(2)[0] == {'batch': 2, 'n': 0}
+        cache.clear()
+        assert not cache.has(0)
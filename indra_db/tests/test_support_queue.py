@@ -0,0 +1,37 @@
+from os import path
+from tempfile import TemporaryDirectory
+
+from indra_db.preassembly.support_queue import SupportQueue
+
+
+def test_support_queue_resume():
+    with TemporaryDirectory() as tmp_dir:
+        file_path = path.join(tmp_dir, 'queue', 'test_support.sqlite')
+        queue = SupportQueue(file_path)
+        assert not queue.is_populated()
+        batches = [[3, -2**63, 2**63 - 1], [5], [7, 8]]
+        queue.populate(batches, [(0, None), (0, 2), (1, None), (2, None)])
+        assert queue.get_batch(0) == batches[0]
+
+        pending = queue.get_pending()
+        assert [(o, i) for _, o, i in pending] \
+            == [(0, None), (0, 2), (1, None), (2, None)], pending
+        queue.mark_done([(pending[0][0], 2, 0.5, 1.0),
+                         (pending[2][0], 0, 0.25, 3.0)])
+        queue.close()
+
+        # Reopening the queue should recover the remaining work.
+        queue = SupportQueue(file_path)
+        assert queue.is_populated()
+        assert queue.get_pending() == [pending[1], pending[3]]
+        assert queue.get_batch(2) == [7, 8]
+        stats = queue.get_stats()
+        assert stats == {'units': 4, 'done': 2, 'links': 2, 'load_time': 0.75,
+                         'compare_time': 4.0, 'max_compare_time': 3.0}, stats
+
+        # Populating again starts over.
+        queue.populate([[1]], [(0, None)])
+        assert len(queue.get_pending()) == 1
+        queue.remove()
+        assert not path.exists(file_path)
+
@@ -0,0 +1,88 @@
+from os import path
+from tempfile import TemporaryDirectory
+from collections import namedtuple
+
+from sqlalchemy.ext.declarative import declarative_base, DeclarativeMeta
+
+from indra_db.schemas.mixins import IndraDBTableMetaClass
+from indra_db.schemas.principal_schema import get_schema
+from indra_db.managers.text_ref_index import TextRefIndex
+
+
+class BaseMeta(DeclarativeMeta, IndraDBTableMetaClass):
+    pass
+
+
+TextRef = get_schema(declarative_base(metaclass=BaseMeta))['text_ref']
+ID_TYPES = ('pmid', 'pmcid', 'doi', 'manuscript_id')
+Ref = namedtuple('Ref', ('id',) + ID_TYPES)
+
+
+def test_text_ref_index_lookup():
+    index = TextRefIndex(TextRef, ID_TYPES)
+    index.add_rows([(1, '123', 'PMC10', '10.1016/J.CELL.1', None),
+                    (2, '123', None, '10.1016/J.CELL.2', None),
+                    (3, 'BAD1', 'PMC11', None, 'NIHMS5'),
+                    (4, '456', None, 'NOT-A-DOI', None)])
+    assert index.max_id == 4
+
+    # Ids are matched by their normalized forms, and raw strings otherwise.
+    assert index.lookup('pmid', ['123', None])[1] == {1, 2}
+    assert index.lookup('pmid', ['BAD1', '999'])[1] == {3}
+    assert index.lookup('pmcid', ['PMC10.2'])[1] == {1}
+    assert index.lookup('doi', ['10.1016/j.cell.2'])[1] == {2}
+    assert index.lookup('doi', ['NOT-A-DOI'])[1] == {4}
+    assert index.lookup('manuscript_id', ['NIHMS5'])[1] == {3}
+    assert index.lookup('manuscript_id', [])[1] == set()
+
+    # Merging the recent additions into the arrays doesn't change anything.
+    index._merge()
+    index.add_rows([(7, '789', 'PMC10', None, None)])
+    assert index.lookup('pmcid', ['PMC10', 'PMC11'])[1] == {1, 3, 7}
+    assert index.lookup('pmid', ['123', '789'])[1] == {1, 2, 7}
+
+    keys_by_type = {'pmid': index.lookup('pmid', ['456'])[0]}
+    assert index.matches(Ref(4, '456', None, None, None), keys_by_type)
+    assert not index.matches(Ref(5, '457', None, None, None), keys_by_type)
+
+
+def test_text_ref_index_snapshot():
+    index = TextRefIndex(TextRef, ID_TYPES)
+    index.add_rows([(i, str(i), 'PMC%d' % (i + 1), None, None)
+                    for i in range(1, 1000)])
+    with TemporaryDirectory() as tmp_dir:
+        dirname = path.join(tmp_dir, 'pmc_oa')
+        index.save(dirname)
+        loaded = TextRefIndex.load(TextRef, dirname)
+        assert loaded.id_types == ID_TYPES
+        assert loaded.max_id == 999
+        assert len(loaded) == len(index)
+        assert loaded.lookup('pmcid', ['PMC2', 'PMC1000'])[1] == {1, 999}
+
+        # The memory-mapped arrays are only read, new refs go elsewhere.
+        loaded.add_rows([(1000, '5', None, None, None)])
+        loaded._merge()
+        assert loaded.lookup('pmid', ['5'])[1] == {5, 1000}
+
+        # The index may be saved over the files it was loaded from.
+        loaded.save(dirname)
+        reloaded = TextRefIndex.load(TextRef, dirname)
+        assert reloaded.max_id == 1000
+        assert reloaded.lookup('pmid', ['5'])[1] == {5, 1000}
+        assert loaded.lookup('pmcid', ['PMC2'])[1] == {1}
+
+
+def test_text_ref_index_merge_duplicates():
+    rows = [(1, '123', 'PMC10', '10.1016/J.CELL.1', None),
+            (2, '123', None, None, None)]
+    index = TextRefIndex(TextRef, ID_TYPES)
+    index.add_rows(rows)
+    index._merge()
+    n_pairs = len(index)
+
+    # Rows that are added again, as by a refresh that checks for updates,
+    # are only kept once.
+    index.add_rows(rows)
+    index._merge()
+    assert len(index) == n_pairs
+    assert index.lookup('pmid', ['123'])[1] == {1, 2}
@@ -0,0 +1,198 @@
+"""Compress and decompress text content with gzip or zstd.
+
+Text content has always been gzipped (see `indra.util.zip_string`). It may
+also be compressed with zstd, using a dictionary trained on content of the
+same source and text type. A dictionary holds what is common to many texts
+(the words of abstracts, the tags and boilerplate of JATS xml), and so small,
+repetitive texts compress far better with one than alone. Zstd is also much
+faster to decompress than gzip.
+
+Content carries its codec with it: gzip and zstd frames each begin with their
+own magic number, and a zstd frame records the id of the dictionary it was
+compressed with, so `unpack_content` reads either without being told which it
+is. Dictionaries are kept in the content_dictionary table, and a dictionary
+is only loaded when content compressed with it is first met, so that reading
+gzipped content never touches the table. It is loaded from the database the
+content was read from, if given to `unpack_content`, else from any databases
+named with `use_dicts_from`, or else from the primary database.
+
+Zstd requires `compression.zstd` (Python 3.14+) or the `backports.zstd`
+package.
+"""
+
+__all__ = ['GZIP', 'ZSTD', 'CODECS', 'CAN_ZSTD', 'pack_content',
+           'unpack_content', 'get_codec', 'get_dict_id', 'register_dict',
+           'use_dicts_from', 'load_content_dicts', 'get_latest_dicts',
+           'MissingDictError']
+
+import zlib
+import logging
+
+from indra.util import zip_string
+
+try:
+    from compression import zstd
+    CAN_ZSTD = True
+except ImportError:
+    try:
+        from backports import zstd
+        CAN_ZSTD = True
+    except ImportError:
+        zstd = None
+        CAN_ZSTD = False
+
+logger = logging.getLogger(__name__)
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+CODECS = (GZIP, ZSTD)
+
+_GZIP_MAGIC = b'\x1f\x8b'
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Trained dictionaries by their id, and the databases they were loaded from.
+_dicts = {}
+_dict_dbs = []
+_primary_db = None
+
+
+class MissingDictError(Exception):
+    pass
+
+
+def _check_zstd():
+    if not CAN_ZSTD:
+        raise RuntimeError("Cannot use zstd: neither `compression.zstd` nor "
+                           "`backports.zstd` is available.")
+
+
+def get_codec(bts):
+    """Get the codec some content was compressed with, from its first bytes.
+    """
+    if bts[:2] == _GZIP_MAGIC:
+        return GZIP
+    if bts[:4] == _ZSTD_MAGIC:
+        return ZSTD
+    raise ValueError("Content is not compressed with a known codec.")
+
+
+def get_dict_id(bts):
+    """Get the id of the dictionary zstd content was compressed with.
+
+    Content compressed without a dictionary (or with gzip) has an id of 0.
+    """
+    if get_codec(bts) != ZSTD:
+        return 0
+    _check_zstd()
+    return zstd.get_frame_info(bts).dictionary_id
+
+
+def register_dict(dict_content):
+    """Make a trained dictionary available to `unpack_content`."""
+    _check_zstd()
+    zstd_dict = zstd.ZstdDict(dict_content)
+    _dicts[zstd_dict.dict_id] = zstd_dict
+    return zstd_dict
+
+
+def use_dicts_from(db):
+    """Look for dictionaries that have not been loaded yet on a database.
+
+    This is only needed to read content from a database other than the
+    primary without giving the database to `unpack_content`.
+    """
+    if db not in _dict_dbs:
+        _dict_dbs.append(db)
+    return
+
+
+def load_content_dicts(db):
+    """Load the dictionaries on a database that haven't been loaded yet."""
+    _check_zstd()
+    res = db.select_all(db.ContentDictionary.dictionary,
+                        db.ContentDictionary.dict_id.notin_(list(_dicts)))
+    for dict_content, in res:
+        register_dict(dict_content)
+    if res:
+        logger.info(f"Loaded {len(res)} content dictionaries.")
+    return len(res)
+
+
+def get_latest_dicts(db, source):
+    """Get the latest dictionary of each text type of a source, by text type.
+    """
+    _check_zstd()
+    CD = db.ContentDictionary
+    rows = (db.session.query(CD.text_type, CD.dictionary)
+            .filter(CD.source == source)
+            .order_by(CD.text_type, CD.create_date.desc())
+            .distinct(CD.text_type))
+    return {text_type: register_dict(dict_content)
+            for text_type, dict_content in rows}
+
+
+def _get_dict_dbs():
+    """Get the databases to look for dictionaries on, by default."""
+    global _primary_db
+    if _dict_dbs:
+        return _dict_dbs
+    if _primary_db is None:
+        # Imported here to avoid a circular import with indra_db.util.
+        from indra_db.util.constructors import get_db
+        _primary_db = get_db('primary')
+        if _primary_db is None:
+            return []
+    return [_primary_db]
+
+
+def _get_dict(dict_id, db=None):
+    if dict_id not in _dicts:
+        for dict_db in [db] if db is not None else _get_dict_dbs():
+            load_content_dicts(dict_db)
+    if dict_id not in _dicts:
+        raise MissingDictError(f"Content dictionary {dict_id} was not found "
+                               f"on the database.")
+    return _dicts[dict_id]
+
+
+def pack_content(content, codec=GZIP, zstd_dict=None, level=None):
+    """Compress text content with a codec.
+
+    Parameters
+    ----------
+    content : str
+        The text to be compressed.
+    codec : str
+        Either 'gzip' (the default) or 'zstd'.
+    zstd_dict : ZstdDict
+        A trained dictionary to compress with. Only used with zstd. Optional.
+    level : int
+        The level of compression, only used with zstd. By default, zstd's
+        default level is used.
+    """
+    if codec == GZIP:
+        return zip_string(content)
+    elif codec == ZSTD:
+        _check_zstd()
+        if zstd_dict is not None:
+            zstd_dict = zstd_dict.as_digested_dict
+        return zstd.compress(content.encode('utf8'), level=level,
+                             zstd_dict=zstd_dict)
+    raise ValueError(f"Unknown codec: {codec}. Options are {CODECS}.")
+
+
+def unpack_content(bts, db=None):
+    """Decompress content compressed with any codec, returning bytes.
+
+    If the content was compressed with a dictionary that has not been loaded
+    yet, it is loaded from `db`, the database the content was read from. By
+    default, it is loaded from the databases named with `use_dicts_from`, or
+    else from the primary database.
+    """
+    codec = get_codec(bts)
+    if codec == GZIP:
+        return zlib.decompress(bts, zlib.MAX_WBITS+16)
+    _check_zstd()
+    dict_id = zstd.get_frame_info(bts).dictionary_id
+    zstd_dict = _get_dict(dict_id, db) if dict_id else None
+    return zstd.decompress(bts, zstd_dict=zstd_dict)
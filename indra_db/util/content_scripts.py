@@ -358,7 +358,7 @@ def _get_text_content(content_identifiers, db=None):
             """ % id_str
 
     res = db.session.execute(text(query), params)
-    return {(trid, source, format, text_type): unpack(content)
+    return {(trid, source, format, text_type): unpack(content, db=db)
             for trid, source, format, text_type, content in res}
 
 
@@ -468,7 +468,7 @@ class TextContentSessionHandler(object):
             # so we iterate to find a non-empty content to return
             for content in contents.get(text_type, []):
                 if content:
-                    return unpack(content)
+                    return unpack(content, db=self.__db)
         return None
 
 
@@ -1,6 +1,8 @@
-__all__ = ['distill_stmts', 'get_filtered_rdg_stmts', 'get_filtered_db_stmts',
-           'delete_raw_statements_by_id', 'get_reading_stmt_dict',
-           'reader_versions', 'text_content_sources']
+__all__ = ['distill_stmts', 'iter_distilled_stmts', 'get_filtered_rdg_stmts',
+           'get_filtered_db_stmts', 'delete_raw_statements_by_id',
+           'get_reading_stmt_dict', 'iter_reading_stmt_dicts',
+           'iter_filtered_rdg_stmts', 'reader_versions',
+           'text_content_sources']
 
 import json
 import pickle
@@ -61,9 +63,8 @@ def extract_duplicates(stmts, key_func=None):
     return list(unique_dict.values()), list(dup_dict.values())
 
 
-def get_reading_stmt_dict(db, clauses=None, get_full_stmts=True):
-    """Get a nested dict of statements, keyed by ref, content, and reading."""
-    # Construct the query for metadata from the database.
+def _get_reading_stmt_query(db, clauses, get_full_stmts):
+    """Construct the query for statement metadata from the database."""
     elements = [db.TextRef, db.TextContent.id, db.TextContent.source,
                 db.TextContent.text_type, db.Reading.id,
                 db.Reading.reader_version, db.RawStatements.id,
@@ -77,6 +78,48 @@ def get_reading_stmt_dict(db, clauses=None, get_full_stmts=True):
                  db.TextContent.text_ref_id == db.TextRef.id))
     if clauses:
         q = q.filter(*clauses)
+    return q
+
+
+def _add_reading_stmt(tr_nd, data, get_full_stmts):
+    """Add a row of statement metadata to the nested dict of its text ref.
+
+    Returns True if the statement was an exact duplicate of one already added.
+    """
+    if get_full_stmts:
+        tr, tcid, src, tt, rid, rv, sid, mk_hash, text_hash, sjson = data
+        stmt_json = json.loads(sjson.decode('utf8'))
+        stmt = Statement._from_json(stmt_json)
+        _set_evidence_text_ref(stmt, tr)
+    else:
+        tr, tcid, src, tt, rid, rv, sid, mk_hash, text_hash = data
+        stmt = None
+
+    stmt_hash = (mk_hash, text_hash)
+
+    # Back out the reader name.
+    for reader, rv_list in reader_versions.items():
+        if rv in rv_list:
+            break
+    else:
+        raise Exception("rv %s not recognized." % rv)
+
+    # For convenience get the endpoint statement dict
+    s_dict = tr_nd[(src, tt)][tcid][reader][rv][rid]
+
+    # Initialize the value to a set, and note duplicates
+    is_duplicate = stmt_hash in s_dict.keys()
+    if not is_duplicate:
+        s_dict[stmt_hash] = set()
+
+    # Either store the statement, or the statement id.
+    s_dict[stmt_hash].add((sid, stmt))
+    return is_duplicate
+
+
+def get_reading_stmt_dict(db, clauses=None, get_full_stmts=True):
+    """Get a nested dict of statements, keyed by ref, content, and reading."""
+    q = _get_reading_stmt_query(db, clauses, get_full_stmts)
 
     # Prime some counters.
     num_duplicate_evidence = 0
@@ -85,44 +128,67 @@ def get_reading_stmt_dict(db, clauses=None, get_full_stmts=True):
     # Populate a dict with all the data.
     stmt_nd = NestedDict()
     for data in q.yield_per(1000):
-        if get_full_stmts:
-            tr, tcid, src, tt, rid, rv, sid, mk_hash, text_hash, sjson = data
-            stmt_json = json.loads(sjson.decode('utf8'))
-            stmt = Statement._from_json(stmt_json)
-            _set_evidence_text_ref(stmt, tr)
+        tr = data[0]
+        if _add_reading_stmt(stmt_nd[tr.id], data, get_full_stmts):
+            num_duplicate_evidence += 1
         else:
-            tr, tcid, src, tt, rid, rv, sid, mk_hash, text_hash = data
+            num_unique_evidence += 1
 
-        stmt_hash = (mk_hash, text_hash)
+    # Report on the results.
+    print("Found %d relevant text refs with statements." % len(stmt_nd))
+    print("number of statement exact duplicates: %d" % num_duplicate_evidence)
+    print("number of unique statements: %d" % num_unique_evidence)
+    return stmt_nd
 
-        # Back out the reader name.
-        for reader, rv_list in reader_versions.items():
-            if rv in rv_list:
-                break
-        else:
-            raise Exception("rv %s not recognized." % rv)
 
-        # For convenience get the endpoint statement dict
-        s_dict = stmt_nd[tr.id][(src, tt)][tcid][reader][rv][rid]
+def iter_reading_stmt_dicts(db, clauses=None, get_full_stmts=True):
+    """Iterate over nested dicts of statements, one text ref at a time.
 
-        # Initialize the value to a set, and count duplicates
-        if stmt_hash not in s_dict.keys():
-            s_dict[stmt_hash] = set()
-            num_unique_evidence += 1
-        else:
-            num_duplicate_evidence += 1
+    This produces the same content as `get_reading_stmt_dict`, but the query is
+    ordered by text ref id and streamed from the database, so only the
+    statements of one text ref are held in memory at once.
+
+    Yields
+    ------
+    trid : int
+        The id of the text ref.
+    tr_nd : NestedDict
+        The statements from the text ref, keyed by content and reading.
+    """
+    q = (_get_reading_stmt_query(db, clauses, get_full_stmts)
+         .order_by(db.TextRef.id)
+         .execution_options(stream_results=True))
+
+    # Prime some counters.
+    num_text_refs = 0
+    num_duplicate_evidence = 0
+    num_unique_evidence = 0
 
-        # Either store the statement, or the statement id.
-        if get_full_stmts:
-            s_dict[stmt_hash].add((sid, stmt))
+    # Gather the rows of each text ref, yielding each group once it is done.
+    trid = None
+    tr_nd = None
+    for data in q.yield_per(1000):
+        tr = data[0]
+        if tr.id != trid:
+            if tr_nd is not None:
+                yield trid, tr_nd
+            trid = tr.id
+            tr_nd = NestedDict()
+            num_text_refs += 1
+
+        if _add_reading_stmt(tr_nd, data, get_full_stmts):
+            num_duplicate_evidence += 1
         else:
-            s_dict[stmt_hash].add((sid, None))
+            num_unique_evidence += 1
+
+    if tr_nd is not None:
+        yield trid, tr_nd
 
     # Report on the results.
-    print("Found %d relevant text refs with statements." % len(stmt_nd))
-    print("number of statement exact duplicates: %d" % num_duplicate_evidence)
-    print("number of unique statements: %d" % num_unique_evidence)
-    return stmt_nd
+    logger.info("Found %d relevant text refs with statements." % num_text_refs)
+    logger.info("Number of statement exact duplicates: %d"
+                % num_duplicate_evidence)
+    logger.info("Number of unique statements: %d" % num_unique_evidence)
 
 
 # Specify sources of fulltext content, and order priorities.
@@ -136,6 +202,80 @@ text_content_sources = [('pubmed', 'title'),
                         ('pmc_oa', 'fulltext')]
 
 
+def _filter_text_ref_stmts(src_dict, linked_sids, bad_dups):
+    """Filter the statements from the readings of a single text ref.
+
+    Returns the (sid, stmt) tuples of the statements chosen, and those of the
+    statements with "better" alternatives. Any exact duplicates found within
+    a reading are added to `bad_dups`.
+    """
+    stmt_tpls = set()
+    bettered_duplicate_tpls = set()
+
+    # Filter out the older reader versions
+    for reader, rv_list in reader_versions.items():
+        simple_src_dict = defaultdict(dict)
+        for (src, _, _), rv_dict in src_dict.get_paths(reader):
+            best_rv = max(rv_dict, key=lambda x: rv_list.index(x))
+
+            # Record the rest of the statement ids.
+            for rv, r_dict in rv_dict.items():
+                if rv != best_rv:
+                    bettered_duplicate_tpls |= r_dict.get_leaves()
+                else:
+                    for h, stmt_set in list(r_dict.values())[0].items():
+                        # Sort the statements by their source, and whether
+                        # they are new or old, defined as whether they have
+                        # yet been included in preassembly. There should be no
+                        # overlap in hashes here.
+                        sid_set = {sid for sid, _ in stmt_set}
+                        if sid_set < linked_sids:
+                            simple_src_dict[src][h] = ('old', stmt_set)
+                        elif sid_set.isdisjoint(linked_sids):
+                            simple_src_dict[src][h] = ('new', stmt_set)
+                        else:
+                            # If you ever see this pop up, something very
+                            # strange has happened. It means that some
+                            # statements from a given reading were already
+                            # included in preassembly, but others were not.
+                            # There is no mechanism that should accept only
+                            # some statements from within a reading, so that
+                            # should never happen, but Murphy will always win
+                            # the day.
+                            assert False, "Found reading partially included."
+
+        # Choose the statements to propagate
+        new_stmt_dict = {}
+        for src in reversed(text_content_sources):
+            for h, (status, s_set) in simple_src_dict[src].items():
+                # If this error ever comes up, it means that the uniqueness
+                # constraint on raw statements per reading is not functioning
+                # correctly.
+                if len(s_set) > 1:
+                    logger.warning("Found exact duplicates from the same "
+                                   "reading: %s" % str(s_set))
+                    bad_dups.add(tuple(s_set))
+
+                # Choose whether to keep the statement or not.
+                s_tpl = s_set.pop()
+                if h not in new_stmt_dict:
+                    # No conflict, no problem
+                    new_stmt_dict[h] = s_tpl
+                elif status == 'old':
+                    # The same statement was newly found by a better version.
+                    bettered_duplicate_tpls.add(s_tpl)
+        stmt_tpls |= set(new_stmt_dict.values())
+
+    return stmt_tpls, bettered_duplicate_tpls
+
+
+def _dump_bad_dups(bad_dups):
+    """Dump the bad duplicates, if any."""
+    if bad_dups:
+        with open('bad_duplicates_%s.pkl' % datetime.now(), 'wb') as f:
+            pickle.dump(bad_dups, f)
+
+
 def get_filtered_rdg_stmts(stmt_nd, get_full_stmts, linked_sids=None):
     """Get the set of statements/ids from readings minus exact duplicates."""
     logger.info("Filtering the statements from reading.")
@@ -147,72 +287,15 @@ def get_filtered_rdg_stmts(stmt_nd, get_full_stmts, linked_sids=None):
     stmt_tpls = set()
     bettered_duplicate_sids = set()  # Statements with "better" alternatives
     for trid, src_dict in stmt_nd.items():
-        some_bettered_duplicate_tpls = set()
-
-        # Filter out the older reader versions
-        for reader, rv_list in reader_versions.items():
-            simple_src_dict = defaultdict(dict)
-            for (src, _, _), rv_dict in src_dict.get_paths(reader):
-                best_rv = max(rv_dict, key=lambda x: rv_list.index(x))
-
-                # Record the rest of the statement ids.
-                for rv, r_dict in rv_dict.items():
-                    if rv != best_rv:
-                        some_bettered_duplicate_tpls |= r_dict.get_leaves()
-                    else:
-                        for h, stmt_set in list(r_dict.values())[0].items():
-                            # Sort the statements by their source, and whether
-                            # they are new or old, defined as whether they
-                            # have yet been included in preassembly. There
-                            # should be no overlap in hashes here.
-                            sid_set = {sid for sid, _ in stmt_set}
-                            if sid_set < linked_sids:
-                                simple_src_dict[src][h] = ('old', stmt_set)
-                            elif sid_set.isdisjoint(linked_sids):
-                                simple_src_dict[src][h] = ('new', stmt_set)
-                            else:
-                                # If you ever see this pop up, something very
-                                # strange has happened. It means that some
-                                # statements from a given reading were already
-                                # included in preassembly, but others were not.
-                                # There is no mechanism that should accept only
-                                # some statements from within a reading, so
-                                # that should never happen, but Murphy will
-                                # always win the day.
-                                assert False, \
-                                    "Found reading partially included."
-
-            # Choose the statements to propagate
-            new_stmt_dict = {}
-            for src in reversed(text_content_sources):
-                for h, (status, s_set) in simple_src_dict[src].items():
-                    # If this error ever comes up, it means that the uniqueness
-                    # constraint on raw statements per reading is not
-                    # functioning correctly.
-                    if len(s_set) > 1:
-                        logger.warning("Found exact duplicates from the same "
-                                       "reading: %s" % str(s_set))
-                        bad_dups.add(tuple(s_set))
-
-                    # Choose whether to keep the statement or not.
-                    s_tpl = s_set.pop()
-                    if h not in new_stmt_dict:
-                        # No conflict, no problem
-                        new_stmt_dict[h] = s_tpl
-                    elif status == 'old':
-                        # The same statement was newly found by a better
-                        # version.
-                        some_bettered_duplicate_tpls.add(s_tpl)
-            stmt_tpls |= set(new_stmt_dict.values())
+        some_stmt_tpls, some_bettered_duplicate_tpls = \
+            _filter_text_ref_stmts(src_dict, linked_sids, bad_dups)
+        stmt_tpls |= some_stmt_tpls
 
         # Add the bettered duplicates found in this round.
         bettered_duplicate_sids |= \
             {sid for sid, _ in some_bettered_duplicate_tpls}
 
-    # Dump the bad duplicates, if any
-    if bad_dups:
-        with open('bad_duplicates_%s.pkl' % datetime.now(), 'wb') as f:
-            pickle.dump(bad_dups, f)
+    _dump_bad_dups(bad_dups)
 
     if get_full_stmts:
         stmts = {stmt for _, stmt in stmt_tpls if stmt is not None}
@@ -226,8 +309,51 @@ def get_filtered_rdg_stmts(stmt_nd, get_full_stmts, linked_sids=None):
     return stmts, bettered_duplicate_sids
 
 
-def get_filtered_db_stmts(db, get_full_stmts=False, clauses=None):
-    """Get the set of statements/ids from databases minus exact duplicates."""
+def iter_filtered_rdg_stmts(stmt_nd_iter, get_full_stmts, linked_sids=None,
+                            bettered_duplicate_sids=None):
+    """Iterate over the statements/ids from readings minus exact duplicates.
+
+    This applies the same filtering as `get_filtered_rdg_stmts`, one text ref
+    at a time, to (text ref id, nested dict) pairs such as those produced by
+    `iter_reading_stmt_dicts`.
+
+    Parameters
+    ----------
+    stmt_nd_iter : iterable[tuple]
+        The (text ref id, nested dict) pairs of statements from reading.
+    get_full_stmts : bool
+        If True, yield the statements, otherwise yield their ids.
+    linked_sids : Optional[set[int]]
+        The ids of the statements that have already been preassembled.
+    bettered_duplicate_sids : Optional[set[int]]
+        If given, the ids of the statements with "better" alternatives are
+        added to this set as they are found.
+    """
+    logger.info("Filtering the statements from reading.")
+    if linked_sids is None:
+        linked_sids = set()
+
+    bad_dups = set()
+    for trid, src_dict in stmt_nd_iter:
+        stmt_tpls, bettered_duplicate_tpls = \
+            _filter_text_ref_stmts(src_dict, linked_sids, bad_dups)
+        if bettered_duplicate_sids is not None:
+            bettered_duplicate_sids |= \
+                {sid for sid, _ in bettered_duplicate_tpls}
+
+        for sid, stmt in stmt_tpls:
+            if get_full_stmts:
+                assert stmt is not None, \
+                    "Statement %d was not loaded with its text ref." % sid
+                yield stmt
+            else:
+                yield sid
+
+    _dump_bad_dups(bad_dups)
+
+
+def _iter_db_stmts(db, get_full_stmts=False, clauses=None):
+    """Iterate over the statements/ids from databases."""
     # Only get the json if it's going to be used.
     if get_full_stmts:
         tbl_list = [db.RawStatements.json]
@@ -243,15 +369,75 @@ def get_filtered_db_stmts(db, get_full_stmts=False, clauses=None):
     # Produce a generator of statement groups.
     db_stmt_data = db_s_q.yield_per(10000)
     if get_full_stmts:
-        return {Statement._from_json(json.loads(s_json.decode('utf-8')))
-                for s_json, in db_stmt_data}
+        for s_json, in db_stmt_data:
+            yield Statement._from_json(json.loads(s_json.decode('utf-8')))
     else:
-        return {sid for sid, in db_stmt_data}
+        for sid, in db_stmt_data:
+            yield sid
+
+
+def get_filtered_db_stmts(db, get_full_stmts=False, clauses=None):
+    """Get the set of statements/ids from databases minus exact duplicates."""
+    return set(_iter_db_stmts(db, get_full_stmts, clauses))
+
+
+def _get_linked_sids(db, handle_duplicates):
+    if handle_duplicates == 'delete' or handle_duplicates == 'error':
+        logger.info("Looking for ids from existing links...")
+        return {sid for sid, in db.select_all(db.RawUniqueLinks.raw_stmt_id)}
+    return set()
+
+
+def _remove_bettered_links(db, bettered_duplicate_sids, linked_sids):
+    """Remove support links for statements that have better versions."""
+    bad_link_sids = bettered_duplicate_sids & linked_sids
+    if len(bad_link_sids):
+        logger.error("Found pre-existing evidence links that were bettered...")
+        logger.info("Removing the links...")
+        rm_links = db.select_all(
+            db.RawUniqueLinks,
+            db.RawUniqueLinks.raw_stmt_id.in_(bad_link_sids)
+        )
+        db.delete_all(rm_links)
+    return
+
+
+def iter_distilled_stmts(db, get_full_stmts=False, clauses=None,
+                         handle_duplicates='error'):
+    """Iterate over a corpus of statements, filtering duplicate evidence.
+
+    This yields the same statements as `distill_stmts`, but the statements
+    from reading are streamed from the database and filtered one text ref at
+    a time, and those from databases are streamed after them, so the corpus
+    is never held in memory unless the caller collects it. The ids of the
+    statements already linked to pa statements are still loaded at the
+    start. The links of statements found to have better versions are only
+    removed once the iteration is finished.
+
+    See `distill_stmts` for the parameters.
+    """
+    linked_sids = _get_linked_sids(db, handle_duplicates)
+
+    logger.info("Sorting reading statements...")
+    bettered_duplicate_sids = set()
+    stmt_nd_iter = iter_reading_stmt_dicts(db, clauses, get_full_stmts)
+    num_rdg_stmts = 0
+    for stmt in iter_filtered_rdg_stmts(stmt_nd_iter, get_full_stmts,
+                                        linked_sids, bettered_duplicate_sids):
+        num_rdg_stmts += 1
+        yield stmt
+    logger.info("After filtering reading: %d unique statements, and %d with "
+                "results from better resources available."
+                % (num_rdg_stmts, len(bettered_duplicate_sids)))
+
+    yield from _iter_db_stmts(db, get_full_stmts, clauses)
+
+    _remove_bettered_links(db, bettered_duplicate_sids, linked_sids)
 
 
 @clockit
 def distill_stmts(db, get_full_stmts=False, clauses=None,
-                  handle_duplicates='error'):
+                  handle_duplicates='error', stream=False):
     """Get a corpus of statements from clauses and filters duplicate evidence.
 
     Parameters
@@ -272,6 +458,13 @@ def distill_stmts(db, get_full_stmts=False, clauses=None,
         duplicates ('delete'), or write a pickle file with their ids (at the
         string file path) for later handling, or raise an exception ('error').
         The default behavior is 'error'.
+    stream : bool
+        If True, the statements are gathered from `iter_distilled_stmts`, so
+        the statements from reading are streamed from the database and
+        filtered one text ref at a time, rather than all being loaded into
+        memory at once. The result is the same, and is still collected into a
+        set: use `iter_distilled_stmts` directly to avoid holding it. Default
+        is False.
 
     Returns
     -------
@@ -279,39 +472,27 @@ def distill_stmts(db, get_full_stmts=False, clauses=None,
         A set of either statement ids or serialized statements, depending on
         `get_full_stmts`.
     """
-    if handle_duplicates == 'delete' or handle_duplicates == 'error':
-        logger.info("Looking for ids from existing links...")
-        linked_sids = {sid for sid,
-                       in db.select_all(db.RawUniqueLinks.raw_stmt_id)}
-    else:
-        linked_sids = set()
+    if stream:
+        return set(iter_distilled_stmts(db, get_full_stmts, clauses,
+                                        handle_duplicates))
+
+    linked_sids = _get_linked_sids(db, handle_duplicates)
 
     # Get de-duplicated Statements, and duplicate uuids, as well as uuid of
     # Statements that have been improved upon...
     logger.info("Sorting reading statements...")
     stmt_nd = get_reading_stmt_dict(db, clauses, get_full_stmts)
-
     stmts, bettered_duplicate_sids = \
         get_filtered_rdg_stmts(stmt_nd, get_full_stmts, linked_sids)
+    del stmt_nd  # This takes up a lot of memory, and is done being used.
     logger.info("After filtering reading: %d unique statements, and %d with "
                 "results from better resources available."
                 % (len(stmts), len(bettered_duplicate_sids)))
-    del stmt_nd  # This takes up a lot of memory, and is done being used.
 
     db_stmts = get_filtered_db_stmts(db, get_full_stmts, clauses)
     stmts |= db_stmts
 
-    # Remove support links for statements that have better versions available.
-    bad_link_sids = bettered_duplicate_sids & linked_sids
-    if len(bad_link_sids):
-        logger.error("Found pre-existing evidence links that were bettered...")
-        logger.info("Removing the links...")
-        rm_links = db.select_all(
-            db.RawUniqueLinks,
-            db.RawUniqueLinks.raw_stmt_id.in_(bad_link_sids)
-        )
-        db.delete_all(rm_links)
-
+    _remove_bettered_links(db, bettered_duplicate_sids, linked_sids)
     return stmts
 
 
@@ -1,14 +1,17 @@
 __all__ = ['unpack', '_get_trids', '_fix_evidence_refs',
            'get_raw_stmts_frm_db_list', '_set_evidence_text_ref',
-           'get_statement_object']
+           'get_statement_object', 'get_process_pool']
 
 import json
-import zlib
 import logging
+from multiprocessing import get_context, get_all_start_methods
+from concurrent.futures import ProcessPoolExecutor
 
 from indra.util import clockit
 from indra.statements import Statement
 
+from indra_db.util.compression import unpack_content
+
 logger = logging.getLogger('util-helpers')
 
 
@@ -21,6 +24,23 @@ def get_statement_object(db_stmt):
     return Statement._from_json(json.loads(jb.decode('utf-8')))
 
 
+def get_process_pool(n_workers, initializer=None, initargs=()):
+    """Get a pool of worker processes, or None if only one is used.
+
+    Where possible the workers are forked, so they share the modules (and any
+    ontology) already loaded in this process.
+    """
+    if n_workers <= 1:
+        return None
+
+    if 'fork' in get_all_start_methods():
+        mp_context = get_context('fork')
+    else:
+        mp_context = None
+    return ProcessPoolExecutor(max_workers=n_workers, mp_context=mp_context,
+                               initializer=initializer, initargs=initargs)
+
+
 def _set_evidence_text_ref(stmt, tr):
     # This is a separate function because it is likely to change, and this is a
     # critical process that is executed in multiple places.
@@ -72,8 +92,8 @@ def get_raw_stmts_frm_db_list(db, db_stmt_objs, fix_refs=True, with_sids=True):
         return [stmt for _, _, stmt in rid_stmt_sid_trios]
 
 
-def unpack(bts, decode=True):
-    ret = zlib.decompress(bts, zlib.MAX_WBITS+16)
+def unpack(bts, decode=True, db=None):
+    ret = unpack_content(bts, db)
     if decode:
         ret = ret.decode('utf-8')
     return ret
@@ -1,6 +1,6 @@
 __all__ = ['insert_raw_agents', 'insert_pa_agents', 'insert_pa_stmts',
            'insert_db_stmts', 'regularize_agent_id', 'extract_agent_data',
-           'hash_pa_agents']
+           'hash_pa_agents', 'get_raw_stmt_record']
 
 import json
 import pickle
@@ -232,7 +232,23 @@ def extract_agent_data(stmt, stmt_id):
     return ref_data, mod_data, mut_data
 
 
-def insert_db_stmts(db, stmts, db_ref_id, verbose=False, batch_id=None):
+def get_raw_stmt_record(stmt):
+    """Get the (uuid, mk_hash, source_hash, type, json) of a raw statement.
+
+    These are the values of the raw statement that depend only on the
+    statement itself, and may therefore be found ahead of time, for instance
+    in worker processes, and passed to `insert_db_stmts`.
+    """
+    assert len(stmt.evidence) == 1, \
+        'Statement with %s evidence.' % len(stmt.evidence)
+    return (stmt.uuid, stmt.get_hash(refresh=True),
+            stmt.evidence[0].get_source_hash(refresh=True),
+            stmt.__class__.__name__,
+            json.dumps(stmt.to_json()).encode('utf8'))
+
+
+def insert_db_stmts(db, stmts, db_ref_id, verbose=False, batch_id=None,
+                    stmt_records=None):
     """Insert statement, their database, and any affiliated agents.
 
     Note that this method is for uploading statements that came from a
@@ -254,6 +270,10 @@ def insert_db_stmts(db, stmts, db_ref_id, verbose=False, batch_id=None):
     batch_id : int or None
         Select a batch id to use for this upload. It can be used to trace what
         content has been added.
+    stmt_records : list[tuple] or None
+        The records of the statements, in the same order, as given by
+        `get_raw_stmt_record`, if they have already been made. By default,
+        they are made here.
     """
     # Preparing the statements for copying
     if batch_id is None:
@@ -266,15 +286,16 @@ def insert_db_stmts(db, stmts, db_ref_id, verbose=False, batch_id=None):
     if verbose:
         print("Loading db statements:", end='', flush=True)
 
+    indra_version = get_version()
     for i, stmt in enumerate(stmts):
-        assert len(stmt.evidence) == 1, \
-            'Statement with %s evidence.' % len(stmt.evidence)
-
-        stmt_rec = (stmt.uuid, stmt.get_hash(refresh=True),
-                    stmt.evidence[0].get_source_hash(refresh=True), db_ref_id,
-                    stmt.__class__.__name__,
-                    json.dumps(stmt.to_json()).encode('utf8'),
-                    get_version(), batch_id)
+        if stmt_records is None:
+            uuid, mk_hash, src_hash, stmt_type, stmt_json = \
+                get_raw_stmt_record(stmt)
+        else:
+            uuid, mk_hash, src_hash, stmt_type, stmt_json = stmt_records[i]
+
+        stmt_rec = (uuid, mk_hash, src_hash, db_ref_id, stmt_type, stmt_json,
+                    indra_version, batch_id)
 
         stmt_data.append(stmt_rec)
 
@@ -0,0 +1,147 @@
+__all__ = ['IntSet']
+
+import numpy as np
+
+
+class IntSet(object):
+    """A compact set of integers, stored as a sorted array of unique int64.
+
+    Python sets of ints cost upwards of 70 bytes per element, which adds up
+    quickly when handling tens of millions of statement ids or hashes. This
+    stores 8 bytes per element, and performs set algebra with vectorized numpy
+    operations. It pickles as a single array.
+
+    Parameters
+    ----------
+    values : iterable[int] or numpy.ndarray
+        The initial values of the set. Duplicates are removed.
+    """
+    # Ints are handed out in chunks of this size when iterating.
+    _chunk_size = 2**16
+
+    def __init__(self, values=()):
+        if isinstance(values, IntSet):
+            self._arr = values._arr.copy()
+            return
+        if not isinstance(values, np.ndarray):
+            if hasattr(values, '__len__'):
+                values = np.fromiter(values, dtype=np.int64,
+                                     count=len(values))
+            else:
+                values = np.fromiter(values, dtype=np.int64)
+        self._arr = np.unique(values.astype(np.int64, copy=False))
+
+    @classmethod
+    def _from_sorted(cls, arr):
+        int_set = cls.__new__(cls)
+        int_set._arr = arr
+        return int_set
+
+    @staticmethod
+    def _get_array(other):
+        if isinstance(other, IntSet):
+            return other._arr
+        return IntSet(other)._arr
+
+    def to_array(self):
+        """Get the (read-only) sorted array of the values."""
+        arr = self._arr.view()
+        arr.flags.writeable = False
+        return arr
+
+    def tolist(self):
+        """Get a sorted list of the values as python ints."""
+        return self._arr.tolist()
+
+    def contains(self, values):
+        """Get a boolean array marking which of the values are in the set."""
+        values = np.asarray(values, dtype=np.int64)
+        idx = np.searchsorted(self._arr, values)
+        found = np.zeros(values.shape, dtype=bool)
+        in_range = idx < len(self._arr)
+        found[in_range] = self._arr[idx[in_range]] == values[in_range]
+        return found
+
+    def union(self, other):
+        return self._from_sorted(np.union1d(self._arr, self._get_array(other)))
+
+    def intersection(self, other):
+        return self._from_sorted(
+            np.intersect1d(self._arr, self._get_array(other),
+                           assume_unique=True)
+        )
+
+    def difference(self, other):
+        return self._from_sorted(
+            np.setdiff1d(self._arr, self._get_array(other), assume_unique=True)
+        )
+
+    def update(self, other):
+        """Add the values of another collection to this set, in place."""
+        self._arr = np.union1d(self._arr, self._get_array(other))
+
+    def difference_update(self, other):
+        """Remove the values of another collection from this set, in place."""
+        self._arr = np.setdiff1d(self._arr, self._get_array(other),
+                                 assume_unique=True)
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __and__(self, other):
+        return self.intersection(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    # With a set on the left, the result is still an IntSet.
+    def __ror__(self, other):
+        return self.union(other)
+
+    def __rand__(self, other):
+        return self.intersection(other)
+
+    def __rsub__(self, other):
+        return IntSet(other).difference(self)
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def __isub__(self, other):
+        self.difference_update(other)
+        return self
+
+    def __contains__(self, value):
+        i = np.searchsorted(self._arr, value)
+        return bool(i < len(self._arr) and self._arr[i] == value)
+
+    def __len__(self):
+        return len(self._arr)
+
+    def __iter__(self):
+        # Yield python ints, which (unlike numpy ints) can be used directly in
+        # database queries.
+        for start in range(0, len(self._arr), self._chunk_size):
+            yield from self._arr[start:start + self._chunk_size].tolist()
+
+    def __eq__(self, other):
+        if isinstance(other, (set, frozenset)):
+            other = IntSet(other)
+        if not isinstance(other, IntSet):
+            return NotImplemented
+        return np.array_equal(self._arr, other._arr)
+
+    def __getstate__(self):
+        return (self._arr,)
+
+    def __setstate__(self, state):
+        self._arr, = state
+
+    def __repr__(self):
+        if len(self._arr) > 6:
+            shown = self._arr[:3].tolist() + ['...'] + self._arr[-3:].tolist()
+        else:
+            shown = self._arr.tolist()
+        shown = ', '.join(str(v) for v in shown)
+        return f'{self.__class__.__name__}({{{shown}}})'
@@ -17,7 +17,8 @@ def main():
                             'pgcopy', 'matplotlib', 'flask', 'nltk',
                             'reportlab', 'cachetools'],
           extras_require={'test': ['nose', 'coverage', 'python-coveralls',
-                                   'nose-timer']},
+                                   'nose-timer'],
+                          'zstd': ['backports.zstd; python_version < "3.14"']},
           )
 
 